@@ -1,3 +1,23 @@
+import os
+
 from dotenv import load_dotenv
 
-load_dotenv()
\ No newline at end of file
+load_dotenv()
+
+from bionexo.application.api.app import create_app
+
+app = create_app()
+
+if __name__ == '__main__':
+    import uvicorn
+
+    # Con varios workers uvicorn necesita importar la app en cada proceso: cada uno abre su
+    # propio cliente de MongoDB. Las credenciales viajan en HTTP Basic: por defecto solo se
+    # escucha en local, y para exponerla se pone detrás de un proxy con TLS
+    uvicorn.run(
+        "bionexo.application.api.app:create_app",
+        factory=True,
+        host=os.getenv("API_HOST", "127.0.0.1"),
+        port=int(os.getenv("API_PORT", "8000")),
+        workers=int(os.getenv("API_WORKERS", str(os.cpu_count() or 1))),
+    )
@@ -0,0 +1,68 @@
+"""
+Script para calcular la máscara de alérgenos (`allergen_mask`) de los alimentos existentes.
+
+Recalcula la máscara de todos los alimentos a partir de `allergens` (y `allergens_tags` si
+lo tienen) y solo escribe las que cambian: sirve tanto para los alimentos anteriores a la
+máscara como tras ampliar `data/allergens.json`.
+
+Uso:
+  python backfill_allergen_masks.py            # dry-run
+  python backfill_allergen_masks.py --apply
+"""
+
+import argparse
+from datetime import datetime
+from dotenv import load_dotenv
+from pymongo import UpdateOne
+
+from bionexo.infrastructure.utils.db import get_db
+from bionexo.infrastructure.utils.migrations import MigrationRunner
+from bionexo.repository.allergens import ALLERGEN_MASK_FIELD, food_allergen_mask, get_allergen_taxonomy
+
+load_dotenv()
+
+
+def backfill_allergen_masks(db, dry_run: bool = True, batch_size: int = 1000, restart: bool = False) -> dict:
+    projection = {"allergens": 1, "allergens_tags": 1, ALLERGEN_MASK_FIELD: 1}
+    unknown: dict[str, int] = {}
+    taxonomy = get_allergen_taxonomy()
+
+    def transform(doc):
+        for term in taxonomy.split([*(doc.get("allergens") or []), *(doc.get("allergens_tags") or [])])[1]:
+            unknown[term] = unknown.get(term, 0) + 1
+        mask = food_allergen_mask(doc)
+        if doc.get(ALLERGEN_MASK_FIELD) == mask:
+            return None
+        # updated_at para que el catálogo y el índice de búsqueda en memoria vean el cambio
+        return UpdateOne({"_id": doc["_id"]}, {"$set": {ALLERGEN_MASK_FIELD: mask, "updated_at": datetime.now()}})
+
+    runner = MigrationRunner(
+        db, "backfill_allergen_masks", "foods", batch_size=batch_size, dry_run=dry_run, resume=not restart
+    )
+    stats = runner.run(transform, projection=projection)
+    return {"total": stats.scanned, "changed": stats.changed, "updated": stats.written, "unknown": unknown}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Calcula allergen_mask para los alimentos existentes")
+    parser.add_argument("--apply", action="store_true", help="Aplicar cambios (por defecto dry-run)")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Documentos por bulk_write")
+    parser.add_argument("--restart", action="store_true", help="Ignorar el checkpoint y empezar desde el principio")
+    args = parser.parse_args()
+
+    db = get_db()
+    res = backfill_allergen_masks(db, dry_run=not args.apply, batch_size=args.batch_size, restart=args.restart)
+    print(f"Alimentos revisados: {res['total']}")
+    print(f"Con máscara nueva o distinta: {res['changed']}")
+    if res["unknown"]:
+        print("Alérgenos sin bit en data/allergens.json (no se pueden filtrar):")
+        for term, count in sorted(res["unknown"].items(), key=lambda item: -item[1])[:20]:
+            print(f"  - {term}: {count}")
+    if args.apply:
+        print(f"Actualizados: {res['updated']}")
+    else:
+        print("(DRY RUN - use --apply para escribir las máscaras)")
+
+
+if __name__ == "__main__":
+    main()
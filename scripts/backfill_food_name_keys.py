@@ -0,0 +1,72 @@
+"""
+Script para calcular el nombre normalizado (`name_normalized`) de los alimentos existentes.
+
+Las búsquedas por nombre de `repository/foods.py` filtran por ese campo (indexado) en lugar
+de una regex sin distinguir mayúsculas; los alimentos creados antes no lo tienen y no se
+encontrarían por nombre hasta ejecutar este script. Solo escribe los que cambian. Avisa de
+los nombres que coinciden al normalizarlos (p. ej. "Pan" y "pan"): la búsqueda devuelve uno.
+
+Uso:
+  python backfill_food_name_keys.py            # dry-run
+  python backfill_food_name_keys.py --apply
+"""
+
+import argparse
+from datetime import datetime
+from dotenv import load_dotenv
+from pymongo import UpdateOne
+
+from bionexo.infrastructure.utils.db import get_db
+from bionexo.infrastructure.utils.migrations import MigrationRunner
+from bionexo.repository.food_catalog import catalog_key
+from bionexo.repository.foods import NAME_KEY_FIELD
+
+load_dotenv()
+
+
+def backfill_food_name_keys(db, dry_run: bool = True, batch_size: int = 1000, restart: bool = False) -> dict:
+    seen: dict[str, str] = {}
+    collisions: list[tuple[str, str]] = []
+
+    def transform(doc):
+        if not isinstance(doc.get("name"), str):
+            return None
+        key = catalog_key(doc["name"])
+        if key in seen and seen[key] != doc["name"]:
+            collisions.append((seen[key], doc["name"]))
+        seen.setdefault(key, doc["name"])
+        if doc.get(NAME_KEY_FIELD) == key:
+            return None
+        # updated_at para que el catálogo y el índice de búsqueda en memoria vean el cambio
+        return UpdateOne({"_id": doc["_id"]}, {"$set": {NAME_KEY_FIELD: key, "updated_at": datetime.now()}})
+
+    runner = MigrationRunner(
+        db, "backfill_food_name_keys", "foods", batch_size=batch_size, dry_run=dry_run, resume=not restart
+    )
+    stats = runner.run(transform, projection={"name": 1, NAME_KEY_FIELD: 1})
+    return {"total": stats.scanned, "changed": stats.changed, "updated": stats.written, "collisions": collisions}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Calcula name_normalized para los alimentos existentes")
+    parser.add_argument("--apply", action="store_true", help="Aplicar cambios (por defecto dry-run)")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Documentos por bulk_write")
+    parser.add_argument("--restart", action="store_true", help="Ignorar el checkpoint y empezar desde el principio")
+    args = parser.parse_args()
+
+    db = get_db()
+    res = backfill_food_name_keys(db, dry_run=not args.apply, batch_size=args.batch_size, restart=args.restart)
+    print(f"Alimentos revisados: {res['total']}")
+    print(f"Sin nombre normalizado o distinto: {res['changed']}")
+    if res["collisions"]:
+        print("Nombres que coinciden sin distinguir mayúsculas (la búsqueda por nombre devuelve uno):")
+        for first, other in res["collisions"][:20]:
+            print(f"  - {first!r} / {other!r}")
+    if args.apply:
+        print(f"Actualizados: {res['updated']}")
+    else:
+        print("(DRY RUN - use --apply para escribir los nombres normalizados)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Script para calcular el vector de nutrientes (`nutrient_vector`) de los alimentos existentes.
+
+Los alimentos guardados antes de tener vectores (o con un layout antiguo) se
+actualizan a partir de sus campos de macros, vitaminas y minerales.
+
+Uso:
+  python backfill_nutrient_vectors.py            # dry-run
+  python backfill_nutrient_vectors.py --apply
+"""
+
+import argparse
+from dotenv import load_dotenv
+from bson import Binary
+from pymongo import UpdateOne
+
+from bionexo.infrastructure.utils.db import get_db
+from bionexo.infrastructure.utils.migrations import MigrationRunner
+from bionexo.repository.nutrient_vectors import NUTRIENT_LAYOUT, document_vector, vector_to_binary
+
+load_dotenv()
+
+
+def backfill_nutrient_vectors(db, dry_run: bool = True, batch_size: int = 1000) -> dict:
+    query = {"nutrient_vector_layout": {"$ne": NUTRIENT_LAYOUT}}
+    projection = {"kcal_per_100g": 1, "protein_g": 1, "carbs_g": 1, "fat_g": 1, "fiber_g": 1, "vitamins": 1, "minerals": 1}
+
+    def transform(doc):
+        return UpdateOne(
+            {"_id": doc["_id"]},
+            {"$set": {
+                "nutrient_vector": Binary(vector_to_binary(document_vector(doc))),
+                "nutrient_vector_layout": NUTRIENT_LAYOUT,
+            }}
+        )
+
+    # La consulta excluye los ya actualizados: si se interrumpe, basta con relanzarlo
+    runner = MigrationRunner(
+        db, "backfill_nutrient_vectors", "foods", batch_size=batch_size, dry_run=dry_run, sort_key=None
+    )
+    stats = runner.run(transform, query, projection)
+    return {"total": stats.scanned, "updated": stats.written, "docs_per_second": stats.throughput}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Calcula nutrient_vector para los alimentos existentes")
+    parser.add_argument("--apply", action="store_true", help="Aplicar cambios (por defecto dry-run)")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Documentos por bulk_write")
+    args = parser.parse_args()
+
+    db = get_db()
+    res = backfill_nutrient_vectors(db, dry_run=not args.apply, batch_size=args.batch_size)
+    print(f"Alimentos sin vector actualizado: {res['total']}")
+    if args.apply:
+        print(f"Actualizados: {res['updated']}")
+    else:
+        print("(DRY RUN - use --apply para escribir los vectores)")
+
+
+if __name__ == "__main__":
+    main()
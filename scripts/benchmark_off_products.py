@@ -0,0 +1,136 @@
+"""
+Benchmark de memoria del parseo de productos de Open Food Facts.
+
+Compara la memoria retenida por cada 1.000 productos con el parseo antiguo
+(dict con `raw_data` = payload completo) frente a `OFFProduct` con whitelist.
+Los productos se generan sintéticamente imitando el tamaño de un payload real
+de OFF (cientos de claves y knowledge panels anidados), no hace falta red.
+
+Uso:
+  python benchmark_off_products.py
+  python benchmark_off_products.py --products 5000 --extra-keys 400
+"""
+
+import argparse
+import gc
+import random
+import time
+import tracemalloc
+
+from bionexo.repository.entity.open_food_facts import OFF_DEFAULT_RAW_FIELDS, OFFProduct
+
+
+def make_off_payload(i: int, extra_keys: int = 300) -> dict:
+    """Genera un producto con una forma parecida a la respuesta `fields=all` de OFF."""
+    rnd = random.Random(i)
+    nutriments = {}
+    for name in ("energy-kcal", "energy", "fat", "saturated-fat", "carbohydrates", "sugars",
+                 "fiber", "proteins", "salt", "sodium", "calcium", "iron", "vitamin-c"):
+        value = round(rnd.uniform(0, 50), 3)
+        nutriments[f"{name}_100g"] = value
+        nutriments[f"{name}_serving"] = value
+        nutriments[f"{name}_value"] = value
+        nutriments[f"{name}_unit"] = "g"
+        nutriments[name] = value
+
+    product = {
+        "code": f"{8400000000000 + i}",
+        "product_name": f"Producto {i}",
+        "brands": f"Marca {i % 50}",
+        "categories": "Alimentos de origen vegetal, Bebidas",
+        "nutriments": nutriments,
+        "allergens_tags": ["en:milk", "en:gluten"] if i % 3 == 0 else ["en:nuts"],
+        "ingredients_text": "agua, azúcar, leche en polvo, cacao, emulgente (lecitina de soja), aroma",
+        "image_url": f"https://images.openfoodfacts.org/images/products/{i}/front_es.jpg",
+        "quantity": "500 g",
+        "serving_size": "30 g",
+        "nutriscore_grade": rnd.choice("abcde"),
+        "nova_group": rnd.randint(1, 4),
+        "ecoscore_grade": rnd.choice("abcde"),
+        "labels_tags": ["en:organic", "en:eu-organic"],
+        "traces_tags": ["en:soybeans"],
+        "ingredients_analysis_tags": ["en:palm-oil-free", "en:vegetarian"],
+        "ingredients": [
+            {"id": f"en:ingredient-{k}", "text": f"ingrediente {k}", "percent_estimate": rnd.random() * 100,
+             "vegan": "yes", "vegetarian": "yes"}
+            for k in range(12)
+        ],
+        "knowledge_panels": {
+            f"panel_{k}": {
+                "title_element": {"title": f"Panel {k}", "subtitle": "Información adicional del producto"},
+                "elements": [{"text_element": {"html": "<p>" + "texto " * 20 + "</p>"}} for _ in range(4)],
+            }
+            for k in range(15)
+        },
+    }
+    for k in range(extra_keys):
+        product[f"extra_field_{k}"] = f"valor {k} del producto {i}"
+    return product
+
+
+def legacy_parse(product_data: dict) -> dict:
+    """Copia del `_parse_product` anterior, que retenía el payload completo."""
+    nutriments = product_data.get('nutriments', {})
+    return {
+        'barcode': product_data.get('code'),
+        'name': product_data.get('product_name', 'Desconocido'),
+        'brands': product_data.get('brands', ''),
+        'categories': product_data.get('categories', ''),
+        'kcal_per_100g': nutriments.get('energy-kcal_100g') or nutriments.get('energy_100g', 0) / 4.184 if nutriments.get('energy_100g') else 0,
+        'nutrients': {
+            'protein': nutriments.get('proteins_100g', 0),
+            'carbs': nutriments.get('carbohydrates_100g', 0),
+            'fat': nutriments.get('fat_100g', 0),
+            'fiber': nutriments.get('fiber_100g', 0),
+            'sugars': nutriments.get('sugars_100g', 0),
+            'salt': nutriments.get('salt_100g', 0),
+        },
+        'allergens': product_data.get('allergens_tags', []),
+        'ingredients': product_data.get('ingredients_text', ''),
+        'image_url': product_data.get('image_url'),
+        'raw_data': product_data
+    }
+
+
+def measure(parse, n_products: int, extra_keys: int) -> tuple[int, float]:
+    """Devuelve (bytes retenidos, segundos de parseo) para `n_products` productos."""
+    # Tiempo medido sin tracemalloc, que ralentiza mucho las asignaciones
+    payloads = [make_off_payload(i, extra_keys) for i in range(n_products)]
+    start = time.perf_counter()
+    parsed = [parse(p) for p in payloads]
+    elapsed = time.perf_counter() - start
+    del parsed, payloads
+
+    gc.collect()
+    tracemalloc.start()
+    payloads = [make_off_payload(i, extra_keys) for i in range(n_products)]
+    parsed = [parse(p) for p in payloads]
+    # La respuesta de la API se descarta; solo queda lo que retiene el parseo
+    del payloads
+    gc.collect()
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del parsed
+    return retained, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de memoria de productos OFF parseados")
+    parser.add_argument("--products", type=int, default=1000, help="Número de productos a parsear")
+    parser.add_argument("--extra-keys", type=int, default=300, help="Claves extra por producto sintético")
+    args = parser.parse_args()
+
+    per_1000 = 1000 / args.products
+
+    legacy_bytes, legacy_time = measure(legacy_parse, args.products, args.extra_keys)
+    lean_bytes, lean_time = measure(lambda p: OFFProduct.from_off(p, OFF_DEFAULT_RAW_FIELDS), args.products, args.extra_keys)
+
+    print(f"Productos: {args.products} (claves extra por producto: {args.extra_keys})")
+    print(f"- Antes  (dict + raw_data completo): {legacy_bytes * per_1000 / 1024 / 1024:8.2f} MiB / 1000 productos, parseo {legacy_time * 1000:.1f} ms")
+    print(f"- Ahora  (OFFProduct + whitelist):   {lean_bytes * per_1000 / 1024 / 1024:8.2f} MiB / 1000 productos, parseo {lean_time * 1000:.1f} ms")
+    if lean_bytes:
+        print(f"- Reducción: x{legacy_bytes / lean_bytes:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+Script para exportar ingestas, reportes de bienestar y alimentos a Parquet.
+
+Escribe un dataset particionado por usuario y mes (sin imágenes) en el directorio de
+salida. Por defecto es incremental: solo exporta lo posterior a la última ejecución. Con --user
+(siempre con --full) se rehace solo la partición de ese usuario, hasta la última ejecución
+global.
+
+Uso:
+  python export_parquet.py --output exports/
+  python export_parquet.py --output exports/ --collections intakes wellness_logs
+  python export_parquet.py --output exports/ --full
+  python export_parquet.py --output exports/ --full --user user@example.com
+"""
+
+import argparse
+from dotenv import load_dotenv
+
+from bionexo.infrastructure.utils.db import get_db
+from bionexo.repository.exports import EXPORT_DIR, EXPORT_SPECS, ExportInProgressError, export_all
+
+load_dotenv()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exporta el histórico a Parquet particionado por usuario y mes")
+    parser.add_argument("--output", default=str(EXPORT_DIR), help="Directorio de salida del dataset")
+    parser.add_argument("--collections", nargs="+", choices=list(EXPORT_SPECS), help="Colecciones a exportar (por defecto todas)")
+    parser.add_argument("--full", action="store_true", help="Exportación completa (borra el dataset e ignora la marca de agua)")
+    parser.add_argument("--user", help="Rehacer solo la partición de este user_id (requiere --full; no mueve la marca de agua)")
+    parser.add_argument("--batch-size", type=int, default=5000, help="Documentos por lote de Arrow")
+    args = parser.parse_args()
+    if args.user and not args.full:
+        parser.error("--user requiere --full")
+
+    db = get_db()
+    try:
+        results = export_all(
+            db,
+            output_dir=args.output,
+            collections=args.collections,
+            batch_size=args.batch_size,
+            full=args.full,
+            user_id=args.user
+        )
+    except (ExportInProgressError, ValueError) as e:
+        parser.exit(1, f"{e}\n")
+    for res in results:
+        print(f"- {res['collection']}: {res['rows']} filas en {res['files']} ficheros (marca de agua: {res['high_water']})")
+
+
+if __name__ == "__main__":
+    main()
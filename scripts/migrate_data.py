@@ -3,6 +3,15 @@ Script de Migración de Datos - Bionexo
 Actualiza documentos existentes en MongoDB para usar los nuevos campos.
 
 IMPORTANTE: Realizar backup de la base de datos antes de ejecutar este script.
+
+Estrategias de escritura (`--strategy`):
+- rewrite (por defecto): copia la colección entera, ya transformada, a una colección nueva
+  con las mismas opciones time-series (inserciones ordenadas por usuario y fecha), crea los
+  índices y cambia los nombres. La colección original queda como `<colección>_backup_rewrite`.
+  Las time-series no se pueden renombrar y se recrean: hay que detener antes las escrituras
+  de la aplicación y pasar `--writes-frozen`.
+- replace: sustituye solo los documentos pendientes por lotes (delete_many + insert_many).
+  Útil cuando quedan pocos documentos por migrar.
 """
 
 import os
@@ -12,6 +21,8 @@ from datetime import datetime
 import argparse
 from typing import Optional
 
+from bionexo.infrastructure.utils.migrations import MigrationRunner, rewrite_collection
+
 # Cargar variables de entorno
 load_dotenv()
 
@@ -120,7 +131,101 @@ def convert_digestive_issues_to_scale(digestive_issues: str) -> Optional[int]:
     
     return comfort_scale
 
-def migrate_intakes(db, dry_run: bool = True) -> dict:
+# Ejemplos de cambios que se muestran en el preview
+PREVIEW_EXAMPLES = 10
+
+def intake_updates(doc: dict) -> dict:
+    """Campos nuevos de una ingesta antigua (vacío si ya está migrada)."""
+    update_dict = {}
+    
+    # Convertir feeling → feeling_scale
+    if "feeling" in doc and "feeling_scale" not in doc:
+        update_dict["feeling_scale"] = convert_feeling_to_scale(doc.get("feeling"))
+    
+    # Agregar meal_type si no existe
+    if "meal_type" not in doc:
+        update_dict["meal_type"] = "Comida"  # Por defecto
+    
+    # Agregar quantity_type si no existe
+    if "quantity_type" not in doc:
+        # Si hay cantidad en gramos, usar "gramos"
+        update_dict["quantity_type"] = "gramos" if doc.get("quantity") else "descriptiva"
+    
+    return update_dict
+
+def wellness_updates(doc: dict) -> dict:
+    """Campos nuevos de un reporte de bienestar antiguo (vacío si ya está migrado)."""
+    update_dict = {}
+    
+    # Agregar digestive_comfort_scale basado en digestive_issues si existe
+    if "digestive_issues" in doc and "digestive_comfort_scale" not in doc:
+        update_dict["digestive_comfort_scale"] = convert_digestive_issues_to_scale(doc.get("digestive_issues"))
+    elif "digestive_comfort_scale" not in doc:
+        # Si no hay digestive_issues, poner valor neutro
+        update_dict["digestive_comfort_scale"] = 5
+    
+    # Agregar appetite_scale basado en appetite antiguo si existe
+    if "appetite" in doc and "appetite_scale" not in doc:
+        appetite_scale = convert_appetite_to_scale(doc.get("appetite"))
+        if appetite_scale is not None:
+            update_dict["appetite_scale"] = appetite_scale
+    elif "appetite_scale" not in doc:
+        # Si no hay appetite antiguo, poner valor neutro
+        update_dict["appetite_scale"] = 5
+    
+    return update_dict
+
+def _migrate_timeseries(
+        db, name: str, collection: str, query: dict, updates, label, dry_run: bool, batch_size: int,
+        strategy: str = "rewrite", force_backup: bool = False, writes_frozen: bool = False
+) -> dict:
+    """
+    Aplica `updates` a los documentos de una colección time-series, que no admiten updates
+    arbitrarios.
+    
+    - "rewrite": `rewrite_collection` copia todos los documentos (con los cambios aplicados)
+      a una colección nueva y la intercambia con la original. Es la opción rápida cuando hay
+      que tocar gran parte de la colección. Como las time-series no se pueden renombrar, la
+      original se recrea y exige `writes_frozen` (la aplicación sin escribir).
+    - "replace": se reescriben por lotes solo los documentos de `query` (delete_many +
+      insert_many del lote). La consulta excluye los ya migrados, así que si se interrumpe
+      basta con relanzarlo.
+    """
+    examples = []
+    changed = {"n": 0}
+    
+    def merged(doc):
+        update_dict = updates(doc)
+        if not update_dict:
+            return None
+        changed["n"] += 1
+        if len(examples) < PREVIEW_EXAMPLES:
+            examples.append(f"  • {label(doc)}: {update_dict}")
+        # Combinar documento original con actualizaciones (se mantiene el _id)
+        return {**doc, **update_dict}
+    
+    if strategy == "rewrite":
+        if not db[collection].count_documents(query, limit=1):
+            print("  Nada que migrar")
+            return {"total": 0, "updated": 0, "errors": 0, "docs_per_second": 0.0}
+        stats = rewrite_collection(
+            db, collection, lambda doc: merged(doc) or doc,
+            batch_size=batch_size, dry_run=dry_run, force_backup=force_backup, writes_frozen=writes_frozen
+        )
+    else:
+        runner = MigrationRunner(
+            db, name, collection, mode="replace", sort_key=None, batch_size=batch_size, dry_run=dry_run
+        )
+        stats = runner.run(merged, query)
+        changed["n"] = stats.changed
+    for line in examples:
+        print(line)
+    return {"total": stats.scanned, "updated": changed["n"], "errors": stats.errors, "docs_per_second": stats.throughput}
+
+def migrate_intakes(
+        db, dry_run: bool = True, batch_size: int = 1000, strategy: str = "rewrite", force_backup: bool = False,
+        writes_frozen: bool = False
+) -> dict:
     """
     Migra documentos en la colección 'intakes'.
     
@@ -129,8 +234,6 @@ def migrate_intakes(db, dry_run: bool = True) -> dict:
     - Agrega meal_type si no existe (por defecto "Comida")
     - Agrega quantity_type si no existe (por defecto "gramos")
     """
-    intakes_collection = db["intakes"]
-    
     # Encontrar documentos sin los nuevos campos
     query = {
         "$or": [
@@ -139,58 +242,19 @@ def migrate_intakes(db, dry_run: bool = True) -> dict:
         ]
     }
     
-    documents = list(intakes_collection.find(query))
-    count_modified = 0
-    
     print(f"\n📊 MIGRACIÓN DE INGESTAS")
     print(f"─" * 50)
-    print(f"Documentos a actualizar: {len(documents)}")
-    
-    if len(documents) == 0:
-        print("✅ No hay documentos para migrar.")
-        return {"total": 0, "updated": 0, "errors": 0}
-    
-    for doc in documents:
-        try:
-            update_dict = {}
-            
-            # Convertir feeling → feeling_scale
-            if "feeling" in doc and "feeling_scale" not in doc:
-                feeling_scale = convert_feeling_to_scale(doc.get("feeling"))
-                update_dict["feeling_scale"] = feeling_scale
-                print(f"  • {doc.get('food_name', 'Unknown')}: '{doc.get('feeling')}' → {feeling_scale}/10")
-            
-            # Agregar meal_type si no existe
-            if "meal_type" not in doc:
-                update_dict["meal_type"] = "Comida"  # Por defecto
-                print(f"  • {doc.get('food_name', 'Unknown')}: meal_type = 'Comida' (default)")
-            
-            # Agregar quantity_type si no existe
-            if "quantity_type" not in doc:
-                # Si hay cantidad en gramos, usar "gramos"
-                if doc.get("quantity"):
-                    update_dict["quantity_type"] = "gramos"
-                else:
-                    update_dict["quantity_type"] = "descriptiva"
-                print(f"  • {doc.get('food_name', 'Unknown')}: quantity_type = '{update_dict['quantity_type']}'")
-            
-            # Ejecutar actualización (delete + insert para time-series)
-            if update_dict:
-                if not dry_run:
-                    # Para time-series: eliminar documento antiguo e insertar uno nuevo
-                    intakes_collection.delete_one({"_id": doc["_id"]})
-                    # Combinar documento original con actualizaciones
-                    updated_doc = {**doc, **update_dict}
-                    # No remover _id, es necesario mantenerlo
-                    intakes_collection.insert_one(updated_doc)
-                count_modified += 1
-        
-        except Exception as e:
-            print(f"  ❌ Error procesando {doc.get('food_name', 'Unknown')}: {str(e)}")
-    
-    return {"total": len(documents), "updated": count_modified, "errors": 0}
+    print(f"Documentos a actualizar: {db['intakes'].count_documents(query)}")
+    
+    return _migrate_timeseries(
+        db, "migrate_data.intakes", "intakes", query, intake_updates,
+        lambda doc: doc.get("food_name", "Unknown"), dry_run, batch_size, strategy, force_backup, writes_frozen
+    )
 
-def migrate_wellness_reports(db, dry_run: bool = True) -> dict:
+def migrate_wellness_reports(
+        db, dry_run: bool = True, batch_size: int = 1000, strategy: str = "rewrite", force_backup: bool = False,
+        writes_frozen: bool = False
+) -> dict:
     """
     Migra documentos en la colección 'wellness_logs'.
     
@@ -199,8 +263,6 @@ def migrate_wellness_reports(db, dry_run: bool = True) -> dict:
     - Se agrega digestive_comfort_scale (1-10) si no existe
     - Se agrega appetite_scale (1-10) si no existe (basado en appetite antiguo si existe)
     """
-    wellness_collection = db["wellness_logs"]
-    
     # Encontrar documentos sin los nuevos campos
     query = {
         "$or": [
@@ -209,57 +271,14 @@ def migrate_wellness_reports(db, dry_run: bool = True) -> dict:
         ]
     }
     
-    documents = list(wellness_collection.find(query))
-    count_modified = 0
-    
     print(f"\n📊 MIGRACIÓN DE REPORTES DE BIENESTAR")
     print(f"─" * 50)
-    print(f"Documentos a actualizar: {len(documents)}")
-    
-    if len(documents) == 0:
-        print("✅ No hay documentos para migrar.")
-        return {"total": 0, "updated": 0, "errors": 0}
-    
-    for doc in documents:
-        try:
-            update_dict = {}
-            
-            # Agregar digestive_comfort_scale basado en digestive_issues si existe
-            if "digestive_issues" in doc and "digestive_comfort_scale" not in doc:
-                digestive_scale = convert_digestive_issues_to_scale(doc.get("digestive_issues"))
-                update_dict["digestive_comfort_scale"] = digestive_scale
-                print(f"  • Digestión: '{doc.get('digestive_issues', 'N/A')}' → {digestive_scale}/10")
-            elif "digestive_comfort_scale" not in doc:
-                # Si no hay digestive_issues, poner valor neutro
-                update_dict["digestive_comfort_scale"] = 5
-                print(f"  • Digestión: sin datos → 5/10 (neutro)")
-            
-            # Agregar appetite_scale basado en appetite antiguo si existe
-            if "appetite" in doc and "appetite_scale" not in doc:
-                appetite_scale = convert_appetite_to_scale(doc.get("appetite"))
-                if appetite_scale is not None:
-                    update_dict["appetite_scale"] = appetite_scale
-                    print(f"  • Apetito: '{doc.get('appetite', 'N/A')}' → {appetite_scale}/10")
-            elif "appetite_scale" not in doc:
-                # Si no hay appetite antiguo, poner valor neutro
-                update_dict["appetite_scale"] = 5
-                print(f"  • Apetito: sin datos → 5/10 (neutro)")
-            
-            # Ejecutar actualización (delete + insert para time-series)
-            if update_dict:
-                if not dry_run:
-                    # Para time-series: eliminar documento antiguo e insertar uno nuevo
-                    wellness_collection.delete_one({"_id": doc["_id"]})
-                    # Combinar documento original con actualizaciones
-                    updated_doc = {**doc, **update_dict}
-                    # No remover _id, es necesario mantenerlo
-                    wellness_collection.insert_one(updated_doc)
-                count_modified += 1
-        
-        except Exception as e:
-            print(f"  ❌ Error procesando documento: {str(e)}")
-    
-    return {"total": len(documents), "updated": count_modified, "errors": 0}
+    print(f"Documentos a actualizar: {db['wellness_logs'].count_documents(query)}")
+    
+    return _migrate_timeseries(
+        db, "migrate_data.wellness_logs", "wellness_logs", query, wellness_updates,
+        lambda doc: str(doc.get("timestamp")), dry_run, batch_size, strategy, force_backup, writes_frozen
+    )
 
 def show_sample_documents(db):
     """Muestra ejemplos de documentos antes y después."""
@@ -304,6 +323,28 @@ def main():
         action="store_true",
         help="Migrar solo reportes de bienestar"
     )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=1000,
+        help="Documentos por lote de escritura"
+    )
+    parser.add_argument(
+        "--strategy",
+        choices=["rewrite", "replace"],
+        default="rewrite",
+        help="rewrite: copiar a una colección nueva e intercambiarlas; replace: sustituir por lotes solo los pendientes"
+    )
+    parser.add_argument(
+        "--force-backup",
+        action="store_true",
+        help="Con --strategy rewrite, sobrescribir el backup de una ejecución anterior"
+    )
+    parser.add_argument(
+        "--writes-frozen",
+        action="store_true",
+        help="Con --strategy rewrite, confirmar que la aplicación no escribe durante la migración (obligatorio en time-series)"
+    )
     parser.add_argument(
         "--show-samples",
         action="store_true",
@@ -336,11 +377,17 @@ def main():
     
     # Migrar ingestas
     if not args.wellness_only:
-        results["intakes"] = migrate_intakes(db, dry_run=dry_run)
+        results["intakes"] = migrate_intakes(
+            db, dry_run=dry_run, batch_size=args.batch_size, strategy=args.strategy, force_backup=args.force_backup,
+            writes_frozen=args.writes_frozen
+        )
     
     # Migrar reportes de bienestar
     if not args.intakes_only:
-        results["wellness"] = migrate_wellness_reports(db, dry_run=dry_run)
+        results["wellness"] = migrate_wellness_reports(
+            db, dry_run=dry_run, batch_size=args.batch_size, strategy=args.strategy, force_backup=args.force_backup,
+            writes_frozen=args.writes_frozen
+        )
     
     # Resumen
     print(f"\n{'=' * 60}")
@@ -352,12 +399,14 @@ def main():
         print(f"  • Total procesados: {results['intakes'].get('total', 0)}")
         print(f"  • Actualizados: {results['intakes'].get('updated', 0)}")
         print(f"  • Errores: {results['intakes'].get('errors', 0)}")
+        print(f"  • Ritmo: {results['intakes'].get('docs_per_second', 0):.0f} docs/s")
     
     if not args.intakes_only:
         print(f"\n📊 Reportes de Bienestar:")
         print(f"  • Total procesados: {results['wellness'].get('total', 0)}")
         print(f"  • Actualizados: {results['wellness'].get('updated', 0)}")
         print(f"  • Errores: {results['wellness'].get('errors', 0)}")
+        print(f"  • Ritmo: {results['wellness'].get('docs_per_second', 0):.0f} docs/s")
     
     if dry_run:
         print(f"\n💡 PRÓXIMO PASO:")
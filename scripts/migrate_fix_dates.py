@@ -7,19 +7,47 @@ Características:
 - Opciones para intentar intercambiar día/mes cuando corresponde.
 - Opción para sumar un día cuando sea necesario.
 - `--dry-run` por defecto; usar `--apply` para ejecutar cambios.
+- Lee por lotes y escribe con bulk_write; guarda un checkpoint en `migrations` y, si se
+  interrumpe, la siguiente ejecución continúa donde lo dejó (`--restart` para empezar de cero).
+- En dry-run muestra un informe de diferencias: cambios por campo, desplazamientos más
+  frecuentes (antes → después) y ejemplos.
+
+Motores (`--engine`):
+- pandas (por defecto): cada lote del cursor se corrige de forma vectorizada (parseo,
+  intercambio día/mes, día extra y conversión a UTC por columnas). Los valores que no
+  encajan (textos con offset, fechas con tzinfo) pasan por la versión documento a documento.
+- python: la versión documento a documento (`fixed_dates`).
+- server: todo en MongoDB con un update de pipeline (`$dateToParts`/`$dateFromParts`) por
+  campo, sin traer documentos. Solo corrige valores de tipo fecha; los textos requieren
+  los otros motores. Exige `--tz` (MongoDB no conoce la zona de la máquina y un offset fijo
+  se equivocaría en los cambios de horario). Cada documento corregido queda marcado en
+  `_dates_fixed.<campo>`, que excluye la consulta: si se corta o se relanza, no se
+  desplaza dos veces (`--restart` borra las marcas).
+
+Si la zona es UTC y no se pide intercambio ni día extra, no hay nada que corregir y la
+colección no se recorre.
 
 Uso:
   python migrate_fix_dates.py --dry-run --collections intakes,wellness_logs --fix-swap
+  python migrate_fix_dates.py --apply --engine server --tz Europe/Madrid --add-day
 
 Precaución: ejecutar primero en `--dry-run` y revisar el resumen.
 """
 
 import os
 import argparse
+from collections import Counter
 from datetime import datetime, timedelta
-from pymongo import MongoClient
+import numpy as np
+import pandas as pd
+from pymongo import MongoClient, UpdateOne
 from dateutil import parser as date_parser
-from dateutil.tz import tzutc, tzlocal
+from dateutil.tz import gettz, tzutc, tzlocal
+
+from bionexo.infrastructure.utils.migrations import MigrationRunner
+
+# Documentos con cambios que se muestran en dry-run
+PREVIEW_EXAMPLES = 20
 
 
 def get_db(uri=None):
@@ -41,10 +69,13 @@ def parse_dt(value):
     return None
 
 
-def ensure_utc_naive(dt: datetime) -> datetime:
-    """Convierte a UTC y retorna datetime naive (sin tzinfo) apropiado para almacenar en MongoDB."""
+def ensure_utc_naive(dt: datetime, tz=None) -> datetime:
+    """
+    Convierte a UTC y retorna datetime naive (sin tzinfo) apropiado para almacenar en MongoDB.
+    Las fechas naive se interpretan en `tz` (por defecto, la zona local de la máquina).
+    """
     if dt.tzinfo is None:
-        dt = dt.replace(tzinfo=tzlocal())
+        dt = dt.replace(tzinfo=tz or tzlocal())
     dt_utc = dt.astimezone(tzutc())
     # PyMongo stores datetimes as naive UTC; quitamos tzinfo
     return dt_utc.replace(tzinfo=None)
@@ -65,74 +96,315 @@ def try_swap_day_month(dt: datetime):
         return None
 
 
-def process_collection(db, coll_name, fields, dry_run=True, fix_swap=False, force_swap=False, add_day=False):
-    coll = db[coll_name]
-    cursor = coll.find({})
-    total = 0
-    modified = 0
-    errors = 0
-
-    for doc in cursor:
-        total += 1
-        updates = {}
-        for field in fields:
-            if field not in doc:
-                continue
-            orig = doc[field]
-            parsed = parse_dt(orig)
-            if parsed is None:
-                # intentar saltar si es None
-                continue
+def fixed_dates(doc, fields, fix_swap=False, force_swap=False, add_day=False, tz=None) -> dict:
+    """Campos de fecha corregidos de un documento (solo los que cambian)."""
+    updates = {}
+    for field in fields:
+        if field not in doc:
+            continue
+        orig = doc[field]
+        parsed = parse_dt(orig)
+        if parsed is None:
+            # intentar saltar si es None
+            continue
+
+        new_dt = parsed
+
+        # Si se detecta mes inválido (>12) y fix_swap está activado, intentar swap
+        if (force_swap or (fix_swap and new_dt.month > 12)):
+            swapped = try_swap_day_month(new_dt)
+            if swapped:
+                new_dt = swapped
+
+        # Aplicar add_day si solicitado
+        if add_day:
+            new_dt = new_dt + timedelta(days=1)
+
+        # Convertir a UTC naive (los errores los cuenta process_collection)
+        utc_naive = ensure_utc_naive(new_dt, tz)
+
+        # Comparar con valor actual; si distinto, actualizar
+        if isinstance(orig, datetime):
+            current = orig.replace(tzinfo=None)
+        else:
+            # Si era string u otro, usar parsed->utc for comparison
+            try:
+                cur_parsed = parse_dt(orig)
+                current = ensure_utc_naive(cur_parsed, tz) if cur_parsed else None
+            except Exception:
+                current = None
+
+        if current != utc_naive:
+            updates[field] = utc_naive
+    return updates
+
+
+# --- Corrección vectorizada (pandas) ---
+
+# Textos con offset explícito: se parsean con dateutil para conservar su zona
+_OFFSET_PATTERN = r"(?:Z|[+-]\d{2}:?\d{2})\s*$"
+
+
+def _to_utc_naive(values: pd.Series, tz=None) -> pd.Series:
+    """`ensure_utc_naive` por columnas para fechas naive."""
+    # gettz() lee la zona local de TZ o /etc/localtime: pandas la aplica por tramos, no fila a fila
+    zone = tz or gettz() or tzlocal()
+    # En el cambio de hora de otoño se toma la primera pasada (horario de verano), como fold=0
+    ambiguous = np.ones(len(values), dtype=bool)
+    localized = values.dt.tz_localize(zone, ambiguous=ambiguous, nonexistent="NaT")
+    gap = localized.isna() & values.notna()
+    if gap.any():
+        # Horas que no existen (cambio de primavera): dateutil les aplica el offset de verano,
+        # que equivale a la hora anterior en horario de invierno
+        localized[gap] = (values[gap] - pd.Timedelta(hours=1)).dt.tz_localize(
+            zone, ambiguous=ambiguous[:int(gap.sum())], nonexistent="NaT"
+        )
+    return localized.dt.tz_convert("UTC").dt.tz_localize(None)
+
+
+def _swap_day_month(values: pd.Series) -> pd.Series:
+    """`try_swap_day_month` por columnas: las fechas sin intercambio válido no cambian."""
+    swapped = pd.to_datetime(
+        pd.DataFrame({"year": values.dt.year, "month": values.dt.day, "day": values.dt.month}),
+        errors="coerce"
+    ) + (values - values.dt.normalize())
+    return swapped.where(swapped.notna(), values)
 
-            new_dt = parsed
 
-            # Si se detecta mes inválido (>12) y fix_swap está activado, intentar swap
-            if (force_swap or (fix_swap and new_dt.month > 12)):
-                swapped = try_swap_day_month(new_dt)
-                if swapped:
-                    new_dt = swapped
+def _parse_strings(values: pd.Series) -> pd.Series:
+    parsed = pd.to_datetime(values, errors="coerce", format="ISO8601")
+    retry = parsed.isna()
+    if retry.any():
+        parsed[retry] = pd.to_datetime(values[retry], errors="coerce", format="mixed")
+    return parsed
 
-            # Aplicar add_day si solicitado
-            if add_day:
-                new_dt = new_dt + timedelta(days=1)
 
-            # Convertir a UTC naive
+def fixed_dates_batch(docs, fields, fix_swap=False, force_swap=False, add_day=False, tz=None) -> list[dict]:
+    """
+    `fixed_dates` para un lote de documentos: devuelve las correcciones de cada documento
+    (vacías si no cambia). Las fechas naive y los textos sin offset se corrigen por columnas;
+    el resto de valores se delega en `fixed_dates`.
+    `fix_swap` no hace nada en la versión vectorizada: una fecha ya parseada nunca tiene mes > 12.
+    """
+    updates = [{} for _ in docs]
+    for field in fields:
+        raw = pd.Series([doc.get(field) for doc in docs], dtype=object)
+        is_naive_dt = raw.map(lambda v: isinstance(v, datetime) and v.tzinfo is None).astype(bool)
+        is_str = raw.map(lambda v: isinstance(v, str)).astype(bool)
+        has_offset = is_str & raw.where(is_str, "").astype(str).str.contains(_OFFSET_PATTERN, regex=True)
+        plain_str = is_str & ~has_offset
+
+        parsed = pd.Series(pd.NaT, index=raw.index, dtype="datetime64[us]")
+        if is_naive_dt.any():
+            parsed[is_naive_dt] = pd.to_datetime(raw[is_naive_dt].tolist()).as_unit("us")
+        if plain_str.any():
+            parsed[plain_str] = _parse_strings(raw[plain_str]).dt.tz_localize(None).astype("datetime64[us]")
+
+        new = parsed
+        if force_swap:
+            new = _swap_day_month(new)
+        if add_day:
+            new = new + pd.Timedelta(days=1)
+        new_utc = _to_utc_naive(new, tz)
+        # Valor actual: las fechas tal cual; los textos, parseados y en UTC (como en fixed_dates)
+        current = parsed.where(is_naive_dt, _to_utc_naive(parsed, tz))
+        changed = new_utc.notna() & (new_utc != current)
+        positions = np.flatnonzero(changed.to_numpy())
+        for i, value in zip(positions, new_utc.iloc[positions].dt.to_pydatetime()):
+            updates[i][field] = value
+
+        # Resto de valores (textos con offset, fechas con tzinfo): documento a documento
+        slow = ~(is_naive_dt | plain_str) & raw.notna()
+        for i in np.flatnonzero(slow.to_numpy()):
+            updates[i].update(fixed_dates(docs[i], [field], fix_swap, force_swap, add_day, tz))
+    return updates
+
+
+def _is_noop(force_swap=False, add_day=False, tz=None) -> bool:
+    """Sin intercambio ni día extra, solo cambian las fechas si la zona no es UTC."""
+    if force_swap or add_day:
+        return False
+    zone = (gettz(tz) if isinstance(tz, str) else tz) or tzlocal()
+    probes = (datetime(2024, 1, 15), datetime(2024, 7, 15))
+    return all(zone.utcoffset(probe) == timedelta(0) for probe in probes)
+
+
+# --- Informe de diferencias (dry-run) ---
+
+class DateDiffReport:
+    """Resumen de los cambios de fechas de una colección."""
+
+    def __init__(self, coll_name: str):
+        self.coll_name = coll_name
+        self.by_field: Counter = Counter()
+        self.shifts: Counter = Counter()
+        self.examples: list[tuple] = []
+
+    def add(self, doc: dict, updates: dict):
+        for field, new in updates.items():
+            old = doc.get(field)
+            self.by_field[field] += 1
+            shift = str(new - old) if isinstance(old, datetime) and old.tzinfo is None else f"{type(old).__name__} → fecha"
+            self.shifts[(field, shift)] += 1
+            if len(self.examples) < PREVIEW_EXAMPLES:
+                self.examples.append((_id_repr(doc), field, old, new))
+
+    def add_server(self, field: str, count: int, shifts: list[dict], examples: list[dict]):
+        self.by_field[field] += count
+        for shift in shifts:
+            self.shifts[(field, str(timedelta(milliseconds=shift["_id"])))] += shift["n"]
+        for example in examples[:max(PREVIEW_EXAMPLES - len(self.examples), 0)]:
+            self.examples.append((str(example["_id"]), field, example["old"], example["new"]))
+
+    def show(self):
+        print(f"\n[DRY] Diferencias en {self.coll_name}:")
+        if not self.by_field:
+            print("  Sin cambios")
+            return
+        for field, count in self.by_field.items():
+            print(f"  - {field}: {count} documentos cambiarían")
+        print("  Desplazamientos más frecuentes:")
+        for (field, shift), count in self.shifts.most_common(10):
+            print(f"    {field}: {shift} ({count})")
+        print("  Ejemplos:")
+        for doc_id, field, old, new in self.examples:
+            print(f"    {doc_id} {field}: {old!r} → {new}")
+
+
+# --- Corrección en el servidor ---
+
+# Marca de los documentos ya corregidos por el motor server (un subcampo por campo de fecha)
+FIXED_MARKER = "_dates_fixed"
+
+
+def server_date_expr(field: str, tz: str, force_swap=False, add_day=False) -> dict:
+    """
+    Expresión de agregación equivalente a `fixed_dates` para un campo de tipo fecha: se toman
+    sus partes (hora de pared), se intercambian día y mes si se pide y el día es <= 12, se
+    suma el día extra y se reconstruye la fecha en la zona `tz` (nombre IANA, con sus cambios
+    de horario; devuelta en UTC).
+    """
+    month, day = "$$p.month", "$$p.day"
+    if force_swap:
+        swap = {"$lte": ["$$p.day", 12]}
+        month, day = {"$cond": [swap, "$$p.day", "$$p.month"]}, {"$cond": [swap, "$$p.month", "$$p.day"]}
+    if add_day:
+        day = {"$add": [day, 1]}  # $dateFromParts acarrea los días sobrantes al mes siguiente
+    return {"$let": {
+        "vars": {"p": {"$dateToParts": {"date": f"${field}"}}},
+        "in": {"$dateFromParts": {
+            "year": "$$p.year", "month": month, "day": day, "hour": "$$p.hour", "minute": "$$p.minute",
+            "second": "$$p.second", "millisecond": "$$p.millisecond", "timezone": tz,
+        }},
+    }}
+
+
+def server_fix_dates(db, coll_name, fields, dry_run=True, force_swap=False, add_day=False, tz=None, report=None,
+                     restart=False):
+    """
+    Corrige los campos de tipo fecha con un update de pipeline por campo: el servidor calcula
+    y escribe la fecha nueva sin enviar documentos. (`$merge` no puede escribir en
+    colecciones time-series; el update de pipeline sí, en el propio sitio.)
+
+    El mismo `$set` marca el documento en `_dates_fixed.<campo>` y la consulta excluye los
+    marcados, así que relanzar tras un corte continúa con los pendientes. Con `restart` se
+    borran antes las marcas y se vuelve a corregir todo.
+    """
+    if not tz:
+        raise ValueError("El motor server necesita la zona horaria (--tz)")
+    coll = db[coll_name]
+    res = {"total": 0, "modified": 0, "errors": 0, "docs_per_second": 0.0}
+    started = datetime.now()
+    if restart and not dry_run:
+        coll.update_many({FIXED_MARKER: {"$exists": True}}, {"$unset": {FIXED_MARKER: ""}})
+    for field in fields:
+        expr = server_date_expr(field, tz, force_swap, add_day)
+        marker = f"{FIXED_MARKER}.{field}"
+        match = {field: {"$type": "date"}, marker: {"$exists": False}, "$expr": {"$ne": [expr, f"${field}"]}}
+        strings = coll.count_documents({field: {"$type": "string"}})
+        if strings:
+            print(f"⚠️ {coll_name}.{field}: {strings} valores de texto no se corrigen con --engine server (use pandas)")
+        if dry_run:
+            facets = next(coll.aggregate([
+                {"$match": match},
+                {"$project": {"old": f"${field}", "new": expr}},
+                {"$facet": {
+                    "count": [{"$count": "n"}],
+                    "shifts": [{"$group": {"_id": {"$subtract": ["$new", "$old"]}, "n": {"$sum": 1}}},
+                               {"$sort": {"n": -1}}, {"$limit": 10}],
+                    "examples": [{"$limit": PREVIEW_EXAMPLES}],
+                }},
+            ], allowDiskUse=True))
+            count = facets["count"][0]["n"] if facets["count"] else 0
+            if report is not None:
+                report.add_server(field, count, facets["shifts"], facets["examples"])
+            res["modified"] += count
+        else:
+            result = coll.update_many(match, [{"$set": {field: expr, marker: True}}])
+            res["total"] += result.matched_count
+            res["modified"] += result.modified_count
+    elapsed = (datetime.now() - started).total_seconds()
+    res["docs_per_second"] = res["modified"] / elapsed if elapsed else 0.0
+    return res
+
+
+def process_collection(db, coll_name, fields, dry_run=True, fix_swap=False, force_swap=False, add_day=False,
+                       batch_size=1000, restart=False, engine="pandas", tz=None, report=None):
+    """
+    Corrige las fechas de una colección con el ejecutor de migraciones: cursor por lotes,
+    updates en bulk_write y checkpoint por `_id` en `migrations` (se reanuda si se corta).
+    Con `engine="pandas"` cada lote se corrige por columnas (`fixed_dates_batch`); con
+    `engine="server"` se delega en `server_fix_dates`.
+    """
+    if _is_noop(force_swap, add_day, tz):
+        print(f"{coll_name}: zona UTC sin intercambio ni día extra, no hay fechas que corregir")
+        return {"total": 0, "modified": 0, "errors": 0, "docs_per_second": 0.0}
+    if engine == "server":
+        return server_fix_dates(db, coll_name, fields, dry_run, force_swap, add_day, tz, report, restart)
+
+    conversion_errors = 0
+
+    def python_updates(docs):
+        nonlocal conversion_errors
+        updates = []
+        for doc in docs:
             try:
-                utc_naive = ensure_utc_naive(new_dt)
+                updates.append(fixed_dates(doc, fields, fix_swap, force_swap, add_day, tz))
             except Exception as e:
-                print(f"Error convirtiendo a UTC doc={doc.get('_id')} field={field}: {e}")
-                errors += 1
-                continue
+                print(f"Error convirtiendo a UTC doc={_id_repr(doc)}: {e}")
+                conversion_errors += 1
+                updates.append({})
+        return updates
 
-            # Si hay diferencia significativa, registrar
-            stored = doc.get(field)
-            # Comparar con valor actual; si distinto, actualizar
-            if isinstance(stored, datetime):
-                current = stored.replace(tzinfo=None)
-            else:
-                # Si era string u otro, usar parsed->utc for comparison
-                try:
-                    cur_parsed = parse_dt(stored)
-                    current = ensure_utc_naive(cur_parsed) if cur_parsed else None
-                except Exception:
-                    current = None
-
-            if current != utc_naive:
-                updates[field] = utc_naive
-
-        if updates:
-            modified += 1
-            if dry_run:
-                print(f"[DRY] {coll_name} {_id_repr(doc)} -> updates: {list(updates.keys())}")
-            else:
-                try:
-                    coll.update_one({"_id": doc["_id"]}, {"$set": updates})
-                    print(f"[OK]  {coll_name} {_id_repr(doc)} updated: {list(updates.keys())}")
-                except Exception as e:
-                    print(f"[ERR] {coll_name} {_id_repr(doc)} failed update: {e}")
-                    errors += 1
-
-    return {"total": total, "modified": modified, "errors": errors}
+    def transform_batch(docs):
+        if engine == "pandas":
+            try:
+                updates = fixed_dates_batch(docs, fields, fix_swap, force_swap, add_day, tz)
+            except Exception:
+                # Valores fuera de rango para pandas u otros casos raros: documento a documento
+                updates = python_updates(docs)
+        else:
+            updates = python_updates(docs)
+        changes = []
+        for doc, doc_updates in zip(docs, updates):
+            if not doc_updates:
+                continue
+            if report is not None:
+                report.add(doc, doc_updates)
+            changes.append(UpdateOne({"_id": doc["_id"]}, {"$set": doc_updates}))
+        return changes
+
+    runner = MigrationRunner(
+        db, f"migrate_fix_dates.{coll_name}", coll_name,
+        batch_size=batch_size, dry_run=dry_run, resume=not restart
+    )
+    stats = runner.run_batches(transform_batch, projection={field: 1 for field in fields})
+    return {
+        "total": stats.scanned,
+        "modified": stats.changed,
+        "errors": stats.errors + conversion_errors,
+        "docs_per_second": stats.throughput,
+    }
 
 
 def _id_repr(doc):
@@ -146,9 +418,20 @@ def main():
     parser.add_argument("--fix-swap", action="store_true", help="Intentar swap día/mes cuando el mes sea inválido")
     parser.add_argument("--force-swap", action="store_true", help="Forzar swap día/mes en todos los documentos")
     parser.add_argument("--add-day", action="store_true", help="Sumar 1 día a las fechas (use con precaución)")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Documentos por lote de escritura")
+    parser.add_argument("--restart", action="store_true", help="Ignorar el checkpoint y empezar desde el principio")
+    parser.add_argument("--engine", choices=["pandas", "python", "server"], default="pandas",
+                        help="pandas: lotes vectorizados; python: documento a documento; server: update de pipeline en MongoDB")
+    parser.add_argument("--tz", default=None,
+                        help="Zona de las fechas naive (p. ej. Europe/Madrid); por defecto la local. Obligatoria con --engine server")
     args = parser.parse_args()
+    if args.engine == "server" and not args.tz:
+        parser.error("--engine server necesita --tz: un offset fijo de la zona local falla en los cambios de horario")
 
     dry_run = not args.apply
+    tz = gettz(args.tz) if args.tz else None
+    if args.tz and tz is None:
+        raise SystemExit(f"Zona horaria desconocida: {args.tz}")
     coll_names = [c.strip() for c in args.collections.split(",") if c.strip()]
 
     db = get_db()
@@ -164,13 +447,19 @@ def main():
             # por defecto intentar timestamp y created_at
             fields = ["timestamp", "created_at"]
 
-        print(f"Procesando colección {coll} campos={fields} dry_run={dry_run}")
-        res = process_collection(db, coll, fields, dry_run=dry_run, fix_swap=args.fix_swap, force_swap=args.force_swap, add_day=args.add_day)
+        print(f"Procesando colección {coll} campos={fields} dry_run={dry_run} engine={args.engine}")
+        report = DateDiffReport(coll) if dry_run else None
+        res = process_collection(db, coll, fields, dry_run=dry_run, fix_swap=args.fix_swap, force_swap=args.force_swap,
+                                 add_day=args.add_day, batch_size=args.batch_size, restart=args.restart,
+                                 engine=args.engine, tz=args.tz if args.engine == "server" else tz, report=report)
+        if report is not None:
+            report.show()
         summary[coll] = res
 
     print("\nResumen de migración:")
     for coll, res in summary.items():
-        print(f"- {coll}: total={res['total']} modificados={res['modified']} errores={res['errors']}")
+        print(f"- {coll}: total={res['total']} modificados={res['modified']} errores={res['errors']} "
+              f"({res['docs_per_second']:.0f} docs/s)")
 
 
 if __name__ == "__main__":
@@ -12,6 +12,7 @@ Uso:
     python migrate_intakes_to_foods.py --user email@example.com
     python migrate_intakes_to_foods.py --show-stats
     python migrate_intakes_to_foods.py --all
+    python migrate_intakes_to_foods.py --all --workers 8 --executor process
 """
 
 import os
@@ -20,47 +21,66 @@ from dotenv import load_dotenv
 from bionexo.infrastructure.utils.db import get_db
 from bionexo.domain.entity.food import Food
 from bionexo.repository.foods import create_or_update_food, get_food_id_by_name
-from collections import defaultdict
+from bionexo.infrastructure.utils.migrations import (
+    MigrationRunner, Partition, run_partitions, user_range_partitions, worker_db
+)
+from pymongo import UpdateOne
+from functools import partial
 import argparse
 from datetime import datetime
 
 load_dotenv()
 
 def get_unique_foods_from_intakes(db, user_id: str = None):
-    """Obtiene las comidas únicas del histórico de intakes, opcionalmente filtrado por usuario."""
+    """
+    Obtiene las comidas únicas del histórico de intakes, opcionalmente filtrado por usuario.
+    Se agrupa en el servidor por nombre (sin distinguir mayúsculas) tomando los datos de la
+    ingesta más reciente; no se cargan las ingestas en memoria.
+    """
     intakes_collection = db["intakes"]
     
-    query = {}
+    match = {"food_name": {"$type": "string"}}
     if user_id:
-        query["user_id"] = user_id
-    
-    # Obtener todos los intakes únicos por nombre de comida
-    intakes = list(intakes_collection.find(query).sort("timestamp", -1))
+        match["user_id"] = user_id
     
-    # Agrupar por food_name (case-insensitive)
-    foods_dict = {}
-    for intake in intakes:
-        food_name = intake.get("food_name", "Unknown").lower()
-        
-        if food_name not in foods_dict:
-            foods_dict[food_name] = {
-                "name": intake.get("food_name", "Unknown"),
-                "user_id": intake.get("user_id"),
-                "ingredients": intake.get("ingredients", []),
-                "kcal": intake.get("kcal"),
-                "quantity": intake.get("quantity"),
-                "count": 0,
-                "first_date": intake.get("timestamp")
-            }
-        
-        foods_dict[food_name]["count"] += 1
-        if intake.get("timestamp") and foods_dict[food_name]["first_date"]:
-            if intake.get("timestamp") > foods_dict[food_name]["first_date"]:
-                foods_dict[food_name]["first_date"] = intake.get("timestamp")
+    pipeline = [
+        {"$match": match},
+        {"$sort": {"timestamp": -1}},
+        {"$group": {
+            "_id": {"$toLower": "$food_name"},
+            "name": {"$first": "$food_name"},
+            "user_id": {"$first": "$user_id"},
+            "ingredients": {"$first": "$ingredients"},
+            "kcal": {"$first": "$kcal"},
+            "quantity": {"$first": "$quantity"},
+            "count": {"$sum": 1},
+            "first_date": {"$max": "$timestamp"},
+        }},
+        {"$project": {"_id": 0}},
+    ]
+    foods = list(intakes_collection.aggregate(pipeline, allowDiskUse=True))
+    for food in foods:
+        food["ingredients"] = food.get("ingredients") or []
+    return foods
+
+def link_intakes_to_foods(db, user_id: str, food_ids: dict, dry_run: bool = False, batch_size: int = 1000):
+    """
+    Escribe `food_id` en las ingestas del usuario a partir de `food_ids` (nombre en
+    minúsculas -> id), con el ejecutor de migraciones: cursor por lotes, updates en
+    bulk_write y checkpoint reanudable por `_id`.
+    """
+    def transform(intake):
+        food_id = food_ids.get((intake.get("food_name") or "").lower())
+        if not food_id or intake.get("food_id") == food_id:
+            return None
+        return UpdateOne({"_id": intake["_id"]}, {"$set": {"food_id": food_id}})
     
-    return list(foods_dict.values())
+    runner = MigrationRunner(
+        db, f"migrate_intakes_to_foods.{user_id}", "intakes", batch_size=batch_size, dry_run=dry_run
+    )
+    return runner.run(transform, {"user_id": user_id}, projection={"food_name": 1, "food_id": 1})
 
-def migrate_intakes_for_user(db, user_id: str, dry_run: bool = False):
+def migrate_intakes_for_user(db, user_id: str, dry_run: bool = False, verbose: bool = True):
     """
     Migra los intakes de un usuario a la colección 'foods'.
     Crea los alimentos y actualiza las referencias en intakes.
@@ -69,11 +89,12 @@ def migrate_intakes_for_user(db, user_id: str, dry_run: bool = False):
         db: Conexión a MongoDB
         user_id: Email del usuario
         dry_run: Si True, solo muestra qué haría sin hacer cambios
+        verbose: Si False, no muestra el detalle por comida (ejecución en paralelo)
     
     Returns:
         dict con estadísticas de migración
     """
-    intakes_collection = db["intakes"]
+    log = print if verbose else (lambda *args, **kwargs: None)
     stats = {
         "foods_created": 0,
         "foods_updated": 0,
@@ -85,17 +106,18 @@ def migrate_intakes_for_user(db, user_id: str, dry_run: bool = False):
     # Obtener comidas únicas del usuario
     unique_foods = get_unique_foods_from_intakes(db, user_id)
     
-    print(f"\n{'='*70}")
-    print(f"Migrando {len(unique_foods)} comidas únicas para usuario: {user_id}")
-    print(f"{'='*70}\n")
+    log(f"\n{'='*70}")
+    log(f"Migrando {len(unique_foods)} comidas únicas para usuario: {user_id}")
+    log(f"{'='*70}\n")
     
     # Para cada comida única, crear o actualizar en foods
+    food_ids = {}
     for i, food_info in enumerate(unique_foods, 1):
         food_name = food_info["name"]
         
-        print(f"[{i}/{len(unique_foods)}] Procesando: {food_name}")
-        print(f"    - Registros encontrados: {food_info['count']}")
-        print(f"    - Ingredientes: {', '.join(food_info['ingredients'][:3]) if food_info['ingredients'] else 'N/A'}")
+        log(f"[{i}/{len(unique_foods)}] Procesando: {food_name}")
+        log(f"    - Registros encontrados: {food_info['count']}")
+        log(f"    - Ingredientes: {', '.join(food_info['ingredients'][:3]) if food_info['ingredients'] else 'N/A'}")
         
         if not dry_run:
             try:
@@ -116,67 +138,93 @@ def migrate_intakes_for_user(db, user_id: str, dry_run: bool = False):
                 # Guardar o actualizar
                 existing_id = get_food_id_by_name(db, food_name)
                 food_id = create_or_update_food(db, food)
+                if food_id is None:
+                    # Otro worker pudo crear el mismo nombre a la vez (índice único en foods.name)
+                    food_id = get_food_id_by_name(db, food_name)
                 
                 if existing_id:
                     stats["foods_updated"] += 1
-                    print(f"    ✓ Actualizada (ID: {food_id})")
+                    log(f"    ✓ Actualizada (ID: {food_id})")
                 else:
                     stats["foods_created"] += 1
-                    print(f"    ✓ Creada (ID: {food_id})")
+                    log(f"    ✓ Creada (ID: {food_id})")
                 
-                # Actualizar todos los intakes con este food_name
                 if food_id:
-                    result = intakes_collection.update_many(
-                        {
-                            "user_id": user_id,
-                            "food_name": {"$regex": f"^{food_name}$", "$options": "i"}
-                        },
-                        {"$set": {"food_id": food_id}}
-                    )
-                    stats["intakes_updated"] += result.modified_count
-                    print(f"    ✓ Actualizados {result.modified_count} intakes")
+                    food_ids[food_name.lower()] = food_id
                 
             except Exception as e:
                 stats["errors"] += 1
-                print(f"    ✗ Error: {str(e)}")
+                log(f"    ✗ Error: {str(e)}")
         else:
-            print(f"    (DRY RUN - No se realizan cambios)")
+            log(f"    (DRY RUN - No se realizan cambios)")
         
-        print()
+        log()
+    
+    # Actualizar los intakes con su food_id, en lotes
+    if food_ids:
+        link_stats = link_intakes_to_foods(db, user_id, food_ids, dry_run)
+        stats["intakes_updated"] += link_stats.written
+        stats["errors"] += link_stats.errors
+        log(f"    ✓ Actualizados {link_stats.written} intakes ({link_stats.throughput:.0f} docs/s)")
     
     return stats
 
-def migrate_all_intakes(db, dry_run: bool = False):
+def _migrate_users_partition(dry_run: bool, partition: Partition) -> dict:
+    """Migra los usuarios de una partición (se ejecuta en un hilo o proceso del pool)."""
+    db = worker_db(get_db)
+    by_user = {}
+    for user_id in db["intakes"].distinct("user_id", partition.query):
+        by_user[user_id] = migrate_intakes_for_user(db, user_id, dry_run, verbose=False)
+    return {"by_user": by_user}
+
+def migrate_all_intakes(db, dry_run: bool = False, workers: int = 1, executor: str = "thread"):
     """
     Migra todos los intakes de todos los usuarios.
     
     Args:
         db: Conexión a MongoDB
         dry_run: Si True, solo muestra qué haría sin hacer cambios
+        workers: Usuarios migrados en paralelo. Con más de 1, los usuarios se reparten por
+            rangos de user_id en particiones que se ejecutan en un pool; el fallo de una
+            partición no detiene las demás.
+        executor: "thread" o "process"
     
     Returns:
         dict con estadísticas totales de migración
     """
-    intakes_collection = db["intakes"]
-    
-    # Obtener usuarios únicos
-    users = list(intakes_collection.find().distinct("user_id"))
-    
-    print(f"\n{'='*70}")
-    print(f"Migrando intakes de {len(users)} usuarios")
-    print(f"{'='*70}\n")
-    
     total_stats = {
         "total_foods_created": 0,
         "total_foods_updated": 0,
         "total_intakes_updated": 0,
         "total_errors": 0,
+        "failed_partitions": [],
         "by_user": {}
     }
     
-    for user_id in users:
-        user_stats = migrate_intakes_for_user(db, user_id, dry_run)
+    if workers > 1:
+        # Varias particiones por worker para repartir mejor usuarios de distinto tamaño
+        partitions = user_range_partitions(db, "intakes", workers * 4)
+        print(f"\n{'='*70}")
+        print(f"Migrando intakes en {len(partitions)} particiones con {workers} workers ({executor})")
+        print(f"{'='*70}\n")
+        results = run_partitions(partial(_migrate_users_partition, dry_run), partitions, workers, executor)
+        by_user = {}
+        for result in results:
+            if result.ok:
+                by_user.update(result.stats["by_user"])
+            else:
+                total_stats["failed_partitions"].append(result.partition)
+    else:
+        # Obtener usuarios únicos
+        users = list(db["intakes"].find().distinct("user_id"))
+        
+        print(f"\n{'='*70}")
+        print(f"Migrando intakes de {len(users)} usuarios")
+        print(f"{'='*70}\n")
         
+        by_user = {user_id: migrate_intakes_for_user(db, user_id, dry_run) for user_id in users}
+    
+    for user_id, user_stats in by_user.items():
         total_stats["total_foods_created"] += user_stats["foods_created"]
         total_stats["total_foods_updated"] += user_stats["foods_updated"]
         total_stats["total_intakes_updated"] += user_stats["intakes_updated"]
@@ -243,6 +291,8 @@ Ejemplos de uso:
     parser.add_argument("--all", action="store_true", help="Migrar todos los usuarios")
     parser.add_argument("--show-stats", action="store_true", help="Mostrar estadísticas de migración")
     parser.add_argument("--dry-run", action="store_true", help="Simular migración sin hacer cambios")
+    parser.add_argument("--workers", type=int, default=1, help="Usuarios en paralelo con --all (por defecto 1)")
+    parser.add_argument("--executor", choices=["thread", "process"], default="thread", help="Pool de hilos o de procesos")
     
     args = parser.parse_args()
     
@@ -264,7 +314,7 @@ Ejemplos de uso:
                 print("\n⚠️  (DRY RUN - No se realizaron cambios reales)")
             print(f"{'='*70}\n")
         elif args.all:
-            stats = migrate_all_intakes(db, args.dry_run)
+            stats = migrate_all_intakes(db, args.dry_run, workers=args.workers, executor=args.executor)
             print(f"\n{'='*70}")
             print("✅ RESUMEN TOTAL DE MIGRACIÓN")
             print(f"{'='*70}")
@@ -272,6 +322,8 @@ Ejemplos de uso:
             print(f"Comidas actualizadas: {stats['total_foods_updated']}")
             print(f"Intakes actualizadas: {stats['total_intakes_updated']}")
             print(f"Errores: {stats['total_errors']}")
+            if stats["failed_partitions"]:
+                print(f"Particiones fallidas (relanzar para reintentarlas): {', '.join(stats['failed_partitions'])}")
             if args.dry_run:
                 print("\n⚠️  (DRY RUN - No se realizaron cambios reales)")
             print(f"{'='*70}\n")
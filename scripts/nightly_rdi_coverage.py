@@ -0,0 +1,91 @@
+"""
+Lote nocturno de cobertura de ingestas de referencia (RDI) para todos los usuarios.
+
+Calcula la cobertura media diaria de los ultimos `--days` dias (hasta la medianoche UTC
+de hoy) con una sola agregacion y la guarda en la coleccion `rdi_coverage`,
+un documento por usuario y ventana. Tambien rellena `nutrients_rdi` en los
+perfiles que aun no lo tienen.
+
+Uso:
+  python nightly_rdi_coverage.py                 # dry-run
+  python nightly_rdi_coverage.py --apply --days 7
+"""
+
+import argparse
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+from dotenv import load_dotenv
+from pymongo import UpdateOne
+
+from bionexo.domain.entity.user import PersonalIntakesRecommendations
+from bionexo.infrastructure.utils.db import get_db
+from bionexo.repository.reference_intakes import compute_rdi_coverage_batch, personal_nutrients_rdi
+
+load_dotenv()
+
+
+def backfill_nutrients_rdi(db, dry_run: bool = True) -> int:
+    ops = []
+    for user in db["users"].find(
+        {"personal_intakes_recommendations.nutrients_rdi": None},
+        {"personal_intakes_recommendations": 1}
+    ):
+        profile = user.get("personal_intakes_recommendations")
+        if not profile:
+            continue
+        rdi = personal_nutrients_rdi(PersonalIntakesRecommendations(**profile))
+        ops.append(UpdateOne({"_id": user["_id"]}, {"$set": {"personal_intakes_recommendations.nutrients_rdi": rdi}}))
+    if ops and not dry_run:
+        db["users"].bulk_write(ops, ordered=False)
+    return len(ops)
+
+
+def run_nightly_rdi_coverage(db, days: int = 7, dry_run: bool = True) -> dict:
+    end = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=None)
+    start = end - timedelta(days=days)
+
+    profiles = backfill_nutrients_rdi(db, dry_run=dry_run)
+
+    t0 = time.perf_counter()
+    coverage = compute_rdi_coverage_batch(db, start, end)
+    elapsed = time.perf_counter() - t0
+
+    ops = []
+    computed_at = datetime.now(timezone.utc).replace(tzinfo=None)
+    values = coverage.to_numpy()
+    columns = coverage.columns
+    for user_id, row in zip(coverage.index, values):
+        with_target = np.flatnonzero(~np.isnan(row))
+        ops.append(UpdateOne(
+            {"user_id": user_id, "start": start, "end": end},
+            {"$set": {
+                "coverage": {columns[i]: round(float(row[i]), 4) for i in with_target},
+                "computed_at": computed_at,
+            }},
+            upsert=True
+        ))
+    if ops and not dry_run:
+        db["rdi_coverage"].bulk_write(ops, ordered=False)
+
+    return {"start": start, "end": end, "users": len(ops), "profiles_backfilled": profiles, "seconds": elapsed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cobertura de RDI para todos los usuarios")
+    parser.add_argument("--days", type=int, default=7, help="Dias de la ventana (terminando hoy a las 00:00 UTC)")
+    parser.add_argument("--apply", action="store_true", help="Guardar resultados (por defecto dry-run)")
+    args = parser.parse_args()
+
+    db = get_db()
+    res = run_nightly_rdi_coverage(db, days=args.days, dry_run=not args.apply)
+    print(f"Ventana: {res['start']} -> {res['end']}")
+    print(f"Perfiles sin nutrients_rdi: {res['profiles_backfilled']}")
+    print(f"Usuarios: {res['users']} (calculo en {res['seconds'] * 1000:.1f} ms)")
+    if not args.apply:
+        print("(DRY RUN - use --apply para guardar en rdi_coverage)")
+
+
+if __name__ == "__main__":
+    main()
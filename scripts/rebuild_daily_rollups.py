@@ -0,0 +1,45 @@
+"""
+Script para recalcular desde cero la colección `daily_rollups`.
+
+Agrega `intakes` y `wellness_logs` por (user_id, día local) en el servidor y
+fusiona el resultado con `$merge`. Útil tras migraciones o si los resúmenes
+incrementales se desincronizan.
+
+Uso:
+  python rebuild_daily_rollups.py                          # dry-run
+  python rebuild_daily_rollups.py --apply
+  python rebuild_daily_rollups.py --apply --user user@example.com --tz Europe/Madrid
+"""
+
+import argparse
+from dotenv import load_dotenv
+
+from bionexo.infrastructure.utils.db import get_db
+from bionexo.repository.daily_rollups import DAILY_ROLLUPS_COLLECTION, rebuild_daily_rollups
+
+load_dotenv()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recalcula los resúmenes diarios (daily_rollups)")
+    parser.add_argument("--apply", action="store_true", help="Aplicar cambios (por defecto dry-run)")
+    parser.add_argument("--user", help="Recalcular solo este user_id")
+    parser.add_argument("--tz", default="Europe/Madrid", help="Zona horaria para el día local")
+    args = parser.parse_args()
+
+    db = get_db()
+    query = {"user_id": args.user} if args.user else {}
+    print(f"Resúmenes actuales: {db[DAILY_ROLLUPS_COLLECTION].count_documents(query)}")
+    print(f"Ingestas: {db['intakes'].count_documents(query)}")
+    print(f"Reportes de bienestar: {db['wellness_logs'].count_documents(query)}")
+
+    if not args.apply:
+        print("(DRY RUN - use --apply para borrar y recalcular los resúmenes)")
+        return
+
+    total = rebuild_daily_rollups(db, tz=args.tz, user_id=args.user)
+    print(f"✅ Resúmenes recalculados: {total}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+"""
+Script para reconstruir el índice de comidas por usuario (`user_meals`) desde `intakes`.
+
+Ejecutar una vez tras desplegar el índice (las ingestas nuevas lo mantienen al día)
+o si se desincroniza.
+
+Uso:
+  python rebuild_user_meals.py                         # dry-run
+  python rebuild_user_meals.py --apply
+  python rebuild_user_meals.py --apply --user user@example.com
+"""
+
+import argparse
+from dotenv import load_dotenv
+
+from bionexo.infrastructure.utils.db import get_db
+from bionexo.repository.user_meals import USER_MEALS_COLLECTION, rebuild_user_meals
+
+load_dotenv()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reconstruye el índice de comidas por usuario")
+    parser.add_argument("--apply", action="store_true", help="Aplicar cambios (por defecto dry-run)")
+    parser.add_argument("--user", help="Reconstruir solo este user_id")
+    args = parser.parse_args()
+
+    db = get_db()
+    query = {"user_id": args.user} if args.user else {}
+    print(f"Entradas actuales en {USER_MEALS_COLLECTION}: {db[USER_MEALS_COLLECTION].count_documents(query)}")
+    print(f"Ingestas: {db['intakes'].count_documents(query)}")
+
+    if not args.apply:
+        print("(DRY RUN - use --apply para reconstruir el índice)")
+        return
+
+    total = rebuild_user_meals(db, user_id=args.user)
+    print(f"✅ Comidas indexadas: {total}")
+
+
+if __name__ == "__main__":
+    main()
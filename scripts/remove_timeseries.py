@@ -9,6 +9,9 @@ Opciones:
   --dry-run   : Solo mostrar lo que se haría (por defecto si no se pasa --apply)
   --apply     : Ejecutar los cambios
   --force-backup : Si existe backup con el mismo nombre, sobrescribirlo
+  --batch-mb  : Tamaño de cada lote de inserción en MB (por defecto 8)
+  --writers   : Hilos escribiendo en paralelo mientras se lee el siguiente lote (por defecto 2)
+  --no-verify : No comprobar la copia (número de documentos y checksum por tramos de _id)
 
 Precaución: ejecutar primero en `--dry-run` y revisar la salida.
 """
@@ -16,7 +19,9 @@ Precaución: ejecutar primero en `--dry-run` y revisar la salida.
 import os
 import argparse
 from pymongo import MongoClient
-from pymongo.errors import BulkWriteError
+
+from bionexo.infrastructure.utils.collection_copy import COPY_BATCH_BYTES, copy_collection as copy_documents
+from bionexo.infrastructure.utils.migrations import collection_options
 
 
 def get_db(uri=None):
@@ -28,37 +33,28 @@ def get_db(uri=None):
 
 
 def is_timeseries(db, coll_name):
-    info = db.command("listCollections", filter={"name": coll_name})
-    first = info.get("cursor", {}).get("firstBatch", [])
-    if not first:
+    opts = collection_options(db, coll_name)
+    if opts is None:
         return False, None
-    opts = first[0].get("options", {})
     ts = opts.get("timeseries")
     return (ts is not None), ts
 
 
-def copy_collection(src, dst, batch_size=1000, force=False):
+def copy_collection(src, dst, force=False, batch_bytes=COPY_BATCH_BYTES, writers=2, verify=True):
     # dst is a Collection object
     if dst.name in src.database.list_collection_names() and force:
         dst.drop()
 
-    # Avoid no_cursor_timeout (not allowed on some Atlas tiers)
-    cursor = src.find({}).batch_size(batch_size)
-    buf = []
-    inserted = 0
-    for doc in cursor:
-        buf.append(doc)
-        if len(buf) >= batch_size:
-            dst.insert_many(buf)
-            inserted += len(buf)
-            buf = []
-    if buf:
-        dst.insert_many(buf)
-        inserted += len(buf)
-    return inserted
-
-
-def process_collection(db, coll_name, dry_run=True, force_backup=False):
+    # Lector y escritores en paralelo, lotes por bytes e insert_many desordenado con
+    # reintentos (ver collection_copy). Lanza una excepción si la verificación no cuadra.
+    # No se reanuda: el backup se recrea entero en cada ejecución.
+    stats = copy_documents(
+        src.database, src.name, dst.name, batch_bytes=batch_bytes, writers=writers, verify=verify
+    )
+    return stats.written
+
+
+def process_collection(db, coll_name, dry_run=True, force_backup=False, **copy_options):
     coll = db[coll_name]
     ts_flag, ts_opts = is_timeseries(db, coll_name)
     if not ts_flag:
@@ -82,7 +78,7 @@ def process_collection(db, coll_name, dry_run=True, force_backup=False):
 
     print(f"Creando backup '{backup_name}' desde '{coll_name}'... Esto puede tardar.")
     backup_coll = db[backup_name]
-    inserted = copy_collection(coll, backup_coll, force=True)
+    inserted = copy_collection(coll, backup_coll, force=True, **copy_options)
     print(f"Backup creado: {inserted} documentos copiados a '{backup_name}'.")
 
     # 2) drop original
@@ -96,7 +92,7 @@ def process_collection(db, coll_name, dry_run=True, force_backup=False):
     # 4) copiar desde backup a nueva
     print(f"Restaurando datos desde '{backup_name}' a '{coll_name}'...")
     new_coll = db[coll_name]
-    restored = copy_collection(backup_coll, new_coll)
+    restored = copy_collection(backup_coll, new_coll, **copy_options)
     print(f"Restauración completada: {restored} documentos insertados en '{coll_name}'.")
 
     # 5) eliminar backup
@@ -111,7 +107,15 @@ def main():
     parser.add_argument("--apply", action="store_true", help="Aplicar cambios (por defecto dry-run)")
     parser.add_argument("--collections", default="intakes,wellness_logs,symptoms", help="Colecciones a procesar (coma-separadas)")
     parser.add_argument("--force-backup", action="store_true", help="Sobrescribir backup existente si lo hay")
+    parser.add_argument("--batch-mb", type=float, default=COPY_BATCH_BYTES / 1024 / 1024, help="MB por lote de inserción")
+    parser.add_argument("--writers", type=int, default=2, help="Hilos de escritura")
+    parser.add_argument("--no-verify", action="store_true", help="No verificar las copias")
     args = parser.parse_args()
+    copy_options = {
+        "batch_bytes": int(args.batch_mb * 1024 * 1024),
+        "writers": args.writers,
+        "verify": not args.no_verify,
+    }
 
     dry_run = not args.apply
     coll_names = [c.strip() for c in args.collections.split(",") if c.strip()]
@@ -122,7 +126,7 @@ def main():
     for coll in coll_names:
         try:
             print(f"Procesando colección '{coll}' (dry_run={dry_run})")
-            res = process_collection(db, coll, dry_run=dry_run, force_backup=args.force_backup)
+            res = process_collection(db, coll, dry_run=dry_run, force_backup=args.force_backup, **copy_options)
             summary[coll] = res
         except Exception as e:
             print(f"Error procesando '{coll}': {e}")
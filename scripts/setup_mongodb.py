@@ -1,77 +1,91 @@
 """
 Script para configurar las colecciones de MongoDB.
-Ejecutar una sola vez para inicializar la base de datos.
 
-Uso: python setup_mongodb.py
+Crea las colecciones e índices declarados en `bionexo.repository.indexes` y recrea los que
+difieren. Se puede ejecutar las veces que haga falta: si la base de datos ya está al día
+no cambia nada.
+
+Uso:
+  python setup_mongodb.py                 # crea/corrige colecciones e índices
+  python setup_mongodb.py --dry-run       # solo informa de las diferencias
+  python setup_mongodb.py --drop-extra    # elimina también los índices no declarados
+  python setup_mongodb.py --advise        # explain() de las consultas: avisa de COLLSCAN
+  python setup_mongodb.py --check         # diferencias + COLLSCAN; sale con 1 si hay alguno (CI)
 """
 
-import os
+import argparse
+import sys
 from dotenv import load_dotenv
-from bionexo.infrastructure.utils.db import get_db, create_intakes_timeseries_collection, create_wellness_logs_timeseries_collection
+
+from bionexo.infrastructure.utils.db import get_db
+from bionexo.repository.indexes import COLLECTION_SPECS, explain_query_shapes, index_drift, reconcile_indexes
 
 load_dotenv()
 
-def setup_database():
+
+def advise(db) -> int:
+    """Muestra el plan ganador de cada consulta y devuelve cuántas hacen COLLSCAN sin esperarlo."""
+    print("\n🔎 Planes de las consultas:")
+    flagged = 0
+    for report in explain_query_shapes(db):
+        if report.error:
+            print(f"  ⚠️ {report.shape.name}: no se pudo obtener el plan ({report.error})")
+            continue
+        plan = " > ".join(report.stages) or "?"
+        indexes = f" [{', '.join(dict.fromkeys(report.indexes))}]" if report.indexes else ""
+        mark = "❌" if report.flagged else "✅"
+        print(f"  {mark} {report.shape.name}: {plan}{indexes}")
+        flagged += report.flagged
+    if flagged:
+        print(f"\n❌ {flagged} consultas recorren la colección entera (COLLSCAN)")
+    return flagged
+
+
+def setup_database(dry_run: bool = False, drop_extra: bool = False):
     """Configura las colecciones necesarias en MongoDB."""
     print("🔧 Inicializando base de datos Bionexo...")
-    
+
     db = get_db()
-    
-    print("\n📝 Creando índices...")
-    
-    # Crear índice en colección de usuarios
-    users_collection = db["users"]
-    try:
-        users_collection.create_index("email", unique=True)
-        print("✅ Índice en 'users.email' creado")
-    except Exception as e:
-        print(f"⚠️ Error creando índice en users: {e}")
-    
-    # Crear colección timeseries para intakes
-    print("\n⏱️ Creando colección timeseries para 'intakes'...")
-    try:
-        create_intakes_timeseries_collection(db)
-    except Exception as e:
-        print(f"⚠️ Error: {e}")
-    
-    # Crear índice compuesto en intakes (si la colección timeseries ya existe)
-    intakes_collection = db["intakes"]
-    try:
-        intakes_collection.create_index([("user_id", 1), ("timestamp", 1)])
-        print("✅ Índice compuesto en 'intakes' creado")
-    except Exception as e:
-        print(f"⚠️ Error creando índice en intakes: {e}")
-    
-    # Crear colección de alimentos (foods)
-    print("\n🍽️ Preparando colección 'foods'...")
-    foods_collection = db["foods"]
-    try:
-        foods_collection.create_index("name", unique=True)
-        print("✅ Índice en 'foods.name' creado")
-    except Exception as e:
-        print(f"⚠️ Error creando índice en foods: {e}")
-    
-    # Crear colección timeseries para wellness_logs
-    print("\n🏥 Creando colección timeseries para 'wellness_logs'...")
-    try:
-        create_wellness_logs_timeseries_collection(db)
-    except Exception as e:
-        print(f"⚠️ Error: {e}")
-    
-    # Crear índice compuesto en wellness_logs
-    wellness_logs_collection = db["wellness_logs"]
-    try:
-        wellness_logs_collection.create_index([("user_id", 1), ("timestamp", -1)])
-        print("✅ Índice compuesto en 'wellness_logs' creado")
-    except Exception as e:
-        print(f"⚠️ Error creando índice en wellness_logs: {e}")
-    
-    print("\n✅ Base de datos configurada exitosamente!")
+
+    print(f"\n📝 {'Diferencias de' if dry_run else 'Reconciliando'} colecciones e índices...")
+    drift = reconcile_indexes(db, dry_run=dry_run, drop_extra=drop_extra)
+    if not drift:
+        print("✅ Colecciones e índices al día")
+    elif dry_run:
+        print(f"\n(DRY RUN - {len(drift)} diferencias; ejecute sin --dry-run para corregirlas)")
+    else:
+        pending = [item for item in index_drift(db) if item.status != "extra" or drop_extra]
+        for item in pending:
+            print(f"⚠️ Pendiente: {item}")
+        if not pending:
+            print("\n✅ Base de datos configurada exitosamente!")
+
     print("\n📋 Colecciones disponibles:")
-    print("  - users: Información de usuarios")
-    print("  - intakes: Registro de comidas (timeseries)")
-    print("  - foods: Recetas y alimentos")
-    print("  - wellness_logs: Registro de síntomas (timeseries)")
+    for spec in COLLECTION_SPECS:
+        print(f"  - {spec.name}: {spec.description}")
+    return db
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Crea y reconcilia las colecciones e índices de MongoDB")
+    parser.add_argument("--dry-run", action="store_true", help="Solo mostrar las diferencias, sin cambiar nada")
+    parser.add_argument("--drop-extra", action="store_true", help="Eliminar los índices que no están declarados")
+    parser.add_argument("--advise", action="store_true", help="Mostrar el plan de cada consulta y avisar de COLLSCAN")
+    parser.add_argument("--check", action="store_true", help="Diferencias + planes sin cambiar nada; sale con 1 si hay problemas")
+    args = parser.parse_args()
+
+    if args.check:
+        db = get_db()
+        drift = index_drift(db)
+        for item in drift:
+            print(f"  {item}")
+        flagged = advise(db)
+        sys.exit(1 if drift or flagged else 0)
+
+    db = setup_database(dry_run=args.dry_run, drop_extra=args.drop_extra)
+    if args.advise:
+        advise(db)
+
 
 if __name__ == "__main__":
-    setup_database()
+    main()
@@ -0,0 +1,25 @@
+"""
+Aplicación FastAPI de Bionexo.
+"""
+
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI
+
+from bionexo.application.api import exports, foods, intakes, wellness
+from bionexo.repository.driver.mongodb import close_async_db
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    await close_async_db()
+
+
+def create_app() -> FastAPI:
+    app = FastAPI(title="Bionexo API", lifespan=lifespan)
+    app.include_router(exports.router)
+    app.include_router(intakes.router)
+    app.include_router(wellness.router)
+    app.include_router(foods.router)
+    return app
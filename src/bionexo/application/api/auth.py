@@ -0,0 +1,61 @@
+"""
+Autenticacion de la API: HTTP Basic con el email y la contraseña de `users`.
+
+Los endpoints toman el usuario de las credenciales (`get_current_user`), nunca de la
+consulta ni del cuerpo: un `user_id` enviado por el cliente se sustituye por el email
+autenticado. Las operaciones sobre todos los usuarios (exportaciones) requieren un email
+de `BIONEXO_API_ADMINS` (separados por comas).
+
+Las busquedas y sugerencias filtran con la mascara de alergias del perfil
+(`get_allergen_mask`); las alergias sin bit se devuelven en la cabecera
+`X-Unmapped-Allergies` (separadas por comas, codificadas como URL).
+"""
+
+import os
+from typing import TypeVar
+from urllib.parse import quote
+
+from fastapi import Depends, HTTPException, Response
+from fastapi.security import HTTPBasic, HTTPBasicCredentials
+from pydantic import BaseModel
+
+from bionexo.application.api.dependencies import get_user_repository
+from bionexo.repository.allergens import user_allergies
+from bionexo.repository.users import UserRepository
+
+API_ADMINS = {email.strip() for email in os.getenv("BIONEXO_API_ADMINS", "").split(",") if email.strip()}
+
+security = HTTPBasic()
+
+Owned = TypeVar("Owned", bound=BaseModel)
+
+
+async def get_current_user(
+        credentials: HTTPBasicCredentials = Depends(security),
+        users: UserRepository = Depends(get_user_repository)
+) -> dict:
+    """Perfil del usuario autenticado (sin la contraseña); 401 si las credenciales no valen."""
+    user = await users.authenticate(credentials.username, credentials.password)
+    if user is None:
+        raise HTTPException(401, "Credenciales incorrectas", headers={"WWW-Authenticate": "Basic"})
+    return user
+
+
+async def require_admin(user: dict = Depends(get_current_user)) -> dict:
+    """Como `get_current_user`, con 403 si el usuario no es administrador."""
+    if user["email"] not in API_ADMINS:
+        raise HTTPException(403, "Solo para administradores")
+    return user
+
+
+async def get_allergen_mask(response: Response, user: dict = Depends(get_current_user)) -> int:
+    """Mascara de alergias del usuario autenticado; las que no se pueden filtrar van en la cabecera."""
+    mask, unmapped = user_allergies(user)
+    if unmapped:
+        response.headers["X-Unmapped-Allergies"] = ",".join(quote(term) for term in unmapped)
+    return mask
+
+
+def owned_by(item: Owned, user: dict) -> Owned:
+    """Copia de `item` con el `user_id` del usuario autenticado."""
+    return item.model_copy(update={"user_id": user["email"]})
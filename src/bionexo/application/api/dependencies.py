@@ -0,0 +1,35 @@
+"""
+Dependencias compartidas de la API.
+"""
+
+from functools import lru_cache
+
+from bionexo.infrastructure.utils.db import get_db
+from bionexo.repository.driver.mongodb import get_async_db
+from bionexo.repository.foods import FoodRepository
+from bionexo.repository.intakes import IntakeRepository
+from bionexo.repository.symptoms import WellnessRepository
+from bionexo.repository.users import UserRepository
+
+
+@lru_cache(maxsize=1)
+def get_database():
+    """Base de datos del proceso; `MongoClient` es thread-safe y mantiene su propio pool."""
+    return get_db()
+
+
+def get_food_repository() -> FoodRepository:
+    # El cliente síncrono solo carga el catálogo y el índice de trigramas en memoria
+    return FoodRepository(get_async_db(), sync_db=get_database())
+
+
+def get_intake_repository() -> IntakeRepository:
+    return IntakeRepository(get_async_db(), foods=get_food_repository())
+
+
+def get_wellness_repository() -> WellnessRepository:
+    return WellnessRepository(get_async_db())
+
+
+def get_user_repository() -> UserRepository:
+    return UserRepository(get_async_db())
@@ -0,0 +1,84 @@
+"""
+Endpoints de exportación: Parquet en segundo plano y descarga en streaming (NDJSON/CSV).
+"""
+
+from datetime import datetime
+from typing import Literal, Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+
+from bionexo.application.api.auth import get_current_user, require_admin
+from bionexo.application.api.dependencies import get_database
+from bionexo.repository.driver.mongodb import get_async_db
+from bionexo.repository.exports import EXPORT_DIR, ExportInProgressError, acquire_export_lock, export_all, load_export_state
+from bionexo.repository.stream_exports import MEDIA_TYPES, astream_export
+
+router = APIRouter(prefix="/exports", tags=["exports"], dependencies=[Depends(get_current_user)])
+
+
+class ExportRequest(BaseModel):
+    collections: Optional[list[Literal["intakes", "wellness_logs", "foods"]]] = None
+    full: bool = False
+    user_id: Optional[str] = None  # Rehace la partición de un usuario; requiere `full`
+    batch_size: int = Field(5000, ge=1, le=50_000)
+
+
+@router.post("", status_code=202, dependencies=[Depends(require_admin)])
+def start_export(request: ExportRequest, background_tasks: BackgroundTasks, db=Depends(get_database)):
+    """
+    Lanza la exportación en segundo plano; el progreso se consulta en `GET /exports/state`.
+    Con otra exportación en curso (en cualquier worker o en el script) responde 409.
+    """
+    if request.user_id is not None and not request.full:
+        raise HTTPException(422, "La exportación de un usuario tiene que ser completa (full=true)")
+    try:
+        # El cerrojo se toma aquí para responder 409 y lo suelta `export_all` al terminar
+        lock = acquire_export_lock(EXPORT_DIR)
+    except ExportInProgressError as e:
+        raise HTTPException(409, str(e))
+    background_tasks.add_task(
+        export_all,
+        db,
+        output_dir=EXPORT_DIR,
+        collections=request.collections,
+        batch_size=request.batch_size,
+        full=request.full,
+        user_id=request.user_id,
+        lock=lock
+    )
+    return {"status": "scheduled", "output_dir": str(EXPORT_DIR)}
+
+
+@router.get("/state", dependencies=[Depends(require_admin)])
+def export_state():
+    """Marca de agua y última ejecución de cada colección."""
+    return load_export_state(EXPORT_DIR)
+
+
+@router.get("/stream")
+async def stream_export(
+        collection: Literal["intakes", "wellness_logs"] = "intakes",
+        format: Literal["ndjson", "csv"] = "ndjson",
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        tz: str = "Europe/Madrid",
+        batch_size: int = Query(1000, ge=1, le=10_000),
+        user: dict = Depends(get_current_user)
+):
+    """
+    Descarga las ingestas o reportes del usuario autenticado en `[start, end)` (fechas en
+    `tz` si no llevan zona), con memoria constante: se envía mientras se lee el cursor.
+    """
+    try:
+        ZoneInfo(tz)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise HTTPException(422, f"Zona horaria desconocida: {tz}")
+    filename = f"{collection}-{datetime.now():%Y%m%d}.{format}"
+    return StreamingResponse(
+        astream_export(get_async_db(), collection, user["email"], format, start, end, tz, batch_size),
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
@@ -0,0 +1,79 @@
+"""
+Endpoints de alimentos.
+"""
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+
+from bionexo.application.api.auth import get_allergen_mask, get_current_user, require_admin
+from bionexo.application.api.dependencies import get_food_repository
+from bionexo.domain.entity.food import Food
+from bionexo.repository.foods import FoodRepository
+
+router = APIRouter(prefix="/foods", tags=["foods"], dependencies=[Depends(get_current_user)])
+
+
+def _public(food: dict) -> dict:
+    # El vector de nutrientes es binario interno
+    food.pop("nutrient_vector", None)
+    food.pop("score", None)
+    return food
+
+
+@router.get("/search")
+async def search_foods(
+        q: str = Query(..., min_length=1),
+        limit: int = Query(20, ge=1, le=100),
+        exclude_allergens: int = Depends(get_allergen_mask),
+        repository: FoodRepository = Depends(get_food_repository)
+):
+    return [_public(food) for food in await repository.search(q, limit, exclude_allergens=exclude_allergens)]
+
+
+@router.get("/by-tag/{tag}")
+async def foods_by_tag(
+        tag: str,
+        limit: int = Query(50, ge=1, le=500),
+        exclude_allergens: int = Depends(get_allergen_mask),
+        repository: FoodRepository = Depends(get_food_repository)
+):
+    return [_public(food) for food in await repository.get_by_tag(tag, limit, exclude_allergens)]
+
+
+@router.get("/by-allergen/{allergen}")
+async def foods_by_allergen(
+        allergen: str,
+        limit: int = Query(100, ge=1, le=500),
+        repository: FoodRepository = Depends(get_food_repository)
+):
+    return [_public(food) for food in await repository.get_by_allergen(allergen, limit)]
+
+
+@router.get("/by-kcal")
+async def foods_by_kcal(
+        min_kcal: float = Query(..., ge=0),
+        max_kcal: float = Query(..., ge=0),
+        limit: int = Query(50, ge=1, le=500),
+        exclude_allergens: int = Depends(get_allergen_mask),
+        repository: FoodRepository = Depends(get_food_repository)
+):
+    return [_public(food) for food in await repository.get_by_calories_range(min_kcal, max_kcal, limit, exclude_allergens)]
+
+
+@router.get("/{food_id}")
+async def get_food(food_id: str, repository: FoodRepository = Depends(get_food_repository)):
+    food = await repository.get_by_id(food_id)
+    if food is None:
+        raise HTTPException(404, "Alimento no encontrado")
+    return _public(food)
+
+
+@router.put("", status_code=200, dependencies=[Depends(require_admin)])
+async def upsert_food(food: Food, repository: FoodRepository = Depends(get_food_repository)):
+    """
+    Crea o actualiza el alimento por nombre. Solo administradores: el catálogo es compartido y
+    sus alérgenos son los que filtran las búsquedas de todos los usuarios.
+    """
+    food_id = await repository.create_or_update(food)
+    if food_id is None:
+        raise HTTPException(500, "No se pudo guardar el alimento")
+    return {"_id": food_id}
@@ -0,0 +1,117 @@
+"""
+Ingesta por lotes y en NDJSON (un documento JSON por línea) para los endpoints de escritura.
+"""
+
+import os
+from typing import Awaitable, Callable, Optional, Type
+
+from fastapi import HTTPException, Request
+from pydantic import BaseModel, ValidationError
+
+from bionexo.application.api.auth import owned_by
+
+API_MAX_BATCH = int(os.getenv("BIONEXO_API_MAX_BATCH", "5000"))
+NDJSON_BATCH_SIZE = int(os.getenv("BIONEXO_API_NDJSON_BATCH", "1000"))
+# Una línea es un documento: con imagen en base64 puede ocupar varios MB, pero no más
+NDJSON_MAX_LINE_BYTES = int(os.getenv("BIONEXO_API_NDJSON_MAX_LINE", str(16 * 1024 * 1024)))
+MAX_REPORTED_ERRORS = 100
+
+SaveMany = Callable[[list], Awaitable[tuple[int, list[dict]]]]
+
+
+class IngestResult(BaseModel):
+    received: int = 0
+    inserted: int = 0
+    failed: int = 0
+    errors: list[dict] = []  # Los primeros MAX_REPORTED_ERRORS
+
+    def add_errors(self, errors: list[dict]):
+        self.failed += len(errors)
+        self.errors += errors[:MAX_REPORTED_ERRORS - len(self.errors)]
+
+
+def check_batch_size(items: list):
+    if len(items) > API_MAX_BATCH:
+        raise HTTPException(413, f"Lote de {len(items)} documentos; el máximo es {API_MAX_BATCH} (usar NDJSON)")
+
+
+async def save_batch(items: list, save_many: SaveMany) -> IngestResult:
+    check_batch_size(items)
+    result = IngestResult(received=len(items))
+    result.inserted, errors = await save_many(items)
+    result.add_errors(errors)
+    return result
+
+
+async def ingest_ndjson(
+        request: Request,
+        model: Type[BaseModel],
+        save_many: SaveMany,
+        batch_size: int = NDJSON_BATCH_SIZE,
+        max_line_bytes: int = NDJSON_MAX_LINE_BYTES,
+        user: Optional[dict] = None
+) -> IngestResult:
+    """
+    Lee el cuerpo por trozos sin cargarlo entero, valida cada línea con `model` y guarda en
+    lotes de `batch_size`. Las líneas inválidas se informan con su número (desde 1) y no
+    detienen la carga. Los errores de escritura se informan con la línea del documento.
+    Una línea de más de `max_line_bytes` (p. ej. un cuerpo sin saltos de línea) corta la
+    lectura con 413; lo guardado hasta entonces se queda.
+    Con `user`, cada documento se guarda con su `user_id` (ver `owned_by`).
+    """
+    result = IngestResult()
+    batch, lines = [], []
+    pending = bytearray()  # Línea a medias
+    line_number = 0
+
+    async def flush():
+        inserted, errors = await save_many(batch)
+        result.inserted += inserted
+        result.add_errors([{"line": lines[error["index"]], "error": error["error"]} for error in errors])
+        batch.clear()
+        lines.clear()
+
+    async def too_long(number: int):
+        if batch:
+            await flush()
+        raise HTTPException(413, {
+            "error": f"La línea {number} supera {max_line_bytes} bytes",
+            "result": result.model_dump(),
+        })
+
+    async def handle(raw: bytes):
+        nonlocal line_number
+        line_number += 1
+        if not raw.strip():
+            return
+        result.received += 1
+        try:
+            item = model.model_validate_json(raw)
+            batch.append(owned_by(item, user) if user else item)
+            lines.append(line_number)
+        except ValidationError as e:
+            result.add_errors([{"line": line_number, "error": e.errors(include_url=False, include_input=False)}])
+        if len(batch) >= batch_size:
+            await flush()
+
+    async for chunk in request.stream():
+        # Solo se busca el salto en el trozo nuevo: una línea de varios MB cuesta lineal
+        view = memoryview(chunk)
+        start = 0
+        end = chunk.find(b"\n")
+        while end != -1:
+            pending += view[start:end]
+            if len(pending) > max_line_bytes:
+                await too_long(line_number + 1)
+            await handle(bytes(pending))
+            pending.clear()
+            start = end + 1
+            end = chunk.find(b"\n", start)
+        pending += view[start:]
+        if len(pending) > max_line_bytes:
+            await too_long(line_number + 1)
+    if pending:
+        await handle(bytes(pending))
+    if batch:
+        await flush()
+    return result
@@ -0,0 +1,85 @@
+"""
+Endpoints de ingestas: una, por lotes y en NDJSON, y las interacciones entre nutrientes.
+"""
+
+from datetime import datetime, timedelta
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+
+from bionexo.application.api.auth import get_allergen_mask, get_current_user, owned_by
+from bionexo.application.api.dependencies import get_intake_repository
+from bionexo.application.api.ingest import API_MAX_BATCH, NDJSON_BATCH_SIZE, IngestResult, ingest_ndjson, save_batch
+from bionexo.domain.entity.intake import Intake
+from bionexo.repository.intakes import IntakeRepository
+
+router = APIRouter(prefix="/intakes", tags=["intakes"])
+
+
+@router.post("", status_code=201)
+async def create_intake(
+        intake: Intake,
+        user: dict = Depends(get_current_user),
+        repository: IntakeRepository = Depends(get_intake_repository)
+):
+    if not await repository.save(owned_by(intake, user)):
+        raise HTTPException(500, "No se pudo guardar la ingesta")
+    return {"status": "created"}
+
+
+@router.post("/batch", response_model=IngestResult)
+async def create_intakes(
+        intakes: list[Intake],
+        user: dict = Depends(get_current_user),
+        repository: IntakeRepository = Depends(get_intake_repository)
+):
+    """Hasta `BIONEXO_API_MAX_BATCH` ingestas; las inválidas rechazan la petición (422)."""
+    return await save_batch([owned_by(item, user) for item in intakes], repository.save_many)
+
+
+@router.post("/ndjson", response_model=IngestResult)
+async def ingest_intakes(
+        request: Request,
+        batch_size: int = Query(NDJSON_BATCH_SIZE, ge=1, le=API_MAX_BATCH),
+        user: dict = Depends(get_current_user),
+        repository: IntakeRepository = Depends(get_intake_repository)
+):
+    """Una ingesta JSON por línea (`application/x-ndjson`), sin límite de tamaño."""
+    return await ingest_ndjson(request, Intake, repository.save_many, batch_size, user=user)
+
+
+@router.get("")
+async def list_intakes(
+        user: dict = Depends(get_current_user),
+        limit: int = Query(50, ge=1, le=1000),
+        repository: IntakeRepository = Depends(get_intake_repository)
+):
+    intakes = await repository.get_recent(user["email"], limit)
+    return [intake.model_dump(exclude={"image_data"}) for intake in intakes]
+
+
+@router.get("/meals")
+async def list_meal_names(
+        user: dict = Depends(get_current_user),
+        limit: int = Query(50, ge=1, le=500),
+        order: str = Query("frequency", pattern="^(frequency|recency)$"),
+        prefix: str | None = None,
+        exclude_allergens: int = Depends(get_allergen_mask),
+        repository: IntakeRepository = Depends(get_intake_repository)
+):
+    """Comidas previas del usuario, sin las que llevan alérgenos de su perfil."""
+    return await repository.get_unique_meal_names(user["email"], limit, order, prefix, exclude_allergens)
+
+
+@router.get("/interactions")
+async def list_interactions(
+        user: dict = Depends(get_current_user),
+        hours: int = Query(6, ge=1, le=168),
+        end: Optional[datetime] = None,
+        repository: IntakeRepository = Depends(get_intake_repository)
+):
+    """Sinergias y antagonismos entre nutrientes de lo ingerido en las `hours` horas anteriores a `end` (por defecto, ahora)."""
+    end = end or datetime.now()
+    start = end - timedelta(hours=hours)
+    report = await repository.get_interactions(user["email"], start, end)
+    return {"start": start, "end": end, **report.to_dict()}
@@ -0,0 +1,54 @@
+"""
+Endpoints de reportes de bienestar: uno, por lotes y en NDJSON.
+"""
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+
+from bionexo.application.api.auth import get_current_user, owned_by
+from bionexo.application.api.dependencies import get_wellness_repository
+from bionexo.application.api.ingest import API_MAX_BATCH, NDJSON_BATCH_SIZE, IngestResult, ingest_ndjson, save_batch
+from bionexo.domain.entity.wellness_logs import WellnessReport
+from bionexo.repository.symptoms import WellnessRepository
+
+router = APIRouter(prefix="/wellness", tags=["wellness"])
+
+
+@router.post("", status_code=201)
+async def create_report(
+        report: WellnessReport,
+        user: dict = Depends(get_current_user),
+        repository: WellnessRepository = Depends(get_wellness_repository)
+):
+    if not await repository.save(owned_by(report, user)):
+        raise HTTPException(500, "No se pudo guardar el reporte")
+    return {"status": "created"}
+
+
+@router.post("/batch", response_model=IngestResult)
+async def create_reports(
+        reports: list[WellnessReport],
+        user: dict = Depends(get_current_user),
+        repository: WellnessRepository = Depends(get_wellness_repository)
+):
+    """Hasta `BIONEXO_API_MAX_BATCH` reportes; los inválidos rechazan la petición (422)."""
+    return await save_batch([owned_by(item, user) for item in reports], repository.save_many)
+
+
+@router.post("/ndjson", response_model=IngestResult)
+async def ingest_reports(
+        request: Request,
+        batch_size: int = Query(NDJSON_BATCH_SIZE, ge=1, le=API_MAX_BATCH),
+        user: dict = Depends(get_current_user),
+        repository: WellnessRepository = Depends(get_wellness_repository)
+):
+    """Un reporte JSON por línea (`application/x-ndjson`), sin límite de tamaño."""
+    return await ingest_ndjson(request, WellnessReport, repository.save_many, batch_size, user=user)
+
+
+@router.get("")
+async def list_reports(
+        user: dict = Depends(get_current_user),
+        limit: int = Query(50, ge=1, le=1000),
+        repository: WellnessRepository = Depends(get_wellness_repository)
+):
+    return await repository.get_recent(user["email"], limit)
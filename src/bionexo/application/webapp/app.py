@@ -2,7 +2,8 @@ from git import List
 import streamlit as st
 import os
 from dotenv import load_dotenv
-from bionexo.infrastructure.utils.db import db_user_exists, get_db, get_ingredients_for_meal, get_intakes_from_db, save_user, save_intake, save_wellness_report, get_wellness_reports_from_db, get_unique_meal_names_from_db
+from bionexo.infrastructure.utils.db import db_user_exists, get_db, get_user_allergies, save_user, save_intake, save_wellness_report
+from bionexo.application.webapp.queries import get_correlations, get_daily_rollups, get_ingredients_for_meal, get_intake_stats, get_intakes_from_db, get_unique_meal_names_from_db, get_wellness_reports_from_db, get_wellness_stats
 from bionexo.infrastructure.utils.api_client import analyze_image
 from bionexo.domain.entity.user import PersonalIntakesRecommendations, User, AgeGroup, Sex, Activity
 # from bionexo.domain.entity.food import Food
@@ -15,7 +16,10 @@ import hashlib
 from PIL import Image
 import io
 
-from bionexo.infrastructure.utils.functions import hash_password, utc_to_local
+from bionexo.infrastructure.utils.functions import hash_password, local_to_utc, utc_to_local
+from bionexo.repository.correlations import LAG_WINDOWS
+
+STATS_PERIODS = {"Todo": None, "Últimos 7 días": 7, "Últimos 30 días": 30, "Últimos 90 días": 90, "Último año": 365}
 
 class MainApp:
     def __init__(self):
@@ -34,6 +38,19 @@ class MainApp:
     def get_db_connection():
         return get_db()
     
+    def allergen_mask(self) -> int:
+        """
+        Máscara de alergias del perfil (se lee una vez por sesión) para quitar de las sugerencias
+        las comidas con esos alérgenos. Avisa de las alergias que no se pueden filtrar.
+        """
+        if "allergen_mask" not in st.session_state:
+            mask, unmapped = get_user_allergies(self.get_db_connection(), st.session_state.get("user_id"))
+            st.session_state["allergen_mask"] = mask
+            st.session_state["unmapped_allergies"] = unmapped
+        if st.session_state["unmapped_allergies"]:
+            st.caption(f"⚠️ Alergias no reconocidas, no se filtran: {', '.join(st.session_state['unmapped_allergies'])}")
+        return st.session_state["allergen_mask"]
+
     def run(self):
         if not st.session_state.get("logged"):
             self.login()
@@ -70,6 +87,7 @@ class MainApp:
                             if db_user_exists(db, email, password):
                                 st.session_state["logged"] = True
                                 st.session_state["user_id"] = email
+                                st.session_state.pop("allergen_mask", None)
                                 st.rerun()
                             else:
                                 st.error("Credenciales incorrectas")
@@ -264,8 +282,13 @@ class MainApp:
             # === SECCIÓN 2: NOMBRE DE LA INGESTA ===
             st.subheader("🍽️ Seleccionar o Crear Comida")
             
-            # Obtener comidas previas
-            previous_meals = get_unique_meal_names_from_db(db, st.session_state.get("user_id")) or []
+            # Obtener comidas previas (top-N del índice del usuario)
+            col_search, col_order = st.columns([3, 1])
+            with col_search:
+                meal_prefix = st.text_input("Buscar comida previa", placeholder="Empieza a escribir...", key="meal_prefix")
+            with col_order:
+                meal_order = st.radio("Ordenar por", ["frequency", "recency"], format_func={"frequency": "Frecuentes", "recency": "Recientes"}.get, key="meal_order")
+            previous_meals = get_unique_meal_names_from_db(db, st.session_state.get("user_id"), order=meal_order, prefix=meal_prefix or None, exclude_allergens=self.allergen_mask()) or []
         
             food_name = st.selectbox(
                 "Selecciona una comida anterior *",
@@ -373,7 +396,7 @@ class MainApp:
                         voice_description=voice_description if voice_description else None
                     )
                     
-                    if save_intake(db, intake):
+                    if save_intake(db, intake, tz):
                         st.toast("¡Ingesta guardada!", icon=":material/check:")
                     else:
                         st.toast("Error al guardar la ingesta", icon=":material/error:")
@@ -417,11 +440,14 @@ class MainApp:
             # === SECCIÓN 2: NOMBRE DE LA INGESTA ===
             st.subheader("🍽️ Seleccionar o Crear Comida")
             
-            # Obtener comidas previas
-            previous_meals = get_unique_meal_names_from_db(db, st.session_state.get("user_id"))
-            
             use_previous = st.checkbox("¿Usar una comida guardada previamente?", key="image_use_previous")
             
+            # Obtener comidas previas (top-N del índice del usuario)
+            previous_meals = []
+            if use_previous:
+                meal_prefix = st.text_input("Buscar comida previa", placeholder="Empieza a escribir...", key="image_meal_prefix")
+                previous_meals = get_unique_meal_names_from_db(db, st.session_state.get("user_id"), prefix=meal_prefix or None, exclude_allergens=self.allergen_mask())
+            
             if use_previous and previous_meals:
                 food_name = st.selectbox(
                     "Selecciona una comida anterior *",
@@ -561,7 +587,7 @@ class MainApp:
                             voice_description=voice_description if voice_description else None
                         )
                         
-                        if save_intake(db, intake):
+                        if save_intake(db, intake, tz):
                             st.success("✅ Ingesta con imagen registrada correctamente")
                         else:
                             st.error("❌ Error al guardar la ingesta")
@@ -579,6 +605,19 @@ class MainApp:
             self.register_image_intake()
 
 
+    @staticmethod
+    def stats_period(key: str):
+        """Selector de periodo para las estadísticas; devuelve (start, end) en UTC naive."""
+        period = st.selectbox("Periodo", list(STATS_PERIODS), index=2, key=key)
+        days = STATS_PERIODS[period]
+        if days is None:
+            return None, None
+        tz = st.session_state.get("tz", "Europe/Madrid")
+        today = datetime.datetime.now(ZoneInfo(tz)).replace(tzinfo=None).replace(hour=0, minute=0, second=0, microsecond=0)
+        start = local_to_utc(today - datetime.timedelta(days=days - 1), tz)
+        end = local_to_utc(today + datetime.timedelta(days=1), tz)
+        return start, end
+
     @staticmethod
     def intake_card(intake: Intake):
         with st.container(border=True, width=200):
@@ -947,7 +986,7 @@ class MainApp:
                             triggers=triggers_list
                         )
                         
-                        if save_wellness_report(db, wellness_report):
+                        if save_wellness_report(db, wellness_report, tz):
                             st.success("✅ Reporte de síntomas guardado correctamente")
                         else:
                             st.error("❌ Error al guardar el reporte")
@@ -994,12 +1033,14 @@ class MainApp:
                     # Estadísticas
                     st.divider()
                     st.subheader("📊 Estadísticas")
+                    start, end = self.stats_period("intake_stats_period")
                     col1, col2, col3 = st.columns(3)
                     
-                    total_kcal = sum([getattr(intake, "kcal", 0) for intake in intakes if getattr(intake, "kcal", None) is not None])
-                    intakes_with_kcal = [intake for intake in intakes if getattr(intake, "kcal", None) is not None]
-                    avg_kcal = total_kcal / len(intakes_with_kcal) if intakes_with_kcal else 0
-                    total_meals = len(intakes)
+                    # Agregados calculados en MongoDB sobre todo el periodo (no solo las 100 últimas)
+                    intake_stats = get_intake_stats(db, st.session_state.get("user_id"), start, end)
+                    total_kcal = intake_stats.total_kcal
+                    avg_kcal = intake_stats.avg_kcal or 0
+                    total_meals = intake_stats.total_intakes
                     
                     with col1:
                         st.metric("Total de Ingestas", total_meals)
@@ -1051,10 +1092,12 @@ class MainApp:
                     # Estadísticas de síntomas
                     st.divider()
                     st.subheader("📊 Estadísticas de Síntomas")
+                    start, end = self.stats_period("wellness_stats_period")
                     
-                    avg_stress = sum([r.get("stress_level", 0) for r in wellness_reports]) / len(wellness_reports) if wellness_reports else 0
-                    avg_anxiety = sum([r.get("anxiety_level", 0) for r in wellness_reports]) / len(wellness_reports) if wellness_reports else 0
-                    avg_energy = sum([r.get("energy_level", 0) for r in wellness_reports]) / len(wellness_reports) if wellness_reports else 0
+                    wellness_stats = get_wellness_stats(db, st.session_state.get("user_id"), start, end)
+                    avg_stress = wellness_stats.averages["stress_level"] or 0
+                    avg_anxiety = wellness_stats.averages["anxiety_level"] or 0
+                    avg_energy = wellness_stats.averages["energy_level"] or 0
                     
                     col1, col2, col3 = st.columns(3)
                     with col1:
@@ -1115,5 +1158,61 @@ class MainApp:
 
         elif menu == "Análisis":
             st.header("Análisis Nutricional")
-            # Gráficos de kcal, detección de patrones, etc.
-            st.write("Funcionalidad en desarrollo")
\ No newline at end of file
+            user_id = st.session_state.get("user_id")
+            
+            st.subheader("🔗 Relación entre comidas y síntomas")
+            st.caption("Compara cómo te encuentras en las horas posteriores a cada comida o ingrediente con el resto de reportes.")
+            
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                symptom_labels = {
+                    "digestive_comfort_scale": "Confort digestivo",
+                    "nausea": "Náusea",
+                    "pain_intensity": "Intensidad del dolor",
+                    "energy_level": "Energía",
+                    "fatigue": "Fatiga",
+                }
+                symptom = st.selectbox("Síntoma", list(symptom_labels), format_func=symptom_labels.get)
+            with col2:
+                window = st.selectbox("Horas tras la comida", [f"{lo}-{hi}h" for lo, hi in LAG_WINDOWS])
+            with col3:
+                min_exposed = st.number_input("Mínimo de reportes", min_value=1, max_value=50, value=3)
+            
+            rebuild = st.button("🔄 Recalcular desde cero")
+            with st.spinner("Calculando correlaciones..."):
+                # Incremental: solo procesa los reportes nuevos desde el último cálculo
+                if rebuild:
+                    correlations = get_correlations.uncached(db, user_id, min_exposed=int(min_exposed), rebuild=True)
+                else:
+                    correlations = get_correlations(db, user_id, min_exposed=int(min_exposed))
+            
+            selected = correlations[(correlations["symptom"] == symptom) & (correlations["window"] == window)]
+            if selected.empty:
+                st.info("Aún no hay suficientes ingestas y reportes de bienestar para encontrar relaciones.")
+            else:
+                st.dataframe(
+                    selected.rename(columns={
+                        "feature": "Alimento/Ingrediente",
+                        "kind": "Tipo",
+                        "n_exposed": "Reportes tras comerlo",
+                        "n_unexposed": "Resto de reportes",
+                        "mean_exposed": "Media tras comerlo",
+                        "mean_unexposed": "Media resto",
+                        "diff": "Diferencia",
+                        "r": "Correlación",
+                    }).drop(columns=["window", "symptom"]).head(20),
+                    width="stretch",
+                    hide_index=True
+                )
+                st.caption("Correlación no implica causalidad: úsalo como pista para comentar con un profesional.")
+            
+            st.divider()
+            st.subheader("🔥 Calorías por día")
+            rollups = get_daily_rollups(db, user_id)
+            daily_kcal = pd.DataFrame(
+                [{"Día": r["local_date"], "kcal": r.get("intakes", {}).get("kcal_total", 0)} for r in rollups]
+            )
+            if daily_kcal.empty:
+                st.info("No hay ingestas registradas aún.")
+            else:
+                st.line_chart(daily_kcal.set_index("Día"))
\ No newline at end of file
@@ -0,0 +1,24 @@
+"""
+Lecturas de la webapp con cache por usuario (TTL + version).
+
+Cada interaccion con un widget vuelve a ejecutar el script de Streamlit; estas versiones
+cacheadas evitan repetir las consultas a Mongo mientras no haya escrituras del usuario.
+`save_intake` y `save_wellness_report` invalidan los ambitos "intakes" y "wellness";
+`update_correlations(rebuild=True)` invalida "correlations".
+"""
+
+from bionexo.infrastructure.utils import db as _db
+from bionexo.infrastructure.utils.query_cache import user_cached
+from bionexo.repository import analytics as _analytics
+from bionexo.repository import correlations as _correlations
+from bionexo.repository import daily_rollups as _daily_rollups
+
+get_intakes_from_db = user_cached("intakes")(_db.get_intakes_from_db)
+get_unique_meal_names_from_db = user_cached("intakes")(_db.get_unique_meal_names_from_db)
+get_ingredients_for_meal = user_cached("intakes")(_db.get_ingredients_for_meal)
+get_wellness_reports_from_db = user_cached("wellness")(_db.get_wellness_reports_from_db)
+
+get_intake_stats = user_cached("intakes")(_analytics.get_intake_stats)
+get_wellness_stats = user_cached("wellness")(_analytics.get_wellness_stats)
+get_daily_rollups = user_cached("intakes", "wellness")(_daily_rollups.get_daily_rollups)
+get_correlations = user_cached("intakes", "wellness", "correlations")(_correlations.get_correlations)
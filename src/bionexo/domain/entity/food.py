@@ -22,7 +22,10 @@ class Food(BaseModel):
     updated_at: datetime = Field(default_factory=datetime.now)
     tags: Optional[List[str]] = None  # Ej: ["organic", "vegan", "gluten-free"]
     allergens: Optional[List[str]] = None
+    allergen_mask: Optional[int] = None  # Bits de los alergenos de `allergens` (ver repository/allergens.py)
     user_created: Optional[bool] = False  # True si fue creado por usuario (receta personalizada)
+    nutrient_vector: Optional[bytes] = None  # float32 por 100g en el orden de NUTRIENT_ORDER (BSON Binary)
+    nutrient_vector_layout: Optional[str] = None  # Version del orden de nutrientes del vector
     
     class Config:
         arbitrary_types_allowed = True
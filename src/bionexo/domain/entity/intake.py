@@ -22,8 +22,11 @@ class Intake(BaseModel):
     feeling_scale: Optional[int] = Field(None, ge=1, le=10, description="1=Con hambre, 10=Muy hinchado/Saciado")
     
     ingredients: Optional[List[str]] = None
-    image_data: Optional[bytes] = None  # Imagen en bytes (BSON Binary)
+    image_data: Optional[bytes] = None  # Imagen en bytes (BSON Binary); en JSON, base64
     voice_description: Optional[str] = None
     
     class Config:
-        arbitrary_types_allowed = True
\ No newline at end of file
+        arbitrary_types_allowed = True
+        # Sin esto pydantic toma la cadena JSON como bytes UTF-8 y se guardaría el texto base64
+        val_json_bytes = "base64"
+        ser_json_bytes = "base64"
\ No newline at end of file
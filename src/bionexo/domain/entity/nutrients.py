@@ -1,4 +1,4 @@
-from ctypes import Union
+from typing import Union
 from enum import Enum
 from pydantic import BaseModel, Field
 
@@ -0,0 +1,345 @@
+"""
+Copia de colecciones completas (backups, restauraciones y reescrituras de `migrations.py`).
+
+`copy_collection` separa lectura y escritura en hilos unidos por una cola acotada: mientras
+los escritores envian un lote el lector ya esta trayendo el siguiente, asi que el enlace con
+el servidor no se queda esperando a cada ida y vuelta. La cola limita la memoria a
+`queue_size` lotes.
+
+- Los lotes se cortan por bytes (`batch_bytes`), no por numero de documentos: miles de
+  ingestas pequeñas o pocos productos grandes de OFF ocupan lo mismo en cada `insert_many`.
+  El `batch_size` del cursor sale de `avgObjSize` de la coleccion.
+- Sin `transform` los documentos viajan como `RawBSONDocument`: no se decodifican ni se
+  vuelven a codificar, y su tamaño es el de los bytes recibidos.
+- Las escrituras son `insert_many` desordenados (salvo `ordered=True`, con un solo escritor)
+  y los fallos de red se reintentan; en un reintento, los `_id` duplicados son documentos
+  que ya llegaron a escribirse.
+- La verificacion compara, por tramos de `_id` (`$bucketAuto` sobre el origen), el numero de
+  documentos y una suma de crc32 de cada documento escrito con los del destino. Un tramo
+  distinto indica donde buscar el problema.
+"""
+
+import bisect
+import queue
+import threading
+import time
+import zlib
+from dataclasses import asdict, dataclass, field
+from typing import Callable, Optional
+
+import bson
+from bson.codec_options import CodecOptions
+from bson.raw_bson import RawBSONDocument
+from pymongo.errors import AutoReconnect, BulkWriteError, ConnectionFailure, NetworkTimeout, OperationFailure
+
+COPY_BATCH_BYTES = 8 * 1024 * 1024
+COPY_QUEUE_SIZE = 4
+VERIFY_RANGES = 32
+
+_DUPLICATE_KEY = 11000
+_RAW = CodecOptions(document_class=RawBSONDocument)
+
+
+@dataclass
+class CopyStats:
+    source: str
+    target: str
+    scanned: int = 0  # Documentos leidos del origen
+    changed: int = 0  # Documentos enviados al destino (los que `transform` no descarta)
+    written: int = 0
+    errors: int = 0
+    batches: int = 0
+    bytes: int = 0
+    retries: int = 0
+    elapsed: float = 0.0
+    mismatched_ranges: list = field(default_factory=list)
+
+    @property
+    def throughput(self) -> float:
+        return self.scanned / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def mb_per_second(self) -> float:
+        return self.bytes / self.elapsed / 1e6 if self.elapsed else 0.0
+
+    def to_dict(self) -> dict:
+        return {**asdict(self), "throughput": round(self.throughput, 1), "mb_per_second": round(self.mb_per_second, 2)}
+
+
+class CopyVerificationError(RuntimeError):
+    pass
+
+
+def _doc_checksum(doc) -> int:
+    """crc32 del documento con los campos de primer nivel ordenados (las time-series no conservan el orden)."""
+    if isinstance(doc, RawBSONDocument):
+        doc = bson.decode(doc.raw)
+    return zlib.crc32(bson.encode(dict(sorted(doc.items()))))
+
+
+class RangeChecksums:
+    """Numero de documentos y suma de crc32 por tramo de `_id`."""
+
+    def __init__(self, bounds: list):
+        self.bounds = bounds  # Limite inferior de cada tramo salvo el primero
+        self.counts = [0] * (len(bounds) + 1)
+        self.sums = [0] * (len(bounds) + 1)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_collection(cls, collection, n: int = VERIFY_RANGES, query: Optional[dict] = None) -> "RangeChecksums":
+        """Tramos de igual tamaño segun la distribucion de `_id` del origen; uno solo si no se puede calcular."""
+        pipeline = [{"$match": query}] if query else []
+        try:
+            buckets = list(collection.aggregate(
+                pipeline + [{"$bucketAuto": {"groupBy": "$_id", "buckets": n}}], allowDiskUse=True
+            ))
+            bounds = [bucket["_id"]["min"] for bucket in buckets[1:]]
+        except OperationFailure:
+            bounds = []
+        if len({type(bound) for bound in bounds}) > 1:
+            bounds = []  # _id de tipos distintos: no se pueden comparar en Python
+        return cls(bounds)
+
+    def _range(self, doc_id) -> int:
+        try:
+            return bisect.bisect_right(self.bounds, doc_id)
+        except TypeError:
+            return 0
+
+    def add(self, docs: list):
+        partial = [(self._range(doc["_id"]), _doc_checksum(doc)) for doc in docs]
+        with self._lock:
+            for i, checksum in partial:
+                self.counts[i] += 1
+                self.sums[i] = (self.sums[i] + checksum) & 0xFFFFFFFFFFFFFFFF
+
+    def describe(self, i: int) -> str:
+        lo = self.bounds[i - 1] if i > 0 else "-inf"
+        hi = self.bounds[i] if i < len(self.bounds) else "+inf"
+        return f"_id [{lo}, {hi})"
+
+    def diff(self, other: "RangeChecksums") -> list[dict]:
+        return [
+            {"range": self.describe(i), "expected": self.counts[i], "found": other.counts[i]}
+            for i in range(len(self.counts))
+            if (self.counts[i], self.sums[i]) != (other.counts[i], other.sums[i])
+        ]
+
+
+def _cursor_batch_size(collection, batch_bytes: int, max_docs: int) -> int:
+    try:
+        avg = collection.database.command("collStats", collection.name).get("avgObjSize") or 1024
+    except OperationFailure:
+        avg = 1024
+    return int(min(max(batch_bytes // max(int(avg), 1), 100), max_docs))
+
+
+class _Copy:
+    """Estado compartido entre el lector y los escritores de una copia."""
+
+    def __init__(self, source, target, transform, *, query, batch_bytes, max_docs, sort, ordered,
+                 writers, queue_size, retries, dry_run, checksums):
+        self.source = source
+        self.target = target
+        self.transform = transform
+        self.query = query or {}
+        self.batch_bytes = batch_bytes
+        self.max_docs = max_docs
+        self.sort = sort
+        self.ordered = ordered
+        self.writers = 1 if ordered else max(writers, 1)
+        self.retries = retries
+        self.dry_run = dry_run
+        self.checksums = checksums
+        self.stats = CopyStats(source.name, target.name)
+        self.batches: queue.Queue = queue.Queue(maxsize=queue_size)
+        self.stop = threading.Event()
+        self.failure: Optional[BaseException] = None
+        self._lock = threading.Lock()
+
+    def _put(self, item):
+        while not self.stop.is_set():
+            try:
+                self.batches.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def read(self):
+        try:
+            collection = self.source if self.transform else self.source.with_options(codec_options=_RAW)
+            cursor = collection.find(self.query).batch_size(_cursor_batch_size(self.source, self.batch_bytes, self.max_docs))
+            if self.sort:
+                cursor = cursor.sort(self.sort).allow_disk_use(True)
+            batch, size = [], 0
+            sample_size = 1024  # Tamaño medio estimado de los documentos transformados
+            for doc in cursor:
+                if self.stop.is_set():
+                    return
+                self.stats.scanned += 1
+                if self.transform:
+                    doc = self.transform(doc)
+                    if doc is None:
+                        continue
+                    if self.stats.scanned % 32 == 1:
+                        sample_size = len(bson.encode(doc))
+                    size += sample_size
+                else:
+                    size += len(doc.raw)
+                batch.append(doc)
+                if size >= self.batch_bytes or len(batch) >= self.max_docs:
+                    self._put((batch, size))
+                    batch, size = [], 0
+            if batch:
+                self._put((batch, size))
+        except BaseException as e:
+            self.fail(e)
+        finally:
+            for _ in range(self.writers):
+                self._put(None)
+
+    def _insert(self, batch: list) -> tuple[int, int]:
+        """Inserta un lote con reintentos; devuelve (escritos, errores)."""
+        for attempt in range(1, self.retries + 2):
+            try:
+                return len(self.target.insert_many(batch, ordered=self.ordered).inserted_ids), 0
+            except BulkWriteError as e:
+                write_errors = e.details.get("writeErrors", [])
+                # Tras un reintento, los duplicados son documentos del intento anterior
+                duplicates = sum(1 for error in write_errors if error.get("code") == _DUPLICATE_KEY) if attempt > 1 else 0
+                failed = len(write_errors) - duplicates
+                for error in write_errors[:3]:
+                    if attempt == 1 or error.get("code") != _DUPLICATE_KEY:
+                        print(f"  ❌ {self.target.name}: {error.get('errmsg')}")
+                if self.ordered:
+                    failed = len(batch) - e.details.get("nInserted", 0) - duplicates
+                return e.details.get("nInserted", 0) + duplicates, failed
+            except (AutoReconnect, ConnectionFailure, NetworkTimeout):
+                if attempt > self.retries:
+                    raise
+                with self._lock:
+                    self.stats.retries += 1
+                time.sleep(min(2 ** (attempt - 1), 10))
+        return 0, len(batch)
+
+    def write(self):
+        try:
+            while True:
+                try:
+                    item = self.batches.get(timeout=0.5)
+                except queue.Empty:
+                    if self.stop.is_set():
+                        return
+                    continue
+                if item is None:
+                    return
+                batch, size = item
+                written, errors = (0, 0) if self.dry_run else self._insert(batch)
+                if self.checksums is not None and not self.dry_run:
+                    self.checksums.add(batch)
+                with self._lock:
+                    self.stats.changed += len(batch)
+                    self.stats.written += written
+                    self.stats.errors += errors
+                    self.stats.batches += 1
+                    self.stats.bytes += size
+        except BaseException as e:
+            self.fail(e)
+
+    def fail(self, error: BaseException):
+        with self._lock:
+            if self.failure is None:
+                self.failure = error
+        self.stop.set()
+
+
+def verify_copy(target, expected: RangeChecksums) -> list[dict]:
+    """Recorre el destino y devuelve los tramos cuyo numero de documentos o checksum no coincide."""
+    found = RangeChecksums(expected.bounds)
+    batch = []
+    for doc in target.with_options(codec_options=_RAW).find():
+        batch.append(doc)
+        if len(batch) >= 1000:
+            found.add(batch)
+            batch = []
+    found.add(batch)
+    return expected.diff(found)
+
+
+def copy_collection(
+        db,
+        source: str,
+        target: str,
+        transform: Optional[Callable[[dict], Optional[dict]]] = None,
+        *,
+        query: Optional[dict] = None,
+        batch_bytes: int = COPY_BATCH_BYTES,
+        batch_size: int = 10_000,
+        sort: Optional[list[tuple[str, int]]] = None,
+        ordered: bool = False,
+        writers: int = 2,
+        queue_size: int = COPY_QUEUE_SIZE,
+        retries: int = 3,
+        verify: bool = True,
+        dry_run: bool = False,
+        progress_every: float = 10.0,
+        log: Callable[[str], None] = print
+) -> CopyStats:
+    """
+    Copia los documentos de `source` que cumplen `query` en `target` pasando cada uno por
+    `transform` (None lo descarta). `batch_size` es el maximo de documentos por lote. Con `verify` se comprueba el destino
+    por tramos y se lanza `CopyVerificationError` si no coincide; tambien si hubo errores de
+    escritura. No se reanuda: si se corta, se vuelve a copiar sobre un destino vacio.
+    """
+    checksums = RangeChecksums.for_collection(db[source], query=query) if verify and not dry_run else None
+    copy = _Copy(
+        db[source], db[target], transform, query=query, batch_bytes=batch_bytes, max_docs=batch_size, sort=sort,
+        ordered=ordered, writers=writers, queue_size=queue_size, retries=retries, dry_run=dry_run,
+        checksums=checksums
+    )
+    started = time.perf_counter()
+    threads = [threading.Thread(target=copy.read, name=f"copy-read-{source}", daemon=True)]
+    threads += [
+        threading.Thread(target=copy.write, name=f"copy-write-{target}-{i}", daemon=True) for i in range(copy.writers)
+    ]
+    for thread in threads:
+        thread.start()
+
+    stats = copy.stats
+    try:
+        while True:
+            alive = [thread for thread in threads if thread.is_alive()]
+            if not alive:
+                break
+            alive[0].join(progress_every)
+            if alive[0].is_alive():
+                stats.elapsed = time.perf_counter() - started
+                log(
+                    f"  ⏱️ {source} -> {target}: {stats.scanned} leídos, {stats.written} escritos "
+                    f"({stats.throughput:.0f} docs/s, {stats.mb_per_second:.1f} MB/s)"
+                )
+    except KeyboardInterrupt:
+        copy.stop.set()
+        raise
+    stats.elapsed = time.perf_counter() - started
+    if copy.failure is not None:
+        raise copy.failure
+
+    log(
+        f"  ⏱️ {source} -> {target}: {stats.scanned} leídos, {stats.changed} enviados, {stats.written} escritos, "
+        f"{stats.errors} errores, {stats.retries} reintentos ({stats.throughput:.0f} docs/s, {stats.mb_per_second:.1f} MB/s)"
+    )
+    if dry_run:
+        return stats
+    if stats.errors:
+        raise CopyVerificationError(f"{stats.errors} errores copiando '{source}' a '{target}'")
+    if checksums is not None:
+        stats.mismatched_ranges = verify_copy(db[target], checksums)
+        if stats.mismatched_ranges:
+            raise CopyVerificationError(
+                f"'{target}' no coincide con lo copiado desde '{source}' en {len(stats.mismatched_ranges)} tramos: "
+                f"{stats.mismatched_ranges[:5]}"
+            )
+        log(f"  ✅ {target}: {sum(checksums.counts)} documentos verificados en {len(checksums.counts)} tramos de _id")
+    return stats
@@ -1,6 +1,6 @@
 import os
 from typing import List
-from pymongo import MongoClient
+from pymongo import MongoClient, UpdateOne
 from pymongo.errors import DuplicateKeyError
 from bson import Binary
 from datetime import datetime
@@ -11,7 +11,16 @@ from bionexo.domain.entity.food import Food
 from bionexo.domain.entity.wellness_logs import WellnessReport
 from bionexo.infrastructure.utils.functions import hash_password
 from bionexo.infrastructure.utils.image_handler import compress_image
+from bionexo.repository.allergens import user_allergies
 from bionexo.repository.foods import create_or_update_food, get_food_id_by_name
+from bionexo.repository.reference_intakes import personal_nutrients_rdi
+from bionexo.repository.daily_rollups import (
+    DAILY_ROLLUPS_COLLECTION, apply_intake_to_rollup, apply_wellness_to_rollup, intake_rollup_update,
+    rollup_key, wellness_rollup_update
+)
+from bionexo.infrastructure.utils.query_cache import invalidate_user
+from bionexo.infrastructure.utils.write_behind import CollectionHandler, get_write_behind_queue
+from bionexo.repository.user_meals import USER_MEALS_COLLECTION, get_user_meals, meal_use_update, record_meal_use
 from PIL import Image
 import io
 
@@ -25,67 +34,151 @@ def db_user_exists(db, email: str, password: str) -> bool:
     user = users_collection.find_one({"email": email, "password": hash_password(password)})
     return user is not None
 
+def get_user_allergies(db, email: str) -> tuple[int, list[str]]:
+    """Máscara de alergias del perfil del usuario y las alergias que no se pueden filtrar."""
+    user = db["users"].find_one({"email": email}, {"personal_intakes_recommendations.allergies": 1})
+    return user_allergies(user or {})
+
+def user_document(user_data: User) -> dict:
+    """Documento a guardar en 'users'."""
+    user_dict = user_data.model_dump()
+    # Objetivos diarios calculados una sola vez al guardar el perfil
+    profile = user_data.personal_intakes_recommendations
+    if profile.nutrients_rdi is None:
+        user_dict["personal_intakes_recommendations"]["nutrients_rdi"] = personal_nutrients_rdi(profile)
+    return user_dict
+
 def save_user(db, user_data: User):
     users_collection = db["users"]
     try:
-        users_collection.insert_one(user_data.model_dump())
+        users_collection.insert_one(user_document(user_data))
         return True
     except DuplicateKeyError:
         return None
 
-def save_intake(db, intake: Intake) -> bool:
+def intake_food(intake: Intake) -> Food:
+    """Alimento (Food) que se crea automáticamente a partir de una ingesta."""
+    return Food(
+        name=intake.food_name,
+        description=intake.voice_description,
+        ingredients=intake.ingredients or [],
+        kcal_per_100g=intake.kcal / 100 if intake.kcal and intake.quantity else 0,
+        tags=["user_created"] if intake.quantity else []
+    )
+
+def intake_document(intake: Intake) -> dict:
+    """
+    Documento a guardar en 'intakes' (sin `food_id`): la imagen se comprime y se guarda
+    como BSON Binary y el timestamp como datetime.
+    """
+    intake_dict = intake.model_dump()
+    
+    # Comprimir y convertir imagen a BSON Binary si existe
+    if intake_dict.get("image_data") and isinstance(intake_dict["image_data"], bytes):
+        try:
+            # Intentar comprimir la imagen
+            image = Image.open(io.BytesIO(intake_dict["image_data"]))
+            compressed_data = compress_image(image, max_width=800, quality=85)
+            intake_dict["image_data"] = Binary(compressed_data)
+            intake_dict["image_size_bytes"] = len(compressed_data)
+        except Exception as e:
+            print(f"Error comprimiendo imagen: {e}")
+            intake_dict["image_data"] = Binary(intake_dict["image_data"])
+            intake_dict["image_size_bytes"] = len(intake_dict["image_data"])
+    
+    # Asegurar que timestamp sea datetime
+    if isinstance(intake_dict.get("timestamp"), str):
+        intake_dict["timestamp"] = datetime.fromisoformat(intake_dict["timestamp"])
+    return intake_dict
+
+def intake_from_document(intake: dict) -> Intake:
+    """Crea el objeto Intake a partir de un documento de 'intakes'."""
+    # Convertir ObjectId a string
+    if "_id" in intake:
+        intake["_id"] = str(intake["_id"])
+    # Convertir imagen Binary a bytes si existe
+    if isinstance(intake.get("image_data"), Binary):
+        intake["image_data"] = bytes(intake["image_data"])
+    return Intake(**intake)
+
+def intake_derived_writes(intake_dicts: List[dict], tz: str = "Europe/Madrid") -> dict[str, list]:
+    """Actualizaciones de `daily_rollups` y `user_meals` para un lote de ingestas ya insertadas."""
+    rollups, meals = [], []
+    for intake_dict in intake_dicts:
+        rollups.append(UpdateOne(rollup_key(intake_dict, tz), intake_rollup_update(intake_dict, tz), upsert=True))
+        meal_use = meal_use_update(
+            intake_dict["user_id"], intake_dict["food_name"], intake_dict["timestamp"], intake_dict.get("food_id")
+        )
+        if meal_use is not None:
+            meals.append(UpdateOne(*meal_use, upsert=True))
+    return {DAILY_ROLLUPS_COLLECTION: rollups, USER_MEALS_COLLECTION: meals}
+
+def wellness_derived_writes(report_dicts: List[dict], tz: str = "Europe/Madrid") -> dict[str, list]:
+    """Actualizaciones de `daily_rollups` para un lote de reportes ya insertados."""
+    return {DAILY_ROLLUPS_COLLECTION: [
+        UpdateOne(rollup_key(report_dict, tz), wellness_rollup_update(report_dict, tz), upsert=True)
+        for report_dict in report_dicts
+    ]}
+
+# Colecciones con escritura diferida opcional (ver write_behind.py)
+WRITE_BEHIND_COLLECTIONS = {
+    "intakes": CollectionHandler(intake_derived_writes, "intakes"),
+    "wellness_logs": CollectionHandler(wellness_derived_writes, "wellness"),
+}
+
+def apply_derived_write(description: str, write, *args):
+    """
+    Escritura derivada (resumen diario, índice de comidas) tras guardar un registro. Si falla
+    se informa y no se propaga: el registro ya está guardado y devolver un error haría que se
+    reintentara, duplicándolo. Los derivados se corrigen con `scripts/rebuild_daily_rollups.py`
+    y `scripts/rebuild_user_meals.py`.
+    """
+    try:
+        write(*args)
+    except Exception as e:
+        print(f"Error actualizando {description} (el registro sí se guardó): {str(e)}")
+
+def save_intake(db, intake: Intake, tz: str = "Europe/Madrid") -> bool:
     """
     Guarda una ingesta en MongoDB con soporte para imágenes en BSON Binary.
     Las imágenes se comprimen automáticamente para optimizar almacenamiento.
     La colección 'intakes' debe tener un índice timeseries con user_id y timestamp.
     
     También crea o actualiza automáticamente un alimento (Food) en la colección 'foods'
-    basado en los datos de la ingesta.
+    basado en los datos de la ingesta, y el resumen diario (`daily_rollups`) del día
+    local en la zona horaria `tz`.
+    
+    Con `BIONEXO_WRITE_BEHIND=1` la ingesta se escribe en lote desde la cola de escritura
+    diferida y el resultado depende de su modo de confirmación.
     """
     intakes_collection = db["intakes"]
     try:
-        intake_dict = intake.model_dump()
-        
-        # Crear o actualizar el alimento (Food) automáticamente
-        food_data = Food(
-            name=intake.food_name,
-            description=intake.voice_description,
-            ingredients=intake.ingredients or [],
-            kcal_per_100g=intake.kcal / 100 if intake.kcal and intake.quantity else 0,
-            tags=["user_created"] if intake.quantity else []
-        )
+        intake_dict = intake_document(intake)
         
         # Obtener o crear el food_id
         existing_food_id = get_food_id_by_name(db, intake.food_name)
         if existing_food_id:
             intake_dict["food_id"] = existing_food_id
         else:
-            food_id = create_or_update_food(db, food_data)
+            food_id = create_or_update_food(db, intake_food(intake))
             if food_id:
                 intake_dict["food_id"] = food_id
         
-        # Comprimir y convertir imagen a BSON Binary si existe
-        if intake_dict.get("image_data") and isinstance(intake_dict["image_data"], bytes):
-            try:
-                # Intentar comprimir la imagen
-                image = Image.open(io.BytesIO(intake_dict["image_data"]))
-                compressed_data = compress_image(image, max_width=800, quality=85)
-                intake_dict["image_data"] = Binary(compressed_data)
-                intake_dict["image_size_bytes"] = len(compressed_data)
-            except Exception as e:
-                print(f"Error comprimiendo imagen: {e}")
-                intake_dict["image_data"] = Binary(intake_dict["image_data"])
-                intake_dict["image_size_bytes"] = len(intake_dict["image_data"])
-        
-        # Asegurar que timestamp sea datetime
-        if isinstance(intake_dict.get("timestamp"), str):
-            intake_dict["timestamp"] = datetime.fromisoformat(intake_dict["timestamp"])
+        write_behind = get_write_behind_queue(db, WRITE_BEHIND_COLLECTIONS)
+        if write_behind is not None:
+            return write_behind.submit("intakes", intake_dict, tz)
         
         intakes_collection.insert_one(intake_dict)
-        return True
     except Exception as e:
         print(f"Error al guardar ingesta: {str(e)}")
         return False
+    apply_derived_write("el resumen diario", apply_intake_to_rollup, db, intake_dict, tz)
+    apply_derived_write(
+        "el índice de comidas", record_meal_use,
+        db, intake.user_id, intake.food_name, intake_dict["timestamp"], intake_dict.get("food_id")
+    )
+    invalidate_user(intake.user_id, "intakes")
+    return True
 
 def get_intakes_from_db(db, user_id: str, limit: int = 50) -> List[Intake]:
     """Obtiene las ingestas de un usuario, ordenadas por timestamp descendente."""
@@ -94,30 +187,17 @@ def get_intakes_from_db(db, user_id: str, limit: int = 50) -> List[Intake]:
         {"user_id": user_id}
     ).sort("timestamp", -1).limit(limit))
     
-    # Convertir ObjectId a string y crear objetos Intake
-    intake_objects = []
-    for intake in intakes:
-        if "_id" in intake:
-            intake["_id"] = str(intake["_id"])
-        # Convertir imagen Binary a bytes si existe
-        if isinstance(intake.get("image_data"), Binary):
-            intake["image_data"] = bytes(intake["image_data"])
-        # Crear objeto Intake
-        intake_objects.append(Intake(**intake))
-    
-    return intake_objects
+    return [intake_from_document(intake) for intake in intakes]
 
-def get_unique_meal_names_from_db(db, user_id: str) -> list:
+def get_unique_meal_names_from_db(db, user_id: str, limit: int = 50, order: str = "frequency", prefix: str = None, exclude_allergens: int = 0) -> list:
     """
-    Obtiene los nombres únicos de comidas guardadas previamente por el usuario.
-    Útil para el select_box de reutilización de comidas.
+    Obtiene los nombres de comidas guardadas previamente por el usuario, desde su índice
+    `user_meals` (top-N por frecuencia o recencia, con búsqueda por prefijo en el servidor).
+    Útil para el select_box de reutilización de comidas. `exclude_allergens` es la máscara de
+    alergias del usuario (`get_user_allergies`): se quitan las comidas con esos alérgenos.
     """
-    intakes_collection = db["foods"]
-    unique_meals = intakes_collection.distinct(
-        "name",
-        # {"user_id": user_id}
-    )
-    return sorted(list(unique_meals))
+    meals = get_user_meals(db, user_id, limit=limit, order=order, prefix=prefix, exclude_allergens=exclude_allergens)
+    return [meal["name"] for meal in meals]
 
 def get_ingredients_for_meal(db, user_id: str, meal_name: str) -> str:
     """
@@ -154,31 +234,41 @@ def create_intakes_timeseries_collection(db):
     except Exception as e:
         print(f"La colección 'intakes' ya existe o hubo un error: {str(e)}")
 
-def save_wellness_report(db, wellness_report: WellnessReport) -> bool:
+def wellness_document(wellness_report: WellnessReport) -> dict:
+    """Documento a guardar en 'wellness_logs'."""
+    report_dict = wellness_report.model_dump()
+    
+    # Asegurar que timestamp sea datetime
+    if isinstance(report_dict.get("timestamp"), str):
+        report_dict["timestamp"] = datetime.fromisoformat(report_dict["timestamp"])
+    
+    # Convertir objetos Symptom a dict si es necesario
+    if report_dict.get("wellness_logs"):
+        report_dict["wellness_logs"] = [
+            s.model_dump() if hasattr(s, "model_dump") else s 
+            for s in report_dict["wellness_logs"]
+        ]
+    return report_dict
+
+def save_wellness_report(db, wellness_report: WellnessReport, tz: str = "Europe/Madrid") -> bool:
     """
-    Guarda un reporte de síntomas en MongoDB.
+    Guarda un reporte de síntomas en MongoDB y actualiza el resumen diario (`daily_rollups`).
     La colección 'wellness_logs' debe tener un índice timeseries con user_id y timestamp.
+    Con `BIONEXO_WRITE_BEHIND=1` se escribe en lote desde la cola de escritura diferida.
     """
     wellness_logs_collection = db["wellness_logs"]
     try:
-        report_dict = wellness_report.model_dump()
-        
-        # Asegurar que timestamp sea datetime
-        if isinstance(report_dict.get("timestamp"), str):
-            report_dict["timestamp"] = datetime.fromisoformat(report_dict["timestamp"])
-        
-        # Convertir objetos Symptom a dict si es necesario
-        if report_dict.get("wellness_logs"):
-            report_dict["wellness_logs"] = [
-                s.model_dump() if hasattr(s, "model_dump") else s 
-                for s in report_dict["wellness_logs"]
-            ]
-        
+        report_dict = wellness_document(wellness_report)
+        write_behind = get_write_behind_queue(db, WRITE_BEHIND_COLLECTIONS)
+        if write_behind is not None:
+            return write_behind.submit("wellness_logs", report_dict, tz)
         wellness_logs_collection.insert_one(report_dict)
-        return True
     except Exception as e:
         print(f"Error al guardar reporte de síntomas: {str(e)}")
         return False
+    apply_derived_write("el resumen diario", apply_wellness_to_rollup, db, report_dict, tz)
+    invalidate_user(wellness_report.user_id, "wellness")
+    return True
 
 def get_wellness_reports_from_db(db, user_id: str, limit: int = 50):
     """Obtiene los reportes de síntomas de un usuario, ordenados por timestamp descendente."""
@@ -0,0 +1,851 @@
+"""
+Ejecutor comun de migraciones por lotes y reanudables para los scripts de `scripts/`.
+
+`MigrationRunner.run(transform)` recorre la coleccion con un cursor por lotes (sin cargarla
+en memoria), pasa cada documento a `transform` y acumula lo que devuelve en escrituras
+`bulk_write` de `batch_size` operaciones. Tras cada lote guarda en la coleccion `migrations`
+un checkpoint con la ultima clave procesada (`sort_key`, por defecto `_id`) y los contadores,
+de modo que si la ejecucion se corta la siguiente continua desde ahi. Cada `progress_every`
+segundos informa del avance y del ritmo (documentos/s).
+
+Modos de escritura (`mode`):
+- "update": `transform(doc)` devuelve una operacion de pymongo (`UpdateOne`, ...), una lista
+  de operaciones o None.
+- "replace": devuelve el documento nuevo completo (mismo `_id`) o None. Se escribe como
+  `delete_many` + `insert_many` por lote, que es lo que admiten las colecciones time-series
+  en versiones de MongoDB sin updates arbitrarios. Cada lote se guarda antes en
+  `migrations_staging` para poder terminarlo si la ejecucion se corta entre ambos pasos.
+- "insert": devuelve el documento a insertar en `target` o None (copias entre colecciones).
+
+Con `sort_key=None` el cursor no se ordena y no se guarda la clave: solo vale para
+migraciones cuya consulta excluye los documentos ya migrados, que al relanzarse continuan
+solas. En dry-run no se escribe nada, tampoco el checkpoint.
+
+Para colecciones grandes, `run_partitioned_migration` divide el trabajo en particiones
+(`user_range_partitions` por rangos de `user_id`, `time_partitions` por meses u otras unidades
+de calendario) y ejecuta un `MigrationRunner` por particion en un pool de hilos o de procesos.
+Cada particion tiene su checkpoint (`<nombre>.<particion>`): un fallo solo afecta a su
+particion, y al relanzar se saltan las terminadas y se reanudan las demas con las mismas
+consultas, que se guardan en el checkpoint de la migracion. El avance agregado se calcula
+leyendo los checkpoints, asi que funciona tambien entre procesos.
+
+`rewrite_collection` reescribe una coleccion entera en vez de sustituir documentos: copia los
+documentos transformados a una coleccion nueva con las mismas opciones (en time-series, con
+`insert_many` ordenados por `metaField` y `timeField`, que llenan cada bucket de una vez),
+copia lo escrito mientras tanto, crea sus indices, verifica el total e intercambia los
+nombres. La coleccion original queda como backup. Las time-series no se pueden renombrar y
+se recrean, lo que exige detener antes las escrituras.
+"""
+
+import os
+import threading
+import time
+import traceback
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timedelta, timezone
+from functools import partial
+from typing import Any, Callable, Iterable, Literal, Optional
+
+from pymongo import IndexModel
+from pymongo.collection import Collection
+from pymongo.errors import AutoReconnect, BulkWriteError, ConnectionFailure, OperationFailure
+
+from bionexo.infrastructure.utils.collection_copy import CopyStats, copy_collection
+
+MIGRATIONS_COLLECTION = "migrations"
+MIGRATION_STAGING_COLLECTION = "migrations_staging"
+
+MigrationMode = Literal["update", "replace", "insert"]
+ExecutorKind = Literal["thread", "process"]
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+@dataclass
+class MigrationStats:
+    name: str
+    scanned: int = 0  # Documentos leidos
+    changed: int = 0  # Documentos para los que `transform` devolvio cambios
+    written: int = 0  # Documentos modificados/insertados/borrados segun el servidor
+    errors: int = 0
+    batches: int = 0
+    elapsed: float = 0.0
+    resumed_from: Any = None
+    resumed_scanned: int = 0  # Documentos leidos por la ejecucion interrumpida
+
+    @property
+    def throughput(self) -> float:
+        """Documentos leidos por segundo en esta ejecucion."""
+        return (self.scanned - self.resumed_scanned) / self.elapsed if self.elapsed else 0.0
+
+    def to_dict(self) -> dict:
+        return {**asdict(self), "throughput": round(self.throughput, 1)}
+
+
+class BulkWriter:
+    """Acumula operaciones y las envia en `bulk_write` desordenados de `batch_size`."""
+
+    def __init__(self, collection: Collection, batch_size: int = 1000, dry_run: bool = True, ordered: bool = False):
+        self.collection = collection
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.ordered = ordered
+        self.pending: list = []
+        self.written = 0
+        self.errors = 0
+        self.batches = 0
+
+    def add(self, ops):
+        if isinstance(ops, (list, tuple)):
+            self.pending.extend(ops)
+        else:
+            self.pending.append(ops)
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def _count(self, result: dict):
+        self.written += sum(result.get(key, 0) for key in ("nModified", "nInserted", "nRemoved", "nUpserted"))
+
+    def _write(self, batch: list):
+        result = self.collection.bulk_write(batch, ordered=self.ordered)
+        self._count(result.bulk_api_result)
+
+    def flush(self):
+        if not self.pending:
+            return
+        batch, self.pending = self.pending, []
+        self.batches += 1
+        if self.dry_run:
+            return
+        try:
+            self._write(batch)
+        except BulkWriteError as e:
+            # Con ordered=False el resto del lote se aplica: se cuentan los fallos y se sigue.
+            # Con ordered=True el lote se corta en el primer fallo (lo detecta quien verifique el total)
+            self._count(e.details)
+            self.errors += len(e.details.get("writeErrors", []))
+            for error in e.details.get("writeErrors", [])[:3]:
+                print(f"  ❌ {self.collection.name}: {error.get('errmsg')}")
+
+
+class ReplaceWriter(BulkWriter):
+    """
+    Sustituye documentos completos. Antes de tocar la coleccion, cada lote se guarda en
+    `migrations_staging` (version nueva y originales con el mismo `_id`); despues se borran los
+    originales, se insertan las versiones nuevas y se descarta lo preparado. Los documentos
+    que el servidor rechaza recuperan su original. Si la ejecucion se corta a mitad de un lote,
+    `recover()` lo termina al empezar la siguiente: ningun original se pierde sin su sustituto.
+    """
+
+    retries = 3
+
+    def __init__(self, collection: Collection, batch_size: int = 1000, dry_run: bool = True, ordered: bool = False, name: Optional[str] = None):
+        super().__init__(collection, batch_size, dry_run, ordered)
+        self.name = name or collection.name  # Clave de los lotes preparados (una por migracion o particion)
+        self.staging = collection.database[MIGRATION_STAGING_COLLECTION]
+
+    def _originals(self, ids: list) -> dict:
+        originals: dict = {}
+        for doc in self.collection.find({"_id": {"$in": ids}}):
+            # En time-series el `_id` no es unico: se guardan todos
+            originals.setdefault(doc["_id"], []).append(doc)
+        return originals
+
+    def _apply(self, batch: list, originals: dict):
+        ids = [doc["_id"] for doc in batch]
+        for attempt in range(1, self.retries + 1):
+            # Borrar antes de cada intento quita tambien lo insertado por un intento cortado
+            self.collection.delete_many({"_id": {"$in": ids}})
+            try:
+                result = self.collection.insert_many(batch, ordered=False)
+                self.written += len(result.inserted_ids)
+                return
+            except BulkWriteError as e:
+                rejected = [batch[error["index"]]["_id"] for error in e.details.get("writeErrors", [])]
+                restore = [doc for _id in rejected for doc in originals.get(_id, [])]
+                if restore:
+                    self.collection.insert_many(restore, ordered=False)
+                raise
+            except (AutoReconnect, ConnectionFailure):
+                if attempt == self.retries:
+                    print(f"  ❌ {self.collection.name}: lote pendiente en '{MIGRATION_STAGING_COLLECTION}' ({self.name})")
+                    raise
+                time.sleep(attempt)
+
+    def _write(self, batch: list):
+        originals = self._originals([doc["_id"] for doc in batch])
+        staged = self.staging.insert_many([
+            {"migration": self.name, "doc_id": doc["_id"], "new": doc, "old": originals.get(doc["_id"], [])}
+            for doc in batch
+        ]).inserted_ids
+        try:
+            self._apply(batch, originals)
+        except BulkWriteError:
+            # Los rechazados ya tienen su original: el lote esta resuelto
+            self.staging.delete_many({"_id": {"$in": staged}})
+            raise
+        # Con un fallo de red lo preparado se queda para `recover()`
+        self.staging.delete_many({"_id": {"$in": staged}})
+
+    def recover(self) -> int:
+        """Termina los lotes preparados por una ejecucion cortada; devuelve los documentos repuestos."""
+        recovered = 0
+        while True:
+            entries = list(self.staging.find({"migration": self.name}).limit(self.batch_size))
+            if not entries:
+                return recovered
+            batch = [entry["new"] for entry in entries]
+            originals = {entry["doc_id"]: entry["old"] for entry in entries}
+            try:
+                self._apply(batch, originals)
+            except BulkWriteError as e:
+                self._count(e.details)
+                self.errors += len(e.details.get("writeErrors", []))
+            self.staging.delete_many({"_id": {"$in": [entry["_id"] for entry in entries]}})
+            recovered += len(entries)
+
+
+class InsertWriter(BulkWriter):
+    def _write(self, batch: list):
+        result = self.collection.insert_many(batch, ordered=self.ordered)
+        self.written += len(result.inserted_ids)
+
+
+class MigrationRunner:
+    """Recorre una coleccion por lotes, escribe con bulk_write y guarda checkpoints reanudables."""
+
+    def __init__(
+            self,
+            db,
+            name: str,
+            collection: str,
+            *,
+            mode: MigrationMode = "update",
+            target: Optional[str] = None,
+            batch_size: int = 1000,
+            dry_run: bool = True,
+            sort_key: Optional[str] = "_id",
+            sort: Optional[list[tuple[str, int]]] = None,
+            ordered: bool = False,
+            resume: bool = True,
+            progress_every: float = 10.0,
+            log: Callable[[str], None] = print,
+            parent: Optional[str] = None
+    ):
+        self.db = db
+        self.name = name
+        self.collection = db[collection]
+        self.mode = mode
+        self.target = db[target] if target else self.collection
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.sort_key = sort_key
+        self.sort = sort  # Orden del cursor sin checkpoint (`sort_key=None`)
+        self.ordered = ordered  # Escrituras ordenadas (p. ej. inserciones en orden de `timestamp`)
+        self.resume = resume
+        self.progress_every = progress_every
+        self.log = log
+        self.parent = parent  # Migracion particionada a la que pertenece
+
+    # --- Checkpoints ---
+
+    @property
+    def checkpoints(self) -> Collection:
+        return self.db[MIGRATIONS_COLLECTION]
+
+    def checkpoint(self) -> Optional[dict]:
+        return self.checkpoints.find_one({"_id": self.name})
+
+    def reset(self):
+        """Olvida el checkpoint: la siguiente ejecucion empieza desde el principio."""
+        self.checkpoints.delete_one({"_id": self.name})
+
+    def _save_checkpoint(self, stats: MigrationStats, last_key: Any, status: str):
+        if self.dry_run:
+            return
+        update = {
+            "collection": self.collection.name,
+            "target": self.target.name,
+            "sort_key": self.sort_key,
+            "last_key": last_key,
+            "status": status,
+            "scanned": stats.scanned,
+            "changed": stats.changed,
+            "written": stats.written,
+            "errors": stats.errors,
+            "parent": self.parent,
+            "updated_at": _utcnow(),
+        }
+        if status == "done":
+            update["finished_at"] = update["updated_at"]
+        self.checkpoints.update_one(
+            {"_id": self.name},
+            {"$set": update, "$setOnInsert": {"started_at": _utcnow()}},
+            upsert=True
+        )
+
+    # --- Ejecucion ---
+
+    def _writer(self) -> BulkWriter:
+        if self.mode == "replace":
+            return ReplaceWriter(self.target, self.batch_size, self.dry_run, self.ordered, name=self.name)
+        writer_class = {"update": BulkWriter, "insert": InsertWriter}[self.mode]
+        return writer_class(self.target, self.batch_size, self.dry_run, self.ordered)
+
+    def _cursor(self, query: dict, projection: Optional[dict], last_key: Any) -> Iterable[dict]:
+        if self.sort_key is not None and last_key is not None:
+            query = {"$and": [query, {self.sort_key: {"$gt": last_key}}]} if query else {self.sort_key: {"$gt": last_key}}
+        cursor = self.collection.find(query, projection).batch_size(self.batch_size)
+        if self.sort_key is not None:
+            cursor = cursor.sort(self.sort_key, 1)
+        elif self.sort:
+            cursor = cursor.sort(self.sort).allow_disk_use(True)
+        return cursor
+
+    def _report(self, stats: MigrationStats, started: float):
+        stats.elapsed = time.perf_counter() - started
+        self.log(
+            f"  ⏱️ {self.name}: {stats.scanned} leídos, {stats.changed} con cambios, "
+            f"{stats.written} escritos, {stats.errors} errores ({stats.throughput:.0f} docs/s)"
+        )
+
+    def run(
+            self,
+            transform: Callable[[dict], Any],
+            query: Optional[dict] = None,
+            projection: Optional[dict] = None
+    ) -> MigrationStats:
+        def transform_batch(docs: list[dict]) -> list:
+            changes = (transform(doc) for doc in docs)
+            return [change for change in changes if change is not None and change != []]
+
+        return self.run_batches(transform_batch, query, projection)
+
+    def run_batches(
+            self,
+            transform_batch: Callable[[list[dict]], list],
+            query: Optional[dict] = None,
+            projection: Optional[dict] = None
+    ) -> MigrationStats:
+        """
+        Como `run`, pero `transform_batch` recibe los documentos de cada lote (`batch_size`)
+        y devuelve un cambio por documento modificado: permite transformaciones vectorizadas.
+        """
+        stats = MigrationStats(name=self.name)
+        last_key = None
+        previous = self.checkpoint() if self.resume else None
+        if previous and previous.get("status") == "running":
+            last_key = previous.get("last_key") if self.sort_key == previous.get("sort_key") else None
+            stats.resumed_from = last_key
+            # Los contadores siguen desde la ejecucion interrumpida
+            for field in ("scanned", "changed", "written", "errors"):
+                setattr(stats, field, previous.get(field, 0))
+            stats.resumed_scanned = stats.scanned
+            self.log(f"  ↪️ {self.name}: se reanuda desde {self.sort_key}={last_key} ({stats.scanned} ya leídos)")
+        elif not self.dry_run:
+            self.reset()
+
+        writer = self._writer()
+        if isinstance(writer, ReplaceWriter) and not self.dry_run:
+            recovered = writer.recover()
+            if recovered:
+                self.log(f"  🩹 {self.name}: completado un lote interrumpido ({recovered} documentos)")
+        base_written, base_errors = stats.written, stats.errors
+        started = time.perf_counter()
+        last_report = started
+        key = last_key
+        docs: list[dict] = []
+
+        def process():
+            nonlocal docs
+            changes = transform_batch(docs) if docs else []
+            docs = []
+            stats.changed += len(changes)
+            for change in changes:
+                writer.add(change)
+            writer.flush()
+            stats.written, stats.errors = base_written + writer.written, base_errors + writer.errors
+
+        try:
+            for doc in self._cursor(query or {}, projection, last_key):
+                stats.scanned += 1
+                docs.append(doc)
+                if len(docs) == self.batch_size:
+                    if self.sort_key is not None:
+                        key = doc.get(self.sort_key)
+                    process()
+                    self._save_checkpoint(stats, key, "running")
+                    if time.perf_counter() - last_report >= self.progress_every:
+                        self._report(stats, started)
+                        last_report = time.perf_counter()
+            if docs and self.sort_key is not None:
+                key = docs[-1].get(self.sort_key)
+            process()
+        finally:
+            stats.written, stats.errors = base_written + writer.written, base_errors + writer.errors
+            stats.batches = writer.batches
+            stats.elapsed = time.perf_counter() - started
+        self._save_checkpoint(stats, key, "done")
+        self._report(stats, started)
+        return stats
+
+
+# --- Migraciones particionadas ---
+
+@dataclass(frozen=True)
+class Partition:
+    key: str  # Estable entre ejecuciones: forma parte del nombre del checkpoint
+    query: dict
+
+
+@dataclass
+class PartitionResult:
+    partition: str
+    stats: Optional[dict] = None
+    error: Optional[str] = None
+    elapsed: float = 0.0
+    skipped: bool = False
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+@dataclass
+class PartitionedMigrationResult:
+    name: str
+    results: list[PartitionResult] = field(default_factory=list)
+    elapsed: float = 0.0
+
+    @property
+    def failed(self) -> list[PartitionResult]:
+        return [result for result in self.results if not result.ok]
+
+    def total(self, counter: str) -> int:
+        return sum((result.stats or {}).get(counter, 0) for result in self.results)
+
+    @property
+    def throughput(self) -> float:
+        processed = sum(
+            (result.stats or {}).get("scanned", 0) - (result.stats or {}).get("resumed_scanned", 0)
+            for result in self.results
+        )
+        return processed / self.elapsed if self.elapsed else 0.0
+
+
+def user_range_partitions(db, collection: str, n: int, field_name: str = "user_id", query: Optional[dict] = None) -> list[Partition]:
+    """
+    Divide los valores de `field_name` en hasta `n` rangos contiguos con un numero parecido de
+    documentos (`$bucketAuto` en el servidor; todos los documentos de un valor caen en el mismo
+    rango). Cada particion es un `$gte`/`$lt` que usa el indice, sin listas de valores que
+    crezcan con el numero de usuarios. Los limites dependen de los datos: para reanudar,
+    `run_partitioned_migration` reutiliza los guardados en el checkpoint.
+    """
+    buckets = list(db[collection].aggregate(
+        [{"$match": query or {}}, {"$bucketAuto": {"groupBy": f"${field_name}", "buckets": n}}], allowDiskUse=True
+    ))
+    partitions = []
+    for i, bucket in enumerate(buckets):
+        lo, hi = bucket["_id"]["min"], bucket["_id"]["max"]
+        # El `max` de cada rango es el `min` del siguiente, salvo en el ultimo, que lo incluye
+        bounds = {"$gte": lo, "$lte": hi} if i == len(buckets) - 1 else {"$gte": lo, "$lt": hi}
+        partitions.append(Partition(f"{field_name}-range-{i + 1}of{len(buckets)}", {**(query or {}), field_name: bounds}))
+    return partitions
+
+
+TimeUnit = Literal["day", "week", "month", "year"]
+
+
+def _unit_start(value: datetime, unit: TimeUnit) -> datetime:
+    day = value.replace(hour=0, minute=0, second=0, microsecond=0)
+    if unit == "week":
+        return day - timedelta(days=day.weekday())
+    if unit == "month":
+        return day.replace(day=1)
+    if unit == "year":
+        return day.replace(month=1, day=1)
+    return day
+
+
+def _next_unit(start: datetime, unit: TimeUnit) -> datetime:
+    if unit == "day":
+        return start + timedelta(days=1)
+    if unit == "week":
+        return start + timedelta(weeks=1)
+    if unit == "month":
+        return start.replace(year=start.year + start.month // 12, month=start.month % 12 + 1)
+    return start.replace(year=start.year + 1)
+
+
+def time_partitions(db, collection: str, unit: TimeUnit = "month", field_name: str = "timestamp", query: Optional[dict] = None) -> list[Partition]:
+    """
+    Un tramo `[inicio, inicio + unit)` por cada dia, semana (desde el lunes), mes o ano de
+    calendario entre el minimo y el maximo de `field_name`. Los limites no dependen de los
+    datos: la particion `timestamp-2024-03` es siempre marzo de 2024, aunque entre una
+    ejecucion cortada y su reanudacion cambien el minimo o el maximo.
+    """
+    base = {**(query or {}), field_name: {"$type": "date"}}
+    first = db[collection].find_one(base, {field_name: 1}, sort=[(field_name, 1)])
+    last = db[collection].find_one(base, {field_name: 1}, sort=[(field_name, -1)])
+    if first is None:
+        return []
+    key_format = {"day": "%Y-%m-%d", "week": "%Y-%m-%d", "month": "%Y-%m", "year": "%Y"}[unit]
+    partitions = []
+    start = _unit_start(first[field_name], unit)
+    while start <= last[field_name]:
+        end = _next_unit(start, unit)
+        partitions.append(Partition(
+            f"{field_name}-{start.strftime(key_format)}", {**(query or {}), field_name: {"$gte": start, "$lt": end}}
+        ))
+        start = end
+    return partitions
+
+
+_worker_dbs: dict = {}
+_worker_dbs_lock = threading.Lock()
+
+
+def worker_db(db_factory: Callable):
+    """
+    Una conexion por factoria y proceso (los hilos del pool la comparten). La clave incluye
+    el pid: un MongoClient heredado por fork no se puede reutilizar en el hijo.
+    """
+    key = (db_factory, os.getpid())
+    with _worker_dbs_lock:
+        if key not in _worker_dbs:
+            _worker_dbs[key] = db_factory()
+        return _worker_dbs[key]
+
+
+def _run_partition(work: Callable[[Partition], Any], partition: Partition) -> PartitionResult:
+    """Ejecuta una particion sin dejar escapar excepciones: el resto sigue."""
+    started = time.perf_counter()
+    try:
+        stats = work(partition)
+        if isinstance(stats, MigrationStats):
+            stats = stats.to_dict()
+        return PartitionResult(partition.key, stats=stats, elapsed=time.perf_counter() - started)
+    except Exception:
+        return PartitionResult(partition.key, error=traceback.format_exc(), elapsed=time.perf_counter() - started)
+
+
+def _executor(kind: ExecutorKind, workers: int) -> Executor:
+    return ProcessPoolExecutor(max_workers=workers) if kind == "process" else ThreadPoolExecutor(max_workers=workers)
+
+
+def run_partitions(
+        work: Callable[[Partition], Any],
+        partitions: list[Partition],
+        workers: int = 4,
+        executor: ExecutorKind = "thread",
+        log: Callable[[str], None] = print
+) -> list[PartitionResult]:
+    """
+    Ejecuta `work(particion)` en paralelo. Con `executor="process"` la funcion (y lo que
+    capture) debe poder serializarse con pickle: funciones de nivel de modulo o `partial`.
+    """
+    results = []
+    with _executor(executor, workers) as pool:
+        futures = {pool.submit(_run_partition, work, partition): partition for partition in partitions}
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            status = "✅" if result.ok else "❌"
+            log(f"  {status} {result.partition} ({len(results)}/{len(partitions)}) en {result.elapsed:.1f}s")
+            if not result.ok:
+                log(result.error.rstrip().splitlines()[-1])
+    return results
+
+
+def _migrate_partition(
+        db_factory: Callable,
+        name: str,
+        collection: str,
+        transform: Callable[[dict], Any],
+        runner_kwargs: dict,
+        partition: Partition
+) -> MigrationStats:
+    runner_kwargs = dict(runner_kwargs)
+    projection = runner_kwargs.pop("projection", None)
+    runner = MigrationRunner(
+        worker_db(db_factory), f"{name}.{partition.key}", collection,
+        parent=name, **{"progress_every": float("inf"), **runner_kwargs}
+    )
+    return runner.run(transform, partition.query, projection)
+
+
+def _report_progress(db, name: str, total: int, started: float, stop: threading.Event, every: float, log):
+    while not stop.wait(every):
+        checkpoints = list(db[MIGRATIONS_COLLECTION].find({"parent": name}, {"scanned": 1, "written": 1, "errors": 1, "status": 1}))
+        scanned = sum(c.get("scanned", 0) for c in checkpoints)
+        done = sum(1 for c in checkpoints if c.get("status") == "done")
+        elapsed = time.perf_counter() - started
+        log(
+            f"  ⏱️ {name}: {done}/{total} particiones, {scanned} leídos, "
+            f"{sum(c.get('written', 0) for c in checkpoints)} escritos, "
+            f"{sum(c.get('errors', 0) for c in checkpoints)} errores ({scanned / elapsed:.0f} docs/s acumulado)"
+        )
+
+
+def run_partitioned_migration(
+        db_factory: Callable,
+        name: str,
+        collection: str,
+        transform: Callable[[dict], Any],
+        partitions: list[Partition],
+        *,
+        workers: int = 4,
+        executor: ExecutorKind = "thread",
+        restart: bool = False,
+        progress_every: float = 10.0,
+        log: Callable[[str], None] = print,
+        **runner_kwargs
+) -> PartitionedMigrationResult:
+    """
+    Ejecuta `transform` sobre cada particion con un `MigrationRunner` propio.
+    `db_factory` (p. ej. `get_db`) crea la conexion en cada proceso del pool. `runner_kwargs`
+    se pasan al runner (`mode`, `batch_size`, `dry_run`, `sort_key`, `projection`...).
+    Si la ejecucion anterior no termino bien se saltan las particiones ya terminadas y las
+    demas se reanudan con las consultas guardadas entonces (no con `partitions`, cuyos limites
+    pueden haber cambiado con los datos).
+    """
+    db = worker_db(db_factory)
+    dry_run = runner_kwargs.get("dry_run", True)
+    checkpoints = db[MIGRATIONS_COLLECTION]
+    previous = checkpoints.find_one({"_id": name})
+    outcome = PartitionedMigrationResult(name)
+
+    done: set[str] = set()
+    if previous and previous.get("status") in ("running", "failed") and not restart:
+        prefix = f"{name}."
+        done = {
+            c["_id"][len(prefix):] for c in checkpoints.find({"parent": name, "status": "done"}, {"_id": 1})
+        }
+        saved = previous.get("partition_queries")
+        if saved:
+            partitions = [Partition(item["key"], item["query"]) for item in saved]
+        log(f"  ↪️ {name}: se reanuda, {len(done)} particiones ya terminadas")
+    elif not dry_run:
+        checkpoints.delete_many({"parent": name})
+
+    if not dry_run:
+        checkpoints.update_one(
+            {"_id": name},
+            {"$set": {
+                "status": "running", "collection": collection, "partitions": [p.key for p in partitions],
+                "partition_queries": [{"key": p.key, "query": p.query} for p in partitions],
+                "workers": workers, "executor": executor, "updated_at": _utcnow(),
+            }},
+            upsert=True
+        )
+
+    pending = [partition for partition in partitions if partition.key not in done]
+    outcome.results += [PartitionResult(key, skipped=True) for key in sorted(done)]
+    log(f"  🚀 {name}: {len(pending)} particiones, {workers} workers ({executor})")
+
+    started = time.perf_counter()
+    stop = threading.Event()
+    reporter = None
+    if not dry_run:
+        reporter = threading.Thread(
+            target=_report_progress, args=(db, name, len(partitions), started, stop, progress_every, log), daemon=True
+        )
+        reporter.start()
+    try:
+        work = partial(_migrate_partition, db_factory, name, collection, transform, runner_kwargs)
+        outcome.results += run_partitions(work, pending, workers, executor, log)
+    finally:
+        stop.set()
+        if reporter is not None:
+            reporter.join()
+    outcome.elapsed = time.perf_counter() - started
+
+    if not dry_run:
+        checkpoints.update_one(
+            {"_id": name},
+            {"$set": {
+                "status": "failed" if outcome.failed else "done",
+                "failed_partitions": [result.partition for result in outcome.failed],
+                "updated_at": _utcnow(),
+            }}
+        )
+    return outcome
+
+
+# --- Reescritura de colecciones completas ---
+
+def collection_options(db, name: str) -> Optional[dict]:
+    """Opciones de creacion de la coleccion (`timeseries`, `expireAfterSeconds`...); None si no existe."""
+    for info in db.list_collections(filter={"name": name}):
+        return dict(info.get("options") or {})
+    return None
+
+
+def _create_options(options: dict) -> dict:
+    options = dict(options)
+    timeseries = options.get("timeseries")
+    if timeseries and timeseries.get("granularity"):
+        # listCollections devuelve los valores derivados de la granularidad, que create no admite junto a ella
+        options["timeseries"] = {
+            k: v for k, v in timeseries.items() if k not in ("bucketMaxSpanSeconds", "bucketRoundingSeconds")
+        }
+    return options
+
+
+def copy_indexes(source: Collection, target: Collection) -> list[str]:
+    """Crea en `target` los indices de `source` (salvo `_id_`), con sus nombres y opciones."""
+    models = []
+    for index in source.list_indexes():
+        if index["name"] == "_id_":
+            continue
+        options = {k: v for k, v in index.items() if k not in ("v", "key", "ns")}
+        models.append(IndexModel(list(index["key"].items()), **options))
+    return target.create_indexes(models) if models else []
+
+
+def _timeseries_order(options: dict) -> list[tuple[str, int]]:
+    timeseries = options.get("timeseries")
+    if not timeseries:
+        return [("_id", 1)]
+    order = [(timeseries["timeField"], 1)]
+    if timeseries.get("metaField"):
+        order.insert(0, (timeseries["metaField"], 1))
+    return order
+
+
+def _last_id(collection: Collection):
+    last = collection.find_one({}, {"_id": 1}, sort=[("_id", -1)])
+    return last["_id"] if last else None
+
+
+def _copy_delta(db, source: str, target: str, transform, after, *, log, max_rounds: int = 5):
+    """
+    Copia los documentos de `source` con `_id` mayor que `after` (los insertados durante la
+    copia anterior), por rondas hasta que no llegan mas. Devuelve (ultimo `_id`, copiados).
+    """
+    copied = 0
+    for _ in range(max_rounds):
+        high = _last_id(db[source])
+        if high is None or (after is not None and high <= after):
+            return after, copied
+        query = {"_id": {"$gt": after, "$lte": high}} if after is not None else {"_id": {"$lte": high}}
+        stats = copy_collection(db, source, target, transform, query=query, verify=False, log=log)
+        copied += stats.changed
+        after = high
+    raise RuntimeError(f"'{source}' sigue recibiendo escrituras tras {max_rounds} rondas de copia; detenga la aplicación")
+
+
+def rewrite_collection(
+        db,
+        collection: str,
+        transform: Callable[[dict], dict],
+        *,
+        batch_size: int = 1000,
+        dry_run: bool = True,
+        backup_name: Optional[str] = None,
+        force_backup: bool = False,
+        writes_frozen: bool = False,
+        log: Callable[[str], None] = print
+) -> CopyStats:
+    """
+    Reescribe `collection` con `transform(doc)` (que devuelve el documento completo, cambiado
+    o no) en una coleccion nueva y la intercambia con la original, que se conserva como
+    `backup_name` (por defecto `<coleccion>_backup_rewrite`).
+
+    1. Se crea `<coleccion>_rewrite` con las mismas opciones (time-series incluida).
+    2. Se copian los documentos transformados con `_id` hasta el ultimo existente al empezar,
+       ordenados por `metaField`/`timeField` con `insert_many` ordenados
+       (`collection_copy.copy_collection`), que verifica el resultado.
+    3. Se copian por rondas los insertados mientras tanto (`_id` mayor que el ultimo copiado) y
+       se crean los mismos indices.
+    4. Se comprueba que el numero de documentos de la original coincide con lo leido (si no,
+       alguien borra o escribe con `_id` antiguos y se aborta sin tocarla), se renombra la
+       original a `backup_name` y la nueva a `collection`, y se copia lo que haya llegado a la
+       original entre la ultima ronda y el renombrado.
+
+    MongoDB no permite renombrar colecciones time-series: para ellas el paso 4 copia la
+    original a `backup_name`, la borra, la recrea y copia en ella la nueva (como en
+    `scripts/remove_timeseries.py`). Entre el borrado y el final de la copia la coleccion no
+    existe o esta a medias y lo que se escriba en ella se pierde, asi que se exige
+    `writes_frozen=True`: la aplicacion debe estar parada o con las escrituras en cola
+    (`BIONEXO_WRITE_BEHIND=spill`) hasta que termine. La comprobacion del paso 4 detecta si no
+    lo esta.
+
+    Hasta el paso 4 la original solo se lee: si algo falla antes basta con relanzar. Si falla
+    durante el paso 4 de una time-series, los datos estan en `backup_name` y en la nueva.
+    En dry-run solo se recorre la coleccion aplicando `transform`.
+    """
+    options = collection_options(db, collection)
+    if options is None:
+        raise RuntimeError(f"La colección '{collection}' no existe")
+    staging = f"{collection}_rewrite"
+    backup_name = backup_name or f"{collection}_backup_rewrite"
+    order = _timeseries_order(options)
+    timeseries = bool(options.get("timeseries"))
+
+    if dry_run:
+        return copy_collection(db, collection, staging, transform, batch_size=batch_size, sort=order, dry_run=True, log=log)
+    if timeseries and not writes_frozen:
+        raise RuntimeError(
+            f"'{collection}' es time-series y no se puede renombrar: la reescritura la borra y la recrea. "
+            "Detenga las escrituras de la aplicación y relance con writes_frozen"
+        )
+
+    existing = db.list_collection_names()
+    if backup_name in existing:
+        if not force_backup:
+            raise RuntimeError(f"El backup '{backup_name}' ya existe. Use force_backup para sobrescribirlo.")
+        log(f"  🗑️ Eliminando backup anterior '{backup_name}'")
+        db.drop_collection(backup_name)
+    if staging in existing:
+        # Restos de una reescritura interrumpida
+        db.drop_collection(staging)
+
+    create_options = _create_options(options)
+    db.create_collection(staging, **create_options)
+    high = _last_id(db[collection])
+    if high is None:
+        raise RuntimeError(f"La colección '{collection}' está vacía")
+    log(f"  📝 Copiando '{collection}' a '{staging}' ordenado por {', '.join(field for field, _ in order)}...")
+    stats = copy_collection(
+        db, collection, staging, transform, query={"_id": {"$lte": high}},
+        batch_size=batch_size, sort=order, ordered=True, log=log
+    )
+    high, delta = _copy_delta(db, collection, staging, transform, high, log=log)
+    if delta:
+        log(f"  ➕ {delta} documentos escritos durante la copia")
+    created = copy_indexes(db[collection], db[staging])
+    log(f"  🔑 Índices creados en '{staging}': {', '.join(created) or 'ninguno'}")
+
+    read = stats.scanned + delta
+    current = db[collection].count_documents({})
+    if current != read:
+        raise RuntimeError(
+            f"'{collection}' tiene {current} documentos y se leyeron {read}: hay escrituras o borrados "
+            f"con _id antiguos. Detenga la aplicación y relance (la original no se ha modificado)"
+        )
+
+    if timeseries:
+        log(f"  ↪️ '{collection}' es time-series y no se puede renombrar; se recrea a partir de '{staging}'")
+        copy_collection(db, collection, backup_name, log=log)
+        db.drop_collection(collection)
+        db.create_collection(collection, **create_options)
+        copy_collection(db, staging, collection, sort=order, ordered=True, log=log)
+        copy_indexes(db[staging], db[collection])
+        db.drop_collection(staging)
+        return stats
+
+    db[collection].rename(backup_name)
+    try:
+        db[staging].rename(collection)
+    except OperationFailure:
+        db[backup_name].rename(collection)
+        raise
+    _, late = _copy_delta(db, backup_name, collection, transform, high, log=log)
+    if late:
+        log(f"  ➕ {late} documentos escritos durante el intercambio")
+    log(f"  🔁 '{staging}' es ahora '{collection}'; la original queda en '{backup_name}'")
+    return stats
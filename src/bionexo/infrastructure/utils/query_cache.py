@@ -0,0 +1,101 @@
+"""
+Cache de lecturas por usuario con TTL e invalidacion por version.
+
+Cada usuario tiene un contador de version por ambito ("intakes", "wellness"). Las funciones
+decoradas con `user_cached` incluyen en la clave las versiones de sus ambitos, asi que cuando
+una escritura llama a `invalidate_user` las entradas antiguas dejan de ser alcanzables y
+expiran solas (TTL o LRU). Las lecturas repetidas dentro del TTL no tocan la base de datos.
+
+El registro de versiones es del proceso: las escrituras hechas desde otro proceso solo se
+ven al caducar el TTL.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from functools import wraps
+from typing import Any, Callable, Hashable, Optional
+
+QUERY_CACHE_TTL_SECONDS = float(os.getenv("BIONEXO_QUERY_CACHE_TTL", "300"))
+QUERY_CACHE_MAX_ENTRIES = int(os.getenv("BIONEXO_QUERY_CACHE_MAX_ENTRIES", "2048"))
+
+_versions: dict[tuple[str, str], int] = defaultdict(int)
+_versions_lock = threading.Lock()
+
+
+def data_version(user_id: str, scope: str) -> int:
+    return _versions[(user_id, scope)]
+
+
+def invalidate_user(user_id: str, *scopes: str):
+    """Incrementa la version de los ambitos del usuario (llamar tras cada escritura)."""
+    with _versions_lock:
+        for scope in scopes:
+            _versions[(user_id, scope)] += 1
+
+
+class TTLCache:
+    """Cache LRU con caducidad por entrada, segura entre hilos (sesiones de Streamlit)."""
+
+    def __init__(self, max_entries: int = QUERY_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> tuple[bool, Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return False, None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return True, entry[1]
+
+    def set(self, key: Hashable, value: Any, ttl: float):
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+query_cache = TTLCache()
+
+
+def user_cached(*scopes: str, ttl: float = QUERY_CACHE_TTL_SECONDS, cache: Optional[TTLCache] = None) -> Callable:
+    """
+    Decorador para lecturas con firma `fn(db, user_id, *args, **kwargs)`.
+    El resto de argumentos deben ser hashables. El resultado se comparte entre llamadas:
+    no debe modificarse. La funcion original queda en `.uncached`.
+    """
+    target = cache or query_cache
+
+    def decorator(fn: Callable) -> Callable:
+        @wraps(fn)
+        def wrapper(db, user_id: str, *args, **kwargs):
+            versions = tuple(data_version(user_id, scope) for scope in scopes)
+            key = (fn.__module__, fn.__qualname__, user_id, versions, args, tuple(sorted(kwargs.items())))
+            hit, value = target.get(key)
+            if hit:
+                return value
+            value = fn(db, user_id, *args, **kwargs)
+            target.set(key, value, ttl)
+            return value
+
+        wrapper.uncached = fn
+        return wrapper
+
+    return decorator
@@ -0,0 +1,475 @@
+"""
+Cola de escritura diferida (write-behind) con group commit para ingestas y reportes
+(opcional, `BIONEXO_WRITE_BEHIND=1`).
+
+`save_intake` / `save_wellness_report` preparan el documento y lo dejan en la cola; un hilo de
+fondo lo escribe junto con los demas: espera como mucho `max_delay` segundos o `max_batch`
+documentos y hace un `insert_many` por coleccion, seguido de un `bulk_write` por coleccion
+derivada (`daily_rollups`, `user_meals`).
+
+Confirmacion (`BIONEXO_WRITE_BEHIND_ACK`):
+
+- "spill" (por defecto): la llamada vuelve tras guardar el documento en el fichero SQLite
+  (modo WAL) `spill_path`. Si Mongo no esta disponible se reintenta desde el fichero, tambien
+  tras reiniciar el proceso (los pendientes de un proceso muerto los recoge el siguiente).
+- "memory": la llamada vuelve al encolar. Si Mongo falla el lote pasa al fichero, pero un
+  cierre brusco del proceso pierde lo que quedara en la cola.
+- "mongo": la llamada espera a que su lote este en Mongo y devuelve si se escribio; solo
+  agrupa operaciones, sin fichero.
+
+Los reintentos no duplican: el `_id` se asigna al encolar y antes de reinsertar se descartan
+los documentos que ya estan en la coleccion. Si fallan las actualizaciones derivadas despues
+de insertar, se avisa: los resumenes se pueden recalcular con `rebuild_daily_rollups` y
+`rebuild_user_meals`.
+
+Los documentos que Mongo rechaza (validacion, documento invalido...) no se reintentan: en los
+modos "spill" y "memory" pasan a la tabla `dead_letter` del fichero con el error, para
+revisarlos o reinsertarlos a mano; en "mongo" quien espera recibe False.
+
+La cache del usuario se invalida al escribir el lote, asi que una lectura inmediatamente
+posterior puede no ver la escritura durante unos milisegundos.
+"""
+
+import atexit
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Literal, Optional
+
+import bson
+from bson import ObjectId
+from pymongo.errors import BulkWriteError, ConnectionFailure, PyMongoError
+
+from bionexo.infrastructure.utils.query_cache import invalidate_user
+
+WRITE_BEHIND_ENABLED = os.getenv("BIONEXO_WRITE_BEHIND", "0") == "1"
+WRITE_BEHIND_ACK = os.getenv("BIONEXO_WRITE_BEHIND_ACK", "spill")
+WRITE_BEHIND_MAX_BATCH = int(os.getenv("BIONEXO_WRITE_BEHIND_MAX_BATCH", "500"))
+WRITE_BEHIND_MAX_DELAY_MS = float(os.getenv("BIONEXO_WRITE_BEHIND_MAX_DELAY_MS", "5"))
+WRITE_BEHIND_MAX_QUEUE = int(os.getenv("BIONEXO_WRITE_BEHIND_MAX_QUEUE", "50000"))
+WRITE_BEHIND_SPILL = Path(os.getenv("BIONEXO_WRITE_BEHIND_SPILL", "write_behind.sqlite"))
+
+RETRY_MIN_SECONDS = 1.0
+RETRY_MAX_SECONDS = 60.0
+
+AckMode = Literal["spill", "memory", "mongo"]
+DerivedWrites = Callable[[list[dict], str], dict[str, list]]
+
+
+@dataclass
+class CollectionHandler:
+    """Escrituras derivadas de un lote insertado y ambito de cache a invalidar."""
+    derived_writes: DerivedWrites
+    cache_scope: str
+
+
+@dataclass
+class _Item:
+    collection: str
+    doc: dict
+    tz: str
+    spill_id: Optional[int] = None
+    future: Optional[Future] = None
+    error: Optional[str] = None  # Motivo del rechazo
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class SpillFile:
+    """Diario SQLite (WAL) de documentos pendientes de escribir en Mongo. Seguro entre hilos."""
+
+    def __init__(self, path: Path = WRITE_BEHIND_SPILL):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.owner = os.getpid()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # NORMAL en WAL: sobrevive a la caida del proceso sin un fsync por escritura
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS pending ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, owner INTEGER NOT NULL, "
+            "collection TEXT NOT NULL, tz TEXT NOT NULL, doc BLOB NOT NULL)"
+        )
+        # Rechazados por Mongo: `doc` en BSON, o su repr si no se pudo codificar
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS dead_letter ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, collection TEXT NOT NULL, tz TEXT NOT NULL, "
+            "doc BLOB NOT NULL, error TEXT, failed_at TEXT NOT NULL)"
+        )
+        self._lock = threading.Lock()
+
+    def add(self, items: list[_Item]):
+        """Guarda los documentos y asigna `spill_id` a cada elemento."""
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                for item in items:
+                    cursor = self._conn.execute(
+                        "INSERT INTO pending (owner, collection, tz, doc) VALUES (?, ?, ?, ?)",
+                        (self.owner, item.collection, item.tz, bson.encode(item.doc))
+                    )
+                    item.spill_id = cursor.lastrowid
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def remove(self, spill_ids: list[int]):
+        with self._lock:
+            for start in range(0, len(spill_ids), 500):
+                chunk = spill_ids[start:start + 500]
+                self._conn.execute(f"DELETE FROM pending WHERE id IN ({','.join('?' * len(chunk))})", chunk)
+
+    def dead_letter(self, items: list[_Item]):
+        """Pasa los documentos rechazados (con su `error`) de pendientes a `dead_letter`."""
+        if not items:
+            return
+        failed_at = datetime.now().isoformat()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                for item in items:
+                    try:
+                        doc = bson.encode(item.doc)
+                    except Exception:
+                        doc = repr(item.doc).encode()
+                    self._conn.execute(
+                        "INSERT INTO dead_letter (collection, tz, doc, error, failed_at) VALUES (?, ?, ?, ?, ?)",
+                        (item.collection, item.tz, doc, item.error, failed_at)
+                    )
+                    if item.spill_id is not None:
+                        self._conn.execute("DELETE FROM pending WHERE id = ?", (item.spill_id,))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def dead_letter_count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM dead_letter").fetchone()[0]
+
+    def claim_orphans(self) -> int:
+        """Adopta los pendientes de procesos que ya no existen."""
+        with self._lock:
+            owners = [row[0] for row in self._conn.execute("SELECT DISTINCT owner FROM pending WHERE owner != ?", (self.owner,))]
+            dead = [owner for owner in owners if not _process_alive(owner)]
+            for owner in dead:
+                self._conn.execute("UPDATE pending SET owner = ? WHERE owner = ?", (self.owner, owner))
+            return len(dead)
+
+    def load(self, limit: int, exclude: set[int]) -> list[_Item]:
+        """Pendientes de este proceso en orden de llegada, sin los que ya estan en la cola."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, collection, tz, doc FROM pending WHERE owner = ? ORDER BY id LIMIT ?",
+                (self.owner, limit + len(exclude))
+            ).fetchall()
+        return [
+            _Item(collection, bson.decode(doc), tz, spill_id)
+            for spill_id, collection, tz, doc in rows if spill_id not in exclude
+        ][:limit]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM pending WHERE owner = ?", (self.owner,)).fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class WriteBehindQueue:
+    def __init__(
+            self,
+            db,
+            handlers: dict[str, CollectionHandler],
+            ack: AckMode = WRITE_BEHIND_ACK,
+            max_batch: int = WRITE_BEHIND_MAX_BATCH,
+            max_delay_ms: float = WRITE_BEHIND_MAX_DELAY_MS,
+            max_queue: int = WRITE_BEHIND_MAX_QUEUE,
+            spill_path: Path = WRITE_BEHIND_SPILL,
+            ack_timeout: float = 30.0
+    ):
+        if ack not in ("spill", "memory", "mongo"):
+            raise ValueError(f"Confirmación desconocida: {ack}")
+        self.db = db
+        self.handlers = handlers
+        self.ack = ack
+        self.max_batch = max_batch
+        self.max_delay = max_delay_ms / 1000
+        self.ack_timeout = ack_timeout
+        # La cola llena bloquea a quien escribe (contrapresion) en vez de crecer sin limite
+        self._queue: queue.Queue[Optional[_Item]] = queue.Queue(maxsize=max_queue)
+        self.spill = SpillFile(spill_path) if ack != "mongo" else None
+        self.flushed = 0
+        self.batches = 0
+        self._queued_spill_ids: set[int] = set()
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._pending = 0
+        self._retry_at: Optional[float] = None
+        self._backoff = RETRY_MIN_SECONDS
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        if self.spill is not None and (self.spill.claim_orphans() or len(self.spill)):
+            self._retry_at = time.monotonic()
+
+    # --- Escritura ---
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+            self._thread.start()
+
+    def submit(self, collection: str, doc: dict, tz: str = "Europe/Madrid") -> bool:
+        """Encola un documento preparado; devuelve si queda confirmado segun `ack`."""
+        if collection not in self.handlers:
+            raise ValueError(f"Colección sin escritura diferida: {collection}")
+        doc.setdefault("_id", ObjectId())
+        item = _Item(collection, doc, tz)
+        if self.ack == "spill":
+            try:
+                self.spill.add([item])
+            except sqlite3.Error as e:
+                print(f"Error guardando en el fichero de escritura diferida: {e}")
+                return False
+        elif self.ack == "mongo":
+            item.future = Future()
+        with self._lock:
+            self._pending += 1
+            if item.spill_id is not None:
+                self._queued_spill_ids.add(item.spill_id)
+        self.start()
+        self._queue.put(item)
+        if item.future is None:
+            return True
+        try:
+            return item.future.result(timeout=self.ack_timeout)
+        except FutureTimeoutError:
+            return False
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Espera a que la cola se vacie (los fallos quedan en el fichero). False si vence `timeout`."""
+        with self._idle:
+            return self._idle.wait_for(lambda: self._pending == 0, timeout)
+
+    def close(self, timeout: float = 10.0):
+        """Escribe lo encolado y para el hilo."""
+        if self._thread is not None and self._thread.is_alive():
+            self._stopped.set()
+            self._queue.put(None)
+            self._thread.join(timeout)
+        if self.spill is not None:
+            self.spill.close()
+
+    def _done(self, items: list[_Item], queued: bool):
+        with self._idle:
+            if queued:
+                self._pending -= len(items)
+            for item in items:
+                self._queued_spill_ids.discard(item.spill_id)
+            self._idle.notify_all()
+
+    # --- Hilo de fondo ---
+
+    def _run(self):
+        while not (self._stopped.is_set() and self._queue.empty()):
+            try:
+                items = self._collect()
+                if items:
+                    self._flush(items, retry=False)
+                if self._retry_at is not None and time.monotonic() >= self._retry_at:
+                    self._replay()
+            except Exception as e:
+                # El hilo no puede morir: la cola se quedaria sin consumir y `flush` sin volver
+                print(f"Error inesperado en la escritura diferida, reintento en {self._backoff:g}s: {e}")
+                self._retry_at = time.monotonic() + self._backoff
+                self._backoff = min(self._backoff * 2, RETRY_MAX_SECONDS)
+
+    def _collect(self) -> list[_Item]:
+        timeout = None if self._retry_at is None else max(0.0, self._retry_at - time.monotonic())
+        try:
+            first = self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return []
+        if first is None:
+            return []
+        items = [first]
+        deadline = time.monotonic() + self.max_delay
+        while len(items) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                break
+            items.append(item)
+        return items
+
+    def _replay(self):
+        with self._lock:
+            exclude = set(self._queued_spill_ids)
+        items = self.spill.load(self.max_batch, exclude) if self.spill is not None else []
+        if not items:
+            self._retry_at = None
+            self._backoff = RETRY_MIN_SECONDS
+            return
+        if self._flush(items, retry=True):
+            self._backoff = RETRY_MIN_SECONDS
+            self._retry_at = time.monotonic()  # Sigue con el resto del fichero
+
+    def _flush(self, items: list[_Item], retry: bool) -> bool:
+        groups: dict[tuple[str, str], list[_Item]] = {}
+        for item in items:
+            groups.setdefault((item.collection, item.tz), []).append(item)
+        ok = True
+        try:
+            for (collection, tz), group in groups.items():
+                try:
+                    ok &= self._write(collection, tz, group, retry)
+                except Exception as e:
+                    # Fallo antes de insertar que no es de Mongo (p. ej. un documento que no se
+                    # puede codificar en BSON): el grupo se rechaza en vez de parar el hilo
+                    print(f"Error inesperado en la escritura diferida de '{collection}': {e}")
+                    for item in group:
+                        item.error = item.error or str(e)
+                    self._reject(group)
+                    ok = False
+        finally:
+            # Los reintentos salen del fichero, no de la cola
+            self._done(items, queued=not retry)
+        return ok
+
+    def _write(self, collection: str, tz: str, items: list[_Item], retry: bool) -> bool:
+        target = self.db[collection]
+        written = []
+        try:
+            if retry:
+                pending = self._not_written(target, items)
+                pending_ids = {id(item) for item in pending}
+                written = [item for item in items if id(item) not in pending_ids]
+                items = pending
+            inserted, failed = self._insert(target, items)
+        except ConnectionFailure as e:
+            self._failed(items, e)
+            return False
+        except PyMongoError as e:
+            # Error no recuperable del lote entero: se rechaza como haria `save_intake`
+            print(f"Error en la escritura diferida de '{collection}': {e}")
+            for item in items:
+                item.error = str(e)
+            inserted, failed = [], items
+
+        for item in inserted:
+            if item.future is not None:
+                item.future.set_result(True)
+        if self.spill is not None:
+            self.spill.remove([item.spill_id for item in written + inserted if item.spill_id is not None])
+        self._reject(failed)
+        self.flushed += len(inserted)
+        self.batches += 1
+
+        docs = [item.doc for item in inserted]
+        handler = self.handlers[collection]
+        try:
+            for name, operations in handler.derived_writes(docs, tz).items():
+                if operations:
+                    self.db[name].bulk_write(operations, ordered=False)
+        except Exception as e:
+            print(f"Error actualizando los resúmenes de '{collection}' (recalcular con rebuild_*): {e}")
+        for user_id in {doc["user_id"] for doc in docs}:
+            invalidate_user(user_id, handler.cache_scope)
+        return True
+
+    @staticmethod
+    def _insert(target, items: list[_Item]) -> tuple[list[_Item], list[_Item]]:
+        if not items:
+            return [], []
+        try:
+            target.insert_many([item.doc for item in items], ordered=False)
+            return items, []
+        except BulkWriteError as e:
+            rejected = set()
+            for error in e.details.get("writeErrors", []):
+                # Clave duplicada: ya estaba escrito (reintento tras un fallo a medias)
+                if error.get("code") != 11000:
+                    rejected.add(error["index"])
+                    items[error["index"]].error = error.get("errmsg")
+                    print(f"Documento rechazado en la escritura diferida: {error.get('errmsg')}")
+            return [item for i, item in enumerate(items) if i not in rejected], \
+                [item for i, item in enumerate(items) if i in rejected]
+
+    @staticmethod
+    def _not_written(target, items: list[_Item]) -> list[_Item]:
+        """Descarta los que ya estan en la coleccion (las time-series no tienen `_id` unico)."""
+        docs = [item.doc for item in items]
+        query = {"_id": {"$in": [doc["_id"] for doc in docs]}}
+        if all("user_id" in doc and "timestamp" in doc for doc in docs):
+            # Acota los buckets de la time-series por usuario y tiempo
+            query["user_id"] = {"$in": list({doc["user_id"] for doc in docs})}
+            query["timestamp"] = {"$gte": min(doc["timestamp"] for doc in docs), "$lte": max(doc["timestamp"] for doc in docs)}
+        existing = {doc["_id"] for doc in target.find(query, {"_id": 1})}
+        return [item for item in items if item.doc["_id"] not in existing]
+
+    def _reject(self, items: list[_Item]):
+        """Documentos que Mongo no acepta: False a quien espera y al `dead_letter` del fichero."""
+        for item in items:
+            if item.future is not None and not item.future.done():
+                item.future.set_result(False)
+        if self.spill is None or not items:
+            return
+        try:
+            self.spill.dead_letter(items)
+        except sqlite3.Error as e:
+            print(f"No se pudieron apartar {len(items)} documentos rechazados en el fichero ({e})")
+
+    def _failed(self, items: list[_Item], error: Exception):
+        """Mongo no disponible: al fichero (o False a quien espera) y reintento con espera creciente."""
+        waiting = [item for item in items if item.future is not None]
+        for item in waiting:
+            item.future.set_result(False)
+        to_spill = [item for item in items if item.future is None and item.spill_id is None]
+        if to_spill:
+            try:
+                self.spill.add(to_spill)
+            except sqlite3.Error as e:
+                print(f"Se pierden {len(to_spill)} documentos: no se pudieron guardar en el fichero ({e})")
+        if self.spill is not None and len(waiting) < len(items):
+            print(f"Mongo no disponible ({error}); {len(items) - len(waiting)} documentos pendientes, reintento en {self._backoff:g}s")
+            self._retry_at = time.monotonic() + self._backoff
+            self._backoff = min(self._backoff * 2, RETRY_MAX_SECONDS)
+
+
+_write_behind: Optional[WriteBehindQueue] = None
+_write_behind_lock = threading.Lock()
+
+
+def get_write_behind_queue(db, handlers: dict[str, CollectionHandler]) -> Optional[WriteBehindQueue]:
+    """Cola compartida del proceso, o None si no esta activada."""
+    global _write_behind
+    if not WRITE_BEHIND_ENABLED:
+        return None
+    if _write_behind is None:
+        with _write_behind_lock:
+            if _write_behind is None:
+                _write_behind = WriteBehindQueue(db, handlers)
+                _write_behind.start()
+                atexit.register(_write_behind.close)
+    return _write_behind
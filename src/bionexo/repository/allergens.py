@@ -0,0 +1,132 @@
+"""
+Mascaras de bits de alergenos (`data/allergens.json`).
+
+Cada alergeno de la taxonomia (los 14 de declaracion obligatoria en la UE, con los codigos
+de OFF) ocupa un bit. Los terminos libres en español o ingles ("cacahuetes", "lácteos") y
+los tags de OFF ("en:milk") se traducen a su bit, de forma que:
+
+- cada alimento guarda en `allergen_mask` la union de `allergens` y `allergens_tags`,
+- las alergias del usuario (`PersonalIntakesRecommendations.allergies`) son otra mascara,
+- un alimento es seguro si `food_mask & user_mask == 0`: un AND en memoria o
+  `$bitsAllClear` en MongoDB.
+
+Los terminos que no estan en la taxonomia no tienen bit y no se pueden filtrar: `split` y
+`user_allergies` los devuelven aparte para avisar al usuario.
+"""
+
+import json
+import os
+from functools import lru_cache
+from pathlib import Path
+from typing import Iterable, Optional
+
+from bionexo.repository.food_search import normalize_text
+
+ALLERGENS_PATH = Path(os.getenv(
+    "BIONEXO_ALLERGENS_PATH",
+    Path(__file__).parents[3] / "data" / "allergens.json"
+))
+
+ALLERGEN_MASK_FIELD = "allergen_mask"
+
+
+class AllergenTaxonomy:
+    """Terminos normalizados -> bit."""
+
+    def __init__(self, allergens: list[dict]):
+        self.codes: tuple[str, ...] = tuple(entry["code"] for entry in allergens)
+        self.bits: dict[str, int] = {code: 1 << i for i, code in enumerate(self.codes)}
+        self.by_tag: dict[str, int] = {}
+        self.by_term: dict[str, int] = {}
+        for entry in allergens:
+            bit = self.bits[entry["code"]]
+            for tag in entry.get("off_tags", []):
+                self.by_tag[tag.lower()] = bit
+            for term in [entry["code"], *entry.get("synonyms", [])]:
+                self.by_term[normalize_text(term)] = bit
+
+    def bit(self, term: str) -> int:
+        """Bit de un termino libre o tag de OFF; 0 si no se reconoce."""
+        raw = term.strip().lower()
+        if raw in self.by_tag:
+            return self.by_tag[raw]
+        # "es:frutos-secos" -> "frutos secos"
+        if len(raw) > 3 and raw[2] == ":":
+            raw = raw[3:]
+        normalized = normalize_text(raw)
+        bit = self.by_term.get(normalized)
+        if bit is not None:
+            return bit
+        # Frases como "alergia al cacahuete": se prueban las palabras y pares de palabras
+        words = normalized.split()
+        mask = 0
+        for i, word in enumerate(words):
+            mask |= self.by_term.get(word, 0)
+            if i + 1 < len(words):
+                mask |= self.by_term.get(f"{word} {words[i + 1]}", 0)
+        return mask
+
+    def mask(self, terms: Optional[Iterable[str]]) -> int:
+        return self.split(terms)[0]
+
+    def split(self, terms: Optional[Iterable[str]]) -> tuple[int, list[str]]:
+        """Mascara de los terminos y los que no tienen bit (no se pueden filtrar)."""
+        mask, unmapped = 0, []
+        for term in terms or ():
+            if isinstance(term, str):
+                bit = self.bit(term)
+                if bit:
+                    mask |= bit
+                elif term.strip():
+                    unmapped.append(term)
+        return mask, unmapped
+
+    def codes_of(self, mask: int) -> list[str]:
+        return [code for code, bit in self.bits.items() if mask & bit]
+
+
+def load_allergen_taxonomy(json_path: Path = ALLERGENS_PATH) -> AllergenTaxonomy:
+    with open(json_path, encoding="utf-8") as f:
+        return AllergenTaxonomy(json.load(f).get("allergens", []))
+
+
+@lru_cache(maxsize=1)
+def get_allergen_taxonomy() -> AllergenTaxonomy:
+    """Taxonomia compartida del proceso."""
+    return load_allergen_taxonomy()
+
+
+def allergen_mask(terms: Optional[Iterable[str]]) -> int:
+    """Mascara de una lista de alergenos o alergias (terminos libres o tags de OFF)."""
+    return get_allergen_taxonomy().mask(terms)
+
+
+def food_allergen_mask(doc: dict) -> int:
+    """Mascara de un documento de `foods` (o producto de OFF): `allergens` + `allergens_tags`."""
+    return allergen_mask([*(doc.get("allergens") or []), *(doc.get("allergens_tags") or [])])
+
+
+def user_allergies(user: dict) -> tuple[int, list[str]]:
+    """Mascara de las alergias de un documento de `users` y las alergias sin bit."""
+    recommendations = user.get("personal_intakes_recommendations") or {}
+    return get_allergen_taxonomy().split(recommendations.get("allergies"))
+
+
+def user_allergen_mask(user: dict) -> int:
+    """Mascara de las alergias de un documento de `users`."""
+    return user_allergies(user)[0]
+
+
+def is_safe(food_mask: int, user_mask: int) -> bool:
+    return not food_mask & user_mask
+
+
+def safe_foods_query(user_mask: int) -> dict:
+    """
+    Filtro de MongoDB que excluye los alimentos con algun alergeno del usuario.
+    Los alimentos sin `allergen_mask` (anteriores a la mascara) no pasan el filtro:
+    ver `scripts/backfill_allergen_masks.py`.
+    """
+    if not user_mask:
+        return {}
+    return {ALLERGEN_MASK_FIELD: {"$bitsAllClear": user_mask}}
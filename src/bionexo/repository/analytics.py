@@ -0,0 +1,115 @@
+"""
+Estadisticas agregadas en MongoDB para el Historial (ingestas y bienestar).
+
+Las pipelines filtran primero por `user_id` (metaField) y `timestamp` (timeField), de modo
+que sobre las colecciones time-series el `$match` se resuelve a nivel de bucket y solo se
+desempaquetan los buckets del usuario y del rango. Solo salen del servidor los agregados.
+"""
+
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Optional
+
+# Limites de los buckets de kcal por ingesta para el histograma
+KCAL_BUCKET_BOUNDARIES = [0, 100, 250, 500, 750, 1000, 1500]
+
+WELLNESS_AVG_METRICS = ("stress_level", "anxiety_level", "energy_level", "sleep_quality", "pain_intensity")
+
+
+@dataclass
+class IntakeStats:
+    total_intakes: int = 0
+    intakes_with_kcal: int = 0
+    total_kcal: float = 0.0
+    avg_kcal: Optional[float] = None  # Media por ingesta con kcal
+    kcal_buckets: list[dict] = field(default_factory=list)  # [{"min": 0, "count": n, "kcal": x}, ...]
+    by_meal_type: dict[str, dict] = field(default_factory=dict)  # {tipo: {"count", "kcal"}}
+
+
+@dataclass
+class WellnessStats:
+    total_reports: int = 0
+    averages: dict[str, Optional[float]] = field(default_factory=dict)  # {metrica: media} (ignora nulos)
+
+
+def _range_match(user_id: str, start: Optional[datetime], end: Optional[datetime]) -> dict:
+    match = {"user_id": user_id}
+    if start or end:
+        match["timestamp"] = {}
+        if start:
+            match["timestamp"]["$gte"] = start
+        if end:
+            match["timestamp"]["$lt"] = end
+    return match
+
+
+def intake_stats_pipeline(user_id: str, start: Optional[datetime] = None, end: Optional[datetime] = None) -> list[dict]:
+    return [
+        {"$match": _range_match(user_id, start, end)},
+        {"$project": {"kcal": 1, "meal_type": 1}},
+        {"$facet": {
+            "totals": [
+                {"$group": {
+                    "_id": None,
+                    "total_intakes": {"$sum": 1},
+                    "intakes_with_kcal": {"$sum": {"$cond": [{"$ne": [{"$ifNull": ["$kcal", None]}, None]}, 1, 0]}},
+                    "total_kcal": {"$sum": {"$ifNull": ["$kcal", 0]}},
+                    "avg_kcal": {"$avg": "$kcal"},
+                }},
+            ],
+            "kcal_buckets": [
+                {"$match": {"kcal": {"$type": "number"}}},
+                {"$bucket": {
+                    "groupBy": "$kcal",
+                    "boundaries": KCAL_BUCKET_BOUNDARIES,
+                    "default": "other",
+                    "output": {"count": {"$sum": 1}, "kcal": {"$sum": "$kcal"}},
+                }},
+            ],
+            "by_meal_type": [
+                {"$group": {
+                    "_id": "$meal_type",
+                    "count": {"$sum": 1},
+                    "kcal": {"$sum": {"$ifNull": ["$kcal", 0]}},
+                }},
+            ],
+        }},
+    ]
+
+
+def wellness_stats_pipeline(user_id: str, start: Optional[datetime] = None, end: Optional[datetime] = None) -> list[dict]:
+    group = {"_id": None, "total_reports": {"$sum": 1}}
+    for metric in WELLNESS_AVG_METRICS:
+        group[metric] = {"$avg": f"${metric}"}
+    return [
+        {"$match": _range_match(user_id, start, end)},
+        {"$project": {metric: 1 for metric in WELLNESS_AVG_METRICS}},
+        {"$group": group},
+    ]
+
+
+def get_intake_stats(db, user_id: str, start: Optional[datetime] = None, end: Optional[datetime] = None) -> IntakeStats:
+    """Estadisticas de ingestas entre `start` (incluido) y `end` (excluido), en UTC naive."""
+    result = next(db["intakes"].aggregate(intake_stats_pipeline(user_id, start, end)), None)
+    if not result or not result["totals"]:
+        return IntakeStats()
+    totals = result["totals"][0]
+    return IntakeStats(
+        total_intakes=totals["total_intakes"],
+        intakes_with_kcal=totals["intakes_with_kcal"],
+        total_kcal=totals["total_kcal"],
+        avg_kcal=totals["avg_kcal"],
+        kcal_buckets=[{"min": b["_id"], "count": b["count"], "kcal": b["kcal"]} for b in result["kcal_buckets"]],
+        by_meal_type={b["_id"] or "-": {"count": b["count"], "kcal": b["kcal"]} for b in result["by_meal_type"]},
+    )
+
+
+def get_wellness_stats(db, user_id: str, start: Optional[datetime] = None, end: Optional[datetime] = None) -> WellnessStats:
+    """Medias de las escalas de bienestar entre `start` (incluido) y `end` (excluido), en UTC naive."""
+    result = next(db["wellness_logs"].aggregate(wellness_stats_pipeline(user_id, start, end)), None)
+    if not result:
+        return WellnessStats(averages={metric: None for metric in WELLNESS_AVG_METRICS})
+    return WellnessStats(
+        total_reports=result["total_reports"],
+        averages={metric: result.get(metric) for metric in WELLNESS_AVG_METRICS},
+    )
@@ -1,6 +1,10 @@
+from typing import Optional
+
 from pydantic import BaseModel
 
 from bionexo.application.definitions import Environment
 
 class RepositoryConfig(BaseModel):
-    environment: Environment
\ No newline at end of file
+    environment: Environment
+    # Campos crudos de OFF a conservar en cada producto (None = OFF_DEFAULT_RAW_FIELDS)
+    off_raw_fields: Optional[list[str]] = None
\ No newline at end of file
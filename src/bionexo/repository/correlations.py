@@ -0,0 +1,277 @@
+"""
+Motor de correlacion entre ingestas y reportes de bienestar.
+
+Cada reporte de bienestar se relaciona con las comidas de las horas anteriores en ventanas
+de retardo (0-6h, 6-12h, 12-24h, 24-48h). Los timestamps se alinean a una rejilla horaria y la
+exposicion de cada reporte a cada alimento/ingrediente sale de una suma acumulada sobre las
+ingestas ordenadas (`searchsorted` + diferencia de `cumsum`), sin bucles por reporte.
+
+Por (ventana, sintoma, alimento) se guardan estadisticos suficientes (n, suma, suma de cuadrados
+de los reportes expuestos y totales), que son aditivos: al llegar reportes nuevos solo se procesan
+esos y se suman. El estado se guarda por usuario en `correlation_stats`, con los arreglos por feature
+en BSON Binary float32 y como maximo `CORRELATION_MAX_FEATURES` features (las que lleguen despues se
+ignoran hasta recalcular) para no acercarse al limite de 16 MB por documento. Si aparecen datos con
+fechas anteriores a la marca de agua (ingestas o reportes atrasados) se recalcula desde cero.
+"""
+
+import os
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+from bson import Binary
+
+from bionexo.infrastructure.utils.query_cache import invalidate_user
+
+CORRELATION_STATS_COLLECTION = "correlation_stats"
+_STATE_VERSION = 2
+_STATE_DTYPE = np.dtype("<f4")  # 240 bytes por feature con 4 ventanas, 5 sintomas y 3 arreglos
+
+# Tope de features por usuario: ~2,4 MB de arreglos con el valor por defecto
+CORRELATION_MAX_FEATURES = int(os.getenv("BIONEXO_CORRELATION_MAX_FEATURES", "10000"))
+
+# Ventanas de retardo en horas (desde, hasta] antes del reporte
+LAG_WINDOWS: tuple[tuple[int, int], ...] = ((0, 6), (6, 12), (12, 24), (24, 48))
+MAX_LAG_HOURS = max(hi for _, hi in LAG_WINDOWS)
+
+# Campos de WellnessReport analizados (los booleanos se tratan como 0/1)
+SYMPTOM_METRICS = ("digestive_comfort_scale", "nausea", "pain_intensity", "energy_level", "fatigue")
+
+
+def _normalize(name: str) -> str:
+    return " ".join(name.strip().lower().split())
+
+
+@dataclass
+class CorrelationState:
+    """Estadisticos suficientes acumulados de un usuario."""
+    features: list[str] = field(default_factory=list)  # "food:<nombre>" o "ingredient:<nombre>"
+    n1: np.ndarray = None  # (ventanas, features, sintomas) reportes expuestos con valor
+    s1: np.ndarray = None  # suma del sintoma en reportes expuestos
+    q1: np.ndarray = None  # suma de cuadrados en reportes expuestos
+    n: np.ndarray = None  # (sintomas,) reportes con valor
+    s: np.ndarray = None
+    q: np.ndarray = None
+    reports_watermark: Optional[datetime] = None  # Timestamp del ultimo reporte procesado
+    reports_count: int = 0  # Reportes con timestamp <= marca de agua
+    intakes_count: int = 0  # Ingestas con timestamp <= marca de agua
+
+    def __post_init__(self):
+        n_windows, n_symptoms = len(LAG_WINDOWS), len(SYMPTOM_METRICS)
+        for name in ("n1", "s1", "q1"):
+            if getattr(self, name) is None:
+                setattr(self, name, np.zeros((n_windows, len(self.features), n_symptoms)))
+        for name in ("n", "s", "q"):
+            if getattr(self, name) is None:
+                setattr(self, name, np.zeros(n_symptoms))
+
+    def extend_features(self, features: list[str]) -> np.ndarray:
+        """
+        Añade features nuevas (con estadisticos a 0) y devuelve la posicion de cada una;
+        -1 para las que no caben por `CORRELATION_MAX_FEATURES`.
+        """
+        position = {f: i for i, f in enumerate(self.features)}
+        new = [f for f in dict.fromkeys(features) if f not in position]
+        new = new[:max(CORRELATION_MAX_FEATURES - len(self.features), 0)]
+        if new:
+            for f in new:
+                position[f] = len(self.features)
+                self.features.append(f)
+            pad = ((0, 0), (0, len(new)), (0, 0))
+            self.n1, self.s1, self.q1 = (np.pad(a, pad) for a in (self.n1, self.s1, self.q1))
+        return np.array([position.get(f, -1) for f in features], dtype=np.int64)
+
+    def to_document(self, user_id: str) -> dict:
+        return {
+            "user_id": user_id,
+            "version": _STATE_VERSION,
+            "windows": [list(w) for w in LAG_WINDOWS],
+            "symptoms": list(SYMPTOM_METRICS),
+            "features": self.features,
+            **{k: Binary(np.ascontiguousarray(getattr(self, k), dtype=_STATE_DTYPE).tobytes())
+               for k in ("n1", "s1", "q1")},
+            "n": self.n.tolist(), "s": self.s.tolist(), "q": self.q.tolist(),
+            "reports_watermark": self.reports_watermark,
+            "reports_count": self.reports_count,
+            "intakes_count": self.intakes_count,
+            "updated_at": datetime.now(),
+        }
+
+    @classmethod
+    def from_document(cls, doc: dict) -> Optional["CorrelationState"]:
+        if (doc.get("version") != _STATE_VERSION
+                or doc.get("windows") != [list(w) for w in LAG_WINDOWS]
+                or doc.get("symptoms") != list(SYMPTOM_METRICS)):
+            return None
+        n_windows, n_symptoms = len(LAG_WINDOWS), len(SYMPTOM_METRICS)
+        shape = (n_windows, len(doc["features"]), n_symptoms)
+        return cls(
+            features=list(doc["features"]),
+            **{k: np.frombuffer(doc[k], dtype=_STATE_DTYPE).astype(np.float64).reshape(shape)
+               for k in ("n1", "s1", "q1")},
+            **{k: np.asarray(doc[k], dtype=np.float64) for k in ("n", "s", "q")},
+            reports_watermark=doc.get("reports_watermark"),
+            reports_count=doc.get("reports_count", 0),
+            intakes_count=doc.get("intakes_count", 0),
+        )
+
+
+def _hour_grid(timestamps) -> np.ndarray:
+    """Timestamps alineados a la hora, en horas desde epoch (int64)."""
+    return pd.to_datetime(pd.Series(timestamps)).dt.floor("h").to_numpy("datetime64[h]").astype(np.int64)
+
+
+def intake_exposures(intakes: pd.DataFrame, report_hours: np.ndarray, state: CorrelationState) -> np.ndarray:
+    """
+    Exposicion binaria (ventanas, reportes, features) de cada reporte a cada alimento/ingrediente.
+    `intakes` necesita las columnas `timestamp`, `food_name` e `ingredients`.
+    """
+    n_windows = len(LAG_WINDOWS)
+    if intakes.empty or len(report_hours) == 0:
+        return np.zeros((n_windows, len(report_hours), len(state.features)), dtype=bool)
+
+    intakes = intakes.assign(hour=_hour_grid(intakes["timestamp"])).sort_values("hour", kind="stable")
+    hours = intakes["hour"].to_numpy()
+
+    # Pares (fila de ingesta, feature) en formato largo
+    rows, features = [], []
+    for i, (food_name, ingredients) in enumerate(zip(intakes["food_name"], intakes["ingredients"])):
+        if isinstance(food_name, str) and food_name.strip():
+            rows.append(i)
+            features.append(f"food:{_normalize(food_name)}")
+        for ingredient in set(_normalize(x) for x in (ingredients if isinstance(ingredients, list) else []) if x):
+            rows.append(i)
+            features.append(f"ingredient:{ingredient}")
+    columns = state.extend_features(features)
+    kept = columns >= 0
+
+    one_hot = np.zeros((len(intakes) + 1, len(state.features)), dtype=np.int32)
+    np.add.at(one_hot, (np.asarray(rows, dtype=np.int64)[kept] + 1, columns[kept]), 1)
+    cumulative = np.cumsum(one_hot, axis=0)
+
+    exposures = np.empty((n_windows, len(report_hours), len(state.features)), dtype=bool)
+    for w, (lo, hi) in enumerate(LAG_WINDOWS):
+        # Ingestas con hora en (reporte - hi, reporte - lo]
+        start = np.searchsorted(hours, report_hours - hi, side="right")
+        end = np.searchsorted(hours, report_hours - lo, side="right")
+        exposures[w] = (cumulative[end] - cumulative[start]) > 0
+    return exposures
+
+
+def symptom_matrix(reports: pd.DataFrame) -> tuple[np.ndarray, np.ndarray]:
+    """Valores (reportes, sintomas) con NaN->0 y mascara de valores presentes."""
+    values = np.full((len(reports), len(SYMPTOM_METRICS)), np.nan)
+    for j, metric in enumerate(SYMPTOM_METRICS):
+        if metric in reports:
+            values[:, j] = pd.to_numeric(reports[metric], errors="coerce").to_numpy(dtype=np.float64)
+    mask = ~np.isnan(values)
+    return np.where(mask, values, 0.0), mask.astype(np.float64)
+
+
+def accumulate(state: CorrelationState, intakes: pd.DataFrame, reports: pd.DataFrame):
+    """Suma a `state` los estadisticos de `reports` frente a las ingestas previas."""
+    if reports.empty:
+        return
+    exposures = intake_exposures(intakes, _hour_grid(reports["timestamp"]), state)
+    values, mask = symptom_matrix(reports)
+    squares = values ** 2
+    for w in range(len(LAG_WINDOWS)):
+        x = exposures[w].astype(np.float64)
+        state.n1[w] += x.T @ mask
+        state.s1[w] += x.T @ values
+        state.q1[w] += x.T @ squares
+    state.n += mask.sum(axis=0)
+    state.s += values.sum(axis=0)
+    state.q += squares.sum(axis=0)
+
+
+def correlation_table(state: CorrelationState, min_exposed: int = 3) -> pd.DataFrame:
+    """
+    Asociaciones por (feature, ventana, sintoma): medias con y sin exposicion, diferencia y
+    correlacion punto-biserial `r`. Ordenado por |r| descendente.
+    """
+    columns = ["feature", "kind", "window", "symptom", "n_exposed", "n_unexposed",
+               "mean_exposed", "mean_unexposed", "diff", "r"]
+    if not state.features or not state.n.any():
+        return pd.DataFrame(columns=columns)
+
+    n, s, q = state.n[None, None, :], state.s[None, None, :], state.q[None, None, :]
+    n1, s1 = state.n1, state.s1
+    n0 = n - n1
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean1 = s1 / n1
+        mean0 = (s - s1) / n0
+        std = np.sqrt(np.maximum(q / n - (s / n) ** 2, 0))
+        r = (mean1 - mean0) * np.sqrt(n1 * n0) / (n * std)
+
+    w_idx, f_idx, s_idx = np.nonzero((n1 >= min_exposed) & (n0 > 0) & (std > 0))
+    features = np.asarray(state.features, dtype=object)[f_idx]
+    table = pd.DataFrame({
+        "feature": [f.split(":", 1)[1] for f in features],
+        "kind": [f.split(":", 1)[0] for f in features],
+        "window": [f"{LAG_WINDOWS[w][0]}-{LAG_WINDOWS[w][1]}h" for w in w_idx],
+        "symptom": np.asarray(SYMPTOM_METRICS, dtype=object)[s_idx],
+        "n_exposed": n1[w_idx, f_idx, s_idx].astype(int),
+        "n_unexposed": n0[w_idx, f_idx, s_idx].astype(int),
+        "mean_exposed": mean1[w_idx, f_idx, s_idx],
+        "mean_unexposed": mean0[w_idx, f_idx, s_idx],
+        "diff": (mean1 - mean0)[w_idx, f_idx, s_idx],
+        "r": r[w_idx, f_idx, s_idx],
+    }, columns=columns)
+    return table.reindex(table["r"].abs().sort_values(ascending=False).index).reset_index(drop=True)
+
+
+def _load_frame(collection, query: dict, fields: list[str]) -> pd.DataFrame:
+    docs = list(collection.find(query, {f: 1 for f in fields} | {"_id": 0}).sort("timestamp", 1))
+    return pd.DataFrame(docs, columns=fields)
+
+
+def update_correlations(db, user_id: str, rebuild: bool = False) -> CorrelationState:
+    """
+    Actualiza (o calcula desde cero) los estadisticos del usuario y los guarda en `correlation_stats`.
+    Solo se leen los reportes posteriores a la marca de agua y las ingestas de las 48h previas a ellos.
+    Tras `rebuild` invalida el ambito "correlations" del usuario para no servir la tabla anterior.
+    """
+    intakes_col, reports_col = db["intakes"], db["wellness_logs"]
+    state = None
+    if not rebuild:
+        doc = db[CORRELATION_STATS_COLLECTION].find_one({"user_id": user_id})
+        state = CorrelationState.from_document(doc) if doc else None
+    if state is not None and state.reports_watermark is not None:
+        # Datos insertados con fecha anterior a la marca de agua invalidan lo acumulado
+        before = {"user_id": user_id, "timestamp": {"$lte": state.reports_watermark}}
+        if (intakes_col.count_documents(before) != state.intakes_count
+                or reports_col.count_documents(before) != state.reports_count):
+            state = None
+    if state is None:
+        state = CorrelationState()
+
+    report_query = {"user_id": user_id}
+    if state.reports_watermark is not None:
+        report_query["timestamp"] = {"$gt": state.reports_watermark}
+    reports = _load_frame(reports_col, report_query, ["timestamp", *SYMPTOM_METRICS])
+
+    if not reports.empty:
+        first = pd.Timestamp(reports["timestamp"].min()).to_pydatetime() - timedelta(hours=MAX_LAG_HOURS + 1)
+        last = pd.Timestamp(reports["timestamp"].max()).to_pydatetime()
+        intakes = _load_frame(
+            intakes_col,
+            {"user_id": user_id, "timestamp": {"$gte": first, "$lte": last}},
+            ["timestamp", "food_name", "ingredients"]
+        )
+        accumulate(state, intakes, reports)
+        state.reports_watermark = last
+        before = {"user_id": user_id, "timestamp": {"$lte": last}}
+        state.reports_count = reports_col.count_documents(before)
+        state.intakes_count = intakes_col.count_documents(before)
+
+    db[CORRELATION_STATS_COLLECTION].replace_one({"user_id": user_id}, state.to_document(user_id), upsert=True)
+    if rebuild:
+        invalidate_user(user_id, "correlations")
+    return state
+
+
+def get_correlations(db, user_id: str, min_exposed: int = 3, rebuild: bool = False) -> pd.DataFrame:
+    return correlation_table(update_correlations(db, user_id, rebuild=rebuild), min_exposed=min_exposed)
@@ -0,0 +1,255 @@
+"""
+Resumenes diarios pre-agregados (`daily_rollups`), uno por (user_id, local_date).
+
+`save_intake` y `save_wellness_report` actualizan el documento del dia con `$inc`
+(sumas y contadores) y `$min`/`$max` (primer/ultimo registro y maximos), asi que los
+paneles leen unas pocas decenas de documentos pequeños en lugar de recorrer las
+colecciones time-series. `rebuild_daily_rollups` los recalcula desde cero en el servidor.
+
+Forma del documento:
+    {
+        "user_id", "local_date": "YYYY-MM-DD", "tz",
+        "intakes": {"count", "kcal_total", "kcal_count", "quantity_g_total", "meal_types": {<tipo>: n},
+                    "first_at", "last_at"},
+        "wellness": {"count", "first_at", "last_at",
+                     "<metrica>": {"sum", "count", "max"}, ...}
+    }
+"""
+
+from datetime import date, datetime
+from typing import Optional
+
+from pymongo import ASCENDING
+
+from bionexo.infrastructure.utils.functions import utc_to_local
+
+DAILY_ROLLUPS_COLLECTION = "daily_rollups"
+
+# Escalas 1-10 de WellnessReport que se resumen por dia
+WELLNESS_METRICS = (
+    "stress_level",
+    "anxiety_level",
+    "energy_level",
+    "sleep_quality",
+    "mood_intensity",
+    "pain_intensity",
+    "digestive_comfort_scale",
+    "appetite_scale",
+)
+
+
+def local_date(timestamp: datetime, tz: str = "Europe/Madrid") -> str:
+    """Fecha local "YYYY-MM-DD" de un timestamp guardado en UTC naive."""
+    return utc_to_local(timestamp, tz).strftime("%Y-%m-%d")
+
+
+def _meal_type_key(meal_type: Optional[str]) -> str:
+    # Las claves de un subdocumento no admiten "." ni empezar por "$"
+    return (meal_type or "sin_tipo").replace(".", "_").lstrip("$") or "sin_tipo"
+
+
+def _meal_type_key_expr() -> dict:
+    """`_meal_type_key` como expresion de agregacion, para que la reconstruccion use las mismas claves."""
+    return {"$let": {
+        "vars": {"key": {"$ltrim": {
+            "input": {"$replaceAll": {"input": {"$ifNull": ["$meal_type", ""]}, "find": ".", "replacement": "_"}},
+            "chars": {"$literal": "$"},
+        }}},
+        "in": {"$cond": [{"$eq": ["$$key", ""]}, "sin_tipo", "$$key"]},
+    }}
+
+
+def ensure_daily_rollups_index(db):
+    # Import diferido: indexes.py importa este modulo para declarar la coleccion
+    from bionexo.repository.indexes import ensure_indexes
+    ensure_indexes(db, DAILY_ROLLUPS_COLLECTION)
+
+
+def intake_rollup_update(intake_dict: dict, tz: str = "Europe/Madrid") -> dict:
+    """Actualizacion `$inc`/`$min`/`$max` del resumen diario para una ingesta."""
+    timestamp = intake_dict["timestamp"]
+    inc = {
+        "intakes.count": 1,
+        f"intakes.meal_types.{_meal_type_key(intake_dict.get('meal_type'))}": 1,
+    }
+    if intake_dict.get("kcal") is not None:
+        inc["intakes.kcal_total"] = intake_dict["kcal"]
+        inc["intakes.kcal_count"] = 1
+    if intake_dict.get("quantity"):
+        inc["intakes.quantity_g_total"] = intake_dict["quantity"]
+    return {
+        "$inc": inc,
+        "$min": {"intakes.first_at": timestamp},
+        "$max": {"intakes.last_at": timestamp},
+        "$setOnInsert": {"tz": tz},
+    }
+
+
+def wellness_rollup_update(report_dict: dict, tz: str = "Europe/Madrid") -> dict:
+    """Actualizacion `$inc`/`$min`/`$max` del resumen diario para un reporte de bienestar."""
+    timestamp = report_dict["timestamp"]
+    inc = {"wellness.count": 1}
+    max_ = {"wellness.last_at": timestamp}
+    for metric in WELLNESS_METRICS:
+        value = report_dict.get(metric)
+        if value is None:
+            continue
+        inc[f"wellness.{metric}.sum"] = value
+        inc[f"wellness.{metric}.count"] = 1
+        max_[f"wellness.{metric}.max"] = value
+    return {
+        "$inc": inc,
+        "$min": {"wellness.first_at": timestamp},
+        "$max": max_,
+        "$setOnInsert": {"tz": tz},
+    }
+
+
+def rollup_key(doc: dict, tz: str = "Europe/Madrid") -> dict:
+    """Filtro del resumen diario al que pertenece una ingesta o un reporte."""
+    return {"user_id": doc["user_id"], "local_date": local_date(doc["timestamp"], tz)}
+
+
+def apply_intake_to_rollup(db, intake_dict: dict, tz: str = "Europe/Madrid"):
+    db[DAILY_ROLLUPS_COLLECTION].update_one(
+        rollup_key(intake_dict, tz), intake_rollup_update(intake_dict, tz), upsert=True
+    )
+
+
+def apply_wellness_to_rollup(db, report_dict: dict, tz: str = "Europe/Madrid"):
+    db[DAILY_ROLLUPS_COLLECTION].update_one(
+        rollup_key(report_dict, tz), wellness_rollup_update(report_dict, tz), upsert=True
+    )
+
+
+def get_daily_rollups(
+        db,
+        user_id: str,
+        start_date: Optional[date | str] = None,
+        end_date: Optional[date | str] = None
+) -> list[dict]:
+    """Resumenes del usuario entre `start_date` y `end_date` (fechas locales, ambas incluidas)."""
+    query = {"user_id": user_id}
+    if start_date or end_date:
+        query["local_date"] = {}
+        if start_date:
+            query["local_date"]["$gte"] = str(start_date)
+        if end_date:
+            query["local_date"]["$lte"] = str(end_date)
+    return list(db[DAILY_ROLLUPS_COLLECTION].find(query, {"_id": 0}).sort("local_date", ASCENDING))
+
+
+def summarize_daily_rollups(rollups: list[dict]) -> dict:
+    """Totales y medias del periodo a partir de los resumenes diarios."""
+    kcal_total = sum(r.get("intakes", {}).get("kcal_total", 0) for r in rollups)
+    kcal_count = sum(r.get("intakes", {}).get("kcal_count", 0) for r in rollups)
+    summary = {
+        "days": len(rollups),
+        "intakes_count": sum(r.get("intakes", {}).get("count", 0) for r in rollups),
+        "kcal_total": kcal_total,
+        "kcal_avg_per_intake": kcal_total / kcal_count if kcal_count else None,
+        "wellness_count": sum(r.get("wellness", {}).get("count", 0) for r in rollups),
+    }
+    for metric in WELLNESS_METRICS:
+        total = sum(r.get("wellness", {}).get(metric, {}).get("sum", 0) for r in rollups)
+        count = sum(r.get("wellness", {}).get(metric, {}).get("count", 0) for r in rollups)
+        summary[f"{metric}_avg"] = total / count if count else None
+    return summary
+
+
+def _local_day(tz: str) -> dict:
+    return {"$dateToString": {"format": "%Y-%m-%d", "date": "$timestamp", "timezone": tz}}
+
+
+def intakes_rollup_pipeline(tz: str = "Europe/Madrid", user_id: Optional[str] = None) -> list[dict]:
+    """Pipeline que recalcula la parte `intakes` de los resumenes y la fusiona en `daily_rollups`."""
+    match = {"user_id": user_id} if user_id else {}
+    return [
+        {"$match": match},
+        {"$group": {
+            "_id": {"user_id": "$user_id", "local_date": _local_day(tz), "meal_type": _meal_type_key_expr()},
+            "count": {"$sum": 1},
+            "kcal_total": {"$sum": {"$ifNull": ["$kcal", 0]}},
+            "kcal_count": {"$sum": {"$cond": [{"$ne": [{"$ifNull": ["$kcal", None]}, None]}, 1, 0]}},
+            "quantity_g_total": {"$sum": {"$ifNull": ["$quantity", 0]}},
+            "first_at": {"$min": "$timestamp"},
+            "last_at": {"$max": "$timestamp"},
+        }},
+        {"$group": {
+            "_id": {"user_id": "$_id.user_id", "local_date": "$_id.local_date"},
+            "count": {"$sum": "$count"},
+            "kcal_total": {"$sum": "$kcal_total"},
+            "kcal_count": {"$sum": "$kcal_count"},
+            "quantity_g_total": {"$sum": "$quantity_g_total"},
+            "meal_types": {"$push": {"k": "$_id.meal_type", "v": "$count"}},
+            "first_at": {"$min": "$first_at"},
+            "last_at": {"$max": "$last_at"},
+        }},
+        {"$project": {
+            "_id": 0,
+            "user_id": "$_id.user_id",
+            "local_date": "$_id.local_date",
+            "tz": {"$literal": tz},
+            "intakes": {
+                "count": "$count",
+                "kcal_total": "$kcal_total",
+                "kcal_count": "$kcal_count",
+                "quantity_g_total": "$quantity_g_total",
+                "meal_types": {"$arrayToObject": "$meal_types"},
+                "first_at": "$first_at",
+                "last_at": "$last_at",
+            },
+        }},
+        {"$merge": {
+            "into": DAILY_ROLLUPS_COLLECTION,
+            "on": ["user_id", "local_date"],
+            "whenMatched": "merge",
+            "whenNotMatched": "insert",
+        }},
+    ]
+
+
+def wellness_rollup_pipeline(tz: str = "Europe/Madrid", user_id: Optional[str] = None) -> list[dict]:
+    """Pipeline que recalcula la parte `wellness` de los resumenes y la fusiona en `daily_rollups`."""
+    match = {"user_id": user_id} if user_id else {}
+    group = {
+        "_id": {"user_id": "$user_id", "local_date": _local_day(tz)},
+        "count": {"$sum": 1},
+        "first_at": {"$min": "$timestamp"},
+        "last_at": {"$max": "$timestamp"},
+    }
+    wellness = {"count": "$count", "first_at": "$first_at", "last_at": "$last_at"}
+    for metric in WELLNESS_METRICS:
+        group[f"{metric}_sum"] = {"$sum": {"$ifNull": [f"${metric}", 0]}}
+        group[f"{metric}_count"] = {"$sum": {"$cond": [{"$ne": [{"$ifNull": [f"${metric}", None]}, None]}, 1, 0]}}
+        group[f"{metric}_max"] = {"$max": f"${metric}"}
+        wellness[metric] = {"sum": f"${metric}_sum", "count": f"${metric}_count", "max": f"${metric}_max"}
+    return [
+        {"$match": match},
+        {"$group": group},
+        {"$project": {
+            "_id": 0,
+            "user_id": "$_id.user_id",
+            "local_date": "$_id.local_date",
+            "tz": {"$literal": tz},
+            "wellness": wellness,
+        }},
+        {"$merge": {
+            "into": DAILY_ROLLUPS_COLLECTION,
+            "on": ["user_id", "local_date"],
+            "whenMatched": "merge",
+            "whenNotMatched": "insert",
+        }},
+    ]
+
+
+def rebuild_daily_rollups(db, tz: str = "Europe/Madrid", user_id: Optional[str] = None) -> int:
+    """
+    Borra y recalcula los resumenes (de todos los usuarios o de `user_id`) en el servidor.
+    Todos los dias se calculan en la zona horaria `tz`.
+    """
+    ensure_daily_rollups_index(db)
+    db[DAILY_ROLLUPS_COLLECTION].delete_many({"user_id": user_id} if user_id else {})
+    db["intakes"].aggregate(intakes_rollup_pipeline(tz, user_id), allowDiskUse=True)
+    db["wellness_logs"].aggregate(wellness_rollup_pipeline(tz, user_id), allowDiskUse=True)
+    return db[DAILY_ROLLUPS_COLLECTION].count_documents({"user_id": user_id} if user_id else {})
@@ -0,0 +1,76 @@
+"""
+Cliente asincrono de MongoDB (PyMongo async) para los repositorios de `intakes.py`,
+`symptoms.py`, `users.py` y `foods.FoodRepository`.
+
+`AsyncMongoClient` queda ligado al bucle de eventos en el que se usa: cada proceso (cada
+worker de la API) crea el suyo dentro del bucle con `get_async_db()` y lo cierra con
+`close_async_db()` al apagarse. Un solo cliente por proceso atiende todas las peticiones
+concurrentes con su pool de conexiones, sin un hilo por peticion.
+"""
+
+import os
+from typing import Any, Dict, Optional
+
+from pymongo import AsyncMongoClient
+from pymongo.errors import BulkWriteError
+
+MONGODB_DATABASE = "bionexo"
+MONGODB_MAX_POOL_SIZE = int(os.getenv("BIONEXO_MONGO_MAX_POOL_SIZE", "100"))
+
+
+class MongoDBDriver:
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        config = config or {}
+        self.config = config
+        self.uri = config.get("uri") or os.getenv("MONGODB_URI")
+        self.database = config.get("database", MONGODB_DATABASE)
+        self.max_pool_size = config.get("max_pool_size", MONGODB_MAX_POOL_SIZE)
+        self._client: Optional[AsyncMongoClient] = None
+
+    @property
+    def client(self) -> AsyncMongoClient:
+        # Se crea al primer uso (dentro del bucle) y no en el import
+        if self._client is None:
+            self._client = AsyncMongoClient(self.uri, maxPoolSize=self.max_pool_size)
+        return self._client
+
+    @property
+    def db(self):
+        return self.client[self.database]
+
+    async def ping(self) -> bool:
+        await self.client.admin.command("ping")
+        return True
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+
+
+_driver = MongoDBDriver()
+
+
+def get_async_db():
+    """Base de datos asincrona del proceso."""
+    return _driver.db
+
+
+async def close_async_db():
+    await _driver.close()
+
+
+async def insert_many_unordered(collection, docs: list[dict]) -> tuple[list[dict], list[dict]]:
+    """
+    `insert_many` sin orden: un error no detiene el resto del lote. Devuelve los documentos
+    insertados y los errores (`index` en `docs` y mensaje).
+    """
+    if not docs:
+        return [], []
+    try:
+        await collection.insert_many(docs, ordered=False)
+        return docs, []
+    except BulkWriteError as e:
+        errors = [{"index": error["index"], "error": error.get("errmsg", "")} for error in e.details.get("writeErrors", [])]
+        failed = {error["index"] for error in errors}
+        return [doc for i, doc in enumerate(docs) if i not in failed], errors
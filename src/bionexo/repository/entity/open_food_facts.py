@@ -1,4 +1,6 @@
-from typing import Literal, Union, type
+import sys
+from dataclasses import dataclass, field
+from typing import Any, Literal, Optional, Union
 from pydantic import BaseModel, Field, field_validator
 
 from bionexo.domain.entity.nutrients import (
@@ -38,21 +40,21 @@ SearchTagsNamesType = Literal[
 ]
 
 class ProductSearchAdvanceParams(BaseModel):
-    additives_tags=None,
-    allergens_tags=None,
-    brands_tags=None,
-    categories_tags=None,
-    countries_tags_en=None,
-    emb_codes_tags=None,
-    labels_tags=None,
-    manufacturing_places_tags=None,
-    nutrition_grades_tags=None,
-    origins_tags=None,
-    packaging_tags_de=None,
-    purchase_places_tags=None,
-    states_tags=None,
-    stores_tags=None,
-    traces_tags=None,
+    additives_tags: Optional[str] = None
+    allergens_tags: Optional[str] = None
+    brands_tags: Optional[str] = None
+    categories_tags: Optional[str] = None
+    countries_tags_en: Optional[str] = None
+    emb_codes_tags: Optional[str] = None
+    labels_tags: Optional[str] = None
+    manufacturing_places_tags: Optional[str] = None
+    nutrition_grades_tags: Optional[str] = None
+    origins_tags: Optional[str] = None
+    packaging_tags_de: Optional[str] = None
+    purchase_places_tags: Optional[str] = None
+    states_tags: Optional[str] = None
+    stores_tags: Optional[str] = None
+    traces_tags: Optional[str] = None
     map_tags_language_code: dict[SearchTagsNamesType, dict[str, str]] = Field(..., description="Mapping of tag names to language codes for localization")
     map_nutrient_value: dict[str, tuple[bool, Literal["100g", "serving"], Literal['lt', 'gt', 'eq'], int | float]] = Field(..., description="Mapping of nutrient names to their filter values")
     sort_by: SearchSortByType = Field(..., description="The allowed values used to sort/order the search results. Default popularity (for food) or last modification date")
@@ -169,4 +171,111 @@ class NutrientMap(BaseModel):
         "methylsulfonylmethane": MineralCompound.MSM,
         "sulphate": MineralCompound.Sulphate,
         "nitrate": MineralCompound.Nitrate,
-    }
\ No newline at end of file
+    }
+
+
+# Campos del producto OFF que se conservan en `OFFProduct.raw_data` por defecto.
+# El payload completo puede tener cientos de claves (knowledge panels, imagenes, etc.)
+# y no se necesita para el seguimiento nutricional.
+OFF_DEFAULT_RAW_FIELDS: tuple[str, ...] = (
+    'quantity',
+    'serving_size',
+    'nutriscore_grade',
+    'nova_group',
+    'ecoscore_grade',
+    'labels_tags',
+    'traces_tags',
+    'ingredients_analysis_tags',
+)
+
+# Campos que `OFFProduct.from_off` necesita siempre, independientemente de la whitelist.
+OFF_PARSED_FIELDS: tuple[str, ...] = (
+    'code',
+    'product_name',
+    'brands',
+    'categories',
+    'nutriments',
+    'allergens_tags',
+    'ingredients_text',
+    'image_url',
+)
+
+_NUTRIMENT_100G_SUFFIX = '_100g'
+
+
+@dataclass(slots=True)
+class OFFProduct:
+    """
+    Representacion compacta de un producto de Open Food Facts.
+    Solo guarda los campos que usamos y, en `raw_data`, los campos de la whitelist.
+    """
+    barcode: Optional[str]
+    name: str
+    brands: str
+    categories: str
+    kcal_per_100g: float
+    nutrients: dict[str, float]
+    allergens: list[str]
+    ingredients: str
+    image_url: Optional[str]
+    nutriments_100g: dict[str, float] = field(default_factory=dict)  # Ej: {"saturated-fat": 1.2, "iron": 0.004}
+    raw_data: dict[str, Any] = field(default_factory=dict)
+
+    @classmethod
+    def from_off(cls, product_data: dict[str, Any], raw_fields: tuple[str, ...] = OFF_DEFAULT_RAW_FIELDS) -> "OFFProduct":
+        """Construye el producto a partir del dict devuelto por la API de OFF."""
+        nutriments = product_data.get('nutriments') or {}
+
+        kcal_per_100g = nutriments.get('energy-kcal_100g')
+        if not kcal_per_100g and nutriments.get('energy_100g'):
+            kcal_per_100g = nutriments['energy_100g'] / 4.184
+
+        # Solo valores numericos por 100g, sin el sufijo: "iron_100g" -> "iron"
+        nutriments_100g = {
+            sys.intern(key[:-len(_NUTRIMENT_100G_SUFFIX)]): float(value)
+            for key, value in nutriments.items()
+            if key.endswith(_NUTRIMENT_100G_SUFFIX) and type(value) in (int, float)
+        }
+
+        return cls(
+            barcode=product_data.get('code'),
+            name=product_data.get('product_name', 'Desconocido'),
+            brands=product_data.get('brands', ''),
+            categories=product_data.get('categories', ''),
+            kcal_per_100g=kcal_per_100g or 0,
+            nutrients={
+                'protein': nutriments.get('proteins_100g', 0),
+                'carbs': nutriments.get('carbohydrates_100g', 0),
+                'fat': nutriments.get('fat_100g', 0),
+                'fiber': nutriments.get('fiber_100g', 0),
+                'sugars': nutriments.get('sugars_100g', 0),
+                'salt': nutriments.get('salt_100g', 0),
+            },
+            # Los tags de alergenos se repiten mucho entre productos ("en:milk", "en:gluten")
+            allergens=[sys.intern(tag) for tag in product_data.get('allergens_tags', [])],
+            ingredients=product_data.get('ingredients_text', ''),
+            image_url=product_data.get('image_url'),
+            nutriments_100g=nutriments_100g,
+            raw_data={key: product_data[key] for key in raw_fields if key in product_data},
+        )
+
+    @staticmethod
+    def request_fields(raw_fields: tuple[str, ...] = OFF_DEFAULT_RAW_FIELDS) -> str:
+        """Lista de campos (separados por coma) a pedir a la API para construir el producto."""
+        return ','.join(dict.fromkeys(OFF_PARSED_FIELDS + tuple(raw_fields)))
+
+    def to_dict(self) -> dict[str, Any]:
+        """Devuelve el producto con el mismo formato de dict que usaba `_parse_product`."""
+        return {
+            'barcode': self.barcode,
+            'name': self.name,
+            'brands': self.brands,
+            'categories': self.categories,
+            'kcal_per_100g': self.kcal_per_100g,
+            'nutrients': dict(self.nutrients),
+            'allergens': list(self.allergens),
+            'ingredients': self.ingredients,
+            'image_url': self.image_url,
+            'nutriments_100g': dict(self.nutriments_100g),
+            'raw_data': dict(self.raw_data),
+        }
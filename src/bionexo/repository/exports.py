@@ -0,0 +1,336 @@
+"""
+Exportacion columnar (Parquet) de ingestas, reportes de bienestar y alimentos.
+
+Los documentos se leen de cursores de Mongo por lotes y se convierten en `RecordBatch` de Arrow
+con un esquema fijo por coleccion; nunca hay mas de un lote en memoria. El cursor se ordena por
+la clave de particion, asi que solo hay un fichero Parquet abierto a la vez:
+
+    <output_dir>/intakes/user_id=<usuario>/month=YYYY-MM/part-<run>-<n>.parquet
+    <output_dir>/wellness_logs/user_id=<usuario>/month=YYYY-MM/part-<run>-<n>.parquet
+    <output_dir>/foods/month=YYYY-MM/part-<run>-<n>.parquet
+
+Las imagenes (`image_data`) no se exportan. Cada coleccion guarda su marca de agua
+(timestamp o `updated_at` maximo exportado) en `<output_dir>/_export_state.json`; las ejecuciones
+incrementales solo exportan documentos posteriores. Los documentos insertados con fecha
+anterior a la marca de agua requieren una exportacion completa (`full=True`).
+
+Solo hay una exportacion a la vez por directorio, tambien entre procesos (`flock` sobre
+`<output_dir>/.export.lock`, que el sistema suelta si el proceso muere).
+"""
+
+import fcntl
+import json
+import os
+import shutil
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import IO, Optional
+from urllib.parse import quote
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from bson import ObjectId
+
+EXPORT_DIR = Path(os.getenv("BIONEXO_EXPORT_DIR", "exports"))
+EXPORT_STATE_FILE = "_export_state.json"
+EXPORT_LOCK_FILE = ".export.lock"
+
+_SYMPTOM_TYPE = pa.struct([
+    ("location", pa.string()),
+    ("description", pa.string()),
+    ("intensity", pa.int32()),
+    ("duration_minutes", pa.int32()),
+])
+
+
+@dataclass(frozen=True)
+class ExportSpec:
+    collection: str
+    schema: pa.Schema
+    time_field: str  # Campo de la marca de agua y del mes de particion
+    partition_by_user: bool
+
+
+EXPORT_SPECS: dict[str, ExportSpec] = {
+    "intakes": ExportSpec(
+        collection="intakes",
+        schema=pa.schema([
+            ("_id", pa.string()),
+            ("user_id", pa.string()),
+            ("timestamp", pa.timestamp("ms")),
+            ("food_name", pa.string()),
+            ("food_id", pa.string()),
+            ("quantity", pa.float64()),
+            ("kcal", pa.float64()),
+            ("meal_type", pa.string()),
+            ("quantity_type", pa.string()),
+            ("quantity_description", pa.string()),
+            ("feeling_scale", pa.int32()),
+            ("ingredients", pa.list_(pa.string())),
+            ("voice_description", pa.string()),
+            ("image_size_bytes", pa.int64()),
+        ]),
+        time_field="timestamp",
+        partition_by_user=True,
+    ),
+    "wellness_logs": ExportSpec(
+        collection="wellness_logs",
+        schema=pa.schema([
+            ("_id", pa.string()),
+            ("user_id", pa.string()),
+            ("timestamp", pa.timestamp("ms")),
+            ("time_of_day", pa.string()),
+            ("hour_start", pa.int32()),
+            ("hour_end", pa.int32()),
+            ("symptoms", pa.list_(_SYMPTOM_TYPE)),
+            ("general_pain", pa.bool_()),
+            ("pain_description", pa.string()),
+            ("pain_intensity", pa.int32()),
+            ("mood", pa.string()),
+            ("mood_intensity", pa.int32()),
+            ("stress_level", pa.int32()),
+            ("anxiety_level", pa.int32()),
+            ("energy_level", pa.int32()),
+            ("sleep_quality", pa.int32()),
+            ("digestive_issues", pa.string()),
+            ("digestive_comfort_scale", pa.int32()),
+            ("appetite_scale", pa.int32()),
+            ("nausea", pa.bool_()),
+            ("breathing_difficulty", pa.bool_()),
+            ("dizziness", pa.bool_()),
+            ("fatigue", pa.bool_()),
+            ("notes", pa.string()),
+            ("medications_taken", pa.list_(pa.string())),
+            ("triggers", pa.list_(pa.string())),
+            ("created_at", pa.timestamp("ms")),
+        ]),
+        time_field="timestamp",
+        partition_by_user=True,
+    ),
+    "foods": ExportSpec(
+        collection="foods",
+        schema=pa.schema([
+            ("_id", pa.string()),
+            ("name", pa.string()),
+            ("description", pa.string()),
+            ("ingredients", pa.list_(pa.string())),
+            ("kcal_per_100g", pa.float64()),
+            ("protein_g", pa.float64()),
+            ("carbs_g", pa.float64()),
+            ("fat_g", pa.float64()),
+            ("fiber_g", pa.float64()),
+            ("tags", pa.list_(pa.string())),
+            ("allergens", pa.list_(pa.string())),
+            ("allergen_mask", pa.int64()),
+            ("user_created", pa.bool_()),
+            ("nutrient_vector", pa.binary()),
+            ("nutrient_vector_layout", pa.string()),
+            ("created_at", pa.timestamp("ms")),
+            ("updated_at", pa.timestamp("ms")),
+        ]),
+        time_field="updated_at",
+        partition_by_user=False,
+    ),
+}
+
+
+def load_export_state(output_dir: Path) -> dict:
+    state_file = Path(output_dir) / EXPORT_STATE_FILE
+    if not state_file.exists():
+        return {}
+    with open(state_file, encoding="utf-8") as f:
+        state = json.load(f)
+    for entry in state.values():
+        if entry.get("high_water"):
+            entry["high_water"] = datetime.fromisoformat(entry["high_water"])
+    return state
+
+
+def save_export_state(output_dir: Path, state: dict):
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    serializable = {
+        name: {**entry, "high_water": entry["high_water"].isoformat() if entry.get("high_water") else None}
+        for name, entry in state.items()
+    }
+    tmp = output_dir / f"{EXPORT_STATE_FILE}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(serializable, f, indent=2)
+    os.replace(tmp, output_dir / EXPORT_STATE_FILE)
+
+
+def _row(doc: dict) -> dict:
+    """Adapta un documento de Mongo a los tipos del esquema (ObjectId -> str)."""
+    for key in ("_id", "food_id"):
+        if isinstance(doc.get(key), ObjectId):
+            doc[key] = str(doc[key])
+    return doc
+
+
+def user_partition_dir(base_dir: Path, user_id: str) -> Path:
+    """Directorio `user_id=<usuario>` de una coleccion particionada por usuario."""
+    return Path(base_dir) / f"user_id={quote(user_id, safe='@.-_')}"
+
+
+class _PartitionWriter:
+    """Mantiene abierto un unico `ParquetWriter`: el de la particion actual."""
+
+    def __init__(self, base_dir: Path, schema: pa.Schema, run_id: str):
+        self.base_dir = base_dir
+        self.schema = schema
+        self.run_id = run_id
+        self.partition: Optional[tuple] = None
+        self.writer: Optional[pq.ParquetWriter] = None
+        self.files = 0
+
+    def _path(self, partition: tuple) -> Path:
+        user_id, month = partition
+        directory = self.base_dir if user_id is None else user_partition_dir(self.base_dir, user_id)
+        directory = directory / f"month={month}"
+        directory.mkdir(parents=True, exist_ok=True)
+        return directory / f"part-{self.run_id}-{self.files:05d}.parquet"
+
+    def write(self, partition: tuple, rows: list[dict]):
+        if partition != self.partition:
+            self.close()
+            self.writer = pq.ParquetWriter(self._path(partition), self.schema, compression="zstd")
+            self.partition = partition
+            self.files += 1
+        self.writer.write_batch(pa.RecordBatch.from_pylist(rows, schema=self.schema))
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+        self.partition = None
+
+
+def export_collection(
+        db,
+        name: str,
+        output_dir: Path = EXPORT_DIR,
+        batch_size: int = 5000,
+        full: bool = False,
+        user_id: Optional[str] = None,
+        state: Optional[dict] = None
+) -> dict:
+    """
+    Exporta una coleccion de `EXPORT_SPECS` a Parquet particionado.
+    Con `full=True` se borra el dataset de la coleccion y se ignora la marca de agua.
+
+    Con `user_id` se rehace solo la particion de ese usuario: tiene que ser `full=True`, se
+    borra su directorio `user_id=<usuario>` y se exporta hasta la marca de agua global, que no
+    se mueve. Asi la siguiente ejecucion incremental continua sin duplicar filas. Una
+    incremental de un usuario escribiria filas que la global volveria a exportar: se rechaza.
+    """
+    spec = EXPORT_SPECS[name]
+    output_dir = Path(output_dir)
+    persist_state = state is None
+    state = load_export_state(output_dir) if state is None else state
+    entry = state.get(name, {})
+    base_dir = output_dir / name
+
+    query = {spec.time_field: {"$type": "date"}}
+    high_water = None if full else entry.get("high_water")
+    if high_water is not None:
+        query[spec.time_field] = {"$gt": high_water}
+    if user_id is not None:
+        if not spec.partition_by_user:
+            raise ValueError(f"La coleccion '{name}' no se particiona por usuario")
+        if not full:
+            raise ValueError("La exportacion de un usuario tiene que ser completa (full=True)")
+        if entry.get("high_water") is None:
+            raise ValueError(f"'{name}' no tiene exportacion global: hacer antes una completa sin usuario")
+        query["user_id"] = user_id
+        query[spec.time_field] = {"$type": "date", "$lte": entry["high_water"]}
+
+    if full:
+        target_dir = base_dir if user_id is None else user_partition_dir(base_dir, user_id)
+        if target_dir.exists():
+            shutil.rmtree(target_dir)
+
+    run_started = datetime.now()
+
+    sort = [("user_id", 1), (spec.time_field, 1)] if spec.partition_by_user else [(spec.time_field, 1)]
+    projection = {field_name: 1 for field_name in spec.schema.names}
+    cursor = db[spec.collection].find(query, projection).sort(sort).batch_size(batch_size)
+    if hasattr(cursor, "allow_disk_use"):
+        cursor = cursor.allow_disk_use(True)
+
+    writer = _PartitionWriter(base_dir, spec.schema, run_started.strftime("%Y%m%dT%H%M%S%f"))
+    rows: list[dict] = []
+    partition = None
+    exported = 0
+    max_time = high_water
+    try:
+        for doc in cursor:
+            timestamp = doc.get(spec.time_field)
+            doc_partition = (doc.get("user_id") if spec.partition_by_user else None, timestamp.strftime("%Y-%m"))
+            if rows and (doc_partition != partition or len(rows) >= batch_size):
+                writer.write(partition, rows)
+                rows = []
+            partition = doc_partition
+            rows.append(_row(doc))
+            exported += 1
+            if max_time is None or timestamp > max_time:
+                max_time = timestamp
+        if rows:
+            writer.write(partition, rows)
+    finally:
+        writer.close()
+
+    if user_id is None:
+        state[name] = {"high_water": max_time, "last_run_at": run_started.isoformat(), "last_run_rows": exported}
+        if persist_state:
+            save_export_state(output_dir, state)
+    return {"collection": name, "rows": exported, "files": writer.files, "high_water": max_time}
+
+
+class ExportInProgressError(RuntimeError):
+    """Ya hay una exportacion en curso en el mismo directorio."""
+
+
+def acquire_export_lock(output_dir: Path = EXPORT_DIR) -> IO:
+    """
+    Toma el cerrojo de exportacion de `output_dir` sin esperar, o lanza `ExportInProgressError`.
+    Se suelta al cerrar el fichero devuelto.
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    lock = open(output_dir / EXPORT_LOCK_FILE, "a")
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock.close()
+        raise ExportInProgressError(f"Ya hay una exportación en curso en {output_dir}")
+    return lock
+
+
+def export_all(
+        db,
+        output_dir: Path = EXPORT_DIR,
+        collections: Optional[list[str]] = None,
+        batch_size: int = 5000,
+        full: bool = False,
+        user_id: Optional[str] = None,
+        lock: Optional[IO] = None
+) -> list[dict]:
+    """
+    Exporta varias colecciones (por defecto todas) y guarda la marca de agua al final de cada una.
+    Toma el cerrojo del directorio (ver `acquire_export_lock`), o usa y suelta el que se pase en
+    `lock`.
+    """
+    output_dir = Path(output_dir)
+    lock = lock or acquire_export_lock(output_dir)
+    try:
+        state = load_export_state(output_dir)
+        results = []
+        for name in collections or list(EXPORT_SPECS):
+            if user_id is not None and not EXPORT_SPECS[name].partition_by_user:
+                continue
+            results.append(export_collection(db, name, output_dir, batch_size, full, user_id, state=state))
+            save_export_state(output_dir, state)
+        return results
+    finally:
+        lock.close()
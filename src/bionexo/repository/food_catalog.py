@@ -0,0 +1,310 @@
+"""
+Catalogo de alimentos en memoria del proceso (opcional, `BIONEXO_FOOD_CATALOG=1`).
+
+Carga la coleccion `foods` una vez y la indexa para servir sin ir a Mongo las lecturas
+calientes de `foods.py`:
+
+- por id y por nombre (sin distinguir mayusculas, la clave de `name_normalized`),
+- por etiqueta y por alergeno (conjuntos invertidos de filas),
+- mascara de alergenos y marca de fila viva en arrays de NumPy (`allergens.py`): filtrar
+  los alimentos no aptos para un usuario es un AND vectorizado,
+- por `kcal_per_100g` (claves `(kcal, fila)` ordenadas, rangos con `bisect`).
+
+Todos los indices se actualizan en el sitio en cada alta, cambio o baja (`bisect` en el
+orden por calorias, asignacion en los arrays): una escritura no obliga a reconstruir nada.
+
+Se mantiene fresco con un change stream en un hilo de fondo (requiere replica set). Si el
+servidor no lo admite, se refresca por sondeo de `updated_at` como mucho cada
+`refresh_interval` segundos, y se recarga entero si desaparecen documentos. Las escrituras
+hechas desde este proceso se aplican al momento con `reload` / `remove`.
+
+Los documentos devueltos son copias superficiales: las listas internas no deben modificarse.
+"""
+
+import bisect
+import heapq
+import math
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Optional
+
+import numpy as np
+from bson import ObjectId
+from pymongo.errors import OperationFailure, PyMongoError
+
+from bionexo.repository.allergens import ALLERGEN_MASK_FIELD, food_allergen_mask
+
+FOOD_CATALOG_ENABLED = os.getenv("BIONEXO_FOOD_CATALOG", "0") == "1"
+FOOD_CATALOG_REFRESH_SECONDS = float(os.getenv("BIONEXO_FOOD_CATALOG_REFRESH", "30"))
+
+
+def catalog_key(name: str) -> str:
+    """Clave de nombre del catalogo y del campo `name_normalized` de `foods`."""
+    return name.strip().lower()
+
+
+class FoodCatalog:
+    """Snapshot indexado de `foods`. Seguro entre hilos."""
+
+    def __init__(self, refresh_interval: float = FOOD_CATALOG_REFRESH_SECONDS):
+        self.refresh_interval = refresh_interval
+        self.docs: list[Optional[dict]] = []  # Fila -> documento (None si se borro)
+        self.position: dict[str, int] = {}
+        self.by_name: dict[str, list[int]] = {}
+        self.by_tag: dict[str, set[int]] = {}
+        self.by_allergen: dict[str, set[int]] = {}
+        self.high_water: Optional[datetime] = None
+        self.last_refresh = 0.0
+        self.loaded = False
+        self.streaming = False
+        # Fila -> mascara de alergenos y fila viva; con capacidad de sobra para crecer sin copiar
+        self._mask_buffer = np.zeros(0, dtype=np.int64)
+        self._alive_buffer = np.zeros(0, dtype=bool)
+        self._kcal_keys: list[tuple[float, int]] = []  # (kcal_per_100g, fila) ordenadas
+        self._lock = threading.RLock()
+        self._watcher: Optional[threading.Thread] = None
+
+    # --- Mantenimiento ---
+
+    @staticmethod
+    def _kcal_key(row: int, doc: dict) -> Optional[tuple[float, int]]:
+        kcal = doc.get("kcal_per_100g")
+        if isinstance(kcal, (int, float)) and not math.isnan(kcal):
+            return float(kcal), row
+        return None
+
+    def _new_row(self) -> int:
+        row = len(self.docs)
+        if row == len(self._mask_buffer):
+            capacity = max(2 * row, 1024)
+            self._mask_buffer = np.resize(self._mask_buffer, capacity)
+            self._alive_buffer = np.resize(self._alive_buffer, capacity)
+            self._mask_buffer[row:] = 0
+            self._alive_buffer[row:] = False
+        self.docs.append(None)
+        return row
+
+    def _index(self, row: int, doc: dict, sort_kcal: bool = True):
+        if sort_kcal:
+            key = self._kcal_key(row, doc)
+            if key is not None:
+                bisect.insort(self._kcal_keys, key)
+        self.by_name.setdefault(catalog_key(doc.get("name") or ""), []).append(row)
+        for tag in doc.get("tags") or []:
+            self.by_tag.setdefault(tag, set()).add(row)
+        for allergen in doc.get("allergens") or []:
+            self.by_allergen.setdefault(allergen, set()).add(row)
+
+    def _unindex(self, row: int, doc: dict):
+        kcal_key = self._kcal_key(row, doc)
+        if kcal_key is not None:
+            i = bisect.bisect_left(self._kcal_keys, kcal_key)
+            if i < len(self._kcal_keys) and self._kcal_keys[i] == kcal_key:
+                del self._kcal_keys[i]
+        key = catalog_key(doc.get("name") or "")
+        rows = self.by_name.get(key, [])
+        if row in rows:
+            rows.remove(row)
+            if not rows:
+                del self.by_name[key]
+        for field, index in (("tags", self.by_tag), ("allergens", self.by_allergen)):
+            for value in doc.get(field) or []:
+                rows = index.get(value)
+                if rows is not None:
+                    rows.discard(row)
+                    if not rows:
+                        del index[value]
+
+    def _upsert(self, doc: dict, sort_kcal: bool = True):
+        doc = dict(doc)
+        doc["_id"] = str(doc["_id"])
+        if not isinstance(doc.get(ALLERGEN_MASK_FIELD), int):
+            doc[ALLERGEN_MASK_FIELD] = food_allergen_mask(doc)
+        with self._lock:
+            row = self.position.get(doc["_id"])
+            if row is None:
+                row = self._new_row()
+                self.position[doc["_id"]] = row
+            else:
+                self._unindex(row, self.docs[row])
+            self.docs[row] = doc
+            self._index(row, doc, sort_kcal)
+            self._mask_buffer[row] = doc[ALLERGEN_MASK_FIELD]
+            self._alive_buffer[row] = True
+            updated_at = doc.get("updated_at")
+            if isinstance(updated_at, datetime) and (self.high_water is None or updated_at > self.high_water):
+                self.high_water = updated_at
+
+    def remove(self, food_id: str):
+        """Quita un alimento borrado."""
+        with self._lock:
+            row = self.position.pop(str(food_id), None)
+            if row is None:
+                return
+            self._unindex(row, self.docs[row])
+            self.docs[row] = None
+            self._mask_buffer[row] = 0
+            self._alive_buffer[row] = False
+
+    def load(self, db):
+        """Carga (o recarga) la coleccion completa."""
+        docs = list(db["foods"].find().batch_size(10_000))
+        with self._lock:
+            self.docs, self.position, self.by_name, self.by_tag, self.by_allergen = [], {}, {}, {}, {}
+            self._mask_buffer = np.zeros(len(docs), dtype=np.int64)
+            self._alive_buffer = np.zeros(len(docs), dtype=bool)
+            self._kcal_keys = []
+            self.high_water = None
+            for doc in docs:
+                self._upsert(doc, sort_kcal=False)
+            # En la carga completa se ordena una vez en lugar de insertar fila a fila
+            self._kcal_keys = sorted(
+                key for key in (self._kcal_key(row, doc) for row, doc in enumerate(self.docs) if doc is not None)
+                if key is not None
+            )
+            self.loaded = True
+            self.last_refresh = time.monotonic()
+
+    def reload(self, db, food_id: str):
+        """Vuelve a leer un alimento (tras escribirlo desde este proceso)."""
+        try:
+            doc = db["foods"].find_one({"_id": ObjectId(food_id)})
+        except Exception:
+            return
+        if doc is None:
+            self.remove(food_id)
+        else:
+            self._upsert(doc)
+
+    def refresh(self, db, force: bool = False):
+        """Sondeo por `updated_at`; no hace nada si hay change stream activo."""
+        if self.streaming or (not force and time.monotonic() - self.last_refresh < self.refresh_interval):
+            return
+        if not self.loaded or db["foods"].estimated_document_count() < len(self.position):
+            self.load(db)
+            return
+        query = {"updated_at": {"$gt": self.high_water}} if self.high_water else {}
+        for doc in db["foods"].find(query):
+            self._upsert(doc)
+        self.last_refresh = time.monotonic()
+
+    def start(self, db):
+        """Carga el catalogo y arranca el change stream (o deja el sondeo si no esta disponible)."""
+        try:
+            # El stream se abre antes de cargar para no perder cambios entre la lectura y el hilo
+            stream = db["foods"].watch(full_document="updateLookup")
+        except OperationFailure:
+            stream = None
+        self.load(db)
+        if stream is None:
+            return
+        self.streaming = True
+        self._watcher = threading.Thread(target=self._watch, args=(db, stream), name="food-catalog", daemon=True)
+        self._watcher.start()
+
+    def _watch(self, db, stream):
+        try:
+            with stream:
+                for change in stream:
+                    operation = change["operationType"]
+                    if operation == "delete":
+                        self.remove(str(change["documentKey"]["_id"]))
+                    elif change.get("fullDocument") is not None:
+                        self._upsert(change["fullDocument"])
+                    elif operation in ("drop", "rename", "invalidate"):
+                        break
+        except PyMongoError as e:
+            print(f"Change stream de 'foods' interrumpido, se pasa a sondeo: {e}")
+        except Exception as e:
+            # Un cambio que no se puede aplicar tampoco debe dejar el catalogo sin refrescar
+            print(f"Error aplicando un cambio de 'foods', se pasa a sondeo: {type(e).__name__}: {e}")
+        finally:
+            # Sin stream: el siguiente acceso recarga por sondeo
+            self.streaming = False
+            self.loaded = False
+
+    # --- Consultas ---
+
+    def _copy(self, rows) -> list[dict]:
+        return [dict(self.docs[row]) for row in rows]
+
+    @property
+    def masks(self) -> np.ndarray:
+        """Fila -> mascara de alergenos (0 si se borro)."""
+        return self._mask_buffer[:len(self.docs)]
+
+    def safe_rows(self, exclude_allergens: int) -> np.ndarray:
+        """Filas vivas sin ninguno de los alergenos de la mascara."""
+        with self._lock:
+            n = len(self.docs)
+            return np.flatnonzero(self._alive_buffer[:n] & ((self._mask_buffer[:n] & exclude_allergens) == 0))
+
+    def is_safe(self, food_id: str, exclude_allergens: int) -> bool:
+        row = self.position.get(str(food_id))
+        return row is not None and not self._mask_buffer[row] & exclude_allergens
+
+    def get_by_id(self, food_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self.position.get(str(food_id))
+            return None if row is None else dict(self.docs[row])
+
+    def get_by_name(self, name: str) -> Optional[dict]:
+        with self._lock:
+            rows = self.by_name.get(catalog_key(name))
+            return dict(self.docs[rows[0]]) if rows else None
+
+    def get_by_tag(self, tag: str, limit: int = 50, exclude_allergens: int = 0) -> list[dict]:
+        with self._lock:
+            rows = self.by_tag.get(tag, ())
+            if exclude_allergens:
+                rows = (row for row in rows if not self._mask_buffer[row] & exclude_allergens)
+            return self._copy(heapq.nsmallest(limit, rows))
+
+    def get_by_allergen(self, allergen: str, limit: int = 100, bit: int = 0) -> list[dict]:
+        """Alimentos con el alergeno: por su bit si esta en la taxonomia, si no por el termino exacto."""
+        with self._lock:
+            if bit:
+                return self._copy(np.flatnonzero(self.masks & bit)[:limit])
+            return self._copy(heapq.nsmallest(limit, self.by_allergen.get(allergen, ())))
+
+    def get_by_kcal_range(
+            self,
+            min_kcal: float,
+            max_kcal: float,
+            limit: int = 50,
+            exclude_allergens: int = 0
+    ) -> list[dict]:
+        """Alimentos con `min_kcal <= kcal_per_100g <= max_kcal`, de menos a mas calorias."""
+        with self._lock:
+            lo = bisect.bisect_left(self._kcal_keys, (min_kcal, -1))
+            hi = bisect.bisect_right(self._kcal_keys, (max_kcal, math.inf))
+            rows = []
+            for i in range(lo, hi):
+                row = self._kcal_keys[i][1]
+                if not self._mask_buffer[row] & exclude_allergens:
+                    rows.append(row)
+                    if len(rows) == limit:
+                        break
+            return self._copy(rows)
+
+    def __len__(self) -> int:
+        return len(self.position)
+
+
+_food_catalog = FoodCatalog()
+_start_lock = threading.Lock()
+
+
+def get_food_catalog(db) -> Optional[FoodCatalog]:
+    """Catalogo compartido del proceso, o None si no esta activado."""
+    if not FOOD_CATALOG_ENABLED:
+        return None
+    if not _food_catalog.loaded and not _food_catalog.streaming:
+        with _start_lock:
+            if not _food_catalog.loaded:
+                _food_catalog.start(db)
+    else:
+        _food_catalog.refresh(db)
+    return _food_catalog
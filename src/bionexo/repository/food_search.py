@@ -0,0 +1,302 @@
+"""
+Busqueda de alimentos: indice de texto de Mongo (español) e indice de trigramas en proceso.
+
+- `text_search_foods`: `$text` sobre un indice con `default_language: "spanish"` (stemming y
+  stopwords) con pesos name > tags > description, ordenado por `textScore`.
+- `TrigramIndex`: indice de trigramas de caracteres sobre los nombres normalizados (sin
+  tildes, minusculas), tolerante a erratas. Se construye vectorizado con NumPy en formato CSR
+  (trigrama -> ids de documento) y puntua con el coeficiente de Dice, con un extra para los
+  nombres que empiezan por la consulta o la contienen como palabra.
+
+El indice en proceso se refresca leyendo los alimentos con `updated_at` posterior a la ultima
+lectura: los cambios van a un delta pequeño que se busca por fuerza bruta, y las versiones
+anteriores se marcan como borradas; cuando el delta crece se reconstruye entero.
+"""
+
+import re
+import threading
+import time
+import unicodedata
+from datetime import datetime
+from typing import Iterable, Optional
+
+import numpy as np
+
+FOOD_TEXT_INDEX_NAME = "foods_text_es"
+FOOD_TEXT_WEIGHTS = {"name": 10, "tags": 5, "description": 1}
+
+# Alfabeto de los trigramas: espacio, a-z, 0-9; el resto de simbolos se normaliza a espacio
+_ALPHABET = " abcdefghijklmnopqrstuvwxyz0123456789"
+_SEPARATOR = len(_ALPHABET)  # Marca el limite entre documentos
+_BASE = len(_ALPHABET) + 1
+_SYMBOLS = np.full(256, _SEPARATOR, dtype=np.int32)
+for _i, _c in enumerate(_ALPHABET):
+    _SYMBOLS[ord(_c)] = _i
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+
+# Proporcion del delta respecto al indice a partir de la cual se reconstruye
+_DELTA_REBUILD_RATIO = 0.05
+_DELTA_REBUILD_MIN = 1000
+
+# Postings como maximo que se recorren para generar candidatos en una busqueda
+_CANDIDATE_POSTINGS_BUDGET = 500_000
+
+
+def normalize_text(text: str) -> str:
+    """Minusculas, sin tildes, solo [a-z0-9] separados por un espacio."""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return _NON_ALNUM.sub(" ", text).strip()
+
+
+def _trigram_codes(normalized: str) -> np.ndarray:
+    padded = f" {normalized} ".encode("ascii")
+    symbols = _SYMBOLS[np.frombuffer(padded, dtype=np.uint8)]
+    codes = symbols[:-2] * _BASE * _BASE + symbols[1:-1] * _BASE + symbols[2:]
+    return np.unique(codes)
+
+
+def ensure_food_text_index(db):
+    # Import diferido: indexes.py importa este modulo para declarar el indice
+    from bionexo.repository.indexes import ensure_indexes
+    ensure_indexes(db, "foods", [FOOD_TEXT_INDEX_NAME])
+
+
+def text_search_foods(
+        db,
+        query: str,
+        limit: int = 20,
+        projection: Optional[dict] = None,
+        extra_filter: Optional[dict] = None
+) -> list[dict]:
+    """Busqueda con el indice de texto, ordenada por relevancia (`score`)."""
+    projection = dict(projection or {})
+    projection["score"] = {"$meta": "textScore"}
+    return list(db["foods"].find(
+        {"$text": {"$search": query, "$language": "spanish"}, **(extra_filter or {})},
+        projection
+    ).sort([("score", {"$meta": "textScore"})]).limit(limit))
+
+
+class TrigramIndex:
+    """Indice inmutable de trigramas sobre nombres de alimentos."""
+
+    def __init__(self, ids: list[str], names: list[str], allergen_masks: Optional[list[int]] = None):
+        self.ids = np.asarray(ids, dtype=object)
+        self.names = np.asarray(names, dtype=object)
+        self.allergen_masks = np.asarray(allergen_masks if allergen_masks is not None else [0] * len(ids), dtype=np.int64)
+        self.normalized = [normalize_text(name or "") for name in names]
+        self.alive = np.ones(len(ids), dtype=bool)
+        self.position = {food_id: i for i, food_id in enumerate(ids)}
+        self._build()
+
+    def _build(self):
+        n_docs = len(self.normalized)
+        n_codes = _BASE ** 3
+        if n_docs == 0:
+            self.indptr = np.zeros(n_codes + 1, dtype=np.int64)
+            self.postings = np.zeros(0, dtype=np.int32)
+            self.doc_trigrams = np.zeros(0, dtype=np.int32)
+            return
+        # Todos los nombres en un unico buffer " a  b  c " con un separador entre documentos
+        padded = [f" {name} " for name in self.normalized]
+        buffer = "\x00".join(padded).encode("ascii")
+        symbols = _SYMBOLS[np.frombuffer(buffer, dtype=np.uint8)]
+        lengths = np.fromiter((len(p) for p in padded), dtype=np.int64, count=n_docs)
+        doc_of_char = np.repeat(np.arange(n_docs, dtype=np.int64), lengths + 1)[:len(symbols)]
+
+        a, b, c = symbols[:-2], symbols[1:-1], symbols[2:]
+        valid = (a != _SEPARATOR) & (b != _SEPARATOR) & (c != _SEPARATOR)
+        codes = (a * _BASE * _BASE + b * _BASE + c)[valid].astype(np.int64)
+        docs = doc_of_char[:-2][valid]
+
+        # Pares (documento, trigrama) unicos, ordenados por trigrama -> CSR
+        # (sort + diff: bastante mas rapido que np.unique con decenas de millones de pares)
+        pairs = codes * n_docs + docs
+        pairs.sort()
+        pairs = pairs[np.concatenate(([True], pairs[1:] != pairs[:-1]))]
+        codes, docs = pairs // n_docs, pairs % n_docs
+        self.postings = docs.astype(np.int32)
+        self.indptr = np.zeros(n_codes + 1, dtype=np.int64)
+        np.cumsum(np.bincount(codes, minlength=n_codes), out=self.indptr[1:])
+        self.doc_trigrams = np.bincount(docs, minlength=n_docs).astype(np.int32)
+
+    def __len__(self) -> int:
+        return int(self.alive.sum())
+
+    def discard(self, food_id: str):
+        position = self.position.get(food_id)
+        if position is not None:
+            self.alive[position] = False
+
+    def search(
+            self,
+            query: str,
+            limit: int = 20,
+            min_similarity: float = 0.3,
+            exclude_allergens: int = 0
+    ) -> list[tuple[str, str, float]]:
+        """
+        Devuelve [(id, nombre, puntuacion)] ordenado por relevancia.
+        `exclude_allergens` es una mascara de alergenos (ver `allergens.py`): se descartan los
+        alimentos que tengan alguno.
+        """
+        normalized = normalize_text(query)
+        if not normalized or not len(self.ids):
+            return []
+        q_codes = _trigram_codes(normalized)
+        starts, ends = self.indptr[q_codes], self.indptr[q_codes + 1]
+        frequency = ends - starts
+        if not frequency.any():
+            return []
+
+        # Candidatos: se cuentan primero los trigramas mas raros hasta un presupuesto de postings;
+        # los muy frecuentes (" de", "con"...) dominan el coste y apenas discriminan
+        order = np.argsort(frequency, kind="stable")
+        order = order[frequency[order] > 0]
+        within_budget = np.cumsum(frequency[order]) <= _CANDIDATE_POSTINGS_BUDGET
+        within_budget[0] = True
+        counted, remaining = order[within_budget], order[~within_budget]
+        hits = np.concatenate([self.postings[starts[t]:ends[t]] for t in counted])
+        shared = np.bincount(hits, minlength=len(self.ids))
+        candidates = np.flatnonzero((shared > 0) & self.alive)
+        if exclude_allergens:
+            candidates = candidates[(self.allergen_masks[candidates] & exclude_allergens) == 0]
+        shared = shared[candidates]
+        if len(candidates) > limit * 20:
+            top = np.argpartition(-shared, limit * 20)[:limit * 20]
+            candidates, shared = candidates[top], shared[top]
+
+        # Recuento exacto de los trigramas restantes solo para los preseleccionados
+        # (las listas de postings estan ordenadas por documento)
+        for t in remaining:
+            posting = self.postings[starts[t]:ends[t]]
+            found = np.searchsorted(posting, candidates)
+            shared = shared + (posting[np.minimum(found, len(posting) - 1)] == candidates)
+
+        scores = 2.0 * shared / (len(q_codes) + self.doc_trigrams[candidates])
+        keep = scores >= min_similarity
+        candidates, scores = candidates[keep], scores[keep]
+
+        results = []
+        for position, score in zip(candidates, scores):
+            name = self.normalized[position]
+            if name.startswith(normalized):
+                score += 0.5
+            elif f" {normalized} " in f" {name} ":
+                score += 0.25
+            results.append((self.ids[position], self.names[position], float(score)))
+        results.sort(key=lambda r: -r[2])
+        return results[:limit]
+
+
+class FoodSearchIndex:
+    """
+    Indice de trigramas de la coleccion `foods` con refresco incremental por `updated_at`.
+    Seguro entre hilos: las busquedas leen una referencia inmutable del indice base.
+    """
+
+    def __init__(self, refresh_interval: float = 30.0):
+        self.refresh_interval = refresh_interval
+        self.base: TrigramIndex = TrigramIndex([], [])
+        self.delta: dict[str, tuple[str, int]] = {}  # id -> (nombre, mascara de alergenos) cambiados desde la construccion
+        self.high_water: Optional[datetime] = None
+        self.last_refresh = 0.0
+        self.expected_count = 0
+        self._delta_index: Optional[TrigramIndex] = None
+        self._lock = threading.Lock()
+
+    def _read(self, db, query: dict) -> Iterable[dict]:
+        return db["foods"].find(
+            query, {"name": 1, "updated_at": 1, "allergen_mask": 1, "allergens": 1, "allergens_tags": 1}
+        ).batch_size(10_000)
+
+    @staticmethod
+    def _allergen_mask(doc: dict) -> int:
+        mask = doc.get("allergen_mask")
+        if isinstance(mask, int):
+            return mask
+        # Documentos anteriores a la mascara
+        from bionexo.repository.allergens import food_allergen_mask
+        return food_allergen_mask(doc)
+
+    def rebuild(self, db):
+        ids, names, masks = [], [], []
+        high_water = None
+        for doc in self._read(db, {}):
+            ids.append(str(doc["_id"]))
+            names.append(doc.get("name") or "")
+            masks.append(self._allergen_mask(doc))
+            updated_at = doc.get("updated_at")
+            if updated_at and (high_water is None or updated_at > high_water):
+                high_water = updated_at
+        base = TrigramIndex(ids, names, masks)
+        with self._lock:
+            self.base, self.delta, self._delta_index = base, {}, None
+            self.high_water = high_water
+            self.expected_count = len(ids)
+            self.last_refresh = time.monotonic()
+
+    def refresh(self, db, force: bool = False):
+        """Incorpora los alimentos creados o modificados desde la ultima lectura."""
+        if not force and time.monotonic() - self.last_refresh < self.refresh_interval:
+            return
+        if not len(self.base.ids) or db["foods"].estimated_document_count() < self.expected_count:
+            # Vacio o con borrados hechos desde otro proceso: se reconstruye
+            self.rebuild(db)
+            return
+        query = {"updated_at": {"$gt": self.high_water}} if self.high_water else {}
+        changed = list(self._read(db, query))
+        with self._lock:
+            for doc in changed:
+                food_id = str(doc["_id"])
+                if food_id not in self.delta and food_id not in self.base.position:
+                    self.expected_count += 1
+                self.base.discard(food_id)
+                self.delta[food_id] = (doc.get("name") or "", self._allergen_mask(doc))
+                self._delta_index = None
+                if doc.get("updated_at") and (self.high_water is None or doc["updated_at"] > self.high_water):
+                    self.high_water = doc["updated_at"]
+            self.last_refresh = time.monotonic()
+            too_big = len(self.delta) > max(_DELTA_REBUILD_MIN, _DELTA_REBUILD_RATIO * len(self.base.ids))
+        if too_big:
+            self.rebuild(db)
+
+    def forget(self, food_id: str):
+        """Quita un alimento borrado desde este proceso."""
+        with self._lock:
+            self.base.discard(food_id)
+            if self.delta.pop(food_id, None) is not None or food_id in self.base.position:
+                self.expected_count -= 1
+                self._delta_index = None
+
+    def search(
+            self,
+            query: str,
+            limit: int = 20,
+            min_similarity: float = 0.3,
+            exclude_allergens: int = 0
+    ) -> list[tuple[str, str, float]]:
+        with self._lock:
+            if self._delta_index is None and self.delta:
+                names, masks = zip(*self.delta.values())
+                self._delta_index = TrigramIndex(list(self.delta), list(names), list(masks))
+            base, delta_index = self.base, self._delta_index
+        results = base.search(query, limit, min_similarity, exclude_allergens)
+        if delta_index is not None:
+            results += delta_index.search(query, limit, min_similarity, exclude_allergens)
+            results.sort(key=lambda r: -r[2])
+        return results[:limit]
+
+
+_food_search_index = FoodSearchIndex()
+
+
+def get_food_search_index(db) -> FoodSearchIndex:
+    """Indice compartido del proceso, refrescado como mucho cada `refresh_interval` segundos."""
+    _food_search_index.refresh(db)
+    return _food_search_index
+
+
+def forget_food(food_id: str):
+    _food_search_index.forget(food_id)
@@ -3,14 +3,81 @@ Funciones para gestionar la colección de alimentos (foods) en MongoDB.
 """
 
 from bionexo.domain.entity.food import Food
+from bionexo.repository.allergens import (
+    ALLERGEN_MASK_FIELD, allergen_mask, food_allergen_mask, safe_foods_query
+)
+from bionexo.repository.food_catalog import catalog_key, get_food_catalog
+from bionexo.repository.food_search import forget_food, get_food_search_index, text_search_foods
+from bionexo.repository.nutrient_vectors import (
+    NUTRIENT_SOURCE_FIELDS, VECTOR_FIELDS, changes_nutrients, document_vector_fields, food_vector_fields
+)
+from bson import Binary, ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import OperationFailure
 from typing import Optional, List
 from datetime import datetime
+import asyncio
+
+# Nombre normalizado (`catalog_key`), indexado: las búsquedas por nombre sin distinguir
+# mayúsculas son una igualdad y no una regex construida con lo que escribe el usuario
+NAME_KEY_FIELD = "name_normalized"
+
+def _food_document(food: Food) -> dict:
+    """Documento a guardar en 'foods', con el vector de nutrientes por 100g en binario."""
+    food_dict = food.model_dump()
+    vector_fields = food_vector_fields(food)
+    food_dict["nutrient_vector"] = Binary(vector_fields["nutrient_vector"])
+    food_dict["nutrient_vector_layout"] = vector_fields["nutrient_vector_layout"]
+    food_dict[ALLERGEN_MASK_FIELD] = food_allergen_mask(food_dict)
+    food_dict[NAME_KEY_FIELD] = catalog_key(food.name)
+    return food_dict
+
+def _name_query(name: str) -> dict:
+    """
+    Filtro por nombre sin distinguir mayúsculas. Los alimentos anteriores al campo
+    normalizado lo reciben con `scripts/backfill_food_name_keys.py`.
+    """
+    return {NAME_KEY_FIELD: catalog_key(name)}
+
+def _update_document(update_data: dict) -> dict:
+    """
+    Actualización de un `$set` parcial con sus campos derivados (máscara de alérgenos, nombre
+    normalizado). Si cambia algún nutriente se quita el vector guardado, que `document_vector`
+    daría por bueno: hasta rehacerlo (`_vector_update`) los lectores lo calculan de los campos.
+    """
+    update_data = {"updated_at": datetime.now(), **update_data}  # Para que el índice de búsqueda vea el cambio
+    if "allergens" in update_data:
+        update_data[ALLERGEN_MASK_FIELD] = food_allergen_mask(update_data)
+    if isinstance(update_data.get("name"), str):
+        update_data[NAME_KEY_FIELD] = catalog_key(update_data["name"])
+    if not changes_nutrients(update_data):
+        return {"$set": update_data}
+    for field in VECTOR_FIELDS:
+        update_data.pop(field, None)
+    return {"$set": update_data, "$unset": {field: "" for field in VECTOR_FIELDS}}
+
+# Lo que devuelve la actualización para poder rehacer el vector
+_UPDATED_PROJECTION = {"_id": 1, "updated_at": 1, **{field: 1 for field in NUTRIENT_SOURCE_FIELDS}}
+
+def _vector_update(updated: dict) -> tuple[dict, dict]:
+    """
+    Filtro y `$set` del vector rehecho desde el documento ya actualizado. El filtro por
+    `updated_at` evita escribir un vector viejo encima de un cambio posterior.
+    """
+    return {"_id": updated["_id"], "updated_at": updated["updated_at"]}, {"$set": document_vector_fields(updated)}
+
+def _refresh_catalog(db, food_id: str):
+    """Aplica al catálogo en memoria (si está activado) un alimento escrito desde este proceso."""
+    catalog = get_food_catalog(db)
+    if catalog is not None:
+        catalog.reload(db, food_id)
 
 def save_food(db, food: Food) -> bool:
     """Guarda un alimento/receta en la colección 'foods'."""
     foods_collection = db["foods"]
     try:
-        foods_collection.insert_one(food.model_dump())
+        result = foods_collection.insert_one(_food_document(food))
+        _refresh_catalog(db, str(result.inserted_id))
         return True
     except Exception as e:
         print(f"Error al guardar alimento: {str(e)}")
@@ -18,24 +85,41 @@ def save_food(db, food: Food) -> bool:
 
 def get_food_by_name(db, name: str) -> Optional[dict]:
     """Obtiene un alimento por nombre."""
+    catalog = get_food_catalog(db)
+    if catalog is not None:
+        food = catalog.get_by_name(name)
+        if food:
+            return food
     foods_collection = db["foods"]
-    food = foods_collection.find_one({"name": {"$regex": f"^{name}$", "$options": "i"}})
+    food = foods_collection.find_one(_name_query(name))
     if food:
         food["_id"] = str(food["_id"])
     return food
 
-def search_foods(db, query: str, limit: int = 20) -> List[dict]:
-    """Busca alimentos por nombre o descripción."""
+def search_foods(db, query: str, limit: int = 20, fuzzy: bool = True, exclude_allergens: int = 0) -> List[dict]:
+    """
+    Busca alimentos por nombre, etiquetas o descripción, ordenados por relevancia.
+    Usa el índice de texto en español (stemming) y, si faltan resultados, completa con el
+    índice de trigramas en proceso, que tolera erratas ("macarones" -> "Macarrones").
+    `exclude_allergens` es la máscara de alergias del usuario (`user_allergen_mask`): se
+    descartan los alimentos que contengan alguno.
+    """
     foods_collection = db["foods"]
-    foods = list(foods_collection.find(
-        {
-            "$or": [
-                {"name": {"$regex": query, "$options": "i"}},
-                {"description": {"$regex": query, "$options": "i"}},
-                {"tags": {"$regex": query, "$options": "i"}}
-            ]
-        }
-    ).limit(limit))
+    try:
+        foods = text_search_foods(db, query, limit, extra_filter=safe_foods_query(exclude_allergens))
+    except OperationFailure as e:
+        # Sin índice de texto (ver setup_mongodb.py): solo búsqueda aproximada
+        print(f"Búsqueda de texto no disponible: {e}")
+        foods = []
+    
+    if fuzzy and len(foods) < limit:
+        seen = {food["_id"] for food in foods}
+        matches = [
+            ObjectId(food_id) for food_id, _, _ in get_food_search_index(db).search(query, limit, exclude_allergens=exclude_allergens)
+            if ObjectId(food_id) not in seen
+        ][:limit - len(foods)]
+        by_id = {food["_id"]: food for food in foods_collection.find({"_id": {"$in": matches}})}
+        foods += [by_id[food_id] for food_id in matches if food_id in by_id]
     
     for food in foods:
         if "_id" in food:
@@ -43,11 +127,14 @@ def search_foods(db, query: str, limit: int = 20) -> List[dict]:
     
     return foods
 
-def get_foods_by_tag(db, tag: str, limit: int = 50) -> List[dict]:
+def get_foods_by_tag(db, tag: str, limit: int = 50, exclude_allergens: int = 0) -> List[dict]:
     """Obtiene alimentos por etiqueta (ej: vegan, organic)."""
+    catalog = get_food_catalog(db)
+    if catalog is not None:
+        return catalog.get_by_tag(tag, limit, exclude_allergens)
     foods_collection = db["foods"]
     foods = list(foods_collection.find(
-        {"tags": tag}
+        {"tags": tag, **safe_foods_query(exclude_allergens)}
     ).limit(limit))
     
     for food in foods:
@@ -56,12 +143,19 @@ def get_foods_by_tag(db, tag: str, limit: int = 50) -> List[dict]:
     
     return foods
 
-def get_foods_by_allergen(db, allergen: str) -> List[dict]:
-    """Obtiene alimentos que contienen un alérgeno específico."""
+def get_foods_by_allergen(db, allergen: str, limit: int = 100) -> List[dict]:
+    """
+    Obtiene alimentos que contienen un alérgeno específico.
+    Si el alérgeno está en la taxonomía ("lácteos", "en:milk") se busca por su bit, que cubre
+    sinónimos y tags de OFF; si no, por coincidencia exacta en `allergens`.
+    """
+    bit = allergen_mask([allergen])
+    catalog = get_food_catalog(db)
+    if catalog is not None:
+        return catalog.get_by_allergen(allergen, limit, bit)
     foods_collection = db["foods"]
-    foods = list(foods_collection.find(
-        {"allergens": allergen}
-    ))
+    query = {ALLERGEN_MASK_FIELD: {"$bitsAnySet": bit}} if bit else {"allergens": allergen}
+    foods = list(foods_collection.find(query).limit(limit))
     
     for food in foods:
         if "_id" in food:
@@ -69,11 +163,20 @@ def get_foods_by_allergen(db, allergen: str) -> List[dict]:
     
     return foods
 
-def get_foods_by_calories_range(db, min_kcal: float, max_kcal: float, limit: int = 50) -> List[dict]:
+def get_foods_by_calories_range(
+        db,
+        min_kcal: float,
+        max_kcal: float,
+        limit: int = 50,
+        exclude_allergens: int = 0
+) -> List[dict]:
     """Obtiene alimentos dentro de un rango de calorías."""
+    catalog = get_food_catalog(db)
+    if catalog is not None:
+        return catalog.get_by_kcal_range(min_kcal, max_kcal, limit, exclude_allergens)
     foods_collection = db["foods"]
     foods = list(foods_collection.find(
-        {"kcal_per_100g": {"$gte": min_kcal, "$lte": max_kcal}}
+        {"kcal_per_100g": {"$gte": min_kcal, "$lte": max_kcal}, **safe_foods_query(exclude_allergens)}
     ).limit(limit))
     
     for food in foods:
@@ -85,12 +188,17 @@ def get_foods_by_calories_range(db, min_kcal: float, max_kcal: float, limit: int
 def update_food(db, name: str, update_data: dict) -> bool:
     """Actualiza un alimento existente."""
     foods_collection = db["foods"]
+    update = _update_document(update_data)
     try:
-        result = foods_collection.update_one(
-            {"name": {"$regex": f"^{name}$", "$options": "i"}},
-            {"$set": update_data}
+        updated = foods_collection.find_one_and_update(
+            _name_query(name), update, projection=_UPDATED_PROJECTION, return_document=ReturnDocument.AFTER
         )
-        return result.modified_count > 0
+        if updated is None:
+            return False
+        if "$unset" in update:
+            foods_collection.update_one(*_vector_update(updated))
+        _refresh_catalog(db, str(updated["_id"]))
+        return True
     except Exception as e:
         print(f"Error al actualizar alimento: {str(e)}")
         return False
@@ -99,10 +207,17 @@ def delete_food(db, name: str) -> bool:
     """Elimina un alimento de la colección."""
     foods_collection = db["foods"]
     try:
-        result = foods_collection.delete_one(
-            {"name": {"$regex": f"^{name}$", "$options": "i"}}
+        deleted = foods_collection.find_one_and_delete(
+            _name_query(name),
+            projection={"_id": 1}
         )
-        return result.deleted_count > 0
+        if deleted is None:
+            return False
+        forget_food(str(deleted["_id"]))
+        catalog = get_food_catalog(db)
+        if catalog is not None:
+            catalog.remove(str(deleted["_id"]))
+        return True
     except Exception as e:
         print(f"Error al eliminar alimento: {str(e)}")
         return False
@@ -116,10 +231,10 @@ def create_or_update_food(db, food: Food) -> Optional[str]:
     try:
         # Buscar si ya existe
         existing = foods_collection.find_one(
-            {"name": {"$regex": f"^{food.name}$", "$options": "i"}}
+            _name_query(food.name)
         )
         
-        food_dict = food.model_dump()
+        food_dict = _food_document(food)
         food_dict["updated_at"] = datetime.now()
         
         if existing:
@@ -128,20 +243,27 @@ def create_or_update_food(db, food: Food) -> Optional[str]:
                 {"_id": existing["_id"]},
                 {"$set": food_dict}
             )
-            return str(existing["_id"])
+            food_id = str(existing["_id"])
         else:
             # Crear nuevo
             result = foods_collection.insert_one(food_dict)
-            return str(result.inserted_id)
+            food_id = str(result.inserted_id)
+        _refresh_catalog(db, food_id)
+        return food_id
     except Exception as e:
         print(f"Error al crear/actualizar alimento: {str(e)}")
         return None
 
 def get_food_id_by_name(db, name: str) -> Optional[str]:
     """Obtiene el ID de un alimento por nombre (case-insensitive)."""
+    catalog = get_food_catalog(db)
+    if catalog is not None:
+        food = catalog.get_by_name(name)
+        if food:
+            return food["_id"]
     foods_collection = db["foods"]
     food = foods_collection.find_one(
-        {"name": {"$regex": f"^{name}$", "$options": "i"}}
+        _name_query(name)
     )
     if food:
         return str(food["_id"])
@@ -150,6 +272,11 @@ def get_food_id_by_name(db, name: str) -> Optional[str]:
 def get_food_by_id(db, food_id: str) -> Optional[dict]:
     """Obtiene un alimento por su ID."""
     from bson.objectid import ObjectId
+    catalog = get_food_catalog(db)
+    if catalog is not None:
+        food = catalog.get_by_id(food_id)
+        if food:
+            return food
     foods_collection = db["foods"]
     try:
         food = foods_collection.find_one({"_id": ObjectId(food_id)})
@@ -167,4 +294,197 @@ def get_all_foods(db, limit: int = 100) -> List[dict]:
     for food in foods:
         if "_id" in food:
             food["_id"] = str(food["_id"])
-    return foods
\ No newline at end of file
+    return foods
+
+
+class FoodRepository:
+    """
+    Versión asíncrona de las funciones de este módulo, sobre `AsyncMongoClient`
+    (ver `repository/driver/mongodb.py`), con la misma semántica.
+
+    El catálogo en memoria y el índice de trigramas se cargan con el cliente síncrono: si se
+    pasa `sync_db` se usan igual que en las funciones (en un hilo, para no bloquear el bucle);
+    sin él, todas las lecturas van a Mongo y `search` solo usa el índice de texto.
+    """
+
+    def __init__(self, db, sync_db=None):
+        self.collection = db["foods"]
+        self.sync_db = sync_db
+
+    async def _catalog(self):
+        if self.sync_db is None:
+            return None
+        return await asyncio.to_thread(get_food_catalog, self.sync_db)
+
+    async def _refresh_catalog(self, food_id: str):
+        if self.sync_db is not None:
+            await asyncio.to_thread(_refresh_catalog, self.sync_db, food_id)
+
+    @staticmethod
+    async def _to_list(cursor) -> List[dict]:
+        foods = await cursor.to_list()
+        for food in foods:
+            if "_id" in food:
+                food["_id"] = str(food["_id"])
+        return foods
+
+    async def save(self, food: Food) -> bool:
+        """Guarda un alimento/receta en la colección 'foods'."""
+        try:
+            result = await self.collection.insert_one(_food_document(food))
+            await self._refresh_catalog(str(result.inserted_id))
+            return True
+        except Exception as e:
+            print(f"Error al guardar alimento: {str(e)}")
+            return False
+
+    async def get_by_name(self, name: str) -> Optional[dict]:
+        """Obtiene un alimento por nombre."""
+        catalog = await self._catalog()
+        if catalog is not None:
+            food = catalog.get_by_name(name)
+            if food:
+                return food
+        food = await self.collection.find_one(_name_query(name))
+        if food:
+            food["_id"] = str(food["_id"])
+        return food
+
+    async def get_id_by_name(self, name: str) -> Optional[str]:
+        """Obtiene el ID de un alimento por nombre (case-insensitive)."""
+        catalog = await self._catalog()
+        if catalog is not None:
+            food = catalog.get_by_name(name)
+            if food:
+                return food["_id"]
+        food = await self.collection.find_one(_name_query(name), {"_id": 1})
+        return str(food["_id"]) if food else None
+
+    async def get_by_id(self, food_id: str) -> Optional[dict]:
+        """Obtiene un alimento por su ID."""
+        catalog = await self._catalog()
+        if catalog is not None:
+            food = catalog.get_by_id(food_id)
+            if food:
+                return food
+        try:
+            food = await self.collection.find_one({"_id": ObjectId(food_id)})
+            if food:
+                food["_id"] = str(food["_id"])
+            return food
+        except Exception as e:
+            print(f"Error al obtener alimento: {str(e)}")
+            return None
+
+    async def search(self, query: str, limit: int = 20, fuzzy: bool = True, exclude_allergens: int = 0) -> List[dict]:
+        """Como `search_foods`: índice de texto y, si faltan resultados, trigramas (con `sync_db`)."""
+        score = {"$meta": "textScore"}
+        try:
+            foods = await self.collection.find(
+                {"$text": {"$search": query, "$language": "spanish"}, **safe_foods_query(exclude_allergens)},
+                {"score": score}
+            ).sort([("score", score)]).limit(limit).to_list()
+        except OperationFailure as e:
+            # Sin índice de texto (ver setup_mongodb.py): solo búsqueda aproximada
+            print(f"Búsqueda de texto no disponible: {e}")
+            foods = []
+
+        if fuzzy and self.sync_db is not None and len(foods) < limit:
+            seen = {food["_id"] for food in foods}
+            index = await asyncio.to_thread(get_food_search_index, self.sync_db)
+            matches = [
+                ObjectId(food_id) for food_id, _, _ in index.search(query, limit, exclude_allergens=exclude_allergens)
+                if ObjectId(food_id) not in seen
+            ][:limit - len(foods)]
+            by_id = {food["_id"]: food for food in await self.collection.find({"_id": {"$in": matches}}).to_list()}
+            foods += [by_id[food_id] for food_id in matches if food_id in by_id]
+
+        for food in foods:
+            if "_id" in food:
+                food["_id"] = str(food["_id"])
+        return foods
+
+    async def get_by_tag(self, tag: str, limit: int = 50, exclude_allergens: int = 0) -> List[dict]:
+        """Obtiene alimentos por etiqueta (ej: vegan, organic)."""
+        catalog = await self._catalog()
+        if catalog is not None:
+            return catalog.get_by_tag(tag, limit, exclude_allergens)
+        return await self._to_list(self.collection.find({"tags": tag, **safe_foods_query(exclude_allergens)}).limit(limit))
+
+    async def get_by_allergen(self, allergen: str, limit: int = 100) -> List[dict]:
+        """Obtiene alimentos que contienen un alérgeno (por su bit si está en la taxonomía)."""
+        bit = allergen_mask([allergen])
+        catalog = await self._catalog()
+        if catalog is not None:
+            return catalog.get_by_allergen(allergen, limit, bit)
+        query = {ALLERGEN_MASK_FIELD: {"$bitsAnySet": bit}} if bit else {"allergens": allergen}
+        return await self._to_list(self.collection.find(query).limit(limit))
+
+    async def get_by_calories_range(
+            self,
+            min_kcal: float,
+            max_kcal: float,
+            limit: int = 50,
+            exclude_allergens: int = 0
+    ) -> List[dict]:
+        """Obtiene alimentos dentro de un rango de calorías."""
+        catalog = await self._catalog()
+        if catalog is not None:
+            return catalog.get_by_kcal_range(min_kcal, max_kcal, limit, exclude_allergens)
+        return await self._to_list(self.collection.find(
+            {"kcal_per_100g": {"$gte": min_kcal, "$lte": max_kcal}, **safe_foods_query(exclude_allergens)}
+        ).limit(limit))
+
+    async def update(self, name: str, update_data: dict) -> bool:
+        """Actualiza un alimento existente."""
+        update = _update_document(update_data)
+        try:
+            updated = await self.collection.find_one_and_update(
+                _name_query(name), update, projection=_UPDATED_PROJECTION, return_document=ReturnDocument.AFTER
+            )
+            if updated is None:
+                return False
+            if "$unset" in update:
+                await self.collection.update_one(*_vector_update(updated))
+            await self._refresh_catalog(str(updated["_id"]))
+            return True
+        except Exception as e:
+            print(f"Error al actualizar alimento: {str(e)}")
+            return False
+
+    async def delete(self, name: str) -> bool:
+        """Elimina un alimento de la colección."""
+        try:
+            deleted = await self.collection.find_one_and_delete(_name_query(name), projection={"_id": 1})
+            if deleted is None:
+                return False
+            forget_food(str(deleted["_id"]))
+            catalog = await self._catalog()
+            if catalog is not None:
+                catalog.remove(str(deleted["_id"]))
+            return True
+        except Exception as e:
+            print(f"Error al eliminar alimento: {str(e)}")
+            return False
+
+    async def create_or_update(self, food: Food) -> Optional[str]:
+        """Crea o actualiza un alimento por nombre y retorna su ID."""
+        try:
+            existing = await self.collection.find_one(_name_query(food.name), {"_id": 1})
+            food_dict = _food_document(food)
+            food_dict["updated_at"] = datetime.now()
+            if existing:
+                await self.collection.update_one({"_id": existing["_id"]}, {"$set": food_dict})
+                food_id = str(existing["_id"])
+            else:
+                result = await self.collection.insert_one(food_dict)
+                food_id = str(result.inserted_id)
+            await self._refresh_catalog(food_id)
+            return food_id
+        except Exception as e:
+            print(f"Error al crear/actualizar alimento: {str(e)}")
+            return None
+
+    async def get_all(self, limit: int = 100) -> List[dict]:
+        """Obtiene todos los alimentos en la colección."""
+        return await self._to_list(self.collection.find().limit(limit))
@@ -0,0 +1,395 @@
+"""
+Colecciones e indices declarados, reconciliacion con la base de datos y asesor de consultas.
+
+`COLLECTION_SPECS` es la fuente de verdad de las colecciones (con sus opciones time-series)
+y de sus indices. `index_drift(db)` compara lo declarado con `list_indexes()`:
+
+- "collection_missing": la coleccion no existe,
+- "options": la coleccion existe con otras opciones time-series (no se puede corregir sin
+  reescribirla, ver `migrations.rewrite_collection`),
+- "missing": falta el indice,
+- "different": existe con el mismo nombre y otra definicion, o con otro nombre y las mismas claves,
+- "extra": existe un indice que no esta declarado.
+
+`reconcile_indexes(db)` corrige todo menos "options" y "extra" (estos solo con
+`drop_extra=True`) y es idempotente: una segunda ejecucion no encuentra diferencias.
+
+`QUERY_SHAPES` recoge la forma de las consultas de los repositorios, con valores de ejemplo
+y los mismos pipelines que usan. `explain_query_shapes(db)` ejecuta `explain` de cada una y
+marca las que el plan ganador resuelve con COLLSCAN (salvo las que recorren la coleccion a
+proposito). `scripts/setup_mongodb.py --check` falla si hay diferencias o COLLSCAN, para
+detectar consultas sin indice antes de desplegar.
+"""
+
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Callable, Literal, Optional
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, TEXT, IndexModel
+from pymongo.errors import OperationFailure
+
+from bionexo.repository.analytics import intake_stats_pipeline, wellness_stats_pipeline
+from bionexo.repository.correlations import CORRELATION_STATS_COLLECTION
+from bionexo.repository.daily_rollups import DAILY_ROLLUPS_COLLECTION
+from bionexo.repository.food_search import FOOD_TEXT_INDEX_NAME, FOOD_TEXT_WEIGHTS
+from bionexo.repository.nutrition_totals import nutrient_totals_pipeline
+from bionexo.repository.user_meals import USER_MEALS_COLLECTION
+
+# Opciones de indice que se comparan al buscar diferencias
+_COMPARED_OPTIONS = ("unique", "sparse", "partialFilterExpression", "expireAfterSeconds", "default_language")
+
+DriftStatus = Literal["collection_missing", "options", "missing", "different", "extra"]
+
+
+@dataclass
+class IndexSpec:
+    name: str
+    keys: list[tuple[str, Any]]
+    options: dict = field(default_factory=dict)
+
+    @property
+    def is_text(self) -> bool:
+        return any(direction == TEXT for _, direction in self.keys)
+
+    def model(self) -> IndexModel:
+        return IndexModel(self.keys, name=self.name, **self.options)
+
+    def key_document(self) -> dict:
+        """Claves como las devuelve `list_indexes()`."""
+        if self.is_text:
+            # Los indices de texto se guardan como {_fts, _ftsx} mas los campos no textuales
+            return {"_fts": "text", "_ftsx": 1}
+        return dict(self.keys)
+
+    def differences(self, existing: dict) -> list[str]:
+        """Diferencias con un indice de `list_indexes()` (vacia si coincide)."""
+        differences = []
+        if dict(existing["key"]) != self.key_document():
+            differences.append(f"claves {dict(existing['key'])} != {self.key_document()}")
+        if self.is_text and dict(existing.get("weights") or {}) != self.options.get("weights"):
+            differences.append(f"pesos {existing.get('weights')} != {self.options.get('weights')}")
+        for option in _COMPARED_OPTIONS:
+            if option == "default_language" and not self.is_text:
+                continue
+            expected, found = self.options.get(option), existing.get(option)
+            if option in ("unique", "sparse"):
+                expected, found = bool(expected), bool(found)
+            if expected != found:
+                differences.append(f"{option} {found!r} != {expected!r}")
+        return differences
+
+
+@dataclass
+class CollectionSpec:
+    name: str
+    indexes: list[IndexSpec] = field(default_factory=list)
+    options: dict = field(default_factory=dict)  # Opciones de creacion (`timeseries`)
+    description: str = ""
+
+    @property
+    def timeseries(self) -> Optional[dict]:
+        return self.options.get("timeseries")
+
+
+@dataclass
+class IndexDrift:
+    collection: str
+    index: Optional[str]
+    status: DriftStatus
+    detail: str = ""
+    existing: Optional[str] = None  # Nombre del indice existente con el que choca
+
+    def __str__(self) -> str:
+        target = f"{self.collection}.{self.index}" if self.index else self.collection
+        return f"{self.status}: {target}" + (f" ({self.detail})" if self.detail else "")
+
+
+def _timeseries(meta: str = "user_id", time: str = "timestamp") -> dict:
+    return {"timeseries": {"timeField": time, "metaField": meta, "granularity": "minutes"}}
+
+
+COLLECTION_SPECS: list[CollectionSpec] = [
+    CollectionSpec("users", [
+        IndexSpec("email_1", [("email", ASCENDING)], {"unique": True}),
+    ], description="Información de usuarios"),
+    CollectionSpec("intakes", [
+        IndexSpec("user_id_1_timestamp_1", [("user_id", ASCENDING), ("timestamp", ASCENDING)]),
+        # Consultas de todos los usuarios por fechas (informe nocturno de RDI, exportaciones)
+        IndexSpec("timestamp_1", [("timestamp", ASCENDING)]),
+    ], _timeseries(), "Registro de comidas (timeseries)"),
+    CollectionSpec("foods", [
+        IndexSpec("name_1", [("name", ASCENDING)], {"unique": True}),
+        # Búsquedas por nombre sin distinguir mayúsculas (`foods._name_query`)
+        IndexSpec("name_normalized_1", [("name_normalized", ASCENDING)]),
+        IndexSpec(FOOD_TEXT_INDEX_NAME, [(name, TEXT) for name in FOOD_TEXT_WEIGHTS], {
+            "weights": FOOD_TEXT_WEIGHTS, "default_language": "spanish",
+        }),
+        # Sondeo de cambios del catálogo en memoria y del índice de búsqueda
+        IndexSpec("updated_at_1", [("updated_at", ASCENDING)]),
+        IndexSpec("tags_1", [("tags", ASCENDING)]),
+        IndexSpec("allergens_1", [("allergens", ASCENDING)]),
+        IndexSpec("allergen_mask_1", [("allergen_mask", ASCENDING)]),
+        IndexSpec("kcal_per_100g_1", [("kcal_per_100g", ASCENDING)]),
+    ], description="Recetas y alimentos"),
+    CollectionSpec("wellness_logs", [
+        IndexSpec("user_id_1_timestamp_-1", [("user_id", ASCENDING), ("timestamp", DESCENDING)]),
+    ], _timeseries(), "Registro de síntomas (timeseries)"),
+    CollectionSpec(DAILY_ROLLUPS_COLLECTION, [
+        IndexSpec("user_id_local_date", [("user_id", ASCENDING), ("local_date", ASCENDING)], {"unique": True}),
+    ], description="Resúmenes diarios por usuario"),
+    CollectionSpec(USER_MEALS_COLLECTION, [
+        IndexSpec("user_id_name", [("user_id", ASCENDING), ("name_normalized", ASCENDING)], {"unique": True}),
+        IndexSpec("user_id_count", [("user_id", ASCENDING), ("count", DESCENDING)]),
+        IndexSpec("user_id_last_used", [("user_id", ASCENDING), ("last_used_at", DESCENDING)]),
+    ], description="Comidas usadas por cada usuario"),
+    CollectionSpec(CORRELATION_STATS_COLLECTION, [
+        IndexSpec("user_id_1", [("user_id", ASCENDING)], {"unique": True}),
+    ], description="Estadísticas incrementales de correlaciones"),
+    CollectionSpec("migrations", [
+        # Avance de las migraciones particionadas
+        IndexSpec("parent_1", [("parent", ASCENDING)]),
+    ], description="Checkpoints de los scripts de migración"),
+    CollectionSpec("migrations_staging", [
+        IndexSpec("migration_1", [("migration", ASCENDING)]),
+    ], description="Lotes en curso de las migraciones que sustituyen documentos"),
+]
+
+
+def get_collection_spec(name: str) -> CollectionSpec:
+    for spec in COLLECTION_SPECS:
+        if spec.name == name:
+            return spec
+    raise KeyError(f"Colección sin especificación de índices: {name}")
+
+
+# --- Diferencias y reconciliacion ---
+
+def _collection_options(db, name: str) -> Optional[dict]:
+    for info in db.list_collections(filter={"name": name}):
+        return dict(info.get("options") or {})
+    return None
+
+
+def _is_automatic(spec: CollectionSpec, index: dict) -> bool:
+    """Indices que crea MongoDB: `_id_` y el de (metaField, timeField) de las time-series."""
+    if index["name"] == "_id_":
+        return True
+    timeseries = spec.timeseries
+    if timeseries and timeseries.get("metaField"):
+        automatic = {timeseries["metaField"]: 1, timeseries["timeField"]: 1}
+        return dict(index["key"]) == automatic and list(index["key"]) == list(automatic)
+    return False
+
+
+def collection_drift(db, spec: CollectionSpec, names: Optional[list[str]] = None) -> list[IndexDrift]:
+    """Diferencias de una coleccion (solo de los indices `names` si se indican)."""
+    options = _collection_options(db, spec.name)
+    if options is None:
+        return [IndexDrift(spec.name, None, "collection_missing")]
+    drift = []
+    if spec.timeseries:
+        found = {k: v for k, v in (options.get("timeseries") or {}).items() if k in spec.timeseries}
+        if found != spec.timeseries:
+            drift.append(IndexDrift(spec.name, None, "options", f"timeseries {options.get('timeseries')} != {spec.timeseries}"))
+
+    existing = {index["name"]: index for index in db[spec.name].list_indexes()}
+    declared = [index for index in spec.indexes if names is None or index.name in names]
+    matched = set()
+    for index in declared:
+        current = existing.get(index.name)
+        if current is None:
+            # Mismas claves con otro nombre: crear el declarado chocaria con el existente
+            same_keys = next(
+                (other for other in existing.values()
+                 if other["name"] != "_id_" and dict(other["key"]) == index.key_document()),
+                None
+            )
+            if same_keys is not None:
+                matched.add(same_keys["name"])
+                drift.append(IndexDrift(spec.name, index.name, "different", f"existe como '{same_keys['name']}'", same_keys["name"]))
+            else:
+                drift.append(IndexDrift(spec.name, index.name, "missing"))
+            continue
+        matched.add(index.name)
+        differences = index.differences(current)
+        if differences:
+            drift.append(IndexDrift(spec.name, index.name, "different", "; ".join(differences), index.name))
+
+    if names is None:
+        for name, index in existing.items():
+            if name not in matched and not _is_automatic(spec, index):
+                drift.append(IndexDrift(spec.name, name, "extra", str(dict(index["key"]))))
+    return drift
+
+
+def index_drift(db, specs: Optional[list[CollectionSpec]] = None) -> list[IndexDrift]:
+    """Diferencias entre lo declarado y la base de datos; vacia si esta al dia."""
+    drift = []
+    for spec in specs or COLLECTION_SPECS:
+        drift += collection_drift(db, spec)
+    return drift
+
+
+def _apply(db, spec: CollectionSpec, drift: list[IndexDrift], drop_extra: bool, log: Callable[[str], None]):
+    collection = db[spec.name]
+    by_name = {index.name: index for index in spec.indexes}
+    if any(item.status == "collection_missing" for item in drift):
+        db.create_collection(spec.name, **spec.options)
+        log(f"✅ Colección '{spec.name}' creada")
+        # Las time-series ya traen su indice automatico; el resto se crea abajo
+        drift = [item for item in collection_drift(db, spec) if item.status != "extra"]
+    to_create = []
+    for item in drift:
+        if item.status == "different" and item.existing:
+            collection.drop_index(item.existing)
+            log(f"🗑️ Índice '{spec.name}.{item.existing}' eliminado para recrearlo ({item.detail})")
+        if item.status in ("missing", "different"):
+            to_create.append(by_name[item.index].model())
+        elif item.status == "extra" and drop_extra:
+            collection.drop_index(item.index)
+            log(f"🗑️ Índice no declarado '{spec.name}.{item.index}' eliminado")
+        elif item.status == "options":
+            log(f"⚠️ {item}: hay que reescribir la colección para cambiarlas")
+    if to_create:
+        created = collection.create_indexes(to_create)
+        log(f"✅ Índices en '{spec.name}': {', '.join(created)}")
+
+
+def reconcile_indexes(
+        db,
+        specs: Optional[list[CollectionSpec]] = None,
+        *,
+        dry_run: bool = False,
+        drop_extra: bool = False,
+        log: Callable[[str], None] = print
+) -> list[IndexDrift]:
+    """
+    Crea las colecciones e indices que faltan y recrea los que difieren. Devuelve las
+    diferencias encontradas antes de corregirlas. En dry-run solo las informa.
+    """
+    found = []
+    for spec in specs or COLLECTION_SPECS:
+        drift = collection_drift(db, spec)
+        found += drift
+        for item in drift:
+            log(f"  {'[DRY] ' if dry_run else ''}{item}")
+        if drift and not dry_run:
+            _apply(db, spec, drift, drop_extra, log)
+    return found
+
+
+def ensure_indexes(db, collection: str, names: Optional[list[str]] = None):
+    """Crea (o recrea si difieren) los indices declarados de una coleccion, sin borrar otros."""
+    spec = get_collection_spec(collection)
+    drift = [item for item in collection_drift(db, spec, names) if item.status in ("missing", "different")]
+    if drift:
+        _apply(db, spec, drift, drop_extra=False, log=lambda message: None)
+
+
+# --- Asesor de consultas ---
+
+@dataclass
+class QueryShape:
+    name: str
+    collection: str
+    filter: Optional[dict] = None
+    sort: Optional[list[tuple[str, int]]] = None
+    pipeline: Optional[list[dict]] = None
+    allow_collscan: bool = False  # Recorridos completos intencionados (trabajos nocturnos, cargas)
+
+    def command(self) -> dict:
+        if self.pipeline is not None:
+            return {"aggregate": self.collection, "pipeline": self.pipeline, "cursor": {}}
+        command = {"find": self.collection, "filter": self.filter or {}}
+        if self.sort:
+            command["sort"] = dict(self.sort)
+        return command
+
+
+@dataclass
+class QueryPlanReport:
+    shape: QueryShape
+    stages: list[str] = field(default_factory=list)
+    indexes: list[str] = field(default_factory=list)
+    error: Optional[str] = None
+
+    @property
+    def collscan(self) -> bool:
+        return "COLLSCAN" in self.stages
+
+    @property
+    def flagged(self) -> bool:
+        return self.error is None and self.collscan and not self.shape.allow_collscan
+
+
+def query_shapes() -> list[QueryShape]:
+    """Consultas de los repositorios con valores de ejemplo (los planes dependen de la forma, no de los valores)."""
+    user_id = "advisor@bionexo.local"
+    end = datetime.now()
+    start = end - timedelta(days=30)
+    return [
+        QueryShape("users.login", "users", {"email": user_id, "password": "x"}),
+        QueryShape("users.all_recommendations", "users", {}, allow_collscan=True),
+        QueryShape("intakes.recent", "intakes", {"user_id": user_id}, [("timestamp", DESCENDING)]),
+        QueryShape("intakes.range", "intakes", {"user_id": user_id, "timestamp": {"$gte": start, "$lt": end}}, [("timestamp", ASCENDING)]),
+        QueryShape("intakes.stats", "intakes", pipeline=intake_stats_pipeline(user_id, start, end)),
+        QueryShape("intakes.nutrient_totals", "intakes", pipeline=nutrient_totals_pipeline(user_id, start, end)),
+        QueryShape("intakes.nightly_rdi", "intakes", pipeline=[
+            {"$match": {"timestamp": {"$gte": start, "$lt": end}, "food_id": {"$type": "string"}, "quantity": {"$gt": 0}}},
+            {"$group": {"_id": {"user_id": "$user_id", "food_id": "$food_id"}, "grams": {"$sum": "$quantity"}}},
+        ]),
+        QueryShape("intakes.export", "intakes", {"timestamp": {"$gt": start}}, [("user_id", ASCENDING), ("timestamp", ASCENDING)]),
+        QueryShape("wellness_logs.recent", "wellness_logs", {"user_id": user_id}, [("timestamp", DESCENDING)]),
+        QueryShape("wellness_logs.stats", "wellness_logs", pipeline=wellness_stats_pipeline(user_id, start, end)),
+        QueryShape("foods.by_id", "foods", {"_id": ObjectId()}),
+        QueryShape("foods.by_ids", "foods", {"_id": {"$in": [ObjectId(), ObjectId()]}}),
+        QueryShape("foods.by_name", "foods", {"name_normalized": "pollo"}),
+        QueryShape("foods.text_search", "foods", {"$text": {"$search": "pollo"}}),
+        QueryShape("foods.by_tag", "foods", {"tags": "vegan", "allergen_mask": {"$bitsAllClear": 1}}),
+        QueryShape("foods.by_allergen", "foods", {"allergen_mask": {"$bitsAnySet": 64}}),
+        QueryShape("foods.by_allergen_term", "foods", {"allergens": "cacahuete"}),
+        QueryShape("foods.by_kcal", "foods", {"kcal_per_100g": {"$gte": 100, "$lte": 200}}),
+        QueryShape("foods.changed_since", "foods", {"updated_at": {"$gt": start}}, [("updated_at", ASCENDING)]),
+        QueryShape("foods.all", "foods", {}, allow_collscan=True),
+        QueryShape("daily_rollups.range", DAILY_ROLLUPS_COLLECTION, {
+            "user_id": user_id, "local_date": {"$gte": start.date().isoformat(), "$lte": end.date().isoformat()},
+        }, [("local_date", ASCENDING)]),
+        QueryShape("user_meals.top", USER_MEALS_COLLECTION, {"user_id": user_id}, [("count", DESCENDING), ("last_used_at", DESCENDING)]),
+        QueryShape("user_meals.prefix", USER_MEALS_COLLECTION, {"user_id": user_id, "name_normalized": {"$regex": "^pol"}}),
+        QueryShape("correlation_stats.by_user", CORRELATION_STATS_COLLECTION, {"user_id": user_id}),
+        QueryShape("migrations.partitions", "migrations", {"parent": "advisor"}),
+    ]
+
+
+def _walk_plans(node: Any, stages: list[str], indexes: list[str], in_plan: bool = False):
+    if isinstance(node, dict):
+        if in_plan:
+            if "stage" in node:
+                stages.append(node["stage"])
+            if node.get("indexName"):
+                indexes.append(node["indexName"])
+        for key, value in node.items():
+            # Se ignoran los planes rechazados: solo cuenta el ganador
+            if key == "rejectedPlans":
+                continue
+            _walk_plans(value, stages, indexes, in_plan or key == "winningPlan")
+    elif isinstance(node, list):
+        for item in node:
+            _walk_plans(item, stages, indexes, in_plan)
+
+
+def explain_query_shape(db, shape: QueryShape) -> QueryPlanReport:
+    report = QueryPlanReport(shape)
+    try:
+        explain = db.command("explain", shape.command(), verbosity="queryPlanner")
+    except OperationFailure as e:
+        report.error = str(e)
+        return report
+    _walk_plans(explain, report.stages, report.indexes)
+    return report
+
+
+def explain_query_shapes(db, shapes: Optional[list[QueryShape]] = None) -> list[QueryPlanReport]:
+    """Plan ganador de cada consulta; `flagged` marca las que recorren la coleccion entera."""
+    return [explain_query_shape(db, shape) for shape in shapes or query_shapes()]
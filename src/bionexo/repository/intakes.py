@@ -0,0 +1,173 @@
+"""
+Repositorio asincrono de ingestas (`intakes`), con la misma semantica que `save_intake`,
+`get_intakes_from_db`, `get_unique_meal_names_from_db` y `get_ingredients_for_meal` de
+`infrastructure/utils/db.py`: el alimento se crea o reutiliza por nombre y se actualizan el
+resumen diario, el indice de comidas del usuario y la cache de lecturas.
+"""
+
+import asyncio
+from datetime import datetime
+from typing import List, Optional
+
+from bson import ObjectId
+
+from bionexo.domain.entity.intake import Intake
+from bionexo.infrastructure.utils.db import intake_derived_writes, intake_document, intake_food, intake_from_document
+from bionexo.infrastructure.utils.query_cache import invalidate_user
+from bionexo.repository.daily_rollups import DAILY_ROLLUPS_COLLECTION, intake_rollup_update, rollup_key
+from bionexo.repository.driver.mongodb import insert_many_unordered
+from bionexo.repository.foods import FoodRepository
+from bionexo.repository.nutrient_interactions import InteractionReport, evaluate_meal_interactions, meal_vector
+from bionexo.repository.nutrition_totals import FOOD_VECTOR_PROJECTION
+from bionexo.repository.user_meals import (
+    SAFE_MEALS_OVERFETCH, USER_MEALS_COLLECTION, MealOrder, drop_unsafe_meals, meal_use_update,
+    safe_meal_foods_query, user_meals_query
+)
+
+
+class IntakeRepository:
+    def __init__(self, db, foods: Optional[FoodRepository] = None, tz: str = "Europe/Madrid"):
+        self.db = db
+        self.collection = db["intakes"]
+        self.foods = foods or FoodRepository(db)
+        self.tz = tz
+
+    async def prepare(self, intake: Intake, food_ids: Optional[dict[str, Optional[str]]] = None) -> dict:
+        """
+        Documento listo para insertar, con `food_id` (crea el alimento si no existe).
+        `food_ids` reutiliza los ids ya resueltos en el mismo lote.
+        """
+        if intake.image_data:
+            # Comprimir la imagen es CPU: fuera del bucle de eventos
+            intake_dict = await asyncio.to_thread(intake_document, intake)
+        else:
+            intake_dict = intake_document(intake)
+        key = intake.food_name.strip().lower()
+        if food_ids is not None and key in food_ids:
+            food_id = food_ids[key]
+        else:
+            food_id = await self.foods.get_id_by_name(intake.food_name) \
+                or await self.foods.create_or_update(intake_food(intake))
+            if food_ids is not None:
+                food_ids[key] = food_id
+        if food_id:
+            intake_dict["food_id"] = food_id
+        return intake_dict
+
+    async def after_insert(self, intake_dict: dict):
+        """
+        Resumen diario, indice de comidas y cache tras insertar una ingesta. Los fallos se
+        informan sin propagarse (ver `apply_derived_write`).
+        """
+        try:
+            await self.db[DAILY_ROLLUPS_COLLECTION].update_one(
+                rollup_key(intake_dict, self.tz), intake_rollup_update(intake_dict, self.tz), upsert=True
+            )
+        except Exception as e:
+            print(f"Error actualizando el resumen diario (el registro sí se guardó): {str(e)}")
+        meal_use = meal_use_update(
+            intake_dict["user_id"], intake_dict["food_name"], intake_dict["timestamp"], intake_dict.get("food_id")
+        )
+        if meal_use is not None:
+            try:
+                await self.db[USER_MEALS_COLLECTION].update_one(*meal_use, upsert=True)
+            except Exception as e:
+                print(f"Error actualizando el índice de comidas (el registro sí se guardó): {str(e)}")
+        invalidate_user(intake_dict["user_id"], "intakes")
+
+    async def save(self, intake: Intake) -> bool:
+        try:
+            intake_dict = await self.prepare(intake)
+            await self.collection.insert_one(intake_dict)
+        except Exception as e:
+            print(f"Error al guardar ingesta: {str(e)}")
+            return False
+        await self.after_insert(intake_dict)
+        return True
+
+    async def save_many(self, intakes: List[Intake]) -> tuple[int, list[dict]]:
+        """
+        Guarda un lote con un `insert_many` y un `bulk_write` por resumen diario e indice de
+        comidas, en vez de cuatro operaciones por ingesta. Devuelve las insertadas y los
+        errores (`index` en `intakes`).
+        """
+        food_ids: dict[str, Optional[str]] = {}
+        docs, errors, positions = [], [], []
+        for i, intake in enumerate(intakes):
+            try:
+                docs.append(await self.prepare(intake, food_ids))
+                positions.append(i)
+            except Exception as e:
+                errors.append({"index": i, "error": str(e)})
+        inserted, insert_errors = await insert_many_unordered(self.collection, docs)
+        errors += [{**error, "index": positions[error["index"]]} for error in insert_errors]
+        await self.after_insert_many(inserted)
+        return len(inserted), errors
+
+    async def after_insert_many(self, intake_dicts: list[dict]):
+        """Como `after_insert` para un lote, con un `bulk_write` por coleccion."""
+        if not intake_dicts:
+            return
+        for name, operations in intake_derived_writes(intake_dicts, self.tz).items():
+            if operations:
+                try:
+                    await self.db[name].bulk_write(operations, ordered=False)
+                except Exception as e:
+                    print(f"Error actualizando '{name}' (los registros sí se guardaron): {str(e)}")
+        for user_id in {intake_dict["user_id"] for intake_dict in intake_dicts}:
+            invalidate_user(user_id, "intakes")
+
+    async def get_recent(self, user_id: str, limit: int = 50) -> List[Intake]:
+        """Ingestas del usuario, ordenadas por timestamp descendente."""
+        intakes = await self.collection.find({"user_id": user_id}).sort("timestamp", -1).limit(limit).to_list()
+        return [intake_from_document(intake) for intake in intakes]
+
+    async def get_unique_meal_names(
+            self,
+            user_id: str,
+            limit: int = 50,
+            order: MealOrder = "frequency",
+            prefix: Optional[str] = None,
+            exclude_allergens: int = 0
+    ) -> list[str]:
+        """Como `get_user_meals`: con alergenos, pagina el cursor hasta tener `limit` comidas seguras."""
+        query, projection, sort = user_meals_query(user_id, order, prefix)
+        if not exclude_allergens:
+            meals = await self.db[USER_MEALS_COLLECTION].find(query, projection).sort(sort).limit(limit).to_list()
+            return [meal["name"] for meal in meals]
+        page_size = limit * SAFE_MEALS_OVERFETCH
+        cursor = self.db[USER_MEALS_COLLECTION].find(query, projection).sort(sort).batch_size(page_size)
+        safe_meals: list[dict] = []
+        try:
+            while len(safe_meals) < limit:
+                meals = await cursor.to_list(page_size)
+                if not meals:
+                    break
+                safe = await self.db["foods"].find(safe_meal_foods_query(meals, exclude_allergens), {"_id": 1}).to_list()
+                safe_meals.extend(drop_unsafe_meals(meals, safe))
+        finally:
+            await cursor.close()
+        return [meal["name"] for meal in safe_meals[:limit]]
+
+    async def get_interactions(self, user_id: str, start: datetime, end: datetime) -> InteractionReport:
+        """
+        Sinergias y antagonismos de las ingestas del usuario en `[start, end)`, con las cantidades
+        totales de la ventana. Las ingestas sin `food_id` o sin gramos no cuentan.
+        """
+        grams: dict[str, float] = {}
+        async for intake in self.collection.find(
+                {"user_id": user_id, "timestamp": {"$gte": start, "$lt": end},
+                 "food_id": {"$type": "string"}, "quantity": {"$gt": 0}},
+                {"_id": 0, "food_id": 1, "quantity": 1}
+        ):
+            grams[intake["food_id"]] = grams.get(intake["food_id"], 0.0) + intake["quantity"]
+        object_ids = [ObjectId(food_id) for food_id in grams if ObjectId.is_valid(food_id)]
+        foods = await self.db["foods"].find({"_id": {"$in": object_ids}}, FOOD_VECTOR_PROJECTION).to_list() \
+            if object_ids else []
+        return evaluate_meal_interactions(meal_vector((food, grams[str(food["_id"])]) for food in foods))
+
+    async def get_ingredients_for_meal(self, meal_name: str) -> str:
+        food = await self.db["foods"].find_one({"name": meal_name}, {"ingredients": 1})
+        if food and "ingredients" in food:
+            return ", ".join(food["ingredients"])
+        return ""
@@ -0,0 +1,178 @@
+"""
+Motor de reglas de interacciones entre nutrientes (`data/nutrient_interactions.json`).
+
+El catalogo se carga una vez y se indexa por nutriente. Para evaluar una comida se obtiene
+el conjunto de nutrientes presentes en su vector y las reglas candidatas salen de la union
+de los indices de esos nutrientes; una regla se dispara si sus nutrientes son un subconjunto
+de los presentes y todas las cantidades alcanzan su umbral (`min_amounts`, en la unidad de
+la taxonomia). Para el historico, `evaluate_matrix` evalua muchas comidas a la vez por regla.
+La API lo aplica a las ingestas de una ventana en `GET /intakes/interactions`.
+"""
+
+import json
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from types import MappingProxyType
+from typing import Iterable, Optional
+
+import numpy as np
+
+from bionexo.domain.entity.interactions import (
+    AbsortionNutrientInteraction, MetabolicNutrientInteraction, NutrientInteractionProfile
+)
+from bionexo.repository.nutrient_vectors import NUTRIENT_ORDER, NUTRIENT_POSITION, document_vector
+
+NUTRIENT_INTERACTIONS_PATH = Path(os.getenv(
+    "BIONEXO_NUTRIENT_INTERACTIONS_PATH",
+    Path(__file__).parents[3] / "data" / "nutrient_interactions.json"
+))
+
+_INTERACTION_CLASSES = {
+    "absorption": AbsortionNutrientInteraction,
+    "metabolic": MetabolicNutrientInteraction,
+}
+
+
+@dataclass(frozen=True, slots=True)
+class InteractionRule:
+    """Regla compilada: la interaccion del dominio y sus umbrales alineados con `positions`."""
+    id: str
+    nutrients: frozenset[str]
+    positions: np.ndarray  # Posiciones en NUTRIENT_ORDER
+    min_amounts: np.ndarray  # Umbral por nutriente, mismo orden que `positions`
+    interaction: AbsortionNutrientInteraction | MetabolicNutrientInteraction
+
+    @property
+    def interaction_type(self) -> str:
+        return self.interaction.interaction_type
+
+
+@dataclass
+class InteractionReport:
+    synergies: list[InteractionRule]
+    antagonisms: list[InteractionRule]
+
+    @property
+    def rule_ids(self) -> list[str]:
+        return [rule.id for rule in (*self.synergies, *self.antagonisms)]
+
+    def to_dict(self) -> dict:
+        """Respuesta de la API: cada regla con su id y los campos de la interaccion."""
+        return {
+            kind: [{"id": rule.id, **rule.interaction.model_dump()} for rule in rules]
+            for kind, rules in (("synergies", self.synergies), ("antagonisms", self.antagonisms))
+        }
+
+    def to_profile(self) -> NutrientInteractionProfile:
+        return NutrientInteractionProfile(
+            interactions=[rule.interaction for rule in (*self.synergies, *self.antagonisms)]
+        )
+
+
+class NutrientInteractionEngine:
+    """Catalogo de reglas indexado por nutriente."""
+
+    def __init__(self, rules: Iterable[InteractionRule]):
+        self.rules: tuple[InteractionRule, ...] = tuple(rules)
+        self.by_id = MappingProxyType({rule.id: rule for rule in self.rules})
+        by_nutrient: dict[str, list[int]] = {}
+        for i, rule in enumerate(self.rules):
+            for nutrient_id in rule.nutrients:
+                by_nutrient.setdefault(nutrient_id, []).append(i)
+        self.by_nutrient = MappingProxyType({k: frozenset(v) for k, v in by_nutrient.items()})
+        # Solo importan los nutrientes que aparecen en alguna regla
+        self._watched = np.array(sorted(NUTRIENT_POSITION[n] for n in self.by_nutrient), dtype=np.int64)
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+    def rules_for(self, nutrient_id: str) -> list[InteractionRule]:
+        return [self.rules[i] for i in sorted(self.by_nutrient.get(nutrient_id, ()))]
+
+    def _present(self, vector: np.ndarray) -> frozenset[str]:
+        watched = self._watched[vector[self._watched] > 0]
+        return frozenset(NUTRIENT_ORDER[i] for i in watched)
+
+    def evaluate(self, vector: np.ndarray) -> InteractionReport:
+        """
+        Interacciones que se disparan para las cantidades totales de una comida o ventana
+        (vector en el orden de `NUTRIENT_ORDER`, no por 100g).
+        """
+        present = self._present(vector)
+        candidates: set[int] = set()
+        for nutrient_id in present:
+            candidates |= self.by_nutrient[nutrient_id]
+
+        report = InteractionReport(synergies=[], antagonisms=[])
+        for i in sorted(candidates):
+            rule = self.rules[i]
+            if rule.nutrients <= present and bool(np.all(vector[rule.positions] >= rule.min_amounts)):
+                if rule.interaction_type == "synergy":
+                    report.synergies.append(rule)
+                else:
+                    report.antagonisms.append(rule)
+        return report
+
+    def evaluate_matrix(self, matrix: np.ndarray) -> np.ndarray:
+        """
+        Evalua muchas comidas a la vez (filas de `matrix`, n_comidas x N_NUTRIENTS).
+        Devuelve una matriz booleana n_comidas x n_reglas en el orden de `self.rules`.
+        """
+        matrix = np.atleast_2d(matrix)
+        fired = np.zeros((matrix.shape[0], len(self.rules)), dtype=bool)
+        for i, rule in enumerate(self.rules):
+            fired[:, i] = np.all(matrix[:, rule.positions] >= rule.min_amounts, axis=1)
+        return fired
+
+
+def meal_vector(foods: Iterable[tuple[dict, float]]) -> np.ndarray:
+    """Vector de cantidades totales de una comida a partir de (documento de `foods`, gramos)."""
+    total = np.zeros(len(NUTRIENT_ORDER), dtype=np.float64)
+    for food_doc, grams in foods:
+        total += document_vector(food_doc) * (grams / 100.0)
+    return total
+
+
+def _compile_rule(raw: dict) -> InteractionRule:
+    kind = raw.get("kind", "absorption")
+    if kind not in _INTERACTION_CLASSES:
+        raise ValueError(f"Tipo de interaccion desconocido '{kind}' en la regla '{raw.get('id')}'")
+    unknown = [n for n in raw["nutrients"] if n not in NUTRIENT_POSITION]
+    if unknown:
+        raise ValueError(f"Nutrientes fuera de la taxonomia en la regla '{raw.get('id')}': {unknown}")
+
+    nutrients = sorted(set(raw["nutrients"]))
+    min_amounts = raw.get("min_amounts", {})
+    fields = {k: raw[k] for k in ("interaction_type", "effect_description", "affected_metabolic_pathways") if k in raw}
+    interaction = _INTERACTION_CLASSES[kind](nutrients=nutrients, **fields)
+
+    positions = np.array([NUTRIENT_POSITION[n] for n in nutrients], dtype=np.int64)
+    # Sin umbral basta con que el nutriente este presente
+    thresholds = np.array([min_amounts.get(n, np.nextafter(0, 1)) for n in nutrients], dtype=np.float64)
+    positions.setflags(write=False)
+    thresholds.setflags(write=False)
+    return InteractionRule(
+        id=raw.get("id") or "-".join(nutrients),
+        nutrients=frozenset(nutrients),
+        positions=positions,
+        min_amounts=thresholds,
+        interaction=interaction,
+    )
+
+
+def load_interaction_engine(json_path: Path = NUTRIENT_INTERACTIONS_PATH) -> NutrientInteractionEngine:
+    with open(json_path, encoding="utf-8") as f:
+        catalog = json.load(f)
+    return NutrientInteractionEngine(_compile_rule(raw) for raw in catalog.get("interactions", []))
+
+
+@lru_cache(maxsize=1)
+def get_interaction_engine() -> NutrientInteractionEngine:
+    """Motor compartido del proceso."""
+    return load_interaction_engine()
+
+
+def evaluate_meal_interactions(vector: np.ndarray, engine: Optional[NutrientInteractionEngine] = None) -> InteractionReport:
+    return (engine or get_interaction_engine()).evaluate(vector)
@@ -0,0 +1,285 @@
+"""
+Indice precompilado de la taxonomia de nutrientes de Open Food Facts (`data/nutrients_off.json`).
+
+El arbol JSON se aplana una sola vez en un indice inmutable con busquedas por id
+(ruta, unidad, importancia, padre, categoria de `NutrientMap` y clase `Nutrient` del dominio).
+El resultado compilado se guarda en un pickle en disco para que otros procesos
+(webapp, API, scripts) no tengan que volver a recorrer el arbol.
+"""
+
+import json
+import os
+import pickle
+import tempfile
+from dataclasses import dataclass
+from enum import Enum
+from functools import lru_cache
+from pathlib import Path
+from types import MappingProxyType
+from typing import Any, Iterator, Optional
+
+from bionexo.domain.entity.nutrients import (
+    AlcoholNutrient, CarboHydrateNutrient, LipidFattyAcidType, LipidType, LipidsNutrient, MineralCompound,
+    MineralMacro, MineralNutrient, MineralTrace, MineralType, Nutrient, ProteinNutrient, VitaminFatSoluble,
+    VitaminNutrient, VitaminType, VitaminWaterSoluble
+)
+from bionexo.repository.entity.open_food_facts import NutrientMap
+
+NUTRIENTS_OFF_PATH = Path(os.getenv(
+    "BIONEXO_NUTRIENTS_OFF_PATH",
+    Path(__file__).parents[3] / "data" / "nutrients_off.json"
+))
+CACHE_DIR = Path(os.getenv("BIONEXO_CACHE_DIR", Path.home() / ".cache" / "bionexo"))
+
+# Incrementar si cambia el formato compilado para invalidar los pickles existentes
+_INDEX_VERSION = 1
+
+# OFF guarda los valores `*_100g` de nutrientes con masa en gramos, aunque la taxonomia
+# indique la unidad de visualizacion (mg, µg)
+_OFF_GRAM_SCALES = {"mg": 1_000.0, "µg": 1_000_000.0}
+
+
+@dataclass(frozen=True, slots=True)
+class NutrientTaxonomyEntry:
+    """Nodo aplanado de la taxonomia OFF."""
+    id: str
+    name: str
+    unit: str
+    important: bool
+    display_in_edit_form: bool
+    parent: Optional[str]
+    path: tuple[str, ...]  # Ej: ("fat", "saturated-fat", "butyric-acid")
+    position: int  # Orden de aparicion en el arbol; define el orden estable de los nutrientes
+
+    @property
+    def map_key(self) -> str:
+        """Clave con el formato de `NutrientMap`: "fat.saturated-fat" o "vitamin-a"."""
+        return f"{self.parent}.{self.id}" if self.parent else self.id
+
+
+class NutrientTaxonomyIndex:
+    """
+    Indice inmutable de la taxonomia de nutrientes.
+    Todas las consultas son busquedas en diccionarios precalculados.
+    """
+
+    def __init__(self, compiled: dict[str, Any]):
+        self._compiled = compiled
+        entries: tuple[NutrientTaxonomyEntry, ...] = compiled["entries"]
+        self.entries = entries
+        self.ids: tuple[str, ...] = tuple(entry.id for entry in entries)
+        self.by_id = MappingProxyType({entry.id: entry for entry in entries})
+        self.children = MappingProxyType(compiled["children"])
+        self.categories = MappingProxyType(compiled["categories"])
+        self._factories = MappingProxyType(compiled["factories"])
+        self._off_scales = MappingProxyType(compiled["off_scales"])
+
+    def __reduce__(self):
+        return (NutrientTaxonomyIndex, (self._compiled,))
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, nutrient_id: str) -> bool:
+        return nutrient_id in self.by_id
+
+    def __iter__(self) -> Iterator[NutrientTaxonomyEntry]:
+        return iter(self.entries)
+
+    def get(self, nutrient_id: str) -> Optional[NutrientTaxonomyEntry]:
+        return self.by_id.get(nutrient_id)
+
+    def path(self, nutrient_id: str) -> tuple[str, ...]:
+        return self.by_id[nutrient_id].path
+
+    def unit(self, nutrient_id: str) -> str:
+        return self.by_id[nutrient_id].unit
+
+    def is_important(self, nutrient_id: str) -> bool:
+        return self.by_id[nutrient_id].important
+
+    def parent(self, nutrient_id: str) -> Optional[str]:
+        return self.by_id[nutrient_id].parent
+
+    def off_scale(self, nutrient_id: str) -> float:
+        """Factor para pasar un valor `*_100g` de OFF (en gramos) a la unidad del nutriente."""
+        return self._off_scales.get(nutrient_id, 1.0)
+
+    def category(self, nutrient_id: str) -> Optional[Enum]:
+        """Enum de `NutrientMap` del nutriente (o del ancestro mas cercano que lo tenga)."""
+        return self.categories.get(nutrient_id)
+
+    def nutrient_class(self, nutrient_id: str) -> Optional[type]:
+        """Clase `Nutrient` del dominio con la que se representa el nutriente."""
+        factory = self._factories.get(nutrient_id)
+        return factory[0] if factory else None
+
+    def to_domain_nutrient(
+            self,
+            nutrient_id: str,
+            amount_per_100g: Optional[float] = None,
+            amount_per_serving: Optional[float] = None
+    ) -> Optional[Nutrient]:
+        """Construye el `Nutrient` del dominio para un id OFF. None si el id no esta en la taxonomia."""
+        factory = self._factories.get(nutrient_id)
+        if factory is None:
+            return None
+        cls, extra = factory
+        entry = self.by_id[nutrient_id]
+        # Los modelos de Nutrient no aceptan None explicito en las cantidades
+        amounts = {}
+        if amount_per_100g is not None:
+            amounts["amount_per_100g"] = amount_per_100g
+        if amount_per_serving is not None:
+            amounts["amount_per_serving"] = amount_per_serving
+        return cls(id=entry.id, name=entry.name, unit=entry.unit, **amounts, **extra)
+
+    def map_nutriments(self, nutriments_100g: dict[str, float]) -> list[Nutrient]:
+        """
+        Convierte nutriments OFF por 100g (`{"iron": 0.004, ...}`) en nutrientes del dominio,
+        pasando las cantidades de gramos a la unidad de la taxonomia.
+        """
+        nutrients = []
+        for nutrient_id, amount in nutriments_100g.items():
+            nutrient = self.to_domain_nutrient(nutrient_id, amount_per_100g=amount * self.off_scale(nutrient_id))
+            if nutrient is not None:
+                nutrients.append(nutrient)
+        return nutrients
+
+
+def _flatten(nodes: list[dict], parent: Optional[str], path: tuple[str, ...], out: list[NutrientTaxonomyEntry]):
+    for node in nodes:
+        node_path = path + (node["id"],)
+        out.append(NutrientTaxonomyEntry(
+            id=node["id"],
+            name=node.get("name", node["id"]),
+            unit=node.get("unit", ""),
+            important=bool(node.get("important", False)),
+            display_in_edit_form=bool(node.get("display_in_edit_form", False)),
+            parent=parent,
+            path=node_path,
+            position=len(out),
+        ))
+        _flatten(node.get("nutrients", []), node["id"], node_path, out)
+
+
+def _category_maps() -> dict[str, Enum]:
+    nutrient_map = NutrientMap()
+    categories = {}
+    for mapping in (
+        nutrient_map.lipid_fatty_acid_type_map,
+        nutrient_map.carbohydrate_type_map,
+        nutrient_map.protein_map,
+        nutrient_map.vitamin_map,
+        nutrient_map.mineral_map,
+    ):
+        categories.update(mapping)
+    return categories
+
+
+def _factory_for(root_class: Optional[type], category: Optional[Enum]) -> tuple[type, dict[str, Any]]:
+    """Clase del dominio y argumentos extra (constantes) para construir el nutriente."""
+    if isinstance(category, (VitaminFatSoluble, VitaminWaterSoluble)):
+        vitamin_type = VitaminType.FatSoluble if isinstance(category, VitaminFatSoluble) else VitaminType.WaterSoluble
+        return VitaminNutrient, {"type": vitamin_type, "vitamin_class": category}
+    if isinstance(category, (MineralMacro, MineralTrace)):
+        mineral_type = MineralType.MacroMineral if isinstance(category, MineralMacro) else MineralType.TraceMineral
+        return MineralNutrient, {"type": mineral_type, "mineral_class": category}
+    if isinstance(category, MineralCompound):
+        # MineralNutrient.mineral_class no admite compuestos (sal, cafeina...)
+        return Nutrient, {}
+    if root_class is LipidsNutrient:
+        if isinstance(category, LipidFattyAcidType):
+            return LipidsNutrient, {"type": LipidType.FattyAcids, "fatty_acid_type": category}
+        return LipidsNutrient, {"type": LipidType.Triglycerides}
+    if root_class is CarboHydrateNutrient:
+        if category is not None:
+            return CarboHydrateNutrient, {"type": category}
+        return Nutrient, {}
+    if root_class is ProteinNutrient:
+        return ProteinNutrient, {"amino_acid_profile": []}
+    if root_class is AlcoholNutrient:
+        return AlcoholNutrient, {}
+    return Nutrient, {}
+
+
+def compile_nutrient_taxonomy(json_path: Path = NUTRIENTS_OFF_PATH) -> dict[str, Any]:
+    """Recorre el arbol JSON una vez y devuelve las tablas del indice (estructura picklable)."""
+    with open(json_path, encoding="utf-8") as f:
+        tree = json.load(f)
+
+    entries: list[NutrientTaxonomyEntry] = []
+    _flatten(tree.get("nutrients", []), None, (), entries)
+
+    map_categories = _category_maps()
+    root_classes = NutrientMap().nutrients
+    children: dict[str, tuple[str, ...]] = {}
+    categories: dict[str, Enum] = {}
+    factories: dict[str, tuple[type, dict[str, Any]]] = {}
+    off_scales: dict[str, float] = {}
+    for entry in entries:
+        if entry.parent:
+            children[entry.parent] = children.get(entry.parent, ()) + (entry.id,)
+
+        # Clave con formato NutrientMap, luego id suelto, luego heredado del padre
+        category = map_categories.get(entry.map_key) or map_categories.get(entry.id)
+        if category is None and entry.parent:
+            category = categories.get(entry.parent)
+        if category is not None:
+            categories[entry.id] = category
+
+        factories[entry.id] = _factory_for(root_classes.get(entry.path[0]), category)
+        if entry.unit in _OFF_GRAM_SCALES:
+            off_scales[entry.id] = _OFF_GRAM_SCALES[entry.unit]
+
+    return {
+        "version": _INDEX_VERSION,
+        "entries": tuple(entries),
+        "children": children,
+        "categories": categories,
+        "factories": factories,
+        "off_scales": off_scales,
+    }
+
+
+def _cache_file(json_path: Path) -> Path:
+    stat = json_path.stat()
+    return CACHE_DIR / f"nutrient_taxonomy-v{_INDEX_VERSION}-{stat.st_size}-{stat.st_mtime_ns}.pickle"
+
+
+def load_nutrient_taxonomy(json_path: Path = NUTRIENTS_OFF_PATH, use_disk_cache: bool = True) -> NutrientTaxonomyIndex:
+    """
+    Carga el indice desde el pickle en disco si esta al dia con el JSON; si no, lo compila y lo guarda.
+    El nombre del pickle incluye tamaño y mtime del JSON, asi que cualquier cambio lo invalida.
+    """
+    json_path = Path(json_path)
+    cache_file = _cache_file(json_path) if use_disk_cache else None
+
+    if cache_file is not None and cache_file.exists():
+        try:
+            with open(cache_file, "rb") as f:
+                compiled = pickle.load(f)
+            if compiled.get("version") == _INDEX_VERSION:
+                return NutrientTaxonomyIndex(compiled)
+        except Exception as e:
+            print(f"Cache de taxonomía inválida, se recompila: {e}")
+
+    compiled = compile_nutrient_taxonomy(json_path)
+
+    if cache_file is not None:
+        try:
+            cache_file.parent.mkdir(parents=True, exist_ok=True)
+            # Escritura atomica: varios procesos pueden compilar a la vez
+            with tempfile.NamedTemporaryFile("wb", dir=cache_file.parent, delete=False) as tmp:
+                pickle.dump(compiled, tmp, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp.name, cache_file)
+        except OSError as e:
+            print(f"No se pudo guardar la cache de taxonomía: {e}")
+
+    return NutrientTaxonomyIndex(compiled)
+
+
+@lru_cache(maxsize=1)
+def get_nutrient_taxonomy() -> NutrientTaxonomyIndex:
+    """Indice compartido del proceso."""
+    return load_nutrient_taxonomy()
@@ -0,0 +1,191 @@
+"""
+Vectores de nutrientes por 100g respaldados por arrays de NumPy.
+
+Cada alimento se representa como un vector float32 con un valor por nutriente,
+en el orden fijo de la taxonomia OFF (`NUTRIENT_ORDER`) y en la unidad de la taxonomia.
+En MongoDB se guarda como BSON Binary (little-endian), asi que sumar los nutrientes
+de un dia o un mes es un producto matriz-vector en lugar de bucles sobre dicts.
+"""
+
+import hashlib
+from typing import Iterable, Optional
+
+import numpy as np
+
+from bionexo.domain.entity.food import Food
+from bionexo.domain.entity.nutrients import (
+    AlcoholNutrient, Aliment, CarboHydrateNutrient, LipidsNutrient, MineralNutrient, Nutrient, ProteinNutrient,
+    VitaminNutrient
+)
+from bionexo.repository.nutrient_taxonomy import get_nutrient_taxonomy
+
+VECTOR_DTYPE = np.dtype("<f4")
+
+NUTRIENT_ORDER: tuple[str, ...] = get_nutrient_taxonomy().ids
+NUTRIENT_POSITION: dict[str, int] = {nutrient_id: i for i, nutrient_id in enumerate(NUTRIENT_ORDER)}
+N_NUTRIENTS = len(NUTRIENT_ORDER)
+
+# Identifica el orden de los nutrientes; se guarda junto al vector para detectar
+# vectores escritos con otra version de la taxonomia
+NUTRIENT_LAYOUT = hashlib.sha1(",".join(NUTRIENT_ORDER).encode()).hexdigest()[:12]
+
+# Campos escalares de Food -> id de la taxonomia
+FOOD_FIELD_NUTRIENTS = {
+    "kcal_per_100g": "energy-kcal",
+    "protein_g": "proteins",
+    "carbs_g": "carbohydrates",
+    "fat_g": "fat",
+    "fiber_g": "fiber",
+}
+
+# Campos de un documento de `foods` de los que sale el vector
+NUTRIENT_SOURCE_FIELDS: tuple[str, ...] = (*FOOD_FIELD_NUTRIENTS, "vitamins", "minerals")
+VECTOR_FIELDS = ("nutrient_vector", "nutrient_vector_layout")
+
+_MACRO_CLASSES = (ProteinNutrient, CarboHydrateNutrient, LipidsNutrient)
+_MICRO_CLASSES = (VitaminNutrient, MineralNutrient)
+
+
+def empty_vector() -> np.ndarray:
+    return np.zeros(N_NUTRIENTS, dtype=VECTOR_DTYPE)
+
+
+def _nutrient_key(name: str) -> Optional[str]:
+    """Normaliza claves libres ("vitamin_c", "Iron") al id de la taxonomia."""
+    key = name.strip().lower().replace("_", "-")
+    return key if key in NUTRIENT_POSITION else None
+
+
+def _fields_to_vector(values: dict) -> np.ndarray:
+    vector = empty_vector()
+    for field, nutrient_id in FOOD_FIELD_NUTRIENTS.items():
+        value = values.get(field)
+        if value is not None:
+            vector[NUTRIENT_POSITION[nutrient_id]] = value
+    for extra in (values.get("vitamins"), values.get("minerals")):
+        for name, value in (extra or {}).items():
+            nutrient_id = _nutrient_key(name)
+            if nutrient_id is not None and value is not None:
+                vector[NUTRIENT_POSITION[nutrient_id]] = value
+    return vector
+
+
+def food_to_vector(food: Food) -> np.ndarray:
+    """Vector por 100g a partir de los campos de `Food` (macros + dicts de vitaminas/minerales)."""
+    return _fields_to_vector({field: getattr(food, field) for field in NUTRIENT_SOURCE_FIELDS})
+
+
+def vector_to_food_fields(vector: np.ndarray) -> dict:
+    """Campos de `Food` (macros, `vitamins`, `minerals`) a partir de un vector."""
+    taxonomy = get_nutrient_taxonomy()
+    fields = {
+        field: float(vector[NUTRIENT_POSITION[nutrient_id]])
+        for field, nutrient_id in FOOD_FIELD_NUTRIENTS.items()
+    }
+    vitamins = {}
+    minerals = {}
+    for i in np.flatnonzero(vector):
+        nutrient_id = NUTRIENT_ORDER[i]
+        nutrient_class = taxonomy.nutrient_class(nutrient_id)
+        if nutrient_class is VitaminNutrient:
+            vitamins[nutrient_id] = float(vector[i])
+        elif nutrient_class is MineralNutrient:
+            minerals[nutrient_id] = float(vector[i])
+    fields["vitamins"] = vitamins or None
+    fields["minerals"] = minerals or None
+    return fields
+
+
+def aliment_to_vector(aliment: Aliment) -> np.ndarray:
+    """Vector por 100g a partir de los `Nutrient` de un `Aliment`."""
+    vector = empty_vector()
+    nutrients: list[Nutrient] = [*aliment.macro_nutrients, *aliment.micro_nutrients]
+    nutrients += [n for n in (aliment.water, aliment.alcohol) if n is not None]
+    for nutrient in nutrients:
+        position = NUTRIENT_POSITION.get(nutrient.id)
+        if position is not None and nutrient.amount_per_100g is not None:
+            vector[position] = nutrient.amount_per_100g
+    return vector
+
+
+def vector_to_aliment(vector: np.ndarray, aliment_id: str, name: str) -> Aliment:
+    """
+    Construye un `Aliment` con los nutrientes no nulos del vector.
+    Los nutrientes sin clase de macro/micro en el dominio (energia, fibra...) no tienen sitio en `Aliment`.
+    """
+    taxonomy = get_nutrient_taxonomy()
+    fields = {"id": aliment_id, "name": name, "macro_nutrients": [], "micro_nutrients": []}
+    for i in np.flatnonzero(vector):
+        nutrient = taxonomy.to_domain_nutrient(NUTRIENT_ORDER[i], amount_per_100g=float(vector[i]))
+        if isinstance(nutrient, _MACRO_CLASSES):
+            fields["macro_nutrients"].append(nutrient)
+        elif isinstance(nutrient, _MICRO_CLASSES):
+            fields["micro_nutrients"].append(nutrient)
+        elif isinstance(nutrient, AlcoholNutrient):
+            fields["alcohol"] = nutrient
+    return Aliment(**fields)
+
+
+def vector_to_binary(vector: np.ndarray) -> bytes:
+    """Serializa el vector como float32 little-endian (504 bytes con la taxonomia actual)."""
+    return np.ascontiguousarray(vector, dtype=VECTOR_DTYPE).tobytes()
+
+
+def vector_from_binary(data: bytes, layout: Optional[str] = NUTRIENT_LAYOUT) -> np.ndarray:
+    """Vector de solo lectura sobre los bytes guardados en Mongo (sin copia)."""
+    if layout != NUTRIENT_LAYOUT:
+        raise ValueError(f"Vector de nutrientes con layout '{layout}', se esperaba '{NUTRIENT_LAYOUT}'")
+    return np.frombuffer(data, dtype=VECTOR_DTYPE, count=N_NUTRIENTS)
+
+
+def food_vector_fields(food: Food) -> dict:
+    """Campos a guardar en el documento de `foods` con el vector del alimento."""
+    return {
+        "nutrient_vector": vector_to_binary(food_to_vector(food)),
+        "nutrient_vector_layout": NUTRIENT_LAYOUT,
+    }
+
+
+def document_vector_fields(food_doc: dict) -> dict:
+    """Como `food_vector_fields`, calculado desde los campos de un documento de `foods`."""
+    return {
+        "nutrient_vector": vector_to_binary(_fields_to_vector(food_doc)),
+        "nutrient_vector_layout": NUTRIENT_LAYOUT,
+    }
+
+
+def changes_nutrients(update_data: dict) -> bool:
+    """Si un `$set` parcial toca algun campo del vector (tambien con ruta: "vitamins.vitamin-c")."""
+    return any(key.split(".")[0] in NUTRIENT_SOURCE_FIELDS for key in update_data)
+
+
+def document_vector(food_doc: dict) -> np.ndarray:
+    """Vector de un documento de `foods`; se calcula desde los campos si no tiene uno valido guardado."""
+    data = food_doc.get("nutrient_vector")
+    if data and food_doc.get("nutrient_vector_layout") == NUTRIENT_LAYOUT:
+        return vector_from_binary(data)
+    return _fields_to_vector(food_doc)
+
+
+def foods_matrix(food_docs: Iterable[dict]) -> tuple[list[str], np.ndarray]:
+    """
+    Apila los vectores de varios documentos de `foods` en una matriz (n_foods x N_NUTRIENTS).
+    Devuelve tambien los `_id` (como string) en el mismo orden que las filas.
+    """
+    ids = []
+    rows = []
+    for doc in food_docs:
+        ids.append(str(doc["_id"]))
+        rows.append(document_vector(doc))
+    if not rows:
+        return ids, np.zeros((0, N_NUTRIENTS), dtype=VECTOR_DTYPE)
+    return ids, np.vstack(rows)
+
+
+def sum_nutrients(matrix: np.ndarray, grams: np.ndarray) -> np.ndarray:
+    """
+    Total de nutrientes para unas cantidades en gramos de cada fila de `matrix` (por 100g).
+    `grams` puede ser (n_foods,) o (n_periodos, n_foods) para sacar varios totales a la vez.
+    Es un unico producto matricial; acumula en float64.
+    """
+    return (np.asarray(grams, dtype=np.float64) / 100.0) @ matrix
@@ -0,0 +1,237 @@
+"""
+Motor de totales de nutrientes sobre las ingestas.
+
+Une las ingestas con sus alimentos por `food_id`, escala el vector por 100g de cada
+alimento por la cantidad en gramos (`quantity`) y agrega por dia, tipo de comida y semana
+con operaciones de NumPy en lote: las cantidades se acumulan en una matriz
+(grupos x alimentos) y los totales salen de un unico producto matricial con la
+matriz de vectores de los alimentos.
+
+Con `pushdown=True` la reduccion por (dia, tipo de comida, alimento) y el `$lookup`
+a `foods` se hacen en MongoDB, y solo viajan las sumas de gramos y los vectores.
+"""
+
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+from bson import ObjectId
+from bson.errors import InvalidId
+
+from bionexo.repository.nutrient_vectors import NUTRIENT_ORDER, document_vector, sum_nutrients
+
+# Campos de `foods` necesarios para obtener el vector (guardado o calculado desde los macros)
+FOOD_VECTOR_PROJECTION = {
+    "nutrient_vector": 1,
+    "nutrient_vector_layout": 1,
+    "kcal_per_100g": 1,
+    "protein_g": 1,
+    "carbs_g": 1,
+    "fat_g": 1,
+    "fiber_g": 1,
+    "vitamins": 1,
+    "minerals": 1,
+}
+
+
+@dataclass
+class NutrientTotals:
+    """Totales de nutrientes (columnas en el orden de `NUTRIENT_ORDER`)."""
+    by_day: pd.DataFrame  # indice: fecha local "YYYY-MM-DD"
+    by_meal_type: pd.DataFrame  # indice: meal_type
+    by_week: pd.DataFrame  # indice: lunes de la semana "YYYY-MM-DD"
+    intakes_used: int
+    intakes_skipped: int  # Ingestas sin food_id, sin cantidad o con alimento inexistente
+
+
+def _time_match(user_id: str, start: Optional[datetime], end: Optional[datetime]) -> dict:
+    match = {"user_id": user_id}
+    if start or end:
+        match["timestamp"] = {}
+        if start:
+            match["timestamp"]["$gte"] = start
+        if end:
+            match["timestamp"]["$lt"] = end
+    return match
+
+
+def nutrient_totals_pipeline(
+        user_id: str,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        tz: str = "Europe/Madrid"
+) -> list[dict]:
+    """
+    Pipeline que reduce las ingestas a gramos por (dia local, tipo de comida, alimento)
+    y adjunta el vector del alimento con `$lookup`.
+    """
+    match = _time_match(user_id, start, end)
+    match["food_id"] = {"$type": "string"}
+    match["quantity"] = {"$gt": 0}
+    return [
+        {"$match": match},
+        {"$group": {
+            "_id": {
+                "day": {"$dateToString": {"format": "%Y-%m-%d", "date": "$timestamp", "timezone": tz}},
+                "meal_type": "$meal_type",
+                "food_id": "$food_id",
+            },
+            "grams": {"$sum": "$quantity"},
+            "intakes": {"$sum": 1},
+        }},
+        {"$lookup": {
+            "from": "foods",
+            "let": {"food_oid": {"$convert": {"input": "$_id.food_id", "to": "objectId", "onError": None, "onNull": None}}},
+            "pipeline": [
+                {"$match": {"$expr": {"$eq": ["$_id", "$$food_oid"]}}},
+                {"$project": FOOD_VECTOR_PROJECTION},
+            ],
+            "as": "food",
+        }},
+        {"$unwind": {"path": "$food", "preserveNullAndEmptyArrays": True}},
+    ]
+
+
+def _empty_frame(index_name: str) -> pd.DataFrame:
+    frame = pd.DataFrame(columns=list(NUTRIENT_ORDER), dtype=np.float64)
+    frame.index.name = index_name
+    return frame
+
+
+def aggregate_nutrient_totals(
+        days: np.ndarray,
+        meal_types: np.ndarray,
+        food_rows: np.ndarray,
+        grams: np.ndarray,
+        food_matrix: np.ndarray
+) -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """
+    Agrega en lote. Cada posicion i de los arrays es una cantidad `grams[i]` del alimento
+    `food_matrix[food_rows[i]]` consumida el dia `days[i]` en la comida `meal_types[i]`.
+    """
+    if len(grams) == 0:
+        return _empty_frame("day"), _empty_frame("meal_type"), _empty_frame("week")
+
+    n_foods = food_matrix.shape[0]
+
+    def grouped(keys: np.ndarray, index_name: str) -> pd.DataFrame:
+        codes, uniques = pd.factorize(keys, sort=True)
+        # Matriz (grupos x alimentos) con los gramos de cada alimento en cada grupo
+        group_grams = np.bincount(
+            codes * n_foods + food_rows,
+            weights=grams,
+            minlength=len(uniques) * n_foods
+        ).reshape(len(uniques), n_foods)
+        totals = sum_nutrients(food_matrix, group_grams)
+        return pd.DataFrame(totals, index=pd.Index(uniques, name=index_name), columns=list(NUTRIENT_ORDER))
+
+    day_dates = pd.to_datetime(days)
+    weeks = (day_dates - pd.to_timedelta(day_dates.dayofweek, unit="D")).strftime("%Y-%m-%d").to_numpy()
+
+    return grouped(days, "day"), grouped(meal_types, "meal_type"), grouped(weeks, "week")
+
+
+def _compute_pushdown(db, user_id, start, end, tz) -> NutrientTotals:
+    rows = list(db["intakes"].aggregate(nutrient_totals_pipeline(user_id, start, end, tz)))
+
+    food_position: dict[str, int] = {}
+    vectors = []
+    days, meal_types, food_rows, grams = [], [], [], []
+    used = 0
+    for row in rows:
+        food = row.get("food")
+        if not food:
+            continue
+        food_id = row["_id"]["food_id"]
+        if food_id not in food_position:
+            food_position[food_id] = len(vectors)
+            vectors.append(document_vector(food))
+        days.append(row["_id"]["day"])
+        meal_types.append(row["_id"].get("meal_type") or "")
+        food_rows.append(food_position[food_id])
+        grams.append(row["grams"])
+        used += row["intakes"]
+
+    # Las ingestas sin food_id o sin cantidad no pasan el $match: se cuentan aparte
+    skipped = db["intakes"].count_documents(_time_match(user_id, start, end)) - used
+
+    return _build_totals(days, meal_types, food_rows, grams, vectors, used, skipped)
+
+
+def _compute_local(db, user_id, start, end, tz) -> NutrientTotals:
+    intakes = list(db["intakes"].find(
+        _time_match(user_id, start, end),
+        {"timestamp": 1, "meal_type": 1, "food_id": 1, "quantity": 1, "_id": 0}
+    ))
+
+    object_ids = {}
+    for intake in intakes:
+        food_id = intake.get("food_id")
+        if isinstance(food_id, str) and food_id not in object_ids:
+            try:
+                object_ids[food_id] = ObjectId(food_id)
+            except InvalidId:
+                pass
+    foods = db["foods"].find({"_id": {"$in": list(object_ids.values())}}, FOOD_VECTOR_PROJECTION)
+    food_position: dict[str, int] = {}
+    vectors = []
+    for food in foods:
+        food_position[str(food["_id"])] = len(vectors)
+        vectors.append(document_vector(food))
+
+    timestamps, meal_types, food_rows, grams = [], [], [], []
+    skipped = 0
+    for intake in intakes:
+        position = food_position.get(intake.get("food_id"))
+        if position is None or not intake.get("quantity") or intake["quantity"] <= 0:
+            skipped += 1
+            continue
+        timestamps.append(intake["timestamp"])
+        meal_types.append(intake.get("meal_type") or "")
+        food_rows.append(position)
+        grams.append(intake["quantity"])
+
+    # Los timestamps se guardan como UTC naive
+    days = pd.to_datetime(timestamps, utc=True).tz_convert(tz).strftime("%Y-%m-%d").to_numpy() if timestamps else []
+    return _build_totals(days, meal_types, food_rows, grams, vectors, len(grams), skipped)
+
+
+def _build_totals(days, meal_types, food_rows, grams, vectors, used, skipped) -> NutrientTotals:
+    food_matrix = np.vstack(vectors) if vectors else np.zeros((0, len(NUTRIENT_ORDER)), dtype=np.float32)
+    by_day, by_meal_type, by_week = aggregate_nutrient_totals(
+        np.asarray(days, dtype=object),
+        np.asarray(meal_types, dtype=object),
+        np.asarray(food_rows, dtype=np.int64),
+        np.asarray(grams, dtype=np.float64),
+        food_matrix
+    )
+    return NutrientTotals(
+        by_day=by_day,
+        by_meal_type=by_meal_type,
+        by_week=by_week,
+        intakes_used=used,
+        intakes_skipped=skipped
+    )
+
+
+def compute_nutrient_totals(
+        db,
+        user_id: str,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        tz: str = "Europe/Madrid",
+        pushdown: bool = True
+) -> NutrientTotals:
+    """
+    Totales de nutrientes de un usuario entre `start` (incluido) y `end` (excluido), en UTC naive.
+    Los dias y semanas se calculan en la zona horaria `tz`.
+
+    Args:
+        pushdown: Si True, agrupa y hace el join con `foods` en MongoDB ($group + $lookup).
+                  Si False, trae las ingestas (sin imagen) y los alimentos y agrega en el proceso.
+    """
+    if pushdown:
+        return _compute_pushdown(db, user_id, start, end, tz)
+    return _compute_local(db, user_id, start, end, tz)
@@ -7,9 +7,9 @@ from openfoodfacts import utils as off_utils
 from openfoodfacts.api import send_get_request
 
 from bionexo.application.definitions import Environment
-from bionexo.infraestructure.utils.functions import predict_language
+from bionexo.infrastructure.utils.functions import predict_language
 from bionexo.repository.config import RepositoryConfig
-from bionexo.repository.entity.open_food_facts import ProductSearchAdvanceParams
+from bionexo.repository.entity.open_food_facts import OFF_DEFAULT_RAW_FIELDS, OFFProduct, ProductSearchAdvanceParams
 
 PRODUCT_RATE = 'product'
 SEARCH_RATE = 'search'
@@ -98,6 +98,9 @@ class OpenFoodFactsAPI:
             username = None
             password = None
 
+        # Whitelist de campos crudos que se conservan por producto
+        self.raw_fields = tuple(config.off_raw_fields) if config.off_raw_fields is not None else OFF_DEFAULT_RAW_FIELDS
+
         self.driver = API(
             user_agent=user_agent,
             username=username,
@@ -109,7 +112,7 @@ class OpenFoodFactsAPI:
         )
 
     @check_product_rate
-    def get_product_by_barcode(self, barcode: str) -> Optional[Dict[str, Any]]:
+    def get_product_by_barcode(self, barcode: str) -> Optional[OFFProduct]:
         """
         Obtiene información de un producto por código de barras.
         Retorna None si no se encuentra.
@@ -121,7 +124,8 @@ class OpenFoodFactsAPI:
         # "none": returns no fields
         # "raw": returns all fields as stored internally in the database
         # "all": returns all fields except generated fields that need to be explicitly requested such as "knowledge_panels".
-        fields = "all"
+        # Solo pedimos los campos que OFFProduct va a conservar
+        fields = OFFProduct.request_fields(self.raw_fields)
         response = self.driver.product.get(
             barcode,
             fields=fields,
@@ -326,27 +330,9 @@ class OpenFoodFactsAPI:
         """
         ...
     
-    def _parse_product(self, product_data: Dict[str, Any]) -> Dict[str, Any]:
+    def _parse_product(self, product_data: Dict[str, Any]) -> OFFProduct:
         """
         Parsea los datos del producto para extraer info nutricional relevante.
+        No conserva el payload completo, solo los campos de `self.raw_fields`.
         """
-        nutriments = product_data.get('nutriments', {})
-        return {
-            'barcode': product_data.get('code'),
-            'name': product_data.get('product_name', 'Desconocido'),
-            'brands': product_data.get('brands', ''),
-            'categories': product_data.get('categories', ''),
-            'kcal_per_100g': nutriments.get('energy-kcal_100g') or nutriments.get('energy_100g', 0) / 4.184 if nutriments.get('energy_100g') else 0,
-            'nutrients': {
-                'protein': nutriments.get('proteins_100g', 0),
-                'carbs': nutriments.get('carbohydrates_100g', 0),
-                'fat': nutriments.get('fat_100g', 0),
-                'fiber': nutriments.get('fiber_100g', 0),
-                'sugars': nutriments.get('sugars_100g', 0),
-                'salt': nutriments.get('salt_100g', 0),
-            },
-            'allergens': product_data.get('allergens_tags', []),
-            'ingredients': product_data.get('ingredients_text', ''),
-            'image_url': product_data.get('image_url'),
-            'raw_data': product_data  # Para acceso completo si es necesario
-        }
\ No newline at end of file
+        return OFFProduct.from_off(product_data, self.raw_fields)
\ No newline at end of file
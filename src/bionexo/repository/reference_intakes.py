@@ -0,0 +1,341 @@
+"""
+Motor de ingestas de referencia (RDI) y cobertura de nutrientes.
+
+Las tablas de referencia se precalculan al importar el modulo, una por
+(grupo etario, sexo, nivel de actividad), como vectores en el orden de `NUTRIENT_ORDER`.
+Los objetivos personales (energia y macros dependen de peso y altura) se calculan una vez
+al guardar el perfil y se guardan en `PersonalIntakesRecommendations.nutrients_rdi`.
+La cobertura es la division elemento a elemento de los totales agregados por el objetivo,
+asi que el lote nocturno para todos los usuarios es una operacion matricial.
+
+Valores orientativos basados en las ingestas de referencia de EFSA para poblacion sana.
+"""
+
+from dataclasses import dataclass
+from datetime import datetime
+from itertools import product
+from types import MappingProxyType
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+from bson import ObjectId
+from bson.errors import InvalidId
+
+from bionexo.domain.entity.user import (
+    Activity, ActivityType, AgeGroup, AgeGroupType, PersonalIntakesRecommendations, Sex, SexType
+)
+from bionexo.repository.nutrient_vectors import N_NUTRIENTS, NUTRIENT_ORDER, NUTRIENT_POSITION, document_vector
+from bionexo.repository.nutrition_totals import FOOD_VECTOR_PROJECTION, compute_nutrient_totals
+
+KJ_PER_KCAL = 4.184
+# Pares (usuario, alimento) por bloque en el lote nocturno: ~16 MB de float64 con 126 nutrientes
+RDI_BATCH_BLOCK = 16_384
+
+AGE_GROUPS = (AgeGroup.BABY, AgeGroup.CHILDREN, AgeGroup.TEEN, AgeGroup.ADULT, AgeGroup.ELDERLY)
+SEXES = (Sex.MALE, Sex.FEMALE)
+ACTIVITIES = (Activity.SEDENTARY, Activity.ACTIVE, Activity.VERY_ACTIVE)
+
+# Edad representativa de cada grupo para las ecuaciones de gasto energetico
+REPRESENTATIVE_AGE = {
+    AgeGroup.BABY: 1,
+    AgeGroup.CHILDREN: 8,
+    AgeGroup.TEEN: 15,
+    AgeGroup.ADULT: 40,
+    AgeGroup.ELDERLY: 72,
+}
+
+# Nivel de actividad fisica (PAL) que multiplica el metabolismo basal
+PHYSICAL_ACTIVITY_LEVEL = {
+    Activity.SEDENTARY: 1.4,
+    Activity.ACTIVE: 1.6,
+    Activity.VERY_ACTIVE: 1.8,
+}
+
+# Proteina en g por kg de peso; se incrementa con la actividad
+PROTEIN_G_PER_KG = {
+    AgeGroup.BABY: 1.3,
+    AgeGroup.CHILDREN: 0.95,
+    AgeGroup.TEEN: 0.9,
+    AgeGroup.ADULT: 0.83,
+    AgeGroup.ELDERLY: 1.0,
+}
+PROTEIN_ACTIVITY_FACTOR = {
+    Activity.SEDENTARY: 1.0,
+    Activity.ACTIVE: 1.2,
+    Activity.VERY_ACTIVE: 1.5,
+}
+
+# Reparto de la energia en macronutrientes (fraccion de kcal) y kcal por gramo
+FAT_ENERGY_SHARE = 0.30
+CARBOHYDRATE_ENERGY_SHARE = 0.50
+FIBER_G_PER_1000_KCAL = 14.0
+
+# Limites superiores (fraccion de la energia total)
+SATURATED_FAT_MAX_ENERGY_SHARE = 0.10
+SUGARS_MAX_ENERGY_SHARE = 0.10
+TRANS_FAT_MAX_ENERGY_SHARE = 0.01
+
+# Micronutrientes en la unidad de la taxonomia: {nutriente: {grupo: (hombre, mujer)}}
+MICRONUTRIENT_RDI: dict[str, dict[str, tuple[float, float]]] = {
+    "vitamin-a": {"baby": (250, 250), "children": (400, 400), "teen": (650, 600), "adult": (750, 650), "elderly": (750, 650)},
+    "vitamin-d": {"baby": (10, 10), "children": (15, 15), "teen": (15, 15), "adult": (15, 15), "elderly": (15, 15)},
+    "vitamin-e": {"baby": (5, 5), "children": (9, 9), "teen": (13, 11), "adult": (13, 11), "elderly": (13, 11)},
+    "vitamin-k": {"baby": (10, 10), "children": (30, 30), "teen": (60, 60), "adult": (70, 70), "elderly": (70, 70)},
+    "vitamin-c": {"baby": (20, 20), "children": (45, 45), "teen": (100, 90), "adult": (110, 95), "elderly": (110, 95)},
+    "vitamin-b1": {"baby": (0.3, 0.3), "children": (0.7, 0.7), "teen": (1.0, 0.9), "adult": (1.1, 0.9), "elderly": (1.1, 0.9)},
+    "vitamin-b2": {"baby": (0.6, 0.6), "children": (1.0, 1.0), "teen": (1.6, 1.6), "adult": (1.6, 1.6), "elderly": (1.6, 1.6)},
+    "vitamin-pp": {"baby": (5, 5), "children": (11, 11), "teen": (15, 13), "adult": (16, 14), "elderly": (16, 14)},
+    "vitamin-b6": {"baby": (0.6, 0.6), "children": (1.0, 1.0), "teen": (1.5, 1.4), "adult": (1.7, 1.6), "elderly": (1.7, 1.6)},
+    "vitamin-b9": {"baby": (120, 120), "children": (200, 200), "teen": (330, 330), "adult": (330, 330), "elderly": (330, 330)},
+    "vitamin-b12": {"baby": (1.5, 1.5), "children": (2.5, 2.5), "teen": (4.0, 4.0), "adult": (4.0, 4.0), "elderly": (4.0, 4.0)},
+    "biotin": {"baby": (20, 20), "children": (25, 25), "teen": (35, 35), "adult": (40, 40), "elderly": (40, 40)},
+    "pantothenic-acid": {"baby": (3, 3), "children": (4, 4), "teen": (5, 5), "adult": (5, 5), "elderly": (5, 5)},
+    "calcium": {"baby": (450, 450), "children": (800, 800), "teen": (1150, 1150), "adult": (950, 950), "elderly": (950, 950)},
+    "iron": {"baby": (8, 8), "children": (10, 10), "teen": (11, 13), "adult": (11, 16), "elderly": (11, 11)},
+    "magnesium": {"baby": (170, 170), "children": (230, 230), "teen": (300, 250), "adult": (350, 300), "elderly": (350, 300)},
+    "zinc": {"baby": (4, 4), "children": (7, 7), "teen": (12, 10), "adult": (11, 8), "elderly": (11, 8)},
+    "potassium": {"baby": (800, 800), "children": (2000, 2000), "teen": (3500, 3500), "adult": (3500, 3500), "elderly": (3500, 3500)},
+    "phosphorus": {"baby": (250, 250), "children": (440, 440), "teen": (640, 640), "adult": (550, 550), "elderly": (550, 550)},
+    "iodine": {"baby": (90, 90), "children": (90, 90), "teen": (130, 130), "adult": (150, 150), "elderly": (150, 150)},
+    "selenium": {"baby": (15, 15), "children": (30, 30), "teen": (70, 60), "adult": (70, 70), "elderly": (70, 70)},
+    "copper": {"baby": (0.5, 0.5), "children": (1.0, 1.0), "teen": (1.3, 1.1), "adult": (1.6, 1.3), "elderly": (1.6, 1.3)},
+    "manganese": {"baby": (0.5, 0.5), "children": (2.0, 2.0), "teen": (3.0, 3.0), "adult": (3.0, 3.0), "elderly": (3.0, 3.0)},
+    "fluoride": {"baby": (0.6, 0.6), "children": (1.5, 1.5), "teen": (3.0, 2.8), "adult": (3.4, 2.9), "elderly": (3.4, 2.9)},
+    "molybdenum": {"baby": (15, 15), "children": (30, 30), "teen": (65, 65), "adult": (65, 65), "elderly": (65, 65)},
+    # Limites superiores (g)
+    "salt": {"baby": (1, 1), "children": (3, 3), "teen": (5, 5), "adult": (5, 5), "elderly": (5, 5)},
+    "sodium": {"baby": (0.4, 0.4), "children": (1.2, 1.2), "teen": (2.0, 2.0), "adult": (2.0, 2.0), "elderly": (2.0, 2.0)},
+}
+
+# Nutrientes cuyo objetivo es un maximo: una cobertura > 1 es un exceso, no un logro
+UPPER_LIMIT_NUTRIENTS = ("salt", "sodium", "saturated-fat", "sugars", "trans-fat")
+UPPER_LIMIT_MASK = np.zeros(N_NUTRIENTS, dtype=bool)
+UPPER_LIMIT_MASK[[NUTRIENT_POSITION[n] for n in UPPER_LIMIT_NUTRIENTS]] = True
+
+
+@dataclass(frozen=True)
+class ReferenceIntakeTable:
+    """Referencias precalculadas para una combinacion (grupo etario, sexo, actividad)."""
+    base: np.ndarray  # Micronutrientes y limites fijos en el orden de NUTRIENT_ORDER
+    age_years: int
+    physical_activity_level: float
+    protein_g_per_kg: float
+
+
+def _build_tables() -> MappingProxyType:
+    tables = {}
+    for age_group, sex, activity in product(AGE_GROUPS, SEXES, ACTIVITIES):
+        base = np.zeros(N_NUTRIENTS, dtype=np.float64)
+        for nutrient_id, by_age in MICRONUTRIENT_RDI.items():
+            male, female = by_age[age_group]
+            base[NUTRIENT_POSITION[nutrient_id]] = male if sex == Sex.MALE else female
+        base.setflags(write=False)
+        tables[(age_group, sex, activity)] = ReferenceIntakeTable(
+            base=base,
+            age_years=REPRESENTATIVE_AGE[age_group],
+            physical_activity_level=PHYSICAL_ACTIVITY_LEVEL[activity],
+            protein_g_per_kg=PROTEIN_G_PER_KG[age_group] * PROTEIN_ACTIVITY_FACTOR[activity],
+        )
+    return MappingProxyType(tables)
+
+
+RDI_TABLES = _build_tables()
+
+
+def energy_requirement_kcal(age_group: AgeGroupType, sex: SexType, activity_level: ActivityType, height_cm: float, weight_kg: float) -> float:
+    """Gasto energetico diario: Mifflin-St Jeor x PAL (bebes: kcal por kg)."""
+    table = RDI_TABLES[(age_group, sex, activity_level)]
+    if age_group == AgeGroup.BABY:
+        return 82.0 * weight_kg
+    bmr = 10 * weight_kg + 6.25 * height_cm - 5 * table.age_years + (5 if sex == Sex.MALE else -161)
+    return bmr * table.physical_activity_level
+
+
+def personal_rdi_vector(profile: PersonalIntakesRecommendations) -> np.ndarray:
+    """Objetivos diarios del usuario en el orden de `NUTRIENT_ORDER` (0 = sin objetivo)."""
+    table = RDI_TABLES[(profile.age_group, profile.sex, profile.activity_level)]
+    kcal = energy_requirement_kcal(profile.age_group, profile.sex, profile.activity_level, profile.height_cm, profile.weight_kg)
+
+    target = table.base.copy()
+    target[NUTRIENT_POSITION["energy-kcal"]] = kcal
+    target[NUTRIENT_POSITION["energy-kj"]] = kcal * KJ_PER_KCAL
+    target[NUTRIENT_POSITION["proteins"]] = table.protein_g_per_kg * profile.weight_kg
+    target[NUTRIENT_POSITION["fat"]] = kcal * FAT_ENERGY_SHARE / 9
+    target[NUTRIENT_POSITION["carbohydrates"]] = kcal * CARBOHYDRATE_ENERGY_SHARE / 4
+    target[NUTRIENT_POSITION["fiber"]] = kcal / 1000 * FIBER_G_PER_1000_KCAL
+    target[NUTRIENT_POSITION["saturated-fat"]] = kcal * SATURATED_FAT_MAX_ENERGY_SHARE / 9
+    target[NUTRIENT_POSITION["sugars"]] = kcal * SUGARS_MAX_ENERGY_SHARE / 4
+    target[NUTRIENT_POSITION["trans-fat"]] = kcal * TRANS_FAT_MAX_ENERGY_SHARE / 9
+    return target
+
+
+def rdi_vector_to_dict(target: np.ndarray) -> dict[str, float]:
+    """Formato de `nutrients_rdi`: solo nutrientes con objetivo."""
+    return {NUTRIENT_ORDER[i]: round(float(target[i]), 4) for i in np.flatnonzero(target)}
+
+
+def rdi_dict_to_vector(nutrients_rdi: dict[str, float]) -> np.ndarray:
+    target = np.zeros(N_NUTRIENTS, dtype=np.float64)
+    for nutrient_id, value in nutrients_rdi.items():
+        position = NUTRIENT_POSITION.get(nutrient_id)
+        if position is not None:
+            target[position] = value
+    return target
+
+
+def personal_nutrients_rdi(profile: PersonalIntakesRecommendations) -> dict[str, float]:
+    """Valor a guardar en `nutrients_rdi` al registrar o actualizar el perfil."""
+    return rdi_vector_to_dict(personal_rdi_vector(profile))
+
+
+def _profile_target(profile_dict: dict) -> np.ndarray:
+    if profile_dict.get("nutrients_rdi"):
+        return rdi_dict_to_vector(profile_dict["nutrients_rdi"])
+    return personal_rdi_vector(PersonalIntakesRecommendations(**profile_dict))
+
+
+def fill_energy_kj(values: np.ndarray) -> np.ndarray:
+    """
+    Los vectores de los alimentos traen la energia en kcal (`kcal_per_100g`): la columna de kJ
+    se deriva de ella para que el objetivo `energy-kj` no salga siempre a ~0%. Modifica `values`.
+    """
+    values[..., NUTRIENT_POSITION["energy-kj"]] = values[..., NUTRIENT_POSITION["energy-kcal"]] * KJ_PER_KCAL
+    return values
+
+
+def coverage_ratio(intake: np.ndarray, target: np.ndarray) -> np.ndarray:
+    """Ingesta / objetivo elemento a elemento; NaN donde no hay objetivo. Admite matrices."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(target > 0, intake / np.where(target > 0, target, 1), np.nan)
+
+
+@dataclass
+class RDICoverage:
+    daily: pd.DataFrame  # Cobertura por dia (filas) y nutriente con objetivo (columnas)
+    summary: pd.DataFrame  # Por nutriente: target, mean_daily, coverage, gap, upper_limit
+
+
+def compute_rdi_coverage(
+        db,
+        user_id: str,
+        start: datetime,
+        end: datetime,
+        tz: str = "Europe/Madrid",
+        pushdown: bool = True
+) -> Optional[RDICoverage]:
+    """
+    Cobertura de los objetivos del usuario entre `start` y `end` (UTC naive).
+    Los dias sin ingestas cuentan como dias con ingesta 0 para la media diaria.
+    """
+    user = db["users"].find_one({"email": user_id}, {"personal_intakes_recommendations": 1})
+    if not user or not user.get("personal_intakes_recommendations"):
+        return None
+    target = _profile_target(user["personal_intakes_recommendations"])
+    with_target = np.flatnonzero(target)
+    columns = [NUTRIENT_ORDER[i] for i in with_target]
+
+    totals = compute_nutrient_totals(db, user_id, start, end, tz, pushdown=pushdown)
+    by_day = fill_energy_kj(totals.by_day.to_numpy(dtype=np.float64, copy=True))[:, with_target]
+    n_days = max((end - start).total_seconds() / 86400, 1)
+    mean_daily = by_day.sum(axis=0) / n_days
+
+    daily = pd.DataFrame(coverage_ratio(by_day, target[with_target]), index=totals.by_day.index, columns=columns)
+    summary = pd.DataFrame({
+        "target": target[with_target],
+        "mean_daily": mean_daily,
+        "coverage": coverage_ratio(mean_daily, target[with_target]),
+        "gap": target[with_target] - mean_daily,
+        "upper_limit": UPPER_LIMIT_MASK[with_target],
+    }, index=pd.Index(columns, name="nutrient"))
+    return RDICoverage(daily=daily, summary=summary)
+
+
+def _sum_by_user(
+        totals: np.ndarray,
+        user_rows: np.ndarray,
+        food_rows: np.ndarray,
+        grams: np.ndarray,
+        vectors: np.ndarray,
+        block: int = RDI_BATCH_BLOCK
+):
+    """
+    Suma en `totals` gramos / 100 x vector de cada par (usuario, alimento). Los pares se ordenan
+    por usuario y se reducen por bloques con `np.add.reduceat`: memoria acotada por `block`.
+    """
+    order = np.argsort(user_rows, kind="stable")
+    user_rows, food_rows, grams = user_rows[order], food_rows[order], grams[order]
+    for start in range(0, len(user_rows), block):
+        users = user_rows[start:start + block]
+        contributions = grams[start:start + block, None] / 100.0 * vectors[food_rows[start:start + block]]
+        # Primera fila de cada usuario dentro del bloque
+        starts = np.flatnonzero(np.r_[True, users[1:] != users[:-1]])
+        totals[users[starts]] += np.add.reduceat(contributions, starts, axis=0)
+
+
+def compute_rdi_coverage_batch(db, start: datetime, end: datetime) -> pd.DataFrame:
+    """
+    Cobertura media diaria de todos los usuarios entre `start` y `end`, pensada para el lote nocturno.
+    Una agregacion agrupa gramos por (usuario, alimento); el resto son operaciones vectorizadas
+    proporcionales al numero de pares (usuario, alimento), no a usuarios x alimentos, y en
+    bloques de `RDI_BATCH_BLOCK` pares.
+    Devuelve un DataFrame usuarios x nutrientes (NaN donde no hay objetivo).
+    """
+    users = list(db["users"].find({}, {"email": 1, "personal_intakes_recommendations": 1}))
+    user_ids = [u["email"] for u in users if u.get("personal_intakes_recommendations")]
+    if not user_ids:
+        return pd.DataFrame(columns=list(NUTRIENT_ORDER))
+    user_position = {user_id: i for i, user_id in enumerate(user_ids)}
+    targets = np.vstack([
+        _profile_target(u["personal_intakes_recommendations"])
+        for u in users if u.get("personal_intakes_recommendations")
+    ])
+
+    rows = list(db["intakes"].aggregate([
+        {"$match": {
+            "timestamp": {"$gte": start, "$lt": end},
+            "food_id": {"$type": "string"},
+            "quantity": {"$gt": 0},
+        }},
+        {"$group": {"_id": {"user_id": "$user_id", "food_id": "$food_id"}, "grams": {"$sum": "$quantity"}}},
+    ], allowDiskUse=True))
+
+    object_ids = set()
+    for row in rows:
+        try:
+            object_ids.add(ObjectId(row["_id"]["food_id"]))
+        except InvalidId:
+            pass
+    food_position: dict[str, int] = {}
+    vectors = []
+    for food in db["foods"].find({"_id": {"$in": list(object_ids)}}, FOOD_VECTOR_PROJECTION):
+        food_position[str(food["_id"])] = len(vectors)
+        vectors.append(document_vector(food))
+
+    user_rows, food_rows, grams = [], [], []
+    for row in rows:
+        u = user_position.get(row["_id"]["user_id"])
+        f = food_position.get(row["_id"]["food_id"])
+        if u is not None and f is not None:
+            user_rows.append(u)
+            food_rows.append(f)
+            grams.append(row["grams"])
+
+    totals = np.zeros((len(user_ids), N_NUTRIENTS))
+    if user_rows:
+        # Sin matriz usuarios x alimentos, que con todo el catalogo no cabria en memoria
+        _sum_by_user(
+            totals,
+            np.asarray(user_rows, dtype=np.int64),
+            np.asarray(food_rows, dtype=np.int64),
+            np.asarray(grams, dtype=np.float64),
+            np.vstack(vectors)
+        )
+    fill_energy_kj(totals)
+
+    n_days = max((end - start).total_seconds() / 86400, 1)
+    return pd.DataFrame(
+        coverage_ratio(totals / n_days, targets),
+        index=pd.Index(user_ids, name="user_id"),
+        columns=list(NUTRIENT_ORDER)
+    )
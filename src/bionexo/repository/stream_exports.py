@@ -0,0 +1,193 @@
+"""
+Exportacion en streaming (NDJSON o CSV) de las ingestas y reportes de bienestar de un usuario.
+
+Los documentos salen de un cursor de Mongo por lotes (`batch_size`) ordenado por timestamp y se
+escriben en un generador de bloques de bytes: solo hay en memoria un lote del cursor y un bloque
+de salida, asi que exportar anos de datos usa memoria constante. El consumidor marca el ritmo
+(contrapresion): el cursor no pide el siguiente lote hasta que se ha enviado lo anterior.
+
+El filtro de fechas `[start, end)` se interpreta en la zona `tz` si las fechas no la llevan, y
+las fechas de salida se convierten a `tz` (ISO 8601 con desplazamiento). Las imagenes no se
+exportan. Hay version sincrona (`stream_export`, cliente de `get_db`) y asincrona
+(`astream_export`, cliente de `driver/mongodb.py`) con la misma salida.
+"""
+
+import csv
+import io
+import json
+from datetime import datetime, timezone
+from typing import AsyncIterator, Iterable, Iterator, Literal, Optional
+from zoneinfo import ZoneInfo
+
+from bson import ObjectId
+
+from bionexo.infrastructure.utils.functions import local_to_utc
+from bionexo.repository.exports import EXPORT_SPECS
+
+StreamFormat = Literal["ndjson", "csv"]
+
+STREAM_COLLECTIONS = ("intakes", "wellness_logs")
+STREAM_CHUNK_BYTES = 64 * 1024
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+
+
+def stream_columns(collection: str) -> list[str]:
+    """Columnas exportadas: las del esquema Parquet de la coleccion (sin imagenes)."""
+    if collection not in STREAM_COLLECTIONS:
+        raise ValueError(f"Colección no exportable en streaming: {collection}")
+    return EXPORT_SPECS[collection].schema.names
+
+
+def stream_query(
+        user_id: str,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        tz: str = "Europe/Madrid"
+) -> dict:
+    """Filtro del usuario y del rango `[start, end)`, con las fechas pasadas a UTC naive."""
+    query: dict = {"user_id": user_id}
+    timestamp = {}
+    if start is not None:
+        timestamp["$gte"] = local_to_utc(start, tz)
+    if end is not None:
+        timestamp["$lt"] = local_to_utc(end, tz)
+    if timestamp:
+        query["timestamp"] = timestamp
+    return query
+
+
+class _Encoder:
+    """Convierte documentos a lineas NDJSON o CSV en la zona horaria de salida."""
+
+    def __init__(self, columns: list[str], fmt: StreamFormat, tz: str):
+        if fmt not in MEDIA_TYPES:
+            raise ValueError(f"Formato desconocido: {fmt}")
+        self.columns = columns
+        self.fmt = fmt
+        self.zone = ZoneInfo(tz)
+        self._buffer = io.StringIO()
+        self._csv = csv.writer(self._buffer, lineterminator="\n")
+
+    def _value(self, value):
+        if isinstance(value, datetime):
+            aware = value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+            return aware.astimezone(self.zone).isoformat()
+        if isinstance(value, ObjectId):
+            return str(value)
+        if isinstance(value, bytes):
+            return None  # Vectores binarios: no tienen representacion util en texto
+        if isinstance(value, list):
+            return [self._value(item) for item in value]
+        if isinstance(value, dict):
+            return {key: self._value(item) for key, item in value.items()}
+        return value
+
+    def header(self) -> str:
+        if self.fmt != "csv":
+            return ""
+        self._csv.writerow(self.columns)
+        return self._take()
+
+    def line(self, doc: dict) -> str:
+        row = {column: self._value(doc.get(column)) for column in self.columns}
+        if self.fmt == "ndjson":
+            return json.dumps(row, ensure_ascii=False) + "\n"
+        self._csv.writerow([
+            # Listas y subdocumentos como JSON dentro de la celda
+            json.dumps(value, ensure_ascii=False) if isinstance(value, (list, dict)) else value
+            for value in row.values()
+        ])
+        return self._take()
+
+    def _take(self) -> str:
+        text = self._buffer.getvalue()
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return text
+
+
+class _Chunker:
+    """Agrupa las lineas de `_Encoder` en bloques de ~`STREAM_CHUNK_BYTES` bytes (sync y async)."""
+
+    def __init__(self, columns: list[str], fmt: StreamFormat, tz: str):
+        self.encoder = _Encoder(columns, fmt, tz)
+        self._parts = [self.encoder.header()]
+        self._size = len(self._parts[0])
+
+    def add(self, doc: dict) -> Optional[bytes]:
+        """Añade un documento; devuelve un bloque si ya hay suficiente."""
+        line = self.encoder.line(doc)
+        self._parts.append(line)
+        self._size += len(line)
+        return self._take() if self._size >= STREAM_CHUNK_BYTES else None
+
+    def finish(self) -> Optional[bytes]:
+        """El resto pendiente, si lo hay."""
+        return self._take() if self._size else None
+
+    def _take(self) -> bytes:
+        chunk = "".join(self._parts).encode("utf-8")
+        self._parts, self._size = [], 0
+        return chunk
+
+
+def encode_stream(docs: Iterable[dict], columns: list[str], fmt: StreamFormat = "ndjson", tz: str = "Europe/Madrid") -> Iterator[bytes]:
+    """Bloques de ~`STREAM_CHUNK_BYTES` bytes con las lineas de `docs`."""
+    chunker = _Chunker(columns, fmt, tz)
+    for doc in docs:
+        chunk = chunker.add(doc)
+        if chunk:
+            yield chunk
+    rest = chunker.finish()
+    if rest:
+        yield rest
+
+
+def stream_export(
+        db,
+        collection: str,
+        user_id: str,
+        fmt: StreamFormat = "ndjson",
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        tz: str = "Europe/Madrid",
+        batch_size: int = 1000
+) -> Iterator[bytes]:
+    """Exportacion de un usuario como generador de bytes (cliente sincrono)."""
+    columns = stream_columns(collection)
+    cursor = db[collection].find(
+        stream_query(user_id, start, end, tz), {column: 1 for column in columns}
+    ).sort("timestamp", 1).batch_size(batch_size)
+    try:
+        yield from encode_stream(cursor, columns, fmt, tz)
+    finally:
+        # Si el cliente corta la descarga, el cursor se cierra en el servidor
+        cursor.close()
+
+
+async def astream_export(
+        db,
+        collection: str,
+        user_id: str,
+        fmt: StreamFormat = "ndjson",
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        tz: str = "Europe/Madrid",
+        batch_size: int = 1000
+) -> AsyncIterator[bytes]:
+    """Como `stream_export` con el cliente asincrono."""
+    columns = stream_columns(collection)
+    chunker = _Chunker(columns, fmt, tz)
+    cursor = db[collection].find(
+        stream_query(user_id, start, end, tz), {column: 1 for column in columns}
+    ).sort("timestamp", 1).batch_size(batch_size)
+    try:
+        async for doc in cursor:
+            chunk = chunker.add(doc)
+            if chunk:
+                yield chunk
+        rest = chunker.finish()
+        if rest:
+            yield rest
+    finally:
+        await cursor.close()
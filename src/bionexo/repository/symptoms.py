@@ -0,0 +1,65 @@
+"""
+Repositorio asincrono de reportes de bienestar (`wellness_logs`), con la misma semantica
+que `save_wellness_report` y `get_wellness_reports_from_db` de `infrastructure/utils/db.py`.
+"""
+
+from bionexo.domain.entity.wellness_logs import WellnessReport
+from bionexo.infrastructure.utils.db import wellness_derived_writes, wellness_document
+from bionexo.infrastructure.utils.query_cache import invalidate_user
+from bionexo.repository.daily_rollups import DAILY_ROLLUPS_COLLECTION, rollup_key, wellness_rollup_update
+from bionexo.repository.driver.mongodb import insert_many_unordered
+
+
+class WellnessRepository:
+    def __init__(self, db, tz: str = "Europe/Madrid"):
+        self.db = db
+        self.collection = db["wellness_logs"]
+        self.tz = tz
+
+    async def after_insert(self, report_dict: dict):
+        """Resumen diario y cache tras insertar un reporte (un fallo del resumen no se propaga)."""
+        try:
+            await self.db[DAILY_ROLLUPS_COLLECTION].update_one(
+                rollup_key(report_dict, self.tz), wellness_rollup_update(report_dict, self.tz), upsert=True
+            )
+        except Exception as e:
+            print(f"Error actualizando el resumen diario (el registro sí se guardó): {str(e)}")
+        invalidate_user(report_dict["user_id"], "wellness")
+
+    async def save(self, wellness_report: WellnessReport) -> bool:
+        try:
+            report_dict = wellness_document(wellness_report)
+            await self.collection.insert_one(report_dict)
+        except Exception as e:
+            print(f"Error al guardar reporte de síntomas: {str(e)}")
+            return False
+        await self.after_insert(report_dict)
+        return True
+
+    async def save_many(self, wellness_reports: list[WellnessReport]) -> tuple[int, list[dict]]:
+        """Guarda un lote con un `insert_many` y un `bulk_write` de resumenes diarios."""
+        inserted, errors = await insert_many_unordered(
+            self.collection, [wellness_document(report) for report in wellness_reports]
+        )
+        await self.after_insert_many(inserted)
+        return len(inserted), errors
+
+    async def after_insert_many(self, report_dicts: list[dict]):
+        """Como `after_insert` para un lote."""
+        if not report_dicts:
+            return
+        for name, operations in wellness_derived_writes(report_dicts, self.tz).items():
+            try:
+                await self.db[name].bulk_write(operations, ordered=False)
+            except Exception as e:
+                print(f"Error actualizando '{name}' (los registros sí se guardaron): {str(e)}")
+        for user_id in {report_dict["user_id"] for report_dict in report_dicts}:
+            invalidate_user(user_id, "wellness")
+
+    async def get_recent(self, user_id: str, limit: int = 50) -> list[dict]:
+        """Reportes del usuario, ordenados por timestamp descendente."""
+        reports = await self.collection.find({"user_id": user_id}).sort("timestamp", -1).limit(limit).to_list()
+        for report in reports:
+            if "_id" in report:
+                report["_id"] = str(report["_id"])
+        return reports
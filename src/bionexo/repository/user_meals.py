@@ -0,0 +1,208 @@
+"""
+Indice de comidas por usuario (`user_meals`): nombre, numero de usos y ultimo uso.
+
+Se actualiza en cada `save_intake` con un upsert (`$inc`/`$max`/`$min`) y sirve el selector
+de comidas previas con el top-N por frecuencia o recencia y busqueda por prefijo en el
+servidor (regex anclada sobre `name_normalized`, que usa el indice). Con la mascara de
+alergias del usuario se quitan las comidas cuyo alimento no es seguro (`safe_foods_query`).
+"""
+
+import re
+from itertools import islice
+from datetime import datetime
+from typing import Literal, Optional
+
+from bson import ObjectId
+from pymongo import DESCENDING, ReplaceOne
+
+from bionexo.repository.allergens import safe_foods_query
+
+USER_MEALS_COLLECTION = "user_meals"
+
+MealOrder = Literal["frequency", "recency"]
+
+# Con filtro de alergenos se leen paginas de `limit * SAFE_MEALS_OVERFETCH` comidas
+SAFE_MEALS_OVERFETCH = 2
+
+
+def normalize_meal_name(name: str) -> str:
+    """Clave de agrupacion (tambien en `rebuild_user_meals`, que la calcula en Python)."""
+    return name.strip().lower()
+
+
+def ensure_user_meals_indexes(db):
+    # Import diferido: indexes.py importa este modulo para declarar la coleccion
+    from bionexo.repository.indexes import ensure_indexes
+    ensure_indexes(db, USER_MEALS_COLLECTION)
+
+
+def record_meal_use(
+        db,
+        user_id: str,
+        food_name: str,
+        timestamp: datetime,
+        food_id: Optional[str] = None
+):
+    """Suma un uso de la comida al indice del usuario."""
+    meal_use = meal_use_update(user_id, food_name, timestamp, food_id)
+    if meal_use is not None:
+        db[USER_MEALS_COLLECTION].update_one(*meal_use, upsert=True)
+
+
+def meal_use_update(
+        user_id: str,
+        food_name: str,
+        timestamp: datetime,
+        food_id: Optional[str] = None
+) -> Optional[tuple[dict, dict]]:
+    """Filtro y actualizacion (upsert) de un uso de la comida, o None si no tiene nombre."""
+    name_normalized = normalize_meal_name(food_name)
+    if not name_normalized:
+        return None
+    update = {
+        "$inc": {"count": 1},
+        "$max": {"last_used_at": timestamp},
+        "$min": {"first_used_at": timestamp},
+        # El nombre visible es el del primer uso, que es con el que se creo el alimento en `foods`
+        "$setOnInsert": {"name": food_name.strip()},
+    }
+    if food_id:
+        update["$set"] = {"food_id": food_id}
+    return {"user_id": user_id, "name_normalized": name_normalized}, update
+
+
+def get_user_meals(
+        db,
+        user_id: str,
+        limit: int = 50,
+        order: MealOrder = "frequency",
+        prefix: Optional[str] = None,
+        exclude_allergens: int = 0
+) -> list[dict]:
+    """
+    Top-N comidas del usuario, opcionalmente filtradas por prefijo (sin distinguir mayusculas)
+    y sin las que tienen alguno de los alergenos de `exclude_allergens`. El filtro se aplica
+    por paginas del mismo cursor hasta reunir `limit` comidas seguras o agotarlo.
+    """
+    query, projection, sort = user_meals_query(user_id, order, prefix)
+    if not exclude_allergens:
+        return list(db[USER_MEALS_COLLECTION].find(query, projection).sort(sort).limit(limit))
+    page_size = limit * SAFE_MEALS_OVERFETCH
+    cursor = db[USER_MEALS_COLLECTION].find(query, projection).sort(sort).batch_size(page_size)
+    safe_meals: list[dict] = []
+    try:
+        while len(safe_meals) < limit:
+            meals = list(islice(cursor, page_size))
+            if not meals:
+                break
+            safe = db["foods"].find(safe_meal_foods_query(meals, exclude_allergens), {"_id": 1})
+            safe_meals.extend(drop_unsafe_meals(meals, safe))
+    finally:
+        cursor.close()
+    return safe_meals[:limit]
+
+
+def user_meals_query(
+        user_id: str,
+        order: MealOrder = "frequency",
+        prefix: Optional[str] = None
+) -> tuple[dict, dict, list[tuple[str, int]]]:
+    """Filtro, proyeccion y orden de `get_user_meals`."""
+    query = {"user_id": user_id}
+    if prefix and prefix.strip():
+        query["name_normalized"] = {"$regex": f"^{re.escape(normalize_meal_name(prefix))}"}
+    sort = [("count", DESCENDING), ("last_used_at", DESCENDING)] if order == "frequency" \
+        else [("last_used_at", DESCENDING)]
+    return query, {"_id": 0, "name": 1, "count": 1, "last_used_at": 1, "food_id": 1}, sort
+
+
+def safe_meal_foods_query(meals: list[dict], exclude_allergens: int) -> dict:
+    """Filtro de `foods` que deja los alimentos seguros de `meals`."""
+    food_ids = [ObjectId(meal["food_id"]) for meal in meals if ObjectId.is_valid(meal.get("food_id") or "")]
+    return {"_id": {"$in": food_ids}, **safe_foods_query(exclude_allergens)}
+
+
+def drop_unsafe_meals(meals: list[dict], safe_foods: list[dict]) -> list[dict]:
+    """
+    Comidas cuyo alimento esta en `safe_foods`. Las que no tienen `food_id` se quitan: como
+    los alimentos sin mascara, no se sabe si son seguras.
+    """
+    safe_ids = {str(food["_id"]) for food in safe_foods}
+    return [meal for meal in meals if meal.get("food_id") in safe_ids]
+
+
+def _merge_meal_group(meals: dict, user_id: str, group: dict):
+    """Suma a `meals` un grupo de ingestas con el mismo nombre exacto, bajo su nombre normalizado."""
+    raw_name = group["_id"]["food_name"]
+    name_normalized = normalize_meal_name(raw_name)
+    if not name_normalized:
+        return
+    meal = meals.get(name_normalized)
+    if meal is None:
+        meals[name_normalized] = {
+            "user_id": user_id,
+            "name_normalized": name_normalized,
+            "name": raw_name.strip(),
+            "food_id": group.get("food_id"),
+            "count": group["count"],
+            "first_used_at": group["first_used_at"],
+            "last_used_at": group["last_used_at"],
+        }
+        return
+    meal["count"] += group["count"]
+    if group["first_used_at"] < meal["first_used_at"]:
+        meal["first_used_at"] = group["first_used_at"]
+        meal["name"] = raw_name.strip()
+    if group["last_used_at"] > meal["last_used_at"]:
+        meal["last_used_at"] = group["last_used_at"]
+        meal["food_id"] = group.get("food_id")
+
+
+def rebuild_user_meals(db, user_id: Optional[str] = None, batch_size: int = 1000) -> int:
+    """
+    Recalcula el indice desde `intakes`. El servidor agrupa por (usuario, nombre exacto) y los
+    grupos se funden aqui con `normalize_meal_name`, la misma clave que `save_intake`:
+    `$toLower` solo pasa a minusculas ASCII y con "Ñoquis"/"ñoquis" crearia dos entradas.
+    Los grupos llegan ordenados por usuario y se escriben al cambiar de usuario.
+    """
+    ensure_user_meals_indexes(db)
+    match = {"food_name": {"$type": "string"}}
+    if user_id:
+        match["user_id"] = user_id
+    collection = db[USER_MEALS_COLLECTION]
+    collection.delete_many({"user_id": user_id} if user_id else {})
+    groups = db["intakes"].aggregate([
+        {"$match": match},
+        {"$sort": {"timestamp": 1}},
+        {"$group": {
+            "_id": {"user_id": "$user_id", "food_name": "$food_name"},
+            "food_id": {"$last": "$food_id"},
+            "count": {"$sum": 1},
+            "first_used_at": {"$min": "$timestamp"},
+            "last_used_at": {"$max": "$timestamp"},
+        }},
+        {"$sort": {"_id.user_id": 1}},
+    ], allowDiskUse=True)
+
+    operations: list = []
+    current, meals = None, {}
+
+    def flush_user():
+        operations.extend(
+            ReplaceOne({"user_id": meal["user_id"], "name_normalized": meal["name_normalized"]}, meal, upsert=True)
+            for meal in meals.values()
+        )
+        meals.clear()
+        if len(operations) >= batch_size:
+            collection.bulk_write(operations, ordered=False)
+            operations.clear()
+
+    for group in groups:
+        if group["_id"]["user_id"] != current:
+            flush_user()
+            current = group["_id"]["user_id"]
+        _merge_meal_group(meals, current, group)
+    flush_user()
+    if operations:
+        collection.bulk_write(operations, ordered=False)
+    return collection.count_documents({"user_id": user_id} if user_id else {})
@@ -0,0 +1,41 @@
+"""
+Repositorio asincrono de usuarios (`users`), con la misma semantica que `db_user_exists` y
+`save_user` de `infrastructure/utils/db.py`.
+"""
+
+from typing import Optional
+
+from pymongo.errors import DuplicateKeyError
+
+from bionexo.domain.entity.user import User
+from bionexo.infrastructure.utils.db import user_document
+from bionexo.infrastructure.utils.functions import hash_password
+
+
+class UserRepository:
+    def __init__(self, db):
+        self.collection = db["users"]
+
+    async def exists(self, email: str, password: str) -> bool:
+        user = await self.collection.find_one(
+            {"email": email, "password": hash_password(password)}, {"_id": 1}
+        )
+        return user is not None
+
+    async def save(self, user_data: User) -> Optional[bool]:
+        """True si se guarda, None si el email ya existe."""
+        try:
+            await self.collection.insert_one(user_document(user_data))
+            return True
+        except DuplicateKeyError:
+            return None
+
+    async def get(self, email: str) -> Optional[dict]:
+        """Perfil del usuario, sin la contraseña."""
+        return await self.collection.find_one({"email": email}, {"_id": 0, "password": 0})
+
+    async def authenticate(self, email: str, password: str) -> Optional[dict]:
+        """Perfil del usuario (sin la contraseña) si las credenciales son correctas, si no None."""
+        return await self.collection.find_one(
+            {"email": email, "password": hash_password(password)}, {"_id": 0, "password": 0}
+        )